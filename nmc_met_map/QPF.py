@@ -4,14 +4,17 @@
 Synoptic analysis or diagnostic maps for numeric weather model.
 """
 import numpy as np
-from nmc_met_io.retrieve_micaps_server import get_model_grid
-from nmc_met_map.graphics import QPF_graphics
+from nmc_met_map.lib.retrieve import get_model_grid
+from nmc_met_map.lib.lazy import lazy_import, lazy_attr
+QPF_graphics = lazy_import('nmc_met_map.graphics.QPF_graphics')
 import nmc_met_map.lib.utility as utl
-from metpy.units import units
-import metpy.calc as mpcalc
-import xarray as xr
+from nmc_met_map.lib import instrument
+units = lazy_attr('metpy.units', 'units')
+mpcalc = lazy_import('metpy.calc')
+xr = lazy_import('xarray')
 import copy
 
+@instrument.product
 def gh_rain(initial_time=None, fhour=24, day_back=0,model='ECMWF',
     gh_lev='500',atime=6,
     map_ratio=19/9,zoom_ratio=20,cntr_pnt=[102,34],
@@ -21,6 +24,27 @@ def gh_rain(initial_time=None, fhour=24, day_back=0,model='ECMWF',
     if(area != '全国'):
         south_China_sea=False
 
+    data = gh_rain_data(initial_time=initial_time, fhour=fhour, day_back=day_back,
+        model=model, gh_lev=gh_lev, atime=atime,
+        map_ratio=map_ratio, zoom_ratio=zoom_ratio, cntr_pnt=cntr_pnt, area=area)
+    if data is None:
+        return
+
+    QPF_graphics.draw_gh_rain(
+        rain=data['rain'], gh=data['gh'],atime=atime,
+        map_extent=data['map_extent'], regrid_shape=20,
+        city=city,south_China_sea=south_China_sea,
+        output_dir=output_dir,Global=Global)
+
+def gh_rain_data(initial_time=None, fhour=24, day_back=0,model='ECMWF',
+    gh_lev='500',atime=6,
+    map_ratio=19/9,zoom_ratio=20,cntr_pnt=[102,34],area = '全国'):
+
+    """
+    Retrieve and crop the data of gh_rain (also used by the animation frames).
+    :return: dict of gh, rain and map_extent, None if the data is missing.
+    """
+
     # micaps data directory
     try:
         data_dir = [utl.Cassandra_dir(data_type='high',data_source=model,var_name='HGT',lvl=gh_lev),
@@ -50,6 +74,7 @@ def gh_rain(initial_time=None, fhour=24, day_back=0,model='ECMWF',
 
 
     # prepare data
+    instrument.phase('crop')
 
     if(area != None):
         cntr_pnt,zoom_ratio=utl.get_map_area(area_name=area)
@@ -88,12 +113,9 @@ def gh_rain(initial_time=None, fhour=24, day_back=0,model='ECMWF',
              'data': copy.deepcopy(rain['data'].values[0,idx_y2[0][0]:(idx_y2[0][-1]+1),idx_x2[0][0]:(idx_x2[0][-1]+1)])
              }
 
-    QPF_graphics.draw_gh_rain(
-        rain=rain, gh=gh,atime=atime,
-        map_extent=map_extent, regrid_shape=20,
-        city=city,south_China_sea=south_China_sea,
-        output_dir=output_dir,Global=Global)
+    return {'gh': gh, 'rain': rain, 'map_extent': map_extent}
 
+@instrument.product
 def mslp_rain_snow(initial_time=None, fhour=24, day_back=0,model='ECMWF',
     atime=6,
     map_ratio=19/9,zoom_ratio=20,cntr_pnt=[102,34],
@@ -132,6 +154,7 @@ def mslp_rain_snow(initial_time=None, fhour=24, day_back=0,model='ECMWF',
 
 
     # prepare data
+    instrument.phase('crop')
 
     if(area != None):
         cntr_pnt,zoom_ratio=utl.get_map_area(area_name=area)
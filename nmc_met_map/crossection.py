@@ -1,17 +1,37 @@
 # _*_ coding: utf-8 _*_
 import numpy as np
-import xarray as xr
-import metpy.calc as mpcalc
-from metpy.interpolate import cross_section
-from nmc_met_io.retrieve_micaps_server import get_model_3D_grid,get_model_grid,get_model_3D_grids,get_latest_initTime,get_model_points,get_model_grids
-from nmc_met_map.graphics import crossection_graphics
+from nmc_met_map.lib.lazy import lazy_import, lazy_attr
+xr = lazy_import('xarray')
+mpcalc = lazy_import('metpy.calc')
+cross_section = lazy_attr('metpy.interpolate', 'cross_section')
+from nmc_met_map.lib.retrieve import get_model_3D_grid,get_model_grid,get_model_3D_grids,get_latest_initTime,get_model_points,get_model_grids
+crossection_graphics = lazy_import('nmc_met_map.graphics.crossection_graphics')
 import nmc_met_map.lib.utility as utl
-from metpy.units import units
-import pandas as pd
+from nmc_met_map.lib import instrument, kernels, derived
+units = lazy_attr('metpy.units', 'units')
+pd = lazy_import('pandas')
 import math
 import os
 import sys
 
+def _parse_cf(data):
+    """
+    data.metpy.parse_cf(), the .metpy accessor of xarray is registered
+    by importing metpy.xarray, which the deferred imports leave undone.
+    """
+    import metpy.xarray
+    return data.metpy.parse_cf()
+
+def _absolute_vorticity(u, v):
+    """
+    Absolute vorticity (1/s) of all the levels of the (level, lat, lon) winds.
+    """
+    dx, dy = kernels.lat_lon_grid_deltas(u['lon'].values, u['lat'].values)
+    return kernels.absolute_vorticity(
+        kernels.field(u['data'].values), kernels.field(v['data'].values),
+        dx, dy, kernels.field(u['lat'].values)[:, None])
+
+@instrument.product
 def Crosssection_Wind_Theta_e_absv(
     initial_time=None, fhour=24,
     levels=[1000, 950, 925, 900, 850, 800, 700,600,500,400,300,200],
@@ -42,53 +62,40 @@ def Crosssection_Wind_Theta_e_absv(
     rh=get_model_3D_grid(directory=data_dir[0][0:-1],filename=filename,levels=levels, allExists=False)
     if rh is None:
         return
-    rh = rh.metpy.parse_cf().squeeze()
+    rh = _parse_cf(rh).squeeze()
 
     u=get_model_3D_grid(directory=data_dir[1][0:-1],filename=filename,levels=levels, allExists=False)
     if u is None:
         return
-    u = u.metpy.parse_cf().squeeze()
+    u = _parse_cf(u).squeeze()
 
     v=get_model_3D_grid(directory=data_dir[2][0:-1],filename=filename,levels=levels, allExists=False)
     if v is None:
         return
-    v = v.metpy.parse_cf().squeeze()
+    v = _parse_cf(v).squeeze()
 
     v2=get_model_3D_grid(directory=data_dir[2][0:-1],filename=filename,levels=levels, allExists=False)
     if v2 is None:
         return
-    v2 = v2.metpy.parse_cf().squeeze()
+    v2 = _parse_cf(v2).squeeze()
 
     t=get_model_3D_grid(directory=data_dir[3][0:-1],filename=filename,levels=levels, allExists=False)
     if t is None:
         return
-    t = t.metpy.parse_cf().squeeze()
+    t = _parse_cf(t).squeeze()
 
     gh=get_model_grid(data_dir[4], filename=filename)
     if t is None:
         return
 
     resolution=u['lon'][1]-u['lon'][0]
-    x,y=np.meshgrid(u['lon'], u['lat'])
 
-    dx,dy=mpcalc.lat_lon_grid_deltas(u['lon'],u['lat'])
-    for ilvl in levels:
-        u2d=u.sel(level=ilvl)
-        #u2d['data'].attrs['units']=units.meter/units.second
-        v2d=v.sel(level=ilvl)
-        #v2d['data'].attrs['units']=units.meter/units.second
-
-        absv2d=mpcalc.absolute_vorticity(u2d['data'].values*units.meter/units.second,
-                v2d['data'].values*units.meter/units.second,dx,dy,y*units.degree)
-        
-        if(ilvl == levels[0]):
-            absv3d = v2
-            absv3d['data'].loc[dict(level=ilvl)]=np.array(absv2d)
-        else:
-            absv3d['data'].loc[dict(level=ilvl)]=np.array(absv2d)
-    absv3d['data'].attrs['units']=absv2d.units
+    absv3d = v2
+    absv3d['data'].values[...] = _absolute_vorticity(u, v)
+    absv3d['data'].attrs['units']='1/s'
 
     #rh=rh.rename(dict(lat='latitude',lon='longitude'))
+    instrument.phase('crop')
     cross = cross_section(rh, st_point, ed_point)
     cross_rh=cross.set_coords(('lat', 'lon'))
     cross = cross_section(u, st_point, ed_point)
@@ -104,20 +111,20 @@ def Crosssection_Wind_Theta_e_absv(
     cross_t=cross.set_coords(('lat', 'lon'))
     cross = cross_section(absv3d, st_point, ed_point)
     cross_absv3d=cross.set_coords(('lat', 'lon'))
-
-    cross_Td = mpcalc.dewpoint_rh(cross_t['data'].values*units.celsius,
-                cross_rh['data'].values* units.percent)
+    instrument.phase('derive')
 
     rh,pressure = xr.broadcast(cross_rh['data'],cross_t['level'])
 
-    Theta_e=mpcalc.equivalent_potential_temperature(pressure,
-                                                cross_t['data'].values*units.celsius, 
-                                                cross_Td)
+    # shared with the other cross-sections of the run on the same section
+    section = dict(model=model, init_time=t.coords['forecast_reference_time'].values,
+                   fhour=fhour, levels=levels, region=('section', st_point, ed_point))
+    raw = {'p': pressure.values, 't': cross_t['data'].values, 'rh': cross_rh['data'].values}
+    Theta_e = derived.field('theta_e', raw, **section)
 
-    cross_Theta_e = xr.DataArray(np.array(Theta_e),
+    cross_Theta_e = xr.DataArray(Theta_e,
                         coords=cross_rh['data'].coords,
                         dims=cross_rh['data'].dims,
-                        attrs={'units': Theta_e.units})
+                        attrs={'units': 'K'})
 
     crossection_graphics.draw_Crosssection_Wind_Theta_e_absv(
                     cross_absv3d=cross_absv3d, cross_Theta_e=cross_Theta_e, cross_u=cross_u,
@@ -126,6 +133,7 @@ def Crosssection_Wind_Theta_e_absv(
                     levels=levels,map_extent=map_extent,
                     output_dir=output_dir)
 
+@instrument.product
 def Crosssection_Wind_Theta_e_RH(
     initial_time=None, fhour=24,
     levels=[1000, 950, 925, 900, 850, 800, 700,600,500,400,300,200],
@@ -156,53 +164,40 @@ def Crosssection_Wind_Theta_e_RH(
     rh=get_model_3D_grid(directory=data_dir[0][0:-1],filename=filename,levels=levels, allExists=False)
     if rh is None:
         return
-    rh = rh.metpy.parse_cf().squeeze()
+    rh = _parse_cf(rh).squeeze()
 
     u=get_model_3D_grid(directory=data_dir[1][0:-1],filename=filename,levels=levels, allExists=False)
     if u is None:
         return
-    u = u.metpy.parse_cf().squeeze()
+    u = _parse_cf(u).squeeze()
 
     v=get_model_3D_grid(directory=data_dir[2][0:-1],filename=filename,levels=levels, allExists=False)
     if v is None:
         return
-    v = v.metpy.parse_cf().squeeze()
+    v = _parse_cf(v).squeeze()
 
     v2=get_model_3D_grid(directory=data_dir[2][0:-1],filename=filename,levels=levels, allExists=False)
     if v2 is None:
         return
-    v2 = v2.metpy.parse_cf().squeeze()
+    v2 = _parse_cf(v2).squeeze()
 
     t=get_model_3D_grid(directory=data_dir[3][0:-1],filename=filename,levels=levels, allExists=False)
     if t is None:
         return
-    t = t.metpy.parse_cf().squeeze()
+    t = _parse_cf(t).squeeze()
 
     gh=get_model_grid(data_dir[4], filename=filename)
     if t is None:
         return
 
     resolution=u['lon'][1]-u['lon'][0]
-    x,y=np.meshgrid(u['lon'], u['lat'])
 
-    dx,dy=mpcalc.lat_lon_grid_deltas(u['lon'],u['lat'])
-    for ilvl in levels:
-        u2d=u.sel(level=ilvl)
-        #u2d['data'].attrs['units']=units.meter/units.second
-        v2d=v.sel(level=ilvl)
-        #v2d['data'].attrs['units']=units.meter/units.second
-
-        absv2d=mpcalc.absolute_vorticity(u2d['data'].values*units.meter/units.second,
-                v2d['data'].values*units.meter/units.second,dx,dy,y*units.degree)
-        
-        if(ilvl == levels[0]):
-            absv3d = v2
-            absv3d['data'].loc[dict(level=ilvl)]=np.array(absv2d)
-        else:
-            absv3d['data'].loc[dict(level=ilvl)]=np.array(absv2d)
-    absv3d['data'].attrs['units']=absv2d.units
+    absv3d = v2
+    absv3d['data'].values[...] = _absolute_vorticity(u, v)
+    absv3d['data'].attrs['units']='1/s'
 
     #rh=rh.rename(dict(lat='latitude',lon='longitude'))
+    instrument.phase('crop')
     cross = cross_section(rh, st_point, ed_point)
     cross_rh=cross.set_coords(('lat', 'lon'))
     cross = cross_section(u, st_point, ed_point)
@@ -218,19 +213,19 @@ def Crosssection_Wind_Theta_e_RH(
     cross_t=cross.set_coords(('lat', 'lon'))
     cross = cross_section(absv3d, st_point, ed_point)
 
-    cross_Td = mpcalc.dewpoint_rh(cross_t['data'].values*units.celsius,
-                cross_rh['data'].values* units.percent)
-
+    instrument.phase('derive')
     rh,pressure = xr.broadcast(cross_rh['data'],cross_t['level'])
 
-    Theta_e=mpcalc.equivalent_potential_temperature(pressure,
-                                                cross_t['data'].values*units.celsius, 
-                                                cross_Td)
+    # shared with the other cross-sections of the run on the same section
+    section = dict(model=model, init_time=t.coords['forecast_reference_time'].values,
+                   fhour=fhour, levels=levels, region=('section', st_point, ed_point))
+    raw = {'p': pressure.values, 't': cross_t['data'].values, 'rh': cross_rh['data'].values}
+    Theta_e = derived.field('theta_e', raw, **section)
 
-    cross_Theta_e = xr.DataArray(np.array(Theta_e),
+    cross_Theta_e = xr.DataArray(Theta_e,
                         coords=cross_rh['data'].coords,
                         dims=cross_rh['data'].dims,
-                        attrs={'units': Theta_e.units})
+                        attrs={'units': 'K'})
 
     crossection_graphics.draw_Crosssection_Wind_Theta_e_RH(
                     cross_rh=cross_rh, cross_Theta_e=cross_Theta_e, cross_u=cross_u,
@@ -240,6 +235,7 @@ def Crosssection_Wind_Theta_e_RH(
                     output_dir=output_dir)
 
 
+@instrument.product
 def Crosssection_Wind_Theta_e_Qv(
     initial_time=None, fhour=24,
     levels=[1000, 950, 925, 900, 850, 800, 700,600,500,400,300,200],
@@ -270,53 +266,40 @@ def Crosssection_Wind_Theta_e_Qv(
     rh=get_model_3D_grid(directory=data_dir[0][0:-1],filename=filename,levels=levels, allExists=False)
     if rh is None:
         return
-    rh = rh.metpy.parse_cf().squeeze()
+    rh = _parse_cf(rh).squeeze()
 
     u=get_model_3D_grid(directory=data_dir[1][0:-1],filename=filename,levels=levels, allExists=False)
     if u is None:
         return
-    u = u.metpy.parse_cf().squeeze()
+    u = _parse_cf(u).squeeze()
 
     v=get_model_3D_grid(directory=data_dir[2][0:-1],filename=filename,levels=levels, allExists=False)
     if v is None:
         return
-    v = v.metpy.parse_cf().squeeze()
+    v = _parse_cf(v).squeeze()
 
     v2=get_model_3D_grid(directory=data_dir[2][0:-1],filename=filename,levels=levels, allExists=False)
     if v2 is None:
         return
-    v2 = v2.metpy.parse_cf().squeeze()
+    v2 = _parse_cf(v2).squeeze()
 
     t=get_model_3D_grid(directory=data_dir[3][0:-1],filename=filename,levels=levels, allExists=False)
     if t is None:
         return
-    t = t.metpy.parse_cf().squeeze()
+    t = _parse_cf(t).squeeze()
 
     gh=get_model_grid(data_dir[4], filename=filename)
     if t is None:
         return
 
     resolution=u['lon'][1]-u['lon'][0]
-    x,y=np.meshgrid(u['lon'], u['lat'])
 
-    dx,dy=mpcalc.lat_lon_grid_deltas(u['lon'],u['lat'])
-    for ilvl in levels:
-        u2d=u.sel(level=ilvl)
-        #u2d['data'].attrs['units']=units.meter/units.second
-        v2d=v.sel(level=ilvl)
-        #v2d['data'].attrs['units']=units.meter/units.second
-
-        absv2d=mpcalc.absolute_vorticity(u2d['data'].values*units.meter/units.second,
-                v2d['data'].values*units.meter/units.second,dx,dy,y*units.degree)
-        
-        if(ilvl == levels[0]):
-            absv3d = v2
-            absv3d['data'].loc[dict(level=ilvl)]=np.array(absv2d)
-        else:
-            absv3d['data'].loc[dict(level=ilvl)]=np.array(absv2d)
-    absv3d['data'].attrs['units']=absv2d.units
+    absv3d = v2
+    absv3d['data'].values[...] = _absolute_vorticity(u, v)
+    absv3d['data'].attrs['units']='1/s'
 
     #rh=rh.rename(dict(lat='latitude',lon='longitude'))
+    instrument.phase('crop')
     cross = cross_section(rh, st_point, ed_point)
     cross_rh=cross.set_coords(('lat', 'lon'))
     cross = cross_section(u, st_point, ed_point)
@@ -332,27 +315,26 @@ def Crosssection_Wind_Theta_e_Qv(
     cross_t=cross.set_coords(('lat', 'lon'))
     cross = cross_section(absv3d, st_point, ed_point)
 
-    cross_Td = mpcalc.dewpoint_rh(cross_t['data'].values*units.celsius,
-                cross_rh['data'].values* units.percent)
-
+    instrument.phase('derive')
     rh,pressure = xr.broadcast(cross_rh['data'],cross_t['level'])
 
-    Qv = mpcalc.specific_humidity_from_dewpoint(cross_Td,
-                pressure)
+    # shared with the other cross-sections of the run on the same section
+    section = dict(model=model, init_time=t.coords['forecast_reference_time'].values,
+                   fhour=fhour, levels=levels, region=('section', st_point, ed_point))
+    raw = {'p': pressure.values, 't': cross_t['data'].values, 'rh': cross_rh['data'].values}
+    Qv = derived.field('qv', raw, **section)
 
-    cross_Qv = xr.DataArray(np.array(Qv)*1000.,
+    cross_Qv = xr.DataArray(Qv*1000.,
                     coords=cross_rh['data'].coords,
                     dims=cross_rh['data'].dims,
-                    attrs={'units': units('g/kg')})
+                    attrs={'units': 'g/kg'})
 
-    Theta_e=mpcalc.equivalent_potential_temperature(pressure,
-                                                cross_t['data'].values*units.celsius, 
-                                                cross_Td)
+    Theta_e = derived.field('theta_e', raw, **section)
 
-    cross_Theta_e = xr.DataArray(np.array(Theta_e),
+    cross_Theta_e = xr.DataArray(Theta_e,
                         coords=cross_rh['data'].coords,
                         dims=cross_rh['data'].dims,
-                        attrs={'units': Theta_e.units})
+                        attrs={'units': 'K'})
 
     crossection_graphics.draw_Crosssection_Wind_Theta_e_Qv(
                     cross_Qv=cross_Qv, cross_Theta_e=cross_Theta_e, cross_u=cross_u,
@@ -361,6 +343,7 @@ def Crosssection_Wind_Theta_e_Qv(
                     levels=levels,map_extent=map_extent,
                     output_dir=output_dir)
 
+@instrument.product
 def Time_Crossection_rh_uv_t(initTime=None,model='ECMWF',points={'lon':[116.3833], 'lat':[39.9]},
     levels=[1000, 950, 925, 900, 850, 800, 700,600,500,400,300,200],
     t_gap=3,t_range=[0,48],output_dir=None):
@@ -380,6 +363,7 @@ def Time_Crossection_rh_uv_t(initTime=None,model='ECMWF',points={'lon':[116.3833
         initTime = get_latest_initTime(data_dir[0][0:-1]+"850")
     filenames = [initTime+'.'+str(fhour).zfill(3) for fhour in fhours]
     TMP_4D=get_model_3D_grids(directory=data_dir[0][0:-1],filenames=filenames,levels=levels, allExists=False)
+    instrument.phase('crop')
     TMP_2D=TMP_4D.interp(lon=('points', points['lon']), lat=('points', points['lat']))
 
     filenames = [initTime+'.'+str(fhour).zfill(3) for fhour in fhours]
@@ -393,6 +377,7 @@ def Time_Crossection_rh_uv_t(initTime=None,model='ECMWF',points={'lon':[116.3833
     filenames = [initTime+'.'+str(fhour).zfill(3) for fhour in fhours]
     rh_4D=get_model_3D_grids(directory=data_dir[3][0:-1],filenames=filenames,levels=levels, allExists=False)
     rh_2D=rh_4D.interp(lon=('points', points['lon']), lat=('points', points['lat']))
+    instrument.phase('derive')
     rh_2D.attrs['model']=model
     rh_2D.attrs['points']=points
 
@@ -401,6 +386,7 @@ def Time_Crossection_rh_uv_t(initTime=None,model='ECMWF',points={'lon':[116.3833
                     output_dir=output_dir)
 
 
+@instrument.product
 def Time_Crossection_rh_uv_theta_e(initTime=None,model='ECMWF',points={'lon':[116.3833], 'lat':[39.9]},
     levels=[1000, 950, 925, 900, 850, 800, 700,600,500,400,300,200],
     t_gap=3,t_range=[0,48],output_dir=None):
@@ -421,6 +407,7 @@ def Time_Crossection_rh_uv_theta_e(initTime=None,model='ECMWF',points={'lon':[11
         initTime = get_latest_initTime(data_dir[0][0:-1]+"850")
     filenames = [initTime+'.'+str(fhour).zfill(3) for fhour in fhours]
     TMP_4D=get_model_3D_grids(directory=data_dir[0][0:-1],filenames=filenames,levels=levels, allExists=False)
+    instrument.phase('crop')
     TMP_2D=TMP_4D.interp(lon=('points', points['lon']), lat=('points', points['lat']))
 
     filenames = [initTime+'.'+str(fhour).zfill(3) for fhour in fhours]
@@ -434,26 +421,25 @@ def Time_Crossection_rh_uv_theta_e(initTime=None,model='ECMWF',points={'lon':[11
     filenames = [initTime+'.'+str(fhour).zfill(3) for fhour in fhours]
     rh_4D=get_model_3D_grids(directory=data_dir[3][0:-1],filenames=filenames,levels=levels, allExists=False)
     rh_2D=rh_4D.interp(lon=('points', points['lon']), lat=('points', points['lat']))
+    instrument.phase('derive')
     rh_2D.attrs['model']=model
     rh_2D.attrs['points']=points
-    Td_2D = mpcalc.dewpoint_rh(TMP_2D['data'].values*units.celsius,
-                rh_2D['data'].values* units.percent)
-
     rh,pressure = xr.broadcast(rh_2D['data'],rh_2D['level'])
 
-    Theta_e=mpcalc.equivalent_potential_temperature(pressure,
-                                                TMP_2D['data'].values*units.celsius, 
-                                                Td_2D)
+    Theta_e = derived.field(
+        'theta_e', {'p': pressure.values, 't': TMP_2D['data'].values, 'rh': rh_2D['data'].values},
+        model=model, init_time=initTime, fhour=fhours, levels=levels, region=('points', points))
 
-    theta_e_2D = xr.DataArray(np.array(Theta_e),
+    theta_e_2D = xr.DataArray(Theta_e,
                         coords=rh_2D['data'].coords,
                         dims=rh_2D['data'].dims,
-                        attrs={'units': Theta_e.units})
+                        attrs={'units': 'K'})
 
     crossection_graphics.draw_Time_Crossection_rh_uv_theta_e(
                     rh_2D=rh_2D, u_2D=u_2D, v_2D=v_2D,theta_e_2D=theta_e_2D,
                     t_range=t_range,output_dir=output_dir)
 
+@instrument.product
 def Crosssection_Wind_Temp_RH(
     initial_time=None, fhour=24,
     levels=[1000, 950, 925, 900, 850, 800, 700,600,500,400,300,200],
@@ -485,33 +471,34 @@ def Crosssection_Wind_Temp_RH(
     rh=get_model_3D_grid(directory=data_dir[0][0:-1],filename=filename,levels=levels, allExists=False)
     if rh is None:
         return
-    rh = rh.metpy.parse_cf().squeeze()
+    rh = _parse_cf(rh).squeeze()
 
     u=get_model_3D_grid(directory=data_dir[1][0:-1],filename=filename,levels=levels, allExists=False)
     if u is None:
         return
-    u = u.metpy.parse_cf().squeeze()
+    u = _parse_cf(u).squeeze()
 
     v=get_model_3D_grid(directory=data_dir[2][0:-1],filename=filename,levels=levels, allExists=False)
     if v is None:
         return
-    v = v.metpy.parse_cf().squeeze()
+    v = _parse_cf(v).squeeze()
 
     v2=get_model_3D_grid(directory=data_dir[2][0:-1],filename=filename,levels=levels, allExists=False)
     if v2 is None:
         return
-    v2 = v2.metpy.parse_cf().squeeze()
+    v2 = _parse_cf(v2).squeeze()
 
     t=get_model_3D_grid(directory=data_dir[3][0:-1],filename=filename,levels=levels, allExists=False)
     if t is None:
         return
-    t = t.metpy.parse_cf().squeeze()
+    t = _parse_cf(t).squeeze()
 
     gh=get_model_grid(data_dir[4], filename=filename)
 
     psfc=get_model_grid(data_dir[5], filename=filename)
-    psfc=psfc.metpy.parse_cf().squeeze()
+    psfc=_parse_cf(psfc).squeeze()
 
+    instrument.phase('crop')
     mask1 = (
             (psfc['lon']>=t['lon'].values.min())&
             (psfc['lon']<=t['lon'].values.max())&
@@ -522,14 +509,11 @@ def Crosssection_Wind_Temp_RH(
     t2,psfc_bdcst=xr.broadcast(t['data'],psfc['data'].where(mask1, drop=True))
     mask2=(psfc_bdcst > -10000)
     psfc_bdcst=psfc_bdcst.where(mask2, drop=True)
-    #psfc_bdcst=psfc_bdcst.metpy.parse_cf().squeeze()
+    #psfc_bdcst=_parse_cf(psfc_bdcst).squeeze()
     if t is None:
         return
 
     resolution=u['lon'][1]-u['lon'][0]
-    x,y=np.meshgrid(u['lon'], u['lat'])
-
-    dx,dy=mpcalc.lat_lon_grid_deltas(u['lon'],u['lat'])
 
     #rh=rh.rename(dict(lat='latitude',lon='longitude'))
     cross = cross_section(rh, st_point, ed_point)
@@ -548,9 +532,7 @@ def Crosssection_Wind_Temp_RH(
     
     cross = cross_section(t, st_point, ed_point)
     cross_Temp=cross.set_coords(('lat', 'lon'))
-
-    cross_Td = mpcalc.dewpoint_rh(cross_Temp['data'].values*units.celsius,
-                cross_rh['data'].values* units.percent)
+    instrument.phase('derive')
 
     rh,pressure = xr.broadcast(cross_rh['data'],cross_Temp['level'])
     cross_terrain=pressure-cross_psfc
@@ -562,6 +544,7 @@ def Crosssection_Wind_Temp_RH(
                     levels=levels,map_extent=map_extent,model=model,
                     output_dir=output_dir)
 
+@instrument.product
 def Time_Crossection_rh_uv_Temp(initTime=None,model='ECMWF',points={'lon':[116.3833], 'lat':[39.9]},
     levels=[1000, 950, 925, 900, 850, 800, 700,600,500,400,300,200],
     t_gap=3,t_range=[0,48],output_dir=None):
@@ -583,6 +566,7 @@ def Time_Crossection_rh_uv_Temp(initTime=None,model='ECMWF',points={'lon':[116.3
         initTime = get_latest_initTime(data_dir[0][0:-1]+"850")
     filenames = [initTime+'.'+str(fhour).zfill(3) for fhour in fhours]
     TMP_4D=get_model_3D_grids(directory=data_dir[0][0:-1],filenames=filenames,levels=levels, allExists=False)
+    instrument.phase('crop')
     TMP_2D=TMP_4D.interp(lon=('points', points['lon']), lat=('points', points['lat']))
 
     u_4D=get_model_3D_grids(directory=data_dir[1][0:-1],filenames=filenames,levels=levels, allExists=False)
@@ -598,6 +582,7 @@ def Time_Crossection_rh_uv_Temp(initTime=None,model='ECMWF',points={'lon':[116.3
 
     Psfc_3D=get_model_grids(directory=data_dir[4][0:-1],filenames=filenames,allExists=False)
     Psfc_1D=Psfc_3D.interp(lon=('points', points['lon']), lat=('points', points['lat']))
+    instrument.phase('derive')
     v_2D2,pressure_2D = xr.broadcast(v_2D['data'],v_2D['level'])
     v_2D2,Psfc_2D = xr.broadcast(v_2D['data'],Psfc_1D['data'])
     terrain_2D=pressure_2D-Psfc_2D
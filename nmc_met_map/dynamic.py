@@ -4,12 +4,15 @@
 Synoptic analysis or diagnostic maps for numeric weather model.
 """
 import numpy as np
-from nmc_met_io.retrieve_micaps_server import get_model_grid
-from nmc_met_map.graphics import dynamic_graphics
+from nmc_met_map.lib.retrieve import get_model_grid
+from nmc_met_map.lib.lazy import lazy_import, lazy_attr
+dynamic_graphics = lazy_import('nmc_met_map.graphics.dynamic_graphics')
 import nmc_met_map.lib.utility as utl
-from metpy.units import units
-import metpy.calc as mpcalc
+from nmc_met_map.lib import instrument
+units = lazy_attr('metpy.units', 'units')
+mpcalc = lazy_import('metpy.calc')
 
+@instrument.product
 def gh_uv_VVEL(initial_time=None, fhour=6, day_back=0,model='ECMWF',
     gh_lev='500',uvw_lev='850',
     map_ratio=19/9,zoom_ratio=20,cntr_pnt=[102,34],
@@ -53,6 +56,7 @@ def gh_uv_VVEL(initial_time=None, fhour=6, day_back=0,model='ECMWF',
 
 
     # prepare data
+    instrument.phase('crop')
 
     if(area != None):
         cntr_pnt,zoom_ratio=utl.get_map_area(area_name=area)
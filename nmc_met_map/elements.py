@@ -4,13 +4,16 @@
 Synoptic analysis or diagnostic maps for numeric weather model.
 """
 import numpy as np
-from nmc_met_io.retrieve_micaps_server import get_model_grid
-from nmc_met_map.graphics import elements_graphics
+from nmc_met_map.lib.retrieve import get_model_grid
+from nmc_met_map.lib.lazy import lazy_import, lazy_attr
+elements_graphics = lazy_import('nmc_met_map.graphics.elements_graphics')
 import nmc_met_map.lib.utility as utl
-from metpy.units import units
-import metpy.calc as mpcalc
-import xarray as xr
+from nmc_met_map.lib import instrument, derived
+units = lazy_attr('metpy.units', 'units')
+mpcalc = lazy_import('metpy.calc')
+xr = lazy_import('xarray')
 
+@instrument.product
 def T2m_all_type(initial_time=None, fhour=24, day_back=0,model='中央台指导预报',Var_plot='Tmn_2m',
     map_ratio=19/9,zoom_ratio=20,cntr_pnt=[102,34],
     south_China_sea=True,area = '全国',city=False,output_dir=None,
@@ -38,6 +41,7 @@ def T2m_all_type(initial_time=None, fhour=24, day_back=0,model='中央台指导
     init_time = T_2m.coords['forecast_reference_time'].values
 
     # prepare data
+    instrument.phase('crop')
 
     if(area != None):
         cntr_pnt,zoom_ratio=utl.get_map_area(area_name=area)
@@ -77,6 +81,7 @@ def T2m_all_type(initial_time=None, fhour=24, day_back=0,model='中央台指导
         city=city,south_China_sea=south_China_sea,
         output_dir=output_dir,Global=Global)
     
+@instrument.product
 def T2m_mslp_uv10m(initial_time=None, fhour=6, day_back=0,model='ECMWF',
     map_ratio=19/9,zoom_ratio=20,cntr_pnt=[102,34],
     south_China_sea=True,area = '全国',city=False,output_dir=None,
@@ -119,6 +124,7 @@ def T2m_mslp_uv10m(initial_time=None, fhour=6, day_back=0,model='ECMWF',
 
 
     # prepare data
+    instrument.phase('crop')
 
     if(area != None):
         cntr_pnt,zoom_ratio=utl.get_map_area(area_name=area)
@@ -173,6 +179,7 @@ def T2m_mslp_uv10m(initial_time=None, fhour=6, day_back=0,model='ECMWF',
         city=city,south_China_sea=south_China_sea,
         output_dir=output_dir,Global=Global)        
 
+@instrument.product
 def mslp_gust10m(initial_time=None, fhour=6, day_back=0,model='ECMWF',
     map_ratio=19/9,zoom_ratio=20,cntr_pnt=[102,34],
     south_China_sea=True,area = '全国',city=False,output_dir=None,
@@ -206,6 +213,7 @@ def mslp_gust10m(initial_time=None, fhour=6, day_back=0,model='ECMWF',
     init_time = mslp.coords['forecast_reference_time'].values
 
     # prepare data
+    instrument.phase('crop')
 
     if(area != None):
         cntr_pnt,zoom_ratio=utl.get_map_area(area_name=area)
@@ -255,6 +263,7 @@ def mslp_gust10m(initial_time=None, fhour=6, day_back=0,model='ECMWF',
         city=city,south_China_sea=south_China_sea,
         output_dir=output_dir,Global=Global)
 
+@instrument.product
 def low_level_wind(initial_time=None, fhour=6, day_back=0,model='ECMWF',wind_level='100m',
     map_ratio=19/9,zoom_ratio=20,cntr_pnt=[102,34],
     south_China_sea=True,area = '全国',city=False,output_dir=None,
@@ -288,6 +297,7 @@ def low_level_wind(initial_time=None, fhour=6, day_back=0,model='ECMWF',wind_lev
     init_time = v10m.coords['forecast_reference_time'].values
 
     # prepare data
+    instrument.phase('crop')
 
     if(area != None):
         cntr_pnt,zoom_ratio=utl.get_map_area(area_name=area)
@@ -331,7 +341,8 @@ def low_level_wind(initial_time=None, fhour=6, day_back=0,model='ECMWF',wind_lev
 
     wsp10m = {'lon': u10m.coords['lon'].where(mask2, drop=True).values,
             'lat': u10m.coords['lat'].where(mask3, drop=True).values,
-             'data': ((uv10m['udata'])**2+ (uv10m['vdata'])**2)**0.5}
+             'data': derived.field('wsp',{'u':uv10m['udata'],'v':uv10m['vdata']},
+                model=model,init_time=init_time,fhour=fhour,levels=wind_level,region=map_extent)}
 
 
     elements_graphics.draw_low_level_wind(
@@ -1,34 +1,69 @@
 # _*_ coding: utf-8 _*_
 
 import numpy as np
-import matplotlib as mpl
-import matplotlib.pyplot as plt
-import cartopy.crs as ccrs
-import cartopy.feature as cfeature
-from cartopy.mpl.gridliner import LONGITUDE_FORMATTER, LATITUDE_FORMATTER
-from nmc_met_graphics.plot.china_map import add_china_map_2cartopy
-from nmc_met_graphics.cmap.cm import guide_cmaps
-from nmc_met_graphics.plot.util import add_model_title
+from nmc_met_map.lib.lazy import lazy_import, lazy_attr
+mpl = lazy_import('matplotlib')
+plt = lazy_import('matplotlib.pyplot')
+ccrs = lazy_import('cartopy.crs')
+cfeature = lazy_import('cartopy.feature')
+LONGITUDE_FORMATTER = lazy_attr('cartopy.mpl.gridliner', 'LONGITUDE_FORMATTER')
+LATITUDE_FORMATTER = lazy_attr('cartopy.mpl.gridliner', 'LATITUDE_FORMATTER')
+add_china_map_2cartopy = lazy_attr('nmc_met_graphics.plot.china_map', 'add_china_map_2cartopy')
+guide_cmaps = lazy_attr('nmc_met_graphics.cmap.cm', 'guide_cmaps')
+add_model_title = lazy_attr('nmc_met_graphics.plot.util', 'add_model_title')
 import nmc_met_map.lib.utility as utl
+from nmc_met_map.lib import instrument
+from nmc_met_map.lib import contour_export
 from datetime import datetime, timedelta
-import pandas as pd
-import locale
+pd = lazy_import('pandas')
 import sys
-from matplotlib.colors import BoundaryNorm,ListedColormap
-import nmc_met_graphics.cmap.ctables as dk_ctables
-from scipy.ndimage import gaussian_filter
+BoundaryNorm = lazy_attr('matplotlib.colors', 'BoundaryNorm')
+ListedColormap = lazy_attr('matplotlib.colors', 'ListedColormap')
+dk_ctables = lazy_import('nmc_met_graphics.cmap.ctables')
+gaussian_filter = lazy_attr('scipy.ndimage', 'gaussian_filter')
 
+@instrument.traced('draw')
 def draw_gh_rain(gh=None, rain=None,atime=24,
                     map_extent=(50, 150, 0, 65),
                     regrid_shape=20,
                     add_china=True,city=True,south_China_sea=True,
                     output_dir=None,Global=False):
 
-    plt.rcParams['font.sans-serif'] = ['SimHei'] # 步骤一（替换sans-serif字体）
-    plt.rcParams['axes.unicode_minus'] = False  # 步骤二（解决坐标轴负数的负号显示问题）
+    fig, ax, bax = gh_rain_figure(gh=gh, atime=atime,
+        map_extent=map_extent, add_china=add_china, city=city,
+        south_China_sea=south_China_sea, Global=Global,
+        interactive=(output_dir == None))
+    plots, artists = gh_rain_layers(fig, ax, bax, gh=gh, rain=rain, atime=atime)
+
+    initial_time = pd.to_datetime(
+    str(gh['init_time'])).replace(tzinfo=None).to_pydatetime()
+
+    # show figure
+    if(output_dir != None):
+        with instrument.span('save'):
+            png_name=(output_dir+'高度场_降水_预报_'+
+            '起报时间_'+utl.cn_time(initial_time, "%Y年%m月%d日%H时")+
+            '预报时效_'+str(gh['fhour'])+'小时'+'.png')
+            fig.savefig(png_name, dpi=200)
+        contour_export.export_plots(plots, png_name)
+    
+    if(output_dir == None):
+        plt.show()
+    utl.close_figure(fig)
+
+def gh_rain_figure(gh=None, atime=24,
+                    map_extent=(50, 150, 0, 65),
+                    add_china=True,city=True,south_China_sea=True,
+                    Global=False,interactive=False):
+
+    """
+    Static part of draw_gh_rain (map, title, logo), drawn once
+    for all frames of an animation.
+    :return: fig, map axes, forecast information axes.
+    """
 
     # draw figure
-    plt.figure(figsize=(16,9))
+    fig = utl.new_figure(figsize=(16,9), interactive=interactive)
 
     # set data projection
     if(Global == True):
@@ -37,9 +72,9 @@ def draw_gh_rain(gh=None, rain=None,atime=24,
         plotcrs = ccrs.AlbersEqualArea(central_latitude=(map_extent[2]+map_extent[3])/2., 
             central_longitude=(map_extent[0]+map_extent[1])/2., standard_parallels=[30., 60.])
  
-    ax = plt.axes([0.01,0.1,.98,.84], projection=plotcrs)
+    ax = fig.add_axes([0.01,0.1,.98,.84], projection=plotcrs)
     
-    plt.title('['+gh['model']+'] '+
+    ax.set_title('['+gh['model']+'] '+
     gh['lev']+'hPa 位势高度场, '+
     str(atime)+'小时降水', 
         loc='left', fontsize=30)
@@ -61,8 +96,50 @@ def draw_gh_rain(gh=None, rain=None,atime=24,
         utl.add_china_map_2cartopy_public(
             ax, name='river', edgecolor='#74b9ff', lw=0.8, zorder=105,alpha=0.5)
 
+    # grid lines
+    gl = ax.gridlines(
+        crs=datacrs, linewidth=2, color='gray', alpha=0.5, linestyle='--', zorder=40)
+    gl.xlocator = mpl.ticker.FixedLocator(np.arange(0, 360, 15))
+    gl.ylocator = mpl.ticker.FixedLocator(np.arange(-90, 90, 15))
+
+    #http://earthpy.org/cartopy_backgroung.html
+    #C:\ProgramData\Anaconda3\Lib\site-packages\cartopy\data\raster\natural_earth
+    ax.background_img(name='RD', resolution='high', cache=True)
+
+    #forecast information
+    bax=fig.add_axes([0.01,0.835,.25,.1],facecolor='#FFFFFFCC')
+    bax.set_yticks([])
+    bax.set_xticks([])
+    bax.axis([0, 10, 0, 10])
+    bax.text(2.5, 0.5,'www.nmc.cn',size=15)
+
+    # add south China sea
+    if south_China_sea:
+        utl.add_south_China_sea(pos=[0.85,0.13,.1,.2],fig=fig)
+
+    small_city=False
+    if(map_extent2[1]-map_extent2[0] < 25):
+        small_city=True
+    if city:
+        utl.add_city_on_map(ax,map_extent=map_extent2,transform=datacrs,zorder=110,size=13,small_city=small_city)
+
+    utl.add_logo_extra_in_axes(pos=[-0.01,0.835,.1,.1],which='nmc', size='Xlarge',fig=fig)
+    return fig, ax, bax
+
+def gh_rain_layers(fig, ax, bax, gh=None, rain=None, atime=24, colorbar=True):
+
+    """
+    Data part of draw_gh_rain, the animation frames remove the
+    artists and draw the next forecast hour on the same figure.
+    :param colorbar: add the color bar (once per figure).
+    :return: plots, list of the drawn artists.
+    """
+
+    datacrs = ccrs.PlateCarree()
+
     # define return plots
     plots = {}
+    artists = []
     # draw mean sea level pressure
     if rain is not None:
         x, y = np.meshgrid(rain['lon'], rain['lat'])
@@ -73,6 +150,7 @@ def draw_gh_rain(gh=None, rain=None,atime=24,
         plots['rain'] = ax.pcolormesh(
             x,y,z, norm=norm,
             cmap=cmap, zorder=100,transform=datacrs,alpha=0.5)
+        artists.append(plots['rain'])
 
     # draw -hPa geopotential height
     if gh is not None:
@@ -81,65 +159,26 @@ def draw_gh_rain(gh=None, rain=None,atime=24,
         plots['gh'] = ax.contour(
             x, y, np.squeeze(gh['data']), clevs_gh, colors='black',
             linewidths=2, transform=datacrs, zorder=110)
-        plt.clabel(plots['gh'], inline=1, fontsize=20, fmt='%.0f',colors='black')
-
-    # grid lines
-    gl = ax.gridlines(
-        crs=datacrs, linewidth=2, color='gray', alpha=0.5, linestyle='--', zorder=40)
-    gl.xlocator = mpl.ticker.FixedLocator(np.arange(0, 360, 15))
-    gl.ylocator = mpl.ticker.FixedLocator(np.arange(-90, 90, 15))
-
-    #http://earthpy.org/cartopy_backgroung.html
-    #C:\ProgramData\Anaconda3\Lib\site-packages\cartopy\data\raster\natural_earth
-    ax.background_img(name='RD', resolution='high')
-
-    #forecast information
-    bax=plt.axes([0.01,0.835,.25,.1],facecolor='#FFFFFFCC')
-    bax.set_yticks([])
-    bax.set_xticks([])
-    bax.axis([0, 10, 0, 10])
+        artists.append(plots['gh'])
+        artists.extend(ax.clabel(plots['gh'], inline=1, fontsize=20, fmt='%.0f',colors='black'))
 
     initial_time = pd.to_datetime(
     str(gh['init_time'])).replace(tzinfo=None).to_pydatetime()
     fcst_time=initial_time+timedelta(hours=gh['fhour'])
     #发布时间
-    if(sys.platform[0:3] == 'lin'):
-        locale.setlocale(locale.LC_CTYPE, 'zh_CN')
-    if(sys.platform[0:3] == 'win'):        
-        locale.setlocale(locale.LC_CTYPE, 'chinese')
-    plt.text(2.5, 7.5,'起报时间: '+initial_time.strftime("%Y年%m月%d日%H时"),size=15)
-    plt.text(2.5, 5,'预报时间: '+fcst_time.strftime("%Y年%m月%d日%H时"),size=15)
-    plt.text(2.5, 2.5,'预报时效: '+str(gh['fhour'])+'小时',size=15)
-    plt.text(2.5, 0.5,'www.nmc.cn',size=15)
+    artists.append(bax.text(2.5, 7.5,'起报时间: '+utl.cn_time(initial_time, "%Y年%m月%d日%H时"),size=15))
+    artists.append(bax.text(2.5, 5,'预报时间: '+utl.cn_time(fcst_time, "%Y年%m月%d日%H时"),size=15))
+    artists.append(bax.text(2.5, 2.5,'预报时效: '+str(gh['fhour'])+'小时',size=15))
 
     # add color bar
-    if(rain != None):
-        cax=plt.axes([0.11,0.06,.86,.02])
-        cb = plt.colorbar(plots['rain'], cax=cax, orientation='horizontal')
+    if(colorbar and rain != None):
+        cax=fig.add_axes([0.11,0.06,.86,.02])
+        cb = fig.colorbar(plots['rain'], cax=cax, orientation='horizontal')
         cb.ax.tick_params(labelsize='x-large')                      
         cb.set_label(str(atime)+'h precipitation (mm)',size=20)
+    return plots, artists
 
-    # add south China sea
-    if south_China_sea:
-        utl.add_south_China_sea(pos=[0.85,0.13,.1,.2])
-
-    small_city=False
-    if(map_extent2[1]-map_extent2[0] < 25):
-        small_city=True
-    if city:
-        utl.add_city_on_map(ax,map_extent=map_extent2,transform=datacrs,zorder=110,size=13,small_city=small_city)
-
-    utl.add_logo_extra_in_axes(pos=[-0.01,0.835,.1,.1],which='nmc', size='Xlarge')
-
-    # show figure
-    if(output_dir != None):
-        plt.savefig(output_dir+'高度场_降水_预报_'+
-        '起报时间_'+initial_time.strftime("%Y年%m月%d日%H时")+
-        '预报时效_'+str(gh['fhour'])+'小时'+'.png', dpi=200)
-    
-    if(output_dir == None):
-        plt.show()
-
+@instrument.traced('draw')
 def draw_mslp_rain_snow(
         rain=None, snow=None,sleet=None,mslp=None,atime=None,
         map_extent=(50, 150, 0, 65),
@@ -147,11 +186,8 @@ def draw_mslp_rain_snow(
         add_china=True,city=True,south_China_sea=True,
         output_dir=None,Global=False):
 
-    plt.rcParams['font.sans-serif'] = ['SimHei'] # 步骤一（替换sans-serif字体）
-    plt.rcParams['axes.unicode_minus'] = False  # 步骤二（解决坐标轴负数的负号显示问题）
-
     # draw figure
-    plt.figure(figsize=(16,9))
+    fig = utl.new_figure(figsize=(16,9), interactive=(output_dir == None))
 
     # set data projection
     if(Global == True):
@@ -160,9 +196,9 @@ def draw_mslp_rain_snow(
         plotcrs = ccrs.AlbersEqualArea(central_latitude=(map_extent[2]+map_extent[3])/2., 
             central_longitude=(map_extent[0]+map_extent[1])/2., standard_parallels=[30., 60.])
  
-    ax = plt.axes([0.01,0.1,.98,.84], projection=plotcrs)
+    ax = fig.add_axes([0.01,0.1,.98,.84], projection=plotcrs)
     
-    plt.title('['+mslp['model']+'] '+
+    ax.set_title('['+mslp['model']+'] '+
     '海平面气压, '+
     str(atime)+'小时降水', 
         loc='left', fontsize=30)
@@ -225,7 +261,7 @@ def draw_mslp_rain_snow(
         plots['mslp'] = ax.contour(
             x, y, z, clevs_mslp, colors='black',
             linewidths=2, transform=datacrs, zorder=110)
-        plt.clabel(plots['mslp'], inline=1, fontsize=20, fmt='%.0f',colors='black')
+        ax.clabel(plots['mslp'], inline=1, fontsize=20, fmt='%.0f',colors='black')
 
     # grid lines
     gl = ax.gridlines(
@@ -235,10 +271,10 @@ def draw_mslp_rain_snow(
 
     #http://earthpy.org/cartopy_backgroung.html
     #C:\ProgramData\Anaconda3\Lib\site-packages\cartopy\data\raster\natural_earth
-    ax.background_img(name='RD', resolution='high')
+    ax.background_img(name='RD', resolution='high', cache=True)
 
     #forecast information
-    bax=plt.axes([0.01,0.835,.25,.1],facecolor='#FFFFFFCC')
+    bax=fig.add_axes([0.01,0.835,.25,.1],facecolor='#FFFFFFCC')
     bax.set_yticks([])
     bax.set_xticks([])
     bax.axis([0, 10, 0, 10])
@@ -247,37 +283,33 @@ def draw_mslp_rain_snow(
     str(mslp['init_time'])).replace(tzinfo=None).to_pydatetime()
     fcst_time=initial_time+timedelta(hours=mslp['fhour'])
     #发布时间
-    if(sys.platform[0:3] == 'lin'):
-        locale.setlocale(locale.LC_CTYPE, 'zh_CN')
-    if(sys.platform[0:3] == 'win'):        
-        locale.setlocale(locale.LC_CTYPE, 'chinese')
-    plt.text(2.5, 7.5,'起报时间: '+initial_time.strftime("%Y年%m月%d日%H时"),size=15)
-    plt.text(2.5, 5,'预报时间: '+fcst_time.strftime("%Y年%m月%d日%H时"),size=15)
-    plt.text(2.5, 2.5,'预报时效: '+str(mslp['fhour'])+'小时',size=15)
-    plt.text(2.5, 0.5,'www.nmc.cn',size=15)
+    bax.text(2.5, 7.5,'起报时间: '+utl.cn_time(initial_time, "%Y年%m月%d日%H时"),size=15)
+    bax.text(2.5, 5,'预报时间: '+utl.cn_time(fcst_time, "%Y年%m月%d日%H时"),size=15)
+    bax.text(2.5, 2.5,'预报时效: '+str(mslp['fhour'])+'小时',size=15)
+    bax.text(2.5, 0.5,'www.nmc.cn',size=15)
 
     # add color bar
     if(sleet != None):
-        cax=plt.axes([0.01,0.06,.30,.02])
-        cb = plt.colorbar(plots['sleet'], cax=cax, orientation='horizontal')
+        cax=fig.add_axes([0.01,0.06,.30,.02])
+        cb = fig.colorbar(plots['sleet'], cax=cax, orientation='horizontal')
         cb.ax.tick_params(labelsize='x-large')                      
         cb.set_label('雨夹雪 (mm)',size=20)
 
     if(snow != None):
-        cax=plt.axes([0.33,0.06,.30,.02])
-        cb = plt.colorbar(plots['snow'], cax=cax, orientation='horizontal')
+        cax=fig.add_axes([0.33,0.06,.30,.02])
+        cb = fig.colorbar(plots['snow'], cax=cax, orientation='horizontal')
         cb.ax.tick_params(labelsize='x-large')                      
         cb.set_label('雪 (mm)',size=20)
 
     if(rain != None):
-        cax=plt.axes([0.66,0.06,.30,.02])
-        cb = plt.colorbar(plots['rain'], cax=cax, orientation='horizontal')
+        cax=fig.add_axes([0.66,0.06,.30,.02])
+        cb = fig.colorbar(plots['rain'], cax=cax, orientation='horizontal')
         cb.ax.tick_params(labelsize='x-large')                      
         cb.set_label('雪 (mm)',size=20)
 
     # add south China sea
     if south_China_sea:
-        utl.add_south_China_sea(pos=[0.85,0.13,.1,.2])
+        utl.add_south_China_sea(pos=[0.85,0.13,.1,.2],fig=fig)
 
     small_city=False
     if(map_extent2[1]-map_extent2[0] < 25):
@@ -285,13 +317,17 @@ def draw_mslp_rain_snow(
     if city:
         utl.add_city_on_map(ax,map_extent=map_extent2,transform=datacrs,zorder=110,size=13,small_city=small_city)
 
-    utl.add_logo_extra_in_axes(pos=[-0.01,0.835,.1,.1],which='nmc', size='Xlarge')
+    utl.add_logo_extra_in_axes(pos=[-0.01,0.835,.1,.1],which='nmc', size='Xlarge',fig=fig)
 
     # show figure
     if(output_dir != None):
-        plt.savefig(output_dir+'海平面气压_降水_预报_'+
-        '起报时间_'+initial_time.strftime("%Y年%m月%d日%H时")+
-        '预报时效_'+str(mslp['fhour'])+'小时'+'.png', dpi=200)
+        with instrument.span('save'):
+            png_name=(output_dir+'海平面气压_降水_预报_'+
+            '起报时间_'+utl.cn_time(initial_time, "%Y年%m月%d日%H时")+
+            '预报时效_'+str(mslp['fhour'])+'小时'+'.png')
+            fig.savefig(png_name, dpi=200)
+        contour_export.export_plots(plots, png_name)
     
     if(output_dir == None):
-        plt.show()
\ No newline at end of file
+        plt.show()
+    utl.close_figure(fig)
\ No newline at end of file
@@ -1,41 +1,42 @@
 import numpy as np
-import matplotlib as mpl
-import matplotlib.pyplot as plt
-import cartopy.crs as ccrs
-import cartopy.feature as cfeature
-from cartopy.mpl.gridliner import LONGITUDE_FORMATTER, LATITUDE_FORMATTER
-from nmc_met_graphics.plot.china_map import add_china_map_2cartopy
-from nmc_met_graphics.cmap.cm import guide_cmaps
-from nmc_met_graphics.plot.util import add_model_title
+from nmc_met_map.lib.lazy import lazy_import, lazy_attr
+mpl = lazy_import('matplotlib')
+plt = lazy_import('matplotlib.pyplot')
+ccrs = lazy_import('cartopy.crs')
+cfeature = lazy_import('cartopy.feature')
+LONGITUDE_FORMATTER = lazy_attr('cartopy.mpl.gridliner', 'LONGITUDE_FORMATTER')
+LATITUDE_FORMATTER = lazy_attr('cartopy.mpl.gridliner', 'LATITUDE_FORMATTER')
+add_china_map_2cartopy = lazy_attr('nmc_met_graphics.plot.china_map', 'add_china_map_2cartopy')
+guide_cmaps = lazy_attr('nmc_met_graphics.cmap.cm', 'guide_cmaps')
+add_model_title = lazy_attr('nmc_met_graphics.plot.util', 'add_model_title')
 import nmc_met_map.lib.utility as utl
+from nmc_met_map.lib import instrument
 from datetime import datetime, timedelta
-import pandas as pd
-import locale
+pd = lazy_import('pandas')
 import sys
-from matplotlib.colors import BoundaryNorm,ListedColormap
-import nmc_met_graphics.cmap.ctables as dk_ctables
-import matplotlib.colors as col
-import matplotlib.cm as cm
+BoundaryNorm = lazy_attr('matplotlib.colors', 'BoundaryNorm')
+ListedColormap = lazy_attr('matplotlib.colors', 'ListedColormap')
+dk_ctables = lazy_import('nmc_met_graphics.cmap.ctables')
+col = lazy_import('matplotlib.colors')
+cm = lazy_import('matplotlib.cm')
     
+@instrument.traced('draw')
 def draw_Crosssection_Wind_Theta_e_absv(
                     cross_absv3d=None, cross_Theta_e=None, cross_u=None,cross_v=None,gh=None,
                     h_pos=None,st_point=None,ed_point=None,
                     levels=None,map_extent=(50, 150, 0, 65),
                     output_dir=None):
 
-    plt.rcParams['font.sans-serif'] = ['SimHei'] # 步骤一（替换sans-serif字体）
-    plt.rcParams['axes.unicode_minus'] = False  # 步骤二（解决坐标轴负数的负号显示问题）
-
 
 
     initial_time = pd.to_datetime(
     str(cross_Theta_e['forecast_reference_time'].values)).replace(tzinfo=None).to_pydatetime()
     fcst_time=initial_time+timedelta(hours=gh['forecast_period'].values[0])
     
-    fig = plt.figure(1, figsize=(16., 9.))
-    ax = plt.axes()
+    fig = utl.new_figure(figsize=(16., 9.), interactive=(output_dir == None))
+    ax = fig.add_subplot(111)
     absv_contour = ax.contourf(cross_absv3d['lon'], cross_absv3d['level'], cross_absv3d['data']*100000,
-                            levels=range(-60, 60, 1), cmap=plt.cm.RdBu_r)
+                            levels=range(-60, 60, 1), cmap=mpl.cm.RdBu_r)
     absv_colorbar = fig.colorbar(absv_contour)
 
     # Plot potential temperature using contour, with some custom labeling
@@ -80,49 +81,45 @@ def draw_Crosssection_Wind_Theta_e_absv(
     ax.set_xlabel('Longitude')
     absv_colorbar.set_label('Absolute Vorticity (dimensionless)')
 
-    if(sys.platform[0:3] == 'lin'):
-        locale.setlocale(locale.LC_CTYPE, 'zh_CN')
-    if(sys.platform[0:3] == 'win'):        
-        locale.setlocale(locale.LC_CTYPE, 'chinese')
     bax=fig.add_axes([0.10,0.88,.25,.07],facecolor='#FFFFFFCC')
     bax.axis('off')
     #bax.set_yticks([])
     #bax.set_xticks([])
     bax.axis([0, 10, 0, 10])        
-    plt.text(2.5, 7.5,'起报时间: '+initial_time.strftime("%Y年%m月%d日%H时"),size=11)
-    plt.text(2.5, 5,'预报时间: '+fcst_time.strftime("%Y年%m月%d日%H时"),size=11)
-    plt.text(2.5, 2.5,'预报时效: '+str(int(gh['forecast_period'].values[0]))+'小时',size=11)
-    plt.text(2.5, 0.5,'www.nmc.cn',size=11)
+    bax.text(2.5, 7.5,'起报时间: '+utl.cn_time(initial_time, "%Y年%m月%d日%H时"),size=11)
+    bax.text(2.5, 5,'预报时间: '+utl.cn_time(fcst_time, "%Y年%m月%d日%H时"),size=11)
+    bax.text(2.5, 2.5,'预报时效: '+str(int(gh['forecast_period'].values[0]))+'小时',size=11)
+    bax.text(2.5, 0.5,'www.nmc.cn',size=11)
 
-    utl.add_logo_extra_in_axes(pos=[0.1,0.88,.07,.07],which='nmc', size='Xlarge')
+    utl.add_logo_extra_in_axes(pos=[0.1,0.88,.07,.07],which='nmc', size='Xlarge',fig=fig)
 
     # show figure
     if(output_dir != None):
-        plt.savefig(output_dir+'相当位温_绝对涡度_水平风场_预报_'+
-        '起报时间_'+initial_time.strftime("%Y年%m月%d日%H时")+
-        '预报时效_'+str(int(gh['forecast_period'].values[0]))+'小时'+'.png', dpi=200)
+        with instrument.span('save'):
+            fig.savefig(output_dir+'相当位温_绝对涡度_水平风场_预报_'+
+            '起报时间_'+utl.cn_time(initial_time, "%Y年%m月%d日%H时")+
+            '预报时效_'+str(int(gh['forecast_period'].values[0]))+'小时'+'.png', dpi=200)
     
     if(output_dir == None):
         plt.show() 
+    utl.close_figure(fig)
 
 
+@instrument.traced('draw')
 def draw_Crosssection_Wind_Theta_e_RH(
                     cross_rh=None, cross_Theta_e=None, cross_u=None,cross_v=None,gh=None,
                     h_pos=None,st_point=None,ed_point=None,
                     levels=None,map_extent=(50, 150, 0, 65),
                     output_dir=None):
 
-    plt.rcParams['font.sans-serif'] = ['SimHei'] # 步骤一（替换sans-serif字体）
-    plt.rcParams['axes.unicode_minus'] = False  # 步骤二（解决坐标轴负数的负号显示问题）
-
 
 
     initial_time = pd.to_datetime(
     str(cross_Theta_e['forecast_reference_time'].values)).replace(tzinfo=None).to_pydatetime()
     fcst_time=initial_time+timedelta(hours=gh['forecast_period'].values[0])
     
-    fig = plt.figure(1, figsize=(16., 9.))
-    ax = plt.axes()
+    fig = utl.new_figure(figsize=(16., 9.), interactive=(output_dir == None))
+    ax = fig.add_subplot(111)
     rh_contour = ax.contourf(cross_rh['lon'], cross_rh['level'], cross_rh['data'],
                             levels=np.arange(0, 106, 5), cmap='YlGnBu')
     rh_colorbar = fig.colorbar(rh_contour)
@@ -169,48 +166,44 @@ def draw_Crosssection_Wind_Theta_e_RH(
     ax.set_xlabel('Longitude')
     rh_colorbar.set_label('Relative Humidity')
 
-    if(sys.platform[0:3] == 'lin'):
-        locale.setlocale(locale.LC_CTYPE, 'zh_CN')
-    if(sys.platform[0:3] == 'win'):        
-        locale.setlocale(locale.LC_CTYPE, 'chinese')
     bax=fig.add_axes([0.10,0.88,.25,.07],facecolor='#FFFFFFCC')
     bax.axis('off')
     #bax.set_yticks([])
     #bax.set_xticks([])
     bax.axis([0, 10, 0, 10])        
-    plt.text(2.5, 7.5,'起报时间: '+initial_time.strftime("%Y年%m月%d日%H时"),size=11)
-    plt.text(2.5, 5,'预报时间: '+fcst_time.strftime("%Y年%m月%d日%H时"),size=11)
-    plt.text(2.5, 2.5,'预报时效: '+str(int(gh['forecast_period'].values[0]))+'小时',size=11)
-    plt.text(2.5, 0.5,'www.nmc.cn',size=11)
+    bax.text(2.5, 7.5,'起报时间: '+utl.cn_time(initial_time, "%Y年%m月%d日%H时"),size=11)
+    bax.text(2.5, 5,'预报时间: '+utl.cn_time(fcst_time, "%Y年%m月%d日%H时"),size=11)
+    bax.text(2.5, 2.5,'预报时效: '+str(int(gh['forecast_period'].values[0]))+'小时',size=11)
+    bax.text(2.5, 0.5,'www.nmc.cn',size=11)
 
-    utl.add_logo_extra_in_axes(pos=[0.1,0.88,.07,.07],which='nmc', size='Xlarge')
+    utl.add_logo_extra_in_axes(pos=[0.1,0.88,.07,.07],which='nmc', size='Xlarge',fig=fig)
 
     # show figure
     if(output_dir != None):
-        plt.savefig(output_dir+'相当位温_相对湿度_水平风场_预报_'+
-        '起报时间_'+initial_time.strftime("%Y年%m月%d日%H时")+
-        '预报时效_'+str(int(gh['forecast_period'].values[0]))+'小时'+'.png', dpi=200)
+        with instrument.span('save'):
+            fig.savefig(output_dir+'相当位温_相对湿度_水平风场_预报_'+
+            '起报时间_'+utl.cn_time(initial_time, "%Y年%m月%d日%H时")+
+            '预报时效_'+str(int(gh['forecast_period'].values[0]))+'小时'+'.png', dpi=200)
     
     if(output_dir == None):
         plt.show()         
+    utl.close_figure(fig)
 
+@instrument.traced('draw')
 def draw_Crosssection_Wind_Theta_e_Qv(
                     cross_Qv=None, cross_Theta_e=None, cross_u=None,cross_v=None,gh=None,
                     h_pos=None,st_point=None,ed_point=None,
                     levels=None,map_extent=(50, 150, 0, 65),
                     output_dir=None):
 
-    plt.rcParams['font.sans-serif'] = ['SimHei'] # 步骤一（替换sans-serif字体）
-    plt.rcParams['axes.unicode_minus'] = False  # 步骤二（解决坐标轴负数的负号显示问题）
-
 
 
     initial_time = pd.to_datetime(
     str(cross_Theta_e['forecast_reference_time'].values)).replace(tzinfo=None).to_pydatetime()
     fcst_time=initial_time+timedelta(hours=gh['forecast_period'].values[0])
     
-    fig = plt.figure(1, figsize=(16., 9.))
-    ax = plt.axes()
+    fig = utl.new_figure(figsize=(16., 9.), interactive=(output_dir == None))
+    ax = fig.add_subplot(111)
     Qv_contour = ax.contourf(cross_Qv['lon'], cross_Qv['level'], cross_Qv.values,
                             levels=np.arange(0, 20, 2), cmap='YlGnBu')
     Qv_colorbar = fig.colorbar(Qv_contour)
@@ -257,41 +250,38 @@ def draw_Crosssection_Wind_Theta_e_Qv(
     ax.set_xlabel('Longitude')
     Qv_colorbar.set_label('Specific Humidity (g/kg)')
 
-    if(sys.platform[0:3] == 'lin'):
-        locale.setlocale(locale.LC_CTYPE, 'zh_CN')
-    if(sys.platform[0:3] == 'win'):        
-        locale.setlocale(locale.LC_CTYPE, 'chinese')
     bax=fig.add_axes([0.10,0.88,.25,.07],facecolor='#FFFFFFCC')
     bax.axis('off')
     #bax.set_yticks([])
     #bax.set_xticks([])
     bax.axis([0, 10, 0, 10])        
-    plt.text(2.5, 7.5,'起报时间: '+initial_time.strftime("%Y年%m月%d日%H时"),size=11)
-    plt.text(2.5, 5,'预报时间: '+fcst_time.strftime("%Y年%m月%d日%H时"),size=11)
-    plt.text(2.5, 2.5,'预报时效: '+str(int(gh['forecast_period'].values[0]))+'小时',size=11)
-    plt.text(2.5, 0.5,'www.nmc.cn',size=11)
+    bax.text(2.5, 7.5,'起报时间: '+utl.cn_time(initial_time, "%Y年%m月%d日%H时"),size=11)
+    bax.text(2.5, 5,'预报时间: '+utl.cn_time(fcst_time, "%Y年%m月%d日%H时"),size=11)
+    bax.text(2.5, 2.5,'预报时效: '+str(int(gh['forecast_period'].values[0]))+'小时',size=11)
+    bax.text(2.5, 0.5,'www.nmc.cn',size=11)
 
-    utl.add_logo_extra_in_axes(pos=[0.1,0.88,.07,.07],which='nmc', size='Xlarge')
+    utl.add_logo_extra_in_axes(pos=[0.1,0.88,.07,.07],which='nmc', size='Xlarge',fig=fig)
 
     # show figure
     if(output_dir != None):
-        plt.savefig(output_dir+'相当位温_绝对湿度_水平风场_预报_'+
-        '起报时间_'+initial_time.strftime("%Y年%m月%d日%H时")+
-        '预报时效_'+str(int(gh['forecast_period'].values[0]))+'小时'+'.png', dpi=200)
+        with instrument.span('save'):
+            fig.savefig(output_dir+'相当位温_绝对湿度_水平风场_预报_'+
+            '起报时间_'+utl.cn_time(initial_time, "%Y年%m月%d日%H时")+
+            '预报时效_'+str(int(gh['forecast_period'].values[0]))+'小时'+'.png', dpi=200)
     
     if(output_dir == None):
         plt.show()
+    utl.close_figure(fig)
 
+@instrument.traced('draw')
 def draw_Time_Crossection_rh_uv_t(
                     rh_2D=None, u_2D=None, v_2D=None,TMP_2D=None,
                     t_range=None,output_dir=None):   
 
-    plt.rcParams['font.sans-serif'] = ['SimHei'] # 步骤一（替换sans-serif字体）
-    plt.rcParams['axes.unicode_minus'] = False  # 步骤二（解决坐标轴负数的负号显示问题）                         
     # # 画图
     # Define the figure object and primary axes
-    fig = plt.figure(1, figsize=(16., 9.))
-    ax = plt.axes()
+    fig = utl.new_figure(figsize=(16., 9.), interactive=(output_dir == None))
+    ax = fig.add_subplot(111)
 
     # Plot RH using contourf
     #rh_contour = ax.contourf(rh_2D['time'].values, rh_2D['level'].values, np.squeeze(rh_2D['data'].values.swapaxes(1,0)),
@@ -310,7 +300,7 @@ def draw_Time_Crossection_rh_uv_t(
     TMP_contour.clabel(TMP_contour.levels[1::2], fontsize=15, colors='#F4511E', inline=1,
                         inline_spacing=8, fmt='%i', rightside_up=True, use_clabeltext=True)
 
-    xstklbls = mpl.dates.DateFormatter('%m月%d日%H时')
+    xstklbls = utl.cn_date_formatter('%m月%d日%H时')
     ax.xaxis.set_major_formatter(xstklbls)
     for label in ax.get_xticklabels():
         label.set_rotation(30)
@@ -328,43 +318,40 @@ def draw_Time_Crossection_rh_uv_t(
     ax.set_xlim([rh_2D['time'].values[0], rh_2D['time'].values[-1]])
 
     #forecast information
-    bax=plt.axes([0.10,0.88,.25,.07],facecolor='#FFFFFFCC')
+    bax=fig.add_axes([0.10,0.88,.25,.07],facecolor='#FFFFFFCC')
     bax.axis('off')
     bax.axis([0, 10, 0, 10])
 
     initial_time = pd.to_datetime(
         str(rh_2D['forecast_reference_time'].values)).replace(tzinfo=None).to_pydatetime()
-    if(sys.platform[0:3] == 'lin'):
-        locale.setlocale(locale.LC_CTYPE, 'zh_CN')
-    if(sys.platform[0:3] == 'win'):        
-        locale.setlocale(locale.LC_CTYPE, 'chinese')
-    plt.text(2.5, 7.5,'起报时间: '+initial_time.strftime("%Y年%m月%d日%H时"),size=11)
-    plt.text(2.5, 5.0,'['+str(rh_2D.attrs['model'])+']'+'模式时间剖面',size=11)
-    plt.text(2.5, 2.5,'预报点: '+str(rh_2D.attrs['points']['lon'])+
+    bax.text(2.5, 7.5,'起报时间: '+utl.cn_time(initial_time, "%Y年%m月%d日%H时"),size=11)
+    bax.text(2.5, 5.0,'['+str(rh_2D.attrs['model'])+']'+'模式时间剖面',size=11)
+    bax.text(2.5, 2.5,'预报点: '+str(rh_2D.attrs['points']['lon'])+
         ', '+str(rh_2D.attrs['points']['lat']),size=11)
-    plt.text(2.5, 0.5,'www.nmc.cn',size=11)
-    utl.add_logo_extra_in_axes(pos=[0.1,0.88,.07,.07],which='nmc', size='Xlarge')
+    bax.text(2.5, 0.5,'www.nmc.cn',size=11)
+    utl.add_logo_extra_in_axes(pos=[0.1,0.88,.07,.07],which='nmc', size='Xlarge',fig=fig)
     ax.set_title('温度, 相对湿度, 水平风', loc='right', fontsize=23)
 
     #出图——————————————————————————————————————————————————————————
     if(output_dir != None ):
-        plt.savefig(output_dir+'时间剖面产品_起报时间_'+
-        str(rh_2D['forecast_reference_time'].values)[0:13]+
-        '_预报时效_'+str(t_range[0])+'_至_'+str(t_range[1])
-        +'.png', dpi=200,bbox_inches='tight')
+        with instrument.span('save'):
+            fig.savefig(output_dir+'时间剖面产品_起报时间_'+
+            str(rh_2D['forecast_reference_time'].values)[0:13]+
+            '_预报时效_'+str(t_range[0])+'_至_'+str(t_range[1])
+            +'.png', dpi=200,bbox_inches='tight')
     else:
         plt.show()                                  
+    utl.close_figure(fig)
 
+@instrument.traced('draw')
 def draw_Time_Crossection_rh_uv_theta_e(
                     rh_2D=None, u_2D=None, v_2D=None,theta_e_2D=None,
                     t_range=None,output_dir=None):        
 
-    plt.rcParams['font.sans-serif'] = ['SimHei'] # 步骤一（替换sans-serif字体）
-    plt.rcParams['axes.unicode_minus'] = False  # 步骤二（解决坐标轴负数的负号显示问题）                    
     # # 画图
     # Define the figure object and primary axes
-    fig = plt.figure(1, figsize=(16., 9.))
-    ax = plt.axes()
+    fig = utl.new_figure(figsize=(16., 9.), interactive=(output_dir == None))
+    ax = fig.add_subplot(111)
 
  #   utl.add_public_title_sta(title=rh_2D.attrs['model']+'模式预报时间剖面',initial_time=rh_2D['forecast_reference_time'].values, fontsize=23)
 
@@ -385,7 +372,7 @@ def draw_Time_Crossection_rh_uv_theta_e(
     TMP_contour.clabel(TMP_contour.levels[1::2], fontsize=15, colors='#F4511E', inline=1,
                         inline_spacing=8, fmt='%i', rightside_up=True, use_clabeltext=True)
 
-    xstklbls = mpl.dates.DateFormatter('%m月%d日%H时')
+    xstklbls = utl.cn_date_formatter('%m月%d日%H时')
     ax.xaxis.set_major_formatter(xstklbls)
     for label in ax.get_xticklabels():
         label.set_rotation(30)
@@ -403,33 +390,32 @@ def draw_Time_Crossection_rh_uv_theta_e(
     ax.set_xlim([rh_2D['time'].values[0], rh_2D['time'].values[-1]])
 
     #forecast information
-    bax=plt.axes([0.10,0.88,.25,.07],facecolor='#FFFFFFCC')
+    bax=fig.add_axes([0.10,0.88,.25,.07],facecolor='#FFFFFFCC')
     bax.axis('off')
     bax.axis([0, 10, 0, 10])
 
     initial_time = pd.to_datetime(
         str(rh_2D['forecast_reference_time'].values)).replace(tzinfo=None).to_pydatetime()
-    if(sys.platform[0:3] == 'lin'):
-        locale.setlocale(locale.LC_CTYPE, 'zh_CN')
-    if(sys.platform[0:3] == 'win'):        
-        locale.setlocale(locale.LC_CTYPE, 'chinese')
-    plt.text(2.5, 7.5,'起报时间: '+initial_time.strftime("%Y年%m月%d日%H时"),size=11)
-    plt.text(2.5, 5.0,'['+str(rh_2D.attrs['model'])+']'+'模式时间剖面',size=11)
-    plt.text(2.5, 2.5,'预报点: '+str(rh_2D.attrs['points']['lon'])+
+    bax.text(2.5, 7.5,'起报时间: '+utl.cn_time(initial_time, "%Y年%m月%d日%H时"),size=11)
+    bax.text(2.5, 5.0,'['+str(rh_2D.attrs['model'])+']'+'模式时间剖面',size=11)
+    bax.text(2.5, 2.5,'预报点: '+str(rh_2D.attrs['points']['lon'])+
         ', '+str(rh_2D.attrs['points']['lat']),size=11)
-    plt.text(2.5, 0.5,'www.nmc.cn',size=11)
-    utl.add_logo_extra_in_axes(pos=[0.1,0.88,.07,.07],which='nmc', size='Xlarge')
+    bax.text(2.5, 0.5,'www.nmc.cn',size=11)
+    utl.add_logo_extra_in_axes(pos=[0.1,0.88,.07,.07],which='nmc', size='Xlarge',fig=fig)
     ax.set_title('相当位温, 相对湿度, 水平风', loc='right', fontsize=23)
 
     #出图——————————————————————————————————————————————————————————
     if(output_dir != None ):
-        plt.savefig(output_dir+'时间剖面产品_起报时间_'+
-        str(rh_2D['forecast_reference_time'].values)[0:13]+
-        '_预报时效_'+str(t_range[0])+'_至_'+str(t_range[1])
-        +'.png', dpi=200,bbox_inches='tight')
+        with instrument.span('save'):
+            fig.savefig(output_dir+'时间剖面产品_起报时间_'+
+            str(rh_2D['forecast_reference_time'].values)[0:13]+
+            '_预报时效_'+str(t_range[0])+'_至_'+str(t_range[1])
+            +'.png', dpi=200,bbox_inches='tight')
     else:
         plt.show()                                          
+    utl.close_figure(fig)
 
+@instrument.traced('draw')
 def draw_Crosssection_Wind_Temp_RH(
                     cross_rh=None, cross_Temp=None, cross_u=None,
                     cross_v=None,cross_terrain=None,
@@ -438,17 +424,14 @@ def draw_Crosssection_Wind_Temp_RH(
                     levels=None,map_extent=(50, 150, 0, 65),model=None,
                     output_dir=None):
 
-    plt.rcParams['font.sans-serif'] = ['SimHei'] # 步骤一（替换sans-serif字体）
-    plt.rcParams['axes.unicode_minus'] = False  # 步骤二（解决坐标轴负数的负号显示问题）
-
 
 
     initial_time = pd.to_datetime(
     str(cross_Temp['forecast_reference_time'].values)).replace(tzinfo=None).to_pydatetime()
     fcst_time=initial_time+timedelta(hours=gh['forecast_period'].values[0])
     
-    fig = plt.figure(1, figsize=(16., 9.))
-    ax = plt.axes()
+    fig = utl.new_figure(figsize=(16., 9.), interactive=(output_dir == None))
+    ax = fig.add_subplot(111)
     cross_rh['data'].values[cross_rh['data'].values > 100]=100
 
     # example 2: use the "fromList() method
@@ -521,41 +504,38 @@ def draw_Crosssection_Wind_Temp_RH(
     ax.set_xlabel('Longitude')
     rh_colorbar.set_label('Relative Humidity (%)')
 
-    if(sys.platform[0:3] == 'lin'):
-        locale.setlocale(locale.LC_CTYPE, 'zh_CN')
-    if(sys.platform[0:3] == 'win'):        
-        locale.setlocale(locale.LC_CTYPE, 'chinese')
     bax=fig.add_axes([0.10,0.88,.25,.07],facecolor='#FFFFFFCC')
     bax.axis('off')
     #bax.set_yticks([])
     #bax.set_xticks([])
     bax.axis([0, 10, 0, 10])        
-    plt.text(2.5, 7.5,'起报时间: '+initial_time.strftime("%Y年%m月%d日%H时"),size=11)
-    plt.text(2.5, 5,'预报时间: '+fcst_time.strftime("%Y年%m月%d日%H时"),size=11)
-    plt.text(2.5, 2.5,'预报时效: '+str(int(gh['forecast_period'].values[0]))+'小时',size=11)
-    plt.text(2.5, 0.5,'www.nmc.cn',size=11)
+    bax.text(2.5, 7.5,'起报时间: '+utl.cn_time(initial_time, "%Y年%m月%d日%H时"),size=11)
+    bax.text(2.5, 5,'预报时间: '+utl.cn_time(fcst_time, "%Y年%m月%d日%H时"),size=11)
+    bax.text(2.5, 2.5,'预报时效: '+str(int(gh['forecast_period'].values[0]))+'小时',size=11)
+    bax.text(2.5, 0.5,'www.nmc.cn',size=11)
 
-    utl.add_logo_extra_in_axes(pos=[0.1,0.88,.07,.07],which='nmc', size='Xlarge')
+    utl.add_logo_extra_in_axes(pos=[0.1,0.88,.07,.07],which='nmc', size='Xlarge',fig=fig)
 
     # show figure
     if(output_dir != None):
-        plt.savefig(output_dir+'温度_相对湿度_水平风场_预报_'+
-        '起报时间_'+initial_time.strftime("%Y年%m月%d日%H时")+
-        '预报时效_'+str(int(gh['forecast_period'].values[0]))+'小时'+'.png', dpi=200)
+        with instrument.span('save'):
+            fig.savefig(output_dir+'温度_相对湿度_水平风场_预报_'+
+            '起报时间_'+utl.cn_time(initial_time, "%Y年%m月%d日%H时")+
+            '预报时效_'+str(int(gh['forecast_period'].values[0]))+'小时'+'.png', dpi=200)
     
     if(output_dir == None):
         plt.show()                 
+    utl.close_figure(fig)
 
+@instrument.traced('draw')
 def draw_Time_Crossection_rh_uv_Temp(
                     rh_2D=None, u_2D=None, v_2D=None,TMP_2D=None,terrain_2D=None,
                     t_range=None,model=None,output_dir=None):        
 
-    plt.rcParams['font.sans-serif'] = ['SimHei'] # 步骤一（替换sans-serif字体）
-    plt.rcParams['axes.unicode_minus'] = False  # 步骤二（解决坐标轴负数的负号显示问题）                    
     # # 画图
     # Define the figure object and primary axes
-    fig = plt.figure(1, figsize=(16., 9.))
-    ax = plt.axes()
+    fig = utl.new_figure(figsize=(16., 9.), interactive=(output_dir == None))
+    ax = fig.add_subplot(111)
 
  #   utl.add_public_title_sta(title=rh_2D.attrs['model']+'模式预报时间剖面',initial_time=rh_2D['forecast_reference_time'].values, fontsize=23)
 
@@ -599,7 +579,7 @@ def draw_Time_Crossection_rh_uv_Temp(
         terrain_contour = ax.contourf(terrain_2D['time'].values, terrain_2D['level'].values,  np.squeeze(terrain_2D.values.swapaxes(1,0)),
                                 levels=np.arange(0, terrain_2D.values.max(), 0.1), cmap=cm.get_cmap('own3'),zorder=100)  
 
-    xstklbls = mpl.dates.DateFormatter('%m月%d日%H时')
+    xstklbls = utl.cn_date_formatter('%m月%d日%H时')
     ax.xaxis.set_major_formatter(xstklbls)
     for label in ax.get_xticklabels():
         label.set_rotation(30)
@@ -617,29 +597,27 @@ def draw_Time_Crossection_rh_uv_Temp(
     ax.set_xlim([rh_2D['time'].values[0], rh_2D['time'].values[-1]])
 
     #forecast information
-    bax=plt.axes([0.10,0.88,.25,.07],facecolor='#FFFFFFCC')
+    bax=fig.add_axes([0.10,0.88,.25,.07],facecolor='#FFFFFFCC')
     bax.axis('off')
     bax.axis([0, 10, 0, 10])
 
     initial_time = pd.to_datetime(
         str(rh_2D['forecast_reference_time'].values)).replace(tzinfo=None).to_pydatetime()
-    if(sys.platform[0:3] == 'lin'):
-        locale.setlocale(locale.LC_CTYPE, 'zh_CN')
-    if(sys.platform[0:3] == 'win'):        
-        locale.setlocale(locale.LC_CTYPE, 'chinese')
-    plt.text(2.5, 7.5,'起报时间: '+initial_time.strftime("%Y年%m月%d日%H时"),size=11)
-    plt.text(2.5, 5.0,'['+str(rh_2D.attrs['model'])+']'+'模式时间剖面',size=11)
-    plt.text(2.5, 2.5,'预报点: '+str(rh_2D.attrs['points']['lon'])+
+    bax.text(2.5, 7.5,'起报时间: '+utl.cn_time(initial_time, "%Y年%m月%d日%H时"),size=11)
+    bax.text(2.5, 5.0,'['+str(rh_2D.attrs['model'])+']'+'模式时间剖面',size=11)
+    bax.text(2.5, 2.5,'预报点: '+str(rh_2D.attrs['points']['lon'])+
         ', '+str(rh_2D.attrs['points']['lat']),size=11)
-    plt.text(2.5, 0.5,'www.nmc.cn',size=11)
-    utl.add_logo_extra_in_axes(pos=[0.1,0.88,.07,.07],which='nmc', size='Xlarge')
+    bax.text(2.5, 0.5,'www.nmc.cn',size=11)
+    utl.add_logo_extra_in_axes(pos=[0.1,0.88,.07,.07],which='nmc', size='Xlarge',fig=fig)
     ax.set_title('['+model+'] '+'温度, 相对湿度, 水平风', loc='right', fontsize=23)
 
     #出图——————————————————————————————————————————————————————————
     if(output_dir != None ):
-        plt.savefig(output_dir+'时间剖面产品_起报时间_'+
-        str(rh_2D['forecast_reference_time'].values)[0:13]+
-        '_预报时效_'+str(t_range[0])+'_至_'+str(t_range[1])
-        +'.png', dpi=200,bbox_inches='tight')
+        with instrument.span('save'):
+            fig.savefig(output_dir+'时间剖面产品_起报时间_'+
+            str(rh_2D['forecast_reference_time'].values)[0:13]+
+            '_预报时效_'+str(t_range[0])+'_至_'+str(t_range[1])
+            +'.png', dpi=200,bbox_inches='tight')
     else:
-        plt.show()                                
\ No newline at end of file
+        plt.show()                                
+    utl.close_figure(fig)
\ No newline at end of file
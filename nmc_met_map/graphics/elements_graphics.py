@@ -1,34 +1,35 @@
 # _*_ coding: utf-8 _*_
 
 import numpy as np
-import matplotlib as mpl
-import matplotlib.pyplot as plt
-import cartopy.crs as ccrs
-import cartopy.feature as cfeature
-from cartopy.mpl.gridliner import LONGITUDE_FORMATTER, LATITUDE_FORMATTER
-from nmc_met_graphics.plot.china_map import add_china_map_2cartopy
-from nmc_met_graphics.cmap.cm import guide_cmaps
-from nmc_met_graphics.plot.util import add_model_title
+from nmc_met_map.lib.lazy import lazy_import, lazy_attr
+mpl = lazy_import('matplotlib')
+plt = lazy_import('matplotlib.pyplot')
+ccrs = lazy_import('cartopy.crs')
+cfeature = lazy_import('cartopy.feature')
+LONGITUDE_FORMATTER = lazy_attr('cartopy.mpl.gridliner', 'LONGITUDE_FORMATTER')
+LATITUDE_FORMATTER = lazy_attr('cartopy.mpl.gridliner', 'LATITUDE_FORMATTER')
+add_china_map_2cartopy = lazy_attr('nmc_met_graphics.plot.china_map', 'add_china_map_2cartopy')
+guide_cmaps = lazy_attr('nmc_met_graphics.cmap.cm', 'guide_cmaps')
+add_model_title = lazy_attr('nmc_met_graphics.plot.util', 'add_model_title')
 import nmc_met_map.lib.utility as utl
+from nmc_met_map.lib import instrument
 from datetime import datetime, timedelta
-import pandas as pd
-import locale
+pd = lazy_import('pandas')
 import sys
-from matplotlib.colors import BoundaryNorm,ListedColormap
-import nmc_met_graphics.cmap.ctables as dk_ctables
-from scipy.ndimage import gaussian_filter
+BoundaryNorm = lazy_attr('matplotlib.colors', 'BoundaryNorm')
+ListedColormap = lazy_attr('matplotlib.colors', 'ListedColormap')
+dk_ctables = lazy_import('nmc_met_graphics.cmap.ctables')
+gaussian_filter = lazy_attr('scipy.ndimage', 'gaussian_filter')
 
+@instrument.traced('draw')
 def draw_T_2m(T_2m=None,
             map_extent=(50, 150, 0, 65),
             regrid_shape=20,
             add_china=True,city=True,south_China_sea=True,
             output_dir=None,Global=False):
 
-    plt.rcParams['font.sans-serif'] = ['SimHei'] # 步骤一（替换sans-serif字体）
-    plt.rcParams['axes.unicode_minus'] = False  # 步骤二（解决坐标轴负数的负号显示问题）
-
     # draw figure
-    plt.figure(figsize=(16,9))
+    fig = utl.new_figure(figsize=(16,9), interactive=(output_dir == None))
 
     # set data projection
     if(Global == True):
@@ -37,9 +38,9 @@ def draw_T_2m(T_2m=None,
         plotcrs = ccrs.AlbersEqualArea(central_latitude=(map_extent[2]+map_extent[3])/2., 
             central_longitude=(map_extent[0]+map_extent[1])/2., standard_parallels=[30., 60.])
  
-    ax = plt.axes([0.01,0.1,.98,.84], projection=plotcrs)
+    ax = fig.add_axes([0.01,0.1,.98,.84], projection=plotcrs)
         
-    plt.title('['+T_2m['model']+']'+' '+T_2m['title'], 
+    ax.set_title('['+T_2m['model']+']'+' '+T_2m['title'], 
         loc='left', fontsize=30)
         
     datacrs = ccrs.PlateCarree()
@@ -85,10 +86,10 @@ def draw_T_2m(T_2m=None,
 
     #http://earthpy.org/cartopy_backgroung.html
     #C:\ProgramData\Anaconda3\Lib\site-packages\cartopy\data\raster\natural_earth
-    ax.background_img(name='RD', resolution='high')
+    ax.background_img(name='RD', resolution='high', cache=True)
 
     #forecast information
-    bax=plt.axes([0.01,0.835,.25,.1],facecolor='#FFFFFFCC')
+    bax=fig.add_axes([0.01,0.835,.25,.1],facecolor='#FFFFFFCC')
     bax.set_yticks([])
     bax.set_xticks([])
     bax.axis([0, 10, 0, 10])
@@ -97,25 +98,21 @@ def draw_T_2m(T_2m=None,
     str(T_2m['init_time'])).replace(tzinfo=None).to_pydatetime()
     fcst_time=initial_time+timedelta(hours=T_2m['fhour'])
     #发布时间
-    if(sys.platform[0:3] == 'lin'):
-        locale.setlocale(locale.LC_CTYPE, 'zh_CN')
-    if(sys.platform[0:3] == 'win'):        
-        locale.setlocale(locale.LC_CTYPE, 'chinese')
-    plt.text(2.5, 7.5,'起报时间: '+initial_time.strftime("%Y年%m月%d日%H时"),size=15)
-    plt.text(2.5, 5,'预报时间: '+fcst_time.strftime("%Y年%m月%d日%H时"),size=15)
-    plt.text(2.5, 2.5,'预报时效: '+str(T_2m['fhour'])+'小时',size=15)
-    plt.text(2.5, 0.5,'www.nmc.cn',size=15)
+    bax.text(2.5, 7.5,'起报时间: '+utl.cn_time(initial_time, "%Y年%m月%d日%H时"),size=15)
+    bax.text(2.5, 5,'预报时间: '+utl.cn_time(fcst_time, "%Y年%m月%d日%H时"),size=15)
+    bax.text(2.5, 2.5,'预报时效: '+str(T_2m['fhour'])+'小时',size=15)
+    bax.text(2.5, 0.5,'www.nmc.cn',size=15)
 
     # add color bar
     if(T_2m != None):
-        cax=plt.axes([0.11,0.06,.86,.02])
-        cb = plt.colorbar(plots['T_2m'], cax=cax, orientation='horizontal')
+        cax=fig.add_axes([0.11,0.06,.86,.02])
+        cb = fig.colorbar(plots['T_2m'], cax=cax, orientation='horizontal')
         cb.ax.tick_params(labelsize='x-large')                      
         cb.set_label(u'°C',size=20)
 
     # add south China sea
     if south_China_sea:
-        utl.add_south_China_sea(pos=[0.85,0.13,.1,.2])
+        utl.add_south_China_sea(pos=[0.85,0.13,.1,.2],fig=fig)
 
     small_city=False
     if(map_extent2[1]-map_extent2[0] < 25):
@@ -123,27 +120,27 @@ def draw_T_2m(T_2m=None,
     if city:
         utl.add_city_on_map(ax,map_extent=map_extent2,transform=datacrs,zorder=110,size=13,small_city=small_city)
 
-    utl.add_logo_extra_in_axes(pos=[-0.01,0.835,.1,.1],which='nmc', size='Xlarge')
+    utl.add_logo_extra_in_axes(pos=[-0.01,0.835,.1,.1],which='nmc', size='Xlarge',fig=fig)
 
     # show figure
     if(output_dir != None):
-        plt.savefig(output_dir+'最低温度_预报_'+
-        '起报时间_'+initial_time.strftime("%Y年%m月%d日%H时")+
-        '预报时效_'+str(T_2m['fhour'])+'小时'+'.png', dpi=200)
+        with instrument.span('save'):
+            fig.savefig(output_dir+'最低温度_预报_'+
+            '起报时间_'+utl.cn_time(initial_time, "%Y年%m月%d日%H时")+
+            '预报时效_'+str(T_2m['fhour'])+'小时'+'.png', dpi=200)
     if(output_dir == None):
         plt.show()
+    utl.close_figure(fig)
 
+@instrument.traced('draw')
 def draw_T2m_mslp_uv10m(t2m=None, mslp=None, uv10m=None,
                     map_extent=(50, 150, 0, 65),
                     regrid_shape=20,
                     add_china=True,city=True,south_China_sea=True,
                     output_dir=None,Global=False):
 
-    plt.rcParams['font.sans-serif'] = ['SimHei'] # 步骤一（替换sans-serif字体）
-    plt.rcParams['axes.unicode_minus'] = False  # 步骤二（解决坐标轴负数的负号显示问题）
-
     # draw figure
-    plt.figure(figsize=(16,9))
+    fig = utl.new_figure(figsize=(16,9), interactive=(output_dir == None))
 
     # set data projection
     if(Global == True):
@@ -152,9 +149,9 @@ def draw_T2m_mslp_uv10m(t2m=None, mslp=None, uv10m=None,
         plotcrs = ccrs.AlbersEqualArea(central_latitude=(map_extent[2]+map_extent[3])/2., 
             central_longitude=(map_extent[0]+map_extent[1])/2., standard_parallels=[30., 60.])
  
-    ax = plt.axes([0.01,0.1,.98,.84], projection=plotcrs)
+    ax = fig.add_axes([0.01,0.1,.98,.84], projection=plotcrs)
     
-    plt.title('['+mslp['model']+'] '+
+    ax.set_title('['+mslp['model']+'] '+
         '海平面气压, '+
         '10米风场, '+
         '2米 温度', 
@@ -207,7 +204,7 @@ def draw_T2m_mslp_uv10m(t2m=None, mslp=None, uv10m=None,
         plots['mslp'] = ax.contour(
             x, y, z, clevs_mslp, colors='black',
             linewidths=2, transform=datacrs, zorder=110)
-        plt.clabel(plots['mslp'], inline=1, fontsize=20, fmt='%.0f',colors='black')
+        ax.clabel(plots['mslp'], inline=1, fontsize=20, fmt='%.0f',colors='black')
 
     # grid lines
     gl = ax.gridlines(
@@ -217,10 +214,10 @@ def draw_T2m_mslp_uv10m(t2m=None, mslp=None, uv10m=None,
 
     #http://earthpy.org/cartopy_backgroung.html
     #C:\ProgramData\Anaconda3\Lib\site-packages\cartopy\data\raster\natural_earth
-    ax.background_img(name='RD', resolution='high')
+    ax.background_img(name='RD', resolution='high', cache=True)
 
     #forecast information
-    bax=plt.axes([0.01,0.835,.25,.1],facecolor='#FFFFFFCC')
+    bax=fig.add_axes([0.01,0.835,.25,.1],facecolor='#FFFFFFCC')
     bax.set_yticks([])
     bax.set_xticks([])
     bax.axis([0, 10, 0, 10])
@@ -229,25 +226,21 @@ def draw_T2m_mslp_uv10m(t2m=None, mslp=None, uv10m=None,
     str(mslp['init_time'])).replace(tzinfo=None).to_pydatetime()
     fcst_time=initial_time+timedelta(hours=mslp['fhour'])
     #发布时间
-    if(sys.platform[0:3] == 'lin'):
-        locale.setlocale(locale.LC_CTYPE, 'zh_CN')
-    if(sys.platform[0:3] == 'win'):        
-        locale.setlocale(locale.LC_CTYPE, 'chinese')
-    plt.text(2.5, 7.5,'起报时间: '+initial_time.strftime("%Y年%m月%d日%H时"),size=15)
-    plt.text(2.5, 5,'预报时间: '+fcst_time.strftime("%Y年%m月%d日%H时"),size=15)
-    plt.text(2.5, 2.5,'预报时效: '+str(mslp['fhour'])+'小时',size=15)
-    plt.text(2.5, 0.5,'www.nmc.cn',size=15)
+    bax.text(2.5, 7.5,'起报时间: '+utl.cn_time(initial_time, "%Y年%m月%d日%H时"),size=15)
+    bax.text(2.5, 5,'预报时间: '+utl.cn_time(fcst_time, "%Y年%m月%d日%H时"),size=15)
+    bax.text(2.5, 2.5,'预报时效: '+str(mslp['fhour'])+'小时',size=15)
+    bax.text(2.5, 0.5,'www.nmc.cn',size=15)
 
     # add color bar
     if(t2m != None):
-        cax=plt.axes([0.11,0.06,.86,.02])
-        cb = plt.colorbar(plots['t2m'], cax=cax, orientation='horizontal')
+        cax=fig.add_axes([0.11,0.06,.86,.02])
+        cb = fig.colorbar(plots['t2m'], cax=cax, orientation='horizontal')
         cb.ax.tick_params(labelsize='x-large')                      
         cb.set_label('Temperature at 2m Above Ground ('+u'°C'+')',size=20)
 
     # add south China sea
     if south_China_sea:
-        utl.add_south_China_sea(pos=[0.85,0.13,.1,.2])
+        utl.add_south_China_sea(pos=[0.85,0.13,.1,.2],fig=fig)
 
     small_city=False
     if(map_extent2[1]-map_extent2[0] < 25):
@@ -255,29 +248,29 @@ def draw_T2m_mslp_uv10m(t2m=None, mslp=None, uv10m=None,
     if city:
         utl.add_city_on_map(ax,map_extent=map_extent2,transform=datacrs,zorder=110,size=13,small_city=small_city)
 
-    utl.add_logo_extra_in_axes(pos=[-0.01,0.835,.1,.1],which='nmc', size='Xlarge')
+    utl.add_logo_extra_in_axes(pos=[-0.01,0.835,.1,.1],which='nmc', size='Xlarge',fig=fig)
 
     # show figure
     if(output_dir != None):
-        plt.savefig(output_dir+'海平面气压_10米风场_2米温度_预报_'+
-        '起报时间_'+initial_time.strftime("%Y年%m月%d日%H时")+
-        '预报时效_'+str(mslp['fhour'])+'小时'+'.png', dpi=200)
+        with instrument.span('save'):
+            fig.savefig(output_dir+'海平面气压_10米风场_2米温度_预报_'+
+            '起报时间_'+utl.cn_time(initial_time, "%Y年%m月%d日%H时")+
+            '预报时效_'+str(mslp['fhour'])+'小时'+'.png', dpi=200)
     
     if(output_dir == None):
         plt.show()                           
+    utl.close_figure(fig)
     
 
+@instrument.traced('draw')
 def draw_mslp_gust10m(gust=None, mslp=None,
                     map_extent=(50, 150, 0, 65),
                     regrid_shape=20,
                     add_china=True,city=True,south_China_sea=True,
                     output_dir=None,Global=False):
 
-    plt.rcParams['font.sans-serif'] = ['SimHei'] # 步骤一（替换sans-serif字体）
-    plt.rcParams['axes.unicode_minus'] = False  # 步骤二（解决坐标轴负数的负号显示问题）
-
     # draw figure
-    plt.figure(figsize=(16,9))
+    fig = utl.new_figure(figsize=(16,9), interactive=(output_dir == None))
 
     # set data projection
     if(Global == True):
@@ -286,9 +279,9 @@ def draw_mslp_gust10m(gust=None, mslp=None,
         plotcrs = ccrs.AlbersEqualArea(central_latitude=(map_extent[2]+map_extent[3])/2., 
             central_longitude=(map_extent[0]+map_extent[1])/2., standard_parallels=[30., 60.])
  
-    ax = plt.axes([0.01,0.1,.98,.84], projection=plotcrs)
+    ax = fig.add_axes([0.01,0.1,.98,.84], projection=plotcrs)
     
-    plt.title('['+mslp['model']+'] '+
+    ax.set_title('['+mslp['model']+'] '+
         '海平面气压, '+
         '逐6小时最大阵风 ', 
         loc='left', fontsize=30)
@@ -330,7 +323,7 @@ def draw_mslp_gust10m(gust=None, mslp=None,
         plots['mslp'] = ax.contour(
             x, y, z, clevs_mslp, colors='black',
             linewidths=1, transform=datacrs, zorder=110)
-        plt.clabel(plots['mslp'], inline=1, fontsize=15, fmt='%.0f',colors='black')
+        ax.clabel(plots['mslp'], inline=1, fontsize=15, fmt='%.0f',colors='black')
 
     # grid lines
     gl = ax.gridlines(
@@ -340,10 +333,10 @@ def draw_mslp_gust10m(gust=None, mslp=None,
 
     #http://earthpy.org/cartopy_backgroung.html
     #C:\ProgramData\Anaconda3\Lib\site-packages\cartopy\data\raster\natural_earth
-    ax.background_img(name='RD', resolution='high')
+    ax.background_img(name='RD', resolution='high', cache=True)
 
     #forecast information
-    bax=plt.axes([0.01,0.835,.25,.1],facecolor='#FFFFFFCC')
+    bax=fig.add_axes([0.01,0.835,.25,.1],facecolor='#FFFFFFCC')
     bax.set_yticks([])
     bax.set_xticks([])
     bax.axis([0, 10, 0, 10])
@@ -352,25 +345,21 @@ def draw_mslp_gust10m(gust=None, mslp=None,
     str(mslp['init_time'])).replace(tzinfo=None).to_pydatetime()
     fcst_time=initial_time+timedelta(hours=mslp['fhour'])
     #发布时间
-    if(sys.platform[0:3] == 'lin'):
-        locale.setlocale(locale.LC_CTYPE, 'zh_CN')
-    if(sys.platform[0:3] == 'win'):        
-        locale.setlocale(locale.LC_CTYPE, 'chinese')
-    plt.text(2.5, 7.5,'起报时间: '+initial_time.strftime("%Y年%m月%d日%H时"),size=15)
-    plt.text(2.5, 5,'预报时间: '+fcst_time.strftime("%Y年%m月%d日%H时"),size=15)
-    plt.text(2.5, 2.5,'预报时效: '+str(mslp['fhour'])+'小时',size=15)
-    plt.text(2.5, 0.5,'www.nmc.cn',size=15)
+    bax.text(2.5, 7.5,'起报时间: '+utl.cn_time(initial_time, "%Y年%m月%d日%H时"),size=15)
+    bax.text(2.5, 5,'预报时间: '+utl.cn_time(fcst_time, "%Y年%m月%d日%H时"),size=15)
+    bax.text(2.5, 2.5,'预报时效: '+str(mslp['fhour'])+'小时',size=15)
+    bax.text(2.5, 0.5,'www.nmc.cn',size=15)
 
     # add color bar
     if(gust != None):
-        cax=plt.axes([0.11,0.06,.86,.02])
-        cb = plt.colorbar(plots['gust'], cax=cax, orientation='horizontal')
+        cax=fig.add_axes([0.11,0.06,.86,.02])
+        cb = fig.colorbar(plots['gust'], cax=cax, orientation='horizontal')
         cb.ax.tick_params(labelsize='x-large')                      
         cb.set_label('风速 (m/s)',size=20)
 
     # add south China sea
     if south_China_sea:
-        utl.add_south_China_sea(pos=[0.85,0.13,.1,.2])
+        utl.add_south_China_sea(pos=[0.85,0.13,.1,.2],fig=fig)
 
     small_city=False
     if(map_extent2[1]-map_extent2[0] < 25):
@@ -378,28 +367,28 @@ def draw_mslp_gust10m(gust=None, mslp=None,
     if city:
         utl.add_city_on_map(ax,map_extent=map_extent2,transform=datacrs,zorder=110,size=13,small_city=small_city)
 
-    utl.add_logo_extra_in_axes(pos=[-0.01,0.835,.1,.1],which='nmc', size='Xlarge')
+    utl.add_logo_extra_in_axes(pos=[-0.01,0.835,.1,.1],which='nmc', size='Xlarge',fig=fig)
 
     # show figure
     if(output_dir != None):
-        plt.savefig(output_dir+'海平面气压_逐6小时最大风速_预报_'+
-        '起报时间_'+initial_time.strftime("%Y年%m月%d日%H时")+
-        '预报时效_'+str(mslp['fhour'])+'小时'+'.png', dpi=200)
+        with instrument.span('save'):
+            fig.savefig(output_dir+'海平面气压_逐6小时最大风速_预报_'+
+            '起报时间_'+utl.cn_time(initial_time, "%Y年%m月%d日%H时")+
+            '预报时效_'+str(mslp['fhour'])+'小时'+'.png', dpi=200)
     
     if(output_dir == None):
         plt.show()                           
+    utl.close_figure(fig)
 
+@instrument.traced('draw')
 def draw_low_level_wind(uv=None,wsp=None,
                     map_extent=(50, 150, 0, 65),
                     regrid_shape=20,
                     add_china=True,city=True,south_China_sea=True,
                     output_dir=None,Global=False):
 
-    plt.rcParams['font.sans-serif'] = ['SimHei'] # 步骤一（替换sans-serif字体）
-    plt.rcParams['axes.unicode_minus'] = False  # 步骤二（解决坐标轴负数的负号显示问题）
-
     # draw figure
-    plt.figure(figsize=(16,9))
+    fig = utl.new_figure(figsize=(16,9), interactive=(output_dir == None))
 
     # set data projection
     if(Global == True):
@@ -408,9 +397,9 @@ def draw_low_level_wind(uv=None,wsp=None,
         plotcrs = ccrs.AlbersEqualArea(central_latitude=(map_extent[2]+map_extent[3])/2., 
             central_longitude=(map_extent[0]+map_extent[1])/2., standard_parallels=[30., 60.])
  
-    ax = plt.axes([0.01,0.1,.98,.84], projection=plotcrs)
+    ax = fig.add_axes([0.01,0.1,.98,.84], projection=plotcrs)
     
-    plt.title('['+uv['model']+'] '+
+    ax.set_title('['+uv['model']+'] '+
     uv['lev']+' 风场, 风速', 
         loc='left', fontsize=30)
         
@@ -472,10 +461,10 @@ def draw_low_level_wind(uv=None,wsp=None,
 
     #http://earthpy.org/cartopy_backgroung.html
     #C:\ProgramData\Anaconda3\Lib\site-packages\cartopy\data\raster\natural_earth
-    ax.background_img(name='RD', resolution='high')
+    ax.background_img(name='RD', resolution='high', cache=True)
 
     #forecast information
-    bax=plt.axes([0.01,0.835,.25,.1],facecolor='#FFFFFFCC')
+    bax=fig.add_axes([0.01,0.835,.25,.1],facecolor='#FFFFFFCC')
     bax.set_yticks([])
     bax.set_xticks([])
     bax.axis([0, 10, 0, 10])
@@ -484,25 +473,21 @@ def draw_low_level_wind(uv=None,wsp=None,
     str(uv['init_time'])).replace(tzinfo=None).to_pydatetime()
     fcst_time=initial_time+timedelta(hours=uv['fhour'])
     #发布时间
-    if(sys.platform[0:3] == 'lin'):
-        locale.setlocale(locale.LC_CTYPE, 'zh_CN')
-    if(sys.platform[0:3] == 'win'):        
-        locale.setlocale(locale.LC_CTYPE, 'chinese')
-    plt.text(2.5, 7.5,'起报时间: '+initial_time.strftime("%Y年%m月%d日%H时"),size=15)
-    plt.text(2.5, 5,'预报时间: '+fcst_time.strftime("%Y年%m月%d日%H时"),size=15)
-    plt.text(2.5, 2.5,'预报时效: '+str(uv['fhour'])+'小时',size=15)
-    plt.text(2.5, 0.5,'www.nmc.cn',size=15)
+    bax.text(2.5, 7.5,'起报时间: '+utl.cn_time(initial_time, "%Y年%m月%d日%H时"),size=15)
+    bax.text(2.5, 5,'预报时间: '+utl.cn_time(fcst_time, "%Y年%m月%d日%H时"),size=15)
+    bax.text(2.5, 2.5,'预报时效: '+str(uv['fhour'])+'小时',size=15)
+    bax.text(2.5, 0.5,'www.nmc.cn',size=15)
 
     # add color bar
     if(wsp != None):
-        cax=plt.axes([0.11,0.06,.86,.02])
-        cb = plt.colorbar(plots['wsp'], cax=cax, orientation='horizontal',
+        cax=fig.add_axes([0.11,0.06,.86,.02])
+        cb = fig.colorbar(plots['wsp'], cax=cax, orientation='horizontal',
                       extend='max',extendrect=False)
         cb.ax.tick_params(labelsize='x-large') 
         cb.set_label('(m/s)',size=20)
     # add south China sea
     if south_China_sea:
-        utl.add_south_China_sea(pos=[0.85,0.13,.1,.2])
+        utl.add_south_China_sea(pos=[0.85,0.13,.1,.2],fig=fig)
 
     small_city=False
     if(map_extent2[1]-map_extent2[0] < 25):
@@ -510,13 +495,15 @@ def draw_low_level_wind(uv=None,wsp=None,
     if city:
         utl.add_city_on_map(ax,map_extent=map_extent2,transform=datacrs,zorder=110,size=13,small_city=small_city)
 
-    utl.add_logo_extra_in_axes(pos=[-0.01,0.835,.1,.1],which='nmc', size='Xlarge')
+    utl.add_logo_extra_in_axes(pos=[-0.01,0.835,.1,.1],which='nmc', size='Xlarge',fig=fig)
 
     # show figure
     if(output_dir != None):
-        plt.savefig(output_dir+'低层风_预报_'+
-        '起报时间_'+initial_time.strftime("%Y年%m月%d日%H时")+
-        '预报时效_'+str(uv['fhour'])+'小时'+'.png', dpi=200)
+        with instrument.span('save'):
+            fig.savefig(output_dir+'低层风_预报_'+
+            '起报时间_'+utl.cn_time(initial_time, "%Y年%m月%d日%H时")+
+            '预报时效_'+str(uv['fhour'])+'小时'+'.png', dpi=200)
     
     if(output_dir == None):
-        plt.show()
\ No newline at end of file
+        plt.show()
+    utl.close_figure(fig)
\ No newline at end of file
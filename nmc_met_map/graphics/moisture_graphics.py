@@ -4,34 +4,35 @@
 # Distributed under the terms of the GPL V3 License.
 
 import numpy as np
-import matplotlib as mpl
-import matplotlib.pyplot as plt
-import cartopy.crs as ccrs
-import cartopy.feature as cfeature
-from cartopy.mpl.gridliner import LONGITUDE_FORMATTER, LATITUDE_FORMATTER
-from nmc_met_graphics.plot.china_map import add_china_map_2cartopy
-from nmc_met_graphics.cmap.cm import guide_cmaps
-from nmc_met_graphics.plot.util import add_model_title
+from nmc_met_map.lib.lazy import lazy_import, lazy_attr
+mpl = lazy_import('matplotlib')
+plt = lazy_import('matplotlib.pyplot')
+ccrs = lazy_import('cartopy.crs')
+cfeature = lazy_import('cartopy.feature')
+LONGITUDE_FORMATTER = lazy_attr('cartopy.mpl.gridliner', 'LONGITUDE_FORMATTER')
+LATITUDE_FORMATTER = lazy_attr('cartopy.mpl.gridliner', 'LATITUDE_FORMATTER')
+add_china_map_2cartopy = lazy_attr('nmc_met_graphics.plot.china_map', 'add_china_map_2cartopy')
+guide_cmaps = lazy_attr('nmc_met_graphics.cmap.cm', 'guide_cmaps')
+add_model_title = lazy_attr('nmc_met_graphics.plot.util', 'add_model_title')
 import nmc_met_map.lib.utility as utl
+from nmc_met_map.lib import instrument
 from datetime import datetime, timedelta
-import pandas as pd
-import locale
+pd = lazy_import('pandas')
 import sys
-from matplotlib.colors import BoundaryNorm,ListedColormap
-import nmc_met_graphics.cmap.ctables as dk_ctables
+BoundaryNorm = lazy_attr('matplotlib.colors', 'BoundaryNorm')
+ListedColormap = lazy_attr('matplotlib.colors', 'ListedColormap')
+dk_ctables = lazy_import('nmc_met_graphics.cmap.ctables')
 import nmc_met_map.lib.gy_ctables as gy_ctables
 
+@instrument.traced('draw')
 def draw_gh_uv_pwat(gh=None, uv=None, pwat=None,
                     map_extent=(50, 150, 0, 65),
                     regrid_shape=20,
                     add_china=True,city=True,south_China_sea=True,
                     output_dir=None,Global=False):
 
-    plt.rcParams['font.sans-serif'] = ['SimHei'] # 步骤一（替换sans-serif字体）
-    plt.rcParams['axes.unicode_minus'] = False  # 步骤二（解决坐标轴负数的负号显示问题）
-
     # draw figure
-    plt.figure(figsize=(16,9))
+    fig = utl.new_figure(figsize=(16,9), interactive=(output_dir == None))
 
     # set data projection
     if(Global == True):
@@ -40,9 +41,9 @@ def draw_gh_uv_pwat(gh=None, uv=None, pwat=None,
         plotcrs = ccrs.AlbersEqualArea(central_latitude=(map_extent[2]+map_extent[3])/2., 
             central_longitude=(map_extent[0]+map_extent[1])/2., standard_parallels=[30., 60.])
  
-    ax = plt.axes([0.01,0.1,.98,.84], projection=plotcrs)
+    ax = fig.add_axes([0.01,0.1,.98,.84], projection=plotcrs)
     
-    plt.title('['+gh['model']+'] '+
+    ax.set_title('['+gh['model']+'] '+
     gh['lev']+'hPa 位势高度场, '+
     uv['lev']+'hPa 风场, 整层可降水量', 
         loc='left', fontsize=30)
@@ -95,7 +96,7 @@ def draw_gh_uv_pwat(gh=None, uv=None, pwat=None,
         plots['gh'] = ax.contour(
             x, y, np.squeeze(gh['data']), clevs_gh, colors='black',
             linewidths=2, transform=datacrs, zorder=110)
-        plt.clabel(plots['gh'], inline=1, fontsize=20, fmt='%.0f',colors='black')
+        ax.clabel(plots['gh'], inline=1, fontsize=20, fmt='%.0f',colors='black')
 
     # grid lines
     gl = ax.gridlines(
@@ -105,10 +106,10 @@ def draw_gh_uv_pwat(gh=None, uv=None, pwat=None,
 
     #http://earthpy.org/cartopy_backgroung.html
     #C:\ProgramData\Anaconda3\Lib\site-packages\cartopy\data\raster\natural_earth
-    ax.background_img(name='RD', resolution='high')
+    ax.background_img(name='RD', resolution='high', cache=True)
 
     #forecast information
-    bax=plt.axes([0.01,0.835,.25,.1],facecolor='#FFFFFFCC')
+    bax=fig.add_axes([0.01,0.835,.25,.1],facecolor='#FFFFFFCC')
     bax.set_yticks([])
     bax.set_xticks([])
     bax.axis([0, 10, 0, 10])
@@ -117,26 +118,22 @@ def draw_gh_uv_pwat(gh=None, uv=None, pwat=None,
     str(gh['init_time'])).replace(tzinfo=None).to_pydatetime()
     fcst_time=initial_time+timedelta(hours=gh['fhour'])
     #发布时间
-    if(sys.platform[0:3] == 'lin'):
-        locale.setlocale(locale.LC_CTYPE, 'zh_CN')
-    if(sys.platform[0:3] == 'win'):        
-        locale.setlocale(locale.LC_CTYPE, 'chinese')
-    plt.text(2.5, 7.5,'起报时间: '+initial_time.strftime("%Y年%m月%d日%H时"),size=15)
-    plt.text(2.5, 5,'预报时间: '+fcst_time.strftime("%Y年%m月%d日%H时"),size=15)
-    plt.text(2.5, 2.5,'预报时效: '+str(gh['fhour'])+'小时',size=15)
-    plt.text(2.5, 0.5,'www.nmc.cn',size=15)
+    bax.text(2.5, 7.5,'起报时间: '+utl.cn_time(initial_time, "%Y年%m月%d日%H时"),size=15)
+    bax.text(2.5, 5,'预报时间: '+utl.cn_time(fcst_time, "%Y年%m月%d日%H时"),size=15)
+    bax.text(2.5, 2.5,'预报时效: '+str(gh['fhour'])+'小时',size=15)
+    bax.text(2.5, 0.5,'www.nmc.cn',size=15)
 
     # add color bar
     if(pwat != None):
-        cax=plt.axes([0.11,0.06,.86,.02])
-        cb = plt.colorbar(plots['pwat'], cax=cax, orientation='horizontal',
+        cax=fig.add_axes([0.11,0.06,.86,.02])
+        cb = fig.colorbar(plots['pwat'], cax=cax, orientation='horizontal',
                       extend='max',extendrect=False)
         cb.ax.tick_params(labelsize='x-large')                      
         cb.set_label('(%)',size=20)
 
     # add south China sea
     if south_China_sea:
-        utl.add_south_China_sea(pos=[0.85,0.13,.1,.2])
+        utl.add_south_China_sea(pos=[0.85,0.13,.1,.2],fig=fig)
 
     small_city=False
     if(map_extent2[1]-map_extent2[0] < 25):
@@ -144,28 +141,28 @@ def draw_gh_uv_pwat(gh=None, uv=None, pwat=None,
     if city:
         utl.add_city_on_map(ax,map_extent=map_extent2,transform=datacrs,zorder=110,size=13,small_city=small_city)
 
-    utl.add_logo_extra_in_axes(pos=[-0.01,0.835,.1,.1],which='nmc', size='Xlarge')
+    utl.add_logo_extra_in_axes(pos=[-0.01,0.835,.1,.1],which='nmc', size='Xlarge',fig=fig)
 
     # show figure
     if(output_dir != None):
-        plt.savefig(output_dir+'位势高度场_风场_整层可降水量_预报_'+
-        '起报时间_'+initial_time.strftime("%Y年%m月%d日%H时")+
-        '预报时效_'+str(gh['fhour'])+'小时'+'.png', dpi=200)
+        with instrument.span('save'):
+            fig.savefig(output_dir+'位势高度场_风场_整层可降水量_预报_'+
+            '起报时间_'+utl.cn_time(initial_time, "%Y年%m月%d日%H时")+
+            '预报时效_'+str(gh['fhour'])+'小时'+'.png', dpi=200)
     
     if(output_dir == None):
         plt.show()        
+    utl.close_figure(fig)
 
+@instrument.traced('draw')
 def draw_gh_uv_rh(gh=None, uv=None, rh=None,
                     map_extent=(50, 150, 0, 65),
                     regrid_shape=20,
                     add_china=True,city=True,south_China_sea=True,
                     output_dir=None,Global=False):
 
-    plt.rcParams['font.sans-serif'] = ['SimHei'] # 步骤一（替换sans-serif字体）
-    plt.rcParams['axes.unicode_minus'] = False  # 步骤二（解决坐标轴负数的负号显示问题）
-
     # draw figure
-    plt.figure(figsize=(16,9))
+    fig = utl.new_figure(figsize=(16,9), interactive=(output_dir == None))
 
     # set data projection
     if(Global == True):
@@ -174,9 +171,9 @@ def draw_gh_uv_rh(gh=None, uv=None, rh=None,
         plotcrs = ccrs.AlbersEqualArea(central_latitude=(map_extent[2]+map_extent[3])/2., 
             central_longitude=(map_extent[0]+map_extent[1])/2., standard_parallels=[30., 60.])
  
-    ax = plt.axes([0.01,0.1,.98,.84], projection=plotcrs)
+    ax = fig.add_axes([0.01,0.1,.98,.84], projection=plotcrs)
     
-    plt.title('['+gh['model']+'] '+
+    ax.set_title('['+gh['model']+'] '+
     gh['lev']+'hPa 位势高度场, '+
     uv['lev']+'hPa 风场, '+
     rh['lev']+'hPa 相对湿度', 
@@ -229,7 +226,7 @@ def draw_gh_uv_rh(gh=None, uv=None, rh=None,
         plots['gh'] = ax.contour(
             x, y, np.squeeze(gh['data']), clevs_gh, colors='black',
             linewidths=2, transform=datacrs, zorder=110)
-        plt.clabel(plots['gh'], inline=1, fontsize=20, fmt='%.0f',colors='black')
+        ax.clabel(plots['gh'], inline=1, fontsize=20, fmt='%.0f',colors='black')
 
     # grid lines
     gl = ax.gridlines(
@@ -239,10 +236,10 @@ def draw_gh_uv_rh(gh=None, uv=None, rh=None,
 
     #http://earthpy.org/cartopy_backgroung.html
     #C:\ProgramData\Anaconda3\Lib\site-packages\cartopy\data\raster\natural_earth
-    ax.background_img(name='RD', resolution='high')
+    ax.background_img(name='RD', resolution='high', cache=True)
 
     #forecast information
-    bax=plt.axes([0.01,0.835,.25,.1],facecolor='#FFFFFFCC')
+    bax=fig.add_axes([0.01,0.835,.25,.1],facecolor='#FFFFFFCC')
     bax.set_yticks([])
     bax.set_xticks([])
     bax.axis([0, 10, 0, 10])
@@ -251,25 +248,21 @@ def draw_gh_uv_rh(gh=None, uv=None, rh=None,
     str(gh['init_time'])).replace(tzinfo=None).to_pydatetime()
     fcst_time=initial_time+timedelta(hours=gh['fhour'])
     #发布时间
-    if(sys.platform[0:3] == 'lin'):
-        locale.setlocale(locale.LC_CTYPE, 'zh_CN')
-    if(sys.platform[0:3] == 'win'):        
-        locale.setlocale(locale.LC_CTYPE, 'chinese')
-    plt.text(2.5, 7.5,'起报时间: '+initial_time.strftime("%Y年%m月%d日%H时"),size=15)
-    plt.text(2.5, 5,'预报时间: '+fcst_time.strftime("%Y年%m月%d日%H时"),size=15)
-    plt.text(2.5, 2.5,'预报时效: '+str(gh['fhour'])+'小时',size=15)
-    plt.text(2.5, 0.5,'www.nmc.cn',size=15)
+    bax.text(2.5, 7.5,'起报时间: '+utl.cn_time(initial_time, "%Y年%m月%d日%H时"),size=15)
+    bax.text(2.5, 5,'预报时间: '+utl.cn_time(fcst_time, "%Y年%m月%d日%H时"),size=15)
+    bax.text(2.5, 2.5,'预报时效: '+str(gh['fhour'])+'小时',size=15)
+    bax.text(2.5, 0.5,'www.nmc.cn',size=15)
 
     # add color bar
     if(rh != None):
-        cax=plt.axes([0.11,0.06,.86,.02])
-        cb = plt.colorbar(plots['rh'], cax=cax, orientation='horizontal')
+        cax=fig.add_axes([0.11,0.06,.86,.02])
+        cb = fig.colorbar(plots['rh'], cax=cax, orientation='horizontal')
         cb.ax.tick_params(labelsize='x-large')                      
         cb.set_label('Relative Humidity (%)',size=20)
 
     # add south China sea
     if south_China_sea:
-        utl.add_south_China_sea(pos=[0.85,0.13,.1,.2])
+        utl.add_south_China_sea(pos=[0.85,0.13,.1,.2],fig=fig)
 
     small_city=False
     if(map_extent2[1]-map_extent2[0] < 25):
@@ -277,28 +270,28 @@ def draw_gh_uv_rh(gh=None, uv=None, rh=None,
     if city:
         utl.add_city_on_map(ax,map_extent=map_extent2,transform=datacrs,zorder=110,size=13,small_city=small_city)
 
-    utl.add_logo_extra_in_axes(pos=[-0.01,0.835,.1,.1],which='nmc', size='Xlarge')
+    utl.add_logo_extra_in_axes(pos=[-0.01,0.835,.1,.1],which='nmc', size='Xlarge',fig=fig)
 
     # show figure
     if(output_dir != None):
-        plt.savefig(output_dir+'位势高度场_风场_相对湿度_预报_'+
-        '起报时间_'+initial_time.strftime("%Y年%m月%d日%H时")+
-        '预报时效_'+str(gh['fhour'])+'小时'+'.png', dpi=200)
+        with instrument.span('save'):
+            fig.savefig(output_dir+'位势高度场_风场_相对湿度_预报_'+
+            '起报时间_'+utl.cn_time(initial_time, "%Y年%m月%d日%H时")+
+            '预报时效_'+str(gh['fhour'])+'小时'+'.png', dpi=200)
     
     if(output_dir == None):
         plt.show()                
+    utl.close_figure(fig)
 
+@instrument.traced('draw')
 def draw_gh_uv_spfh(gh=None, uv=None, spfh=None,
                     map_extent=(50, 150, 0, 65),
                     regrid_shape=20,
                     add_china=True,city=True,south_China_sea=True,
                     output_dir=None,Global=False):
 
-    plt.rcParams['font.sans-serif'] = ['SimHei'] # 步骤一（替换sans-serif字体）
-    plt.rcParams['axes.unicode_minus'] = False  # 步骤二（解决坐标轴负数的负号显示问题）
-
     # draw figure
-    plt.figure(figsize=(16,9))
+    fig = utl.new_figure(figsize=(16,9), interactive=(output_dir == None))
 
     # set data projection
     if(Global == True):
@@ -307,9 +300,9 @@ def draw_gh_uv_spfh(gh=None, uv=None, spfh=None,
         plotcrs = ccrs.AlbersEqualArea(central_latitude=(map_extent[2]+map_extent[3])/2., 
             central_longitude=(map_extent[0]+map_extent[1])/2., standard_parallels=[30., 60.])
  
-    ax = plt.axes([0.01,0.1,.98,.84], projection=plotcrs)
+    ax = fig.add_axes([0.01,0.1,.98,.84], projection=plotcrs)
     
-    plt.title('['+gh['model']+'] '+
+    ax.set_title('['+gh['model']+'] '+
     gh['lev']+'hPa 位势高度场, '+
     uv['lev']+'hPa 风场, '+
     spfh['lev']+'hPa 比湿', 
@@ -364,7 +357,7 @@ def draw_gh_uv_spfh(gh=None, uv=None, spfh=None,
         plots['gh'] = ax.contour(
             x, y, np.squeeze(gh['data']), clevs_gh, colors='black',
             linewidths=2, transform=datacrs, zorder=110)
-        plt.clabel(plots['gh'], inline=1, fontsize=20, fmt='%.0f',colors='black')
+        ax.clabel(plots['gh'], inline=1, fontsize=20, fmt='%.0f',colors='black')
 
     # grid lines
     gl = ax.gridlines(
@@ -374,10 +367,10 @@ def draw_gh_uv_spfh(gh=None, uv=None, spfh=None,
 
     #http://earthpy.org/cartopy_backgroung.html
     #C:\ProgramData\Anaconda3\Lib\site-packages\cartopy\data\raster\natural_earth
-    ax.background_img(name='RD', resolution='high')
+    ax.background_img(name='RD', resolution='high', cache=True)
 
     #forecast information
-    bax=plt.axes([0.01,0.835,.25,.1],facecolor='#FFFFFFCC')
+    bax=fig.add_axes([0.01,0.835,.25,.1],facecolor='#FFFFFFCC')
     bax.set_yticks([])
     bax.set_xticks([])
     bax.axis([0, 10, 0, 10])
@@ -386,19 +379,15 @@ def draw_gh_uv_spfh(gh=None, uv=None, spfh=None,
     str(gh['init_time'])).replace(tzinfo=None).to_pydatetime()
     fcst_time=initial_time+timedelta(hours=gh['fhour'])
     #发布时间
-    if(sys.platform[0:3] == 'lin'):
-        locale.setlocale(locale.LC_CTYPE, 'zh_CN')
-    if(sys.platform[0:3] == 'win'):        
-        locale.setlocale(locale.LC_CTYPE, 'chinese')
-    plt.text(2.5, 7.5,'起报时间: '+initial_time.strftime("%Y年%m月%d日%H时"),size=15)
-    plt.text(2.5, 5,'预报时间: '+fcst_time.strftime("%Y年%m月%d日%H时"),size=15)
-    plt.text(2.5, 2.5,'预报时效: '+str(gh['fhour'])+'小时',size=15)
-    plt.text(2.5, 0.5,'www.nmc.cn',size=15)
+    bax.text(2.5, 7.5,'起报时间: '+utl.cn_time(initial_time, "%Y年%m月%d日%H时"),size=15)
+    bax.text(2.5, 5,'预报时间: '+utl.cn_time(fcst_time, "%Y年%m月%d日%H时"),size=15)
+    bax.text(2.5, 2.5,'预报时效: '+str(gh['fhour'])+'小时',size=15)
+    bax.text(2.5, 0.5,'www.nmc.cn',size=15)
 
     # add color bar
     if(spfh != None):
-        cax=plt.axes([0.11,0.06,.86,.02])
-        cb = plt.colorbar(plots['spfh'], cax=cax, orientation='horizontal')
+        cax=fig.add_axes([0.11,0.06,.86,.02])
+        cb = fig.colorbar(plots['spfh'], cax=cax, orientation='horizontal')
         cb.ax.tick_params(labelsize='x-large')                      
         cb.set_label('Specific Humidity (g/kg)',size=20)
         cb.set_ticks([0,4,8,12,16,20,24])
@@ -406,7 +395,7 @@ def draw_gh_uv_spfh(gh=None, uv=None, spfh=None,
 
     # add south China sea
     if south_China_sea:
-        utl.add_south_China_sea(pos=[0.85,0.13,.1,.2])
+        utl.add_south_China_sea(pos=[0.85,0.13,.1,.2],fig=fig)
 
     small_city=False
     if(map_extent2[1]-map_extent2[0] < 25):
@@ -414,28 +403,28 @@ def draw_gh_uv_spfh(gh=None, uv=None, spfh=None,
     if city:
         utl.add_city_on_map(ax,map_extent=map_extent2,transform=datacrs,zorder=110,size=13,small_city=small_city)
 
-    utl.add_logo_extra_in_axes(pos=[-0.01,0.835,.1,.1],which='nmc', size='Xlarge')
+    utl.add_logo_extra_in_axes(pos=[-0.01,0.835,.1,.1],which='nmc', size='Xlarge',fig=fig)
 
     # show figure
     if(output_dir != None):
-        plt.savefig(output_dir+'位势高度场_风场_比湿_预报_'+
-        '起报时间_'+initial_time.strftime("%Y年%m月%d日%H时")+
-        '预报时效_'+str(gh['fhour'])+'小时'+'.png', dpi=200)
+        with instrument.span('save'):
+            fig.savefig(output_dir+'位势高度场_风场_比湿_预报_'+
+            '起报时间_'+utl.cn_time(initial_time, "%Y年%m月%d日%H时")+
+            '预报时效_'+str(gh['fhour'])+'小时'+'.png', dpi=200)
     
     if(output_dir == None):
         plt.show()                        
+    utl.close_figure(fig)
 
+@instrument.traced('draw')
 def draw_gh_uv_wvfl(gh=None, uv=None, wvfl=None,
                     map_extent=(50, 150, 0, 65),
                     regrid_shape=20,
                     add_china=True,city=True,south_China_sea=True,
                     output_dir=None,Global=False):
 
-    plt.rcParams['font.sans-serif'] = ['SimHei'] # 步骤一（替换sans-serif字体）
-    plt.rcParams['axes.unicode_minus'] = False  # 步骤二（解决坐标轴负数的负号显示问题）
-
     # draw figure
-    plt.figure(figsize=(16,9))
+    fig = utl.new_figure(figsize=(16,9), interactive=(output_dir == None))
 
     # set data projection
     if(Global == True):
@@ -444,9 +433,9 @@ def draw_gh_uv_wvfl(gh=None, uv=None, wvfl=None,
         plotcrs = ccrs.AlbersEqualArea(central_latitude=(map_extent[2]+map_extent[3])/2., 
             central_longitude=(map_extent[0]+map_extent[1])/2., standard_parallels=[30., 60.])
  
-    ax = plt.axes([0.01,0.1,.98,.84], projection=plotcrs)
+    ax = fig.add_axes([0.01,0.1,.98,.84], projection=plotcrs)
     
-    plt.title('['+gh['model']+'] '+
+    ax.set_title('['+gh['model']+'] '+
     gh['lev']+'hPa 位势高度场, '+
     uv['lev']+'hPa 风场, '+
     wvfl['lev']+'hPa 水汽通量', 
@@ -504,7 +493,7 @@ def draw_gh_uv_wvfl(gh=None, uv=None, wvfl=None,
         plots['gh'] = ax.contour(
             x, y, np.squeeze(gh['data']), clevs_gh, colors='black',
             linewidths=2, transform=datacrs, zorder=110)
-        plt.clabel(plots['gh'], inline=1, fontsize=20, fmt='%.0f',colors='black')
+        ax.clabel(plots['gh'], inline=1, fontsize=20, fmt='%.0f',colors='black')
 
     # grid lines
     gl = ax.gridlines(
@@ -514,10 +503,10 @@ def draw_gh_uv_wvfl(gh=None, uv=None, wvfl=None,
 
     #http://earthpy.org/cartopy_backgroung.html
     #C:\ProgramData\Anaconda3\Lib\site-packages\cartopy\data\raster\natural_earth
-    ax.background_img(name='RD', resolution='high')
+    ax.background_img(name='RD', resolution='high', cache=True)
 
     #forecast information
-    bax=plt.axes([0.01,0.835,.25,.1],facecolor='#FFFFFFCC')
+    bax=fig.add_axes([0.01,0.835,.25,.1],facecolor='#FFFFFFCC')
     bax.set_yticks([])
     bax.set_xticks([])
     bax.axis([0, 10, 0, 10])
@@ -526,19 +515,15 @@ def draw_gh_uv_wvfl(gh=None, uv=None, wvfl=None,
     str(gh['init_time'])).replace(tzinfo=None).to_pydatetime()
     fcst_time=initial_time+timedelta(hours=gh['fhour'])
     #发布时间
-    if(sys.platform[0:3] == 'lin'):
-        locale.setlocale(locale.LC_CTYPE, 'zh_CN')
-    if(sys.platform[0:3] == 'win'):        
-        locale.setlocale(locale.LC_CTYPE, 'chinese')
-    plt.text(2.5, 7.5,'起报时间: '+initial_time.strftime("%Y年%m月%d日%H时"),size=15)
-    plt.text(2.5, 5,'预报时间: '+fcst_time.strftime("%Y年%m月%d日%H时"),size=15)
-    plt.text(2.5, 2.5,'预报时效: '+str(gh['fhour'])+'小时',size=15)
-    plt.text(2.5, 0.5,'www.nmc.cn',size=15)
+    bax.text(2.5, 7.5,'起报时间: '+utl.cn_time(initial_time, "%Y年%m月%d日%H时"),size=15)
+    bax.text(2.5, 5,'预报时间: '+utl.cn_time(fcst_time, "%Y年%m月%d日%H时"),size=15)
+    bax.text(2.5, 2.5,'预报时效: '+str(gh['fhour'])+'小时',size=15)
+    bax.text(2.5, 0.5,'www.nmc.cn',size=15)
 
     # add color bar
     if(wvfl != None):
-        cax=plt.axes([0.11,0.06,.86,.02])
-        cb = plt.colorbar(plots['wvfl'], cax=cax, orientation='horizontal')
+        cax=fig.add_axes([0.11,0.06,.86,.02])
+        cb = fig.colorbar(plots['wvfl'], cax=cax, orientation='horizontal')
         cb.ax.tick_params(labelsize='x-large')                      
         cb.set_label('Water Vapor Flux (0.1g/(cm*hPa*s)',size=20)
  #       cb.set_ticks([0,4,8,12,16,20,24])
@@ -546,7 +531,7 @@ def draw_gh_uv_wvfl(gh=None, uv=None, wvfl=None,
 
     # add south China sea
     if south_China_sea:
-        utl.add_south_China_sea(pos=[0.85,0.13,.1,.2])
+        utl.add_south_China_sea(pos=[0.85,0.13,.1,.2],fig=fig)
 
     small_city=False
     if(map_extent2[1]-map_extent2[0] < 25):
@@ -554,13 +539,15 @@ def draw_gh_uv_wvfl(gh=None, uv=None, wvfl=None,
     if city:
         utl.add_city_on_map(ax,map_extent=map_extent2,transform=datacrs,zorder=110,size=13,small_city=small_city)
 
-    utl.add_logo_extra_in_axes(pos=[-0.01,0.835,.1,.1],which='nmc', size='Xlarge')
+    utl.add_logo_extra_in_axes(pos=[-0.01,0.835,.1,.1],which='nmc', size='Xlarge',fig=fig)
 
     # show figure
     if(output_dir != None):
-        plt.savefig(output_dir+'位势高度场_风场_水汽通量_预报_'+
-        '起报时间_'+initial_time.strftime("%Y年%m月%d日%H时")+
-        '预报时效_'+str(gh['fhour'])+'小时'+'.png', dpi=200)
+        with instrument.span('save'):
+            fig.savefig(output_dir+'位势高度场_风场_水汽通量_预报_'+
+            '起报时间_'+utl.cn_time(initial_time, "%Y年%m月%d日%H时")+
+            '预报时效_'+str(gh['fhour'])+'小时'+'.png', dpi=200)
     
     if(output_dir == None):
-        plt.show()                                
\ No newline at end of file
+        plt.show()                                
+    utl.close_figure(fig)
\ No newline at end of file
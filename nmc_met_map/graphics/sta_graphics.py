@@ -1,308 +1,273 @@
 
 import numpy as np
-import matplotlib as mpl
-import matplotlib.pyplot as plt
+from nmc_met_map.lib.lazy import lazy_import, lazy_attr
+mpl = lazy_import('matplotlib')
+plt = lazy_import('matplotlib.pyplot')
 import nmc_met_map.lib.utility as utl
+from nmc_met_map.lib import instrument
 from datetime import datetime, timedelta
-import pandas as pd
-import locale
+pd = lazy_import('pandas')
 import sys
-import metpy.calc as mpcalc
-from metpy.plots import  SkewT
+mpcalc = lazy_import('metpy.calc')
+units = lazy_attr('metpy.units', 'units')
+SkewT = lazy_attr('metpy.plots', 'SkewT')
 import os
-from mpl_toolkits.axisartist.parasite_axes import HostAxes, ParasiteAxes
-from matplotlib.ticker import MultipleLocator
+HostAxes = lazy_attr('mpl_toolkits.axisartist.parasite_axes', 'HostAxes')
+ParasiteAxes = lazy_attr('mpl_toolkits.axisartist.parasite_axes', 'ParasiteAxes')
+MultipleLocator = lazy_attr('matplotlib.ticker', 'MultipleLocator')
 import math
 
-def draw_Station_Synthetical_Forecast_From_Cassandra(
-            t2m=None,Td2m=None,AT=None,u10m=None,v10m=None,u100m=None,v100m=None,
-            gust10m=None,wsp10m=None,wsp100m=None,r03=None,TCDC=None,LCDC=None,
-            draw_VIS=False,VIS=None,drw_thr=False,
-            time_all=None,
-            model=None,points=None,
-            output_dir=None,extra_info={
-            'output_head_name':' ',
-            'output_tail_name':' ',
-            'point_name':' ',
-            'upper_wind':False,
-            'upper_wind_lev':'800'}):
-
-    #if(sys.platform[0:3] == 'win'):
-    plt.rcParams['font.sans-serif'] = ['SimHei'] # 步骤一（替换sans-serif字体）
-    plt.rcParams['axes.unicode_minus'] = False  # 步骤二（解决坐标轴负数的负号显示问题）
-    if(sys.platform[0:3] == 'lin'):
-        locale.setlocale(locale.LC_CTYPE, 'zh_CN')
-    if(sys.platform[0:3] == 'win'):        
-        locale.setlocale(locale.LC_CTYPE, 'chinese')       
-
-    initial_time1=pd.to_datetime(str(t2m['forecast_reference_time'].values)).replace(tzinfo=None).to_pydatetime()
-    initial_time2=pd.to_datetime(str(VIS['forecast_reference_time'].values)).replace(tzinfo=None).to_pydatetime()
-
-    # draw figure
-    fig=plt.figure(figsize=(12,16))
-    # draw main figure
-    #温度————————————————————————————————————————————————
-    ax = plt.axes([0.05,0.83,.94,.15])
-    utl.add_public_title_sta(title=model+'预报 '+extra_info['point_name']+' ['+str(points['lon'][0])+','+str(points['lat'][0])+']',initial_time=initial_time1, fontsize=23)
-
-    for ifhour in t2m['forecast_period'].values:
-        if (ifhour == t2m['forecast_period'].values[0] ):
-            t2m_t=(initial_time1
-                +timedelta(hours=ifhour))
-        else:
-            t2m_t=np.append(t2m_t,
-                            (initial_time1
-                            +timedelta(hours=ifhour)))
-    #开启自适应
-    xaxis_intaval=mpl.dates.HourLocator(byhour=(8,20)) #单位是小时
-    ax.xaxis.set_major_locator(xaxis_intaval)
-    ax.set_xticklabels([' '])
-    ax.fill_between(t2m_t, np.squeeze(t2m['data']), -100,facecolor='#3D5AFE')
-    ax.fill_between(t2m_t, np.squeeze(t2m['data']), -5,facecolor='#2979FF')
-    ax.fill_between(t2m_t, np.squeeze(t2m['data']), 0,facecolor='#00B0FF')
-    ax.fill_between(t2m_t, np.squeeze(t2m['data']), 5,facecolor='#00E5FF')
-    ax.fill_between(t2m_t, np.squeeze(t2m['data']), 13,facecolor='#1DE9B6')
-    ax.fill_between(t2m_t, np.squeeze(t2m['data']), 18,facecolor='#00E676')
-    ax.fill_between(t2m_t, np.squeeze(t2m['data']), 22,facecolor='#76FF03')
-    ax.fill_between(t2m_t, np.squeeze(t2m['data']), 28,facecolor='#C6FF00')
-    ax.fill_between(t2m_t, np.squeeze(t2m['data']), 33,facecolor='#FFEA00')
-    ax.fill_between(t2m_t, np.squeeze(t2m['data']), 35,facecolor='#FFC400')
-    ax.fill_between(t2m_t, np.squeeze(t2m['data']), 37,facecolor='#FF9100')
-    ax.fill_between(t2m_t, np.squeeze(t2m['data']), 40,facecolor='#FF3D00')
-    ax.fill_between(t2m_t, np.squeeze(t2m['data']), 100,facecolor='#FFFFFF')
-    ax.plot(t2m_t,np.squeeze(t2m['data']),label='2米温度')
-    ax.plot(t2m_t, np.squeeze(Td2m), dashes=[6, 2],linewidth=4,c='#00796B',label='2米露点温度')
-    ax.plot(t2m_t, np.squeeze(AT), dashes=[6, 2],linewidth=3,c='#FF9933',label='2米体感温度')
-    ax.tick_params(length=10)
-    ax.grid()
-    ax.grid(axis='x',c='black')
-    miloc = mpl.dates.HourLocator(byhour=(11,14,17,23,2,5)) #单位是小时
-    ax.xaxis.set_minor_locator(miloc)
-    ax.grid(axis='x', which='minor')
-    plt.xlim(time_all[0],time_all[-1])
-    plt.ylim(min([np.array(Td2m).min(),AT.values.min(),t2m['data'].values.min()]),
-        max([np.array(Td2m).max(),AT.values.max(),t2m['data'].values.max()]))
-    ax.legend(fontsize=10,loc='upper right')
-    ax.set_ylabel('2米温度 体感温度\n'+'2米露点温度 ($^\circ$C)', fontsize=15)
-    
-                      
-    #10米风——————————————————————————————————————
-    ax = plt.axes([0.05,0.66,.94,.15])
-    for ifhour in u10m['forecast_period'].values:
-        if (ifhour == u10m['forecast_period'].values[0] ):
-            uv10m_t=(initial_time1
-                +timedelta(hours=ifhour))
-        else:
-            uv10m_t=np.append(uv10m_t,
-                            (initial_time1
-                            +timedelta(hours=ifhour)))
-
-    for ifhour in u100m['forecast_period'].values:
-        if (ifhour == u100m['forecast_period'].values[0] ):
-            uv100m_t=(initial_time1
-                +timedelta(hours=ifhour))
-        else:
-            uv100m_t=np.append(uv100m_t,
-                            (initial_time1
-                            +timedelta(hours=ifhour)))
-            
-    for ifhour in gust10m['forecast_period'].values:
-        if (ifhour == gust10m['forecast_period'].values[0] ):
-            gust10m_t=(initial_time1
-                +timedelta(hours=ifhour))
+_HOURS_MAJOR = (8,20)
+_HOURS_MINOR = (11,14,17,23,2,5)
+
+
+class MeteogramTemplate(object):
+
+    """
+    Figure of the station synthetical forecast, built once and used for
+    many stations. The axes, locators, grids, labels, logo and legends
+    are kept, render() only swaps the data artists (lines, bands, bars,
+    barbs) and the texts of a station and saves the figure.
+
+    >>> template = sta_graphics.MeteogramTemplate(draw_VIS=True)
+    >>> for station in stations:
+    >>>     template.render(output_dir=output_dir, **station)
+    >>> template.close()
+    """
+
+    def __init__(self, draw_VIS=False, drw_thr=False, interactive=False):
+        """
+        :param draw_VIS: add the visibility panel.
+        :param drw_thr: draw the thresholds of high impact weather.
+        :param interactive: pyplot figure for plt.show().
+        """
+        self.draw_VIS = draw_VIS
+        self.drw_thr = drw_thr
+        self.fig = utl.new_figure(figsize=(12,16), interactive=interactive)
+        self.lines = {}
+        self.artists = {}
+        self.legends = set()
+
+        #温度 10米风 降水 总量云————————————————————————————————
+        self.ax_t2m = self._panel([0.05,0.83,.94,.15], '2米温度 体感温度\n'+'2米露点温度 ($^\circ$C)')
+        self.ax_wind = self._panel([0.05,0.66,.94,.15], '10米风 100米 风\n'+'风速 (m/s)')
+        self.ax_rain = self._panel([0.05,0.49,.94,.15], '')
+        self.ax_cloud = self._panel([0.05,0.32,.94,.15], '云量 (%)', ylim=(0,100))
+        #能见度——————————————————————————————————————
+        if(draw_VIS == True):
+            self.ax_vis = self._panel([0.05,0.15,.94,.15], '能见度 （km）', ylim=(0,25))
+            self.ax_time = self.ax_vis
         else:
-            gust10m_t=np.append(gust10m_t,
-                            (initial_time1
-                            +timedelta(hours=ifhour)))
+            self.ax_vis = None
+            self.ax_time = self.ax_cloud
+        for ax in (self.ax_t2m, self.ax_wind, self.ax_rain, self.ax_cloud):
+            if ax is not self.ax_time:
+                ax.set_xticklabels([' '])
+        self.ax_time.xaxis.set_major_formatter(utl.cn_date_formatter('%m月%d日%H时'))
 
-    ax.plot(uv10m_t, np.squeeze(wsp10m), c='#40C4FF',label='10米风',linewidth=3)
-    ax.plot(uv100m_t,np.squeeze(wsp100m),c='#FF6F00',label='100米风',linewidth=3)
-    ax.plot(gust10m_t,np.squeeze(gust10m['data']),c='#7C4DFF',label='10米阵风',linewidth=3)
-    if(drw_thr == True):
-        ax.plot([uv10m_t[0],uv10m_t[-1]],[5.5,5.5],c='#4CAE50',label='10米平均风一般影响',linewidth=1)
-        ax.plot([uv10m_t[0],uv10m_t[-1]],[8,8],c='#FFEB3B',label='10米平均风较大影响',linewidth=1)
-        ax.plot([uv10m_t[0],uv10m_t[-1]],[10.8,10.8],c='#F44336',label='10米平均风高影响',linewidth=1)
-
-        ax.plot([gust10m_t[0],gust10m_t[-1]],[10.8,10.8],c='#4CAE50',label='10米阵风一般影响', dashes=[6, 2],linewidth=1)
-        ax.plot([gust10m_t[0],gust10m_t[-1]],[13.9,13.9],c='#FFEB3B',label='10米阵风较大影响', dashes=[6, 2],linewidth=1)
-        ax.plot([gust10m_t[0],gust10m_t[-1]],[17.2,17.2],c='#F44336',label='10米阵风高影响', dashes=[6, 2],linewidth=1)
+        #发布信息————————————————————————————————————————————————
+        ax = self.fig.add_axes([0.05,0.08,.94,.05])
+        ax.axis([0, 10, 0, 10])
+        ax.axis('off')
+        if(draw_VIS == True):
+            utl.add_logo_extra_in_axes(pos=[0.7,0.06,.05,.05],which='nmc', size='Xlarge',fig=self.fig)
+            self.issue_text = ax.text(7.5, 0.1, '', size=15)
+        else:
+            utl.add_logo_extra_in_axes(pos=[0.7,0.23,.05,.05],which='nmc', size='Xlarge',fig=self.fig)
+            self.issue_text = ax.text(7.5, 33, '', size=15)
 
-    ax.barbs(uv10m_t[0:-1], wsp10m[0:-1], 
+    def _panel(self, pos, ylabel, ylim=None):
+        ax = self.fig.add_axes(pos)
+        ax.xaxis.set_major_locator(mpl.dates.HourLocator(byhour=_HOURS_MAJOR)) #单位是小时
+        ax.xaxis.set_minor_locator(mpl.dates.HourLocator(byhour=_HOURS_MINOR))
+        ax.tick_params(length=10)
+        ax.grid()
+        ax.grid(axis='x',c='black')
+        ax.grid(axis='x', which='minor')
+        ax.set_ylabel(ylabel, fontsize=15)
+        if ylim is not None:
+            ax.set_ylim(*ylim)
+        return ax
+
+    def _line(self, key, ax, x, y, **kwargs):
+        """
+        Move the data of a line, the line is drawn at the first station.
+        """
+        line = self.lines.get(key)
+        if line is None:
+            line, = ax.plot(x, y, **kwargs)
+            self.lines[key] = line
+        else:
+            line.set_data(x, y)
+            if 'label' in kwargs and line.get_label() != kwargs['label']:
+                line.set_label(kwargs['label'])
+                self.legends.discard(ax)
+        return line
+
+    def _threshold(self, key, ax, t, value, **kwargs):
+        return self._line(key, ax, [t[0],t[-1]], [value,value], linewidth=1, **kwargs)
+
+    def _replace(self, key, artist):
+        """
+        Remove the artist of the previous station.
+        """
+        old = self.artists.get(key)
+        if old is not None:
+            old.remove()
+        self.artists[key] = artist
+
+    def _legend(self, ax):
+        # the handles of the legend are copies, they stay valid when the
+        # bars of the first station are removed
+        if ax not in self.legends:
+            ax.legend(fontsize=10,loc='upper right')
+            self.legends.add(ax)
+
+    @instrument.traced('draw')
+    def render(self, t2m=None,Td2m=None,AT=None,u10m=None,v10m=None,u100m=None,v100m=None,
+               gust10m=None,wsp10m=None,wsp100m=None,r03=None,TCDC=None,LCDC=None,
+               VIS=None,time_all=None,model=None,points=None,output_dir=None,
+               extra_info={
+                'output_head_name':' ',
+                'output_tail_name':' ',
+                'point_name':' '}):
+        """
+        Draw the data of one station and save the figure, the arguments
+        are those of draw_Station_Synthetical_Forecast_From_Cassandra.
+        :return: path of the image, None if output_dir is None.
+        """
+        initial_time1=pd.to_datetime(str(t2m['forecast_reference_time'].values)).replace(tzinfo=None).to_pydatetime()
+        initial_time2=pd.to_datetime(str(VIS['forecast_reference_time'].values)).replace(tzinfo=None).to_pydatetime()
+
+        #温度————————————————————————————————————————————————
+        ax = self.ax_t2m
+        utl.add_public_title_sta(title=model+'预报 '+extra_info['point_name']+' ['+str(points['lon'][0])+','+str(points['lat'][0])+']',initial_time=initial_time1, fontsize=23, ax=ax)
+        t2m_t=utl.forecast_time_axis(initial_time1, t2m['forecast_period'].values)
+        self._replace('t2m_fill', utl.banded_fill(ax, t2m_t, np.squeeze(t2m['data']),
+            levels=[-100,-5,0,5,13,18,22,28,33,35,37,40,100],
+            colors=['#3D5AFE','#2979FF','#00B0FF','#00E5FF','#1DE9B6','#00E676','#76FF03','#C6FF00','#FFEA00','#FFC400','#FF9100','#FF3D00','#FFFFFF']))
+        self._line('t2m', ax, t2m_t, np.squeeze(t2m['data']), c='C0', label='2米温度')
+        self._line('Td2m', ax, t2m_t, np.squeeze(Td2m), dashes=[6, 2],linewidth=4,c='#00796B',label='2米露点温度')
+        self._line('AT', ax, t2m_t, np.squeeze(AT), dashes=[6, 2],linewidth=3,c='#FF9933',label='2米体感温度')
+        ax.set_xlim(time_all[0],time_all[-1])
+        ax.set_ylim(min([np.array(Td2m).min(),AT.values.min(),t2m['data'].values.min()]),
+            max([np.array(Td2m).max(),AT.values.max(),t2m['data'].values.max()]))
+        self._legend(ax)
+
+        #10米风——————————————————————————————————————
+        ax = self.ax_wind
+        uv10m_t=utl.forecast_time_axis(initial_time1, u10m['forecast_period'].values)
+        uv100m_t=utl.forecast_time_axis(initial_time1, u100m['forecast_period'].values)
+        gust10m_t=utl.forecast_time_axis(initial_time1, gust10m['forecast_period'].values)
+        self._line('wsp10m', ax, uv10m_t, np.squeeze(wsp10m), c='#40C4FF',label='10米风',linewidth=3)
+        self._line('wsp100m', ax, uv100m_t, np.squeeze(wsp100m), c='#FF6F00',label='100米风',linewidth=3)
+        self._line('gust10m', ax, gust10m_t, np.squeeze(gust10m['data']), c='#7C4DFF',label='10米阵风',linewidth=3)
+        if(self.drw_thr == True):
+            self._threshold('wsp10m_1', ax, uv10m_t, 5.5, c='#4CAE50', label='10米平均风一般影响')
+            self._threshold('wsp10m_2', ax, uv10m_t, 8, c='#FFEB3B', label='10米平均风较大影响')
+            self._threshold('wsp10m_3', ax, uv10m_t, 10.8, c='#F44336', label='10米平均风高影响')
+            self._threshold('gust10m_1', ax, gust10m_t, 10.8, c='#4CAE50', label='10米阵风一般影响', dashes=[6, 2])
+            self._threshold('gust10m_2', ax, gust10m_t, 13.9, c='#FFEB3B', label='10米阵风较大影响', dashes=[6, 2])
+            self._threshold('gust10m_3', ax, gust10m_t, 17.2, c='#F44336', label='10米阵风高影响', dashes=[6, 2])
+        self._replace('barbs10m', ax.barbs(uv10m_t[0:-1], wsp10m[0:-1],
             np.squeeze(u10m['data'])[0:-1], np.squeeze(v10m['data'])[0:-1],
-            fill_empty=True,color='gray',barb_increments={'half':2,'full':4,'flag':20})
-
-    ax.barbs(uv100m_t[0:-1], wsp100m[0:-1], 
+            fill_empty=True,color='gray',barb_increments={'half':2,'full':4,'flag':20}))
+        self._replace('barbs100m', ax.barbs(uv100m_t[0:-1], wsp100m[0:-1],
             np.squeeze(u100m['data'])[0:-1], np.squeeze(v100m['data'])[0:-1],
-            fill_empty=True,color='gray',barb_increments={'half':2,'full':4,'flag':20})
-
-    xaxis_intaval=mpl.dates.HourLocator(byhour=(8,20)) #单位是小时
-    ax.xaxis.set_major_locator(xaxis_intaval)
-    ax.set_xticklabels([' '])
-    plt.xlim(time_all[0],time_all[-1])    
-    # add legend
-    ax.legend(fontsize=10,loc='upper right')
-    ax.tick_params(length=10)    
-    ax.grid()
-    ax.grid(axis='x',c='black')
-    miloc = mpl.dates.HourLocator(byhour=(11,14,17,23,2,5)) #单位是小时
-    ax.xaxis.set_minor_locator(miloc)
-    ax.grid(axis='x', which='minor')    
-    ax.set_ylabel('10米风 100米 风\n'+'风速 (m/s)', fontsize=15)
-    #降水——————————————————————————————————————
-    # draw main figure
-    ax = plt.axes([0.05,0.49,.94,.15])
-    for ifhour in r03['forecast_period'].values:
-        if (ifhour == r03['forecast_period'].values[0] ):
-            r03_t=(initial_time1
-                +timedelta(hours=ifhour))
-        else:
-            r03_t=np.append(r03_t,
-                            (initial_time1
-                            +timedelta(hours=ifhour)))
-    #开启自适应
-    xaxis_intaval=mpl.dates.HourLocator(byhour=(8,20)) #单位是小时
-    ax.xaxis.set_major_locator(xaxis_intaval)
-    ax.set_xticklabels([' '])
-    ax.bar(r03_t,np.squeeze(r03['data']),width=0.12,color='#1E88E5')
-    gap_hour_r03=int(r03['forecast_period'].values[1]-r03['forecast_period'].values[0])
+            fill_empty=True,color='gray',barb_increments={'half':2,'full':4,'flag':20}))
+        ax.set_xlim(time_all[0],time_all[-1])
+        # the lines are moved, the y limits follow the data of this station
+        ax.relim()
+        ax.autoscale_view(scalex=False)
+        self._legend(ax)
+
+        #降水——————————————————————————————————————
+        ax = self.ax_rain
+        r03_t=utl.forecast_time_axis(initial_time1, r03['forecast_period'].values)
+        self._replace('r03', ax.bar(r03_t,np.squeeze(r03['data']),width=0.12,color='#1E88E5'))
+        gap_hour_r03=int(r03['forecast_period'].values[1]-r03['forecast_period'].values[0])
+        if(self.drw_thr == True):
+            self._threshold('r03_1', ax, r03_t, 1*gap_hour_r03, c='#FFEB3B', label=str(gap_hour_r03)+'小时降水较大影响')
+            self._threshold('r03_2', ax, r03_t, 10*gap_hour_r03, c='#F44336', label=str(gap_hour_r03)+'小时降水高影响')
+            self._legend(ax)
+        ax.set_xlim(time_all[0],time_all[-1])
+        ax.set_ylim([np.squeeze(r03['data']).values.min(),np.squeeze(r03['data'].values.max())+2])
+        ax.set_ylabel(str(gap_hour_r03)+'小时累积雨量 (mm)', fontsize=15)
+
+        #总量云——————————————————————————————————————
+        ax = self.ax_cloud
+        TCDC_t=utl.forecast_time_axis(initial_time1, TCDC['forecast_period'].values)
+        LCDC_t=utl.forecast_time_axis(initial_time1, LCDC['forecast_period'].values)
+        self._replace('TCDC', ax.bar(TCDC_t,np.squeeze(TCDC['data']),width=0.20,color='#82B1FF',label='总云量'))
+        self._replace('LCDC', ax.bar(LCDC_t,np.squeeze(LCDC['data']),width=0.125,color='#2962FF',label='低云量'))
+        ax.set_xlim(time_all[0],time_all[-1])
+        self._legend(ax)
 
-    if(drw_thr == True):
-        ax.plot([r03_t[0],r03_t[-1]],[1*gap_hour_r03,1*gap_hour_r03],c='#FFEB3B',label=str(gap_hour_r03)+'小时降水较大影响',linewidth=1)
-        ax.plot([r03_t[0],r03_t[-1]],[10*gap_hour_r03,10*gap_hour_r03],c='#F44336',label=str(gap_hour_r03)+'小时降水高影响',linewidth=1)
-        ax.legend(fontsize=10,loc='upper right')
-    ax.tick_params(length=10)    
-    ax.grid()
-    ax.grid(axis='x',c='black')
-    miloc = mpl.dates.HourLocator(byhour=(11,14,17,23,2,5)) #单位是小时
-    ax.xaxis.set_minor_locator(miloc)
-    ax.grid(axis='x', which='minor')    
-    plt.xlim(time_all[0],time_all[-1])
-    plt.ylim([np.squeeze(r03['data']).values.min(),np.squeeze(r03['data'].values.max())+2])
-    ax.set_ylabel(str(gap_hour_r03)+'小时累积雨量 (mm)', fontsize=15)
-    #总量云——————————————————————————————————————
-    # draw main figure
-    ax = plt.axes([0.05,0.32,.94,.15])
-    for ifhour in TCDC['forecast_period'].values:
-        if (ifhour == TCDC['forecast_period'].values[0] ):
-            TCDC_t=(initial_time1
-                +timedelta(hours=ifhour))
-        else:
-            TCDC_t=np.append(TCDC_t,
-                            (initial_time1
-                            +timedelta(hours=ifhour)))
-    # draw main figure
-    for ifhour in LCDC['forecast_period'].values:
-        if (ifhour == LCDC['forecast_period'].values[0] ):
-            LCDC_t=(initial_time1
-                +timedelta(hours=ifhour))
+        #能见度——————————————————————————————————————
+        if(self.draw_VIS == True):
+            ax = self.ax_vis
+            VIS_t=utl.forecast_time_axis(initial_time2, VIS['forecast_period'].values)
+            self._replace('VIS_fill', utl.banded_fill(ax, VIS_t, np.squeeze(VIS['data']),
+                levels=[-100,1,3,5,10,15,20,25,30,100],
+                colors=['#B3E5FC','#81D4FA','#4FC3F7','#29B6F6','#03A9F4','#039BE5','#0288D1','#0277BD','#01579B','#FFFFFF']))
+            self._line('VIS', ax, VIS_t, np.squeeze(VIS['data']), c='C0')
+            if(self.drw_thr == True):
+                self._threshold('VIS_1', ax, VIS_t, 5, c='#4CAF50', label='能见度一般影响')
+                self._threshold('VIS_2', ax, VIS_t, 3, c='#FFEB3B', label='能见度较大影响')
+                self._threshold('VIS_3', ax, VIS_t, 1, c='#F44336', label='能见度高影响')
+                self._legend(ax)
+            ax.set_xlim(time_all[0],time_all[-1])
+            self.issue_text.set_text(utl.cn_time(initial_time2 - timedelta(hours=2), "%Y年%m月%d日%H时")+'发布')
         else:
-            LCDC_t=np.append(LCDC_t,
-                            (initial_time1
-                            +timedelta(hours=ifhour)))
-
-    #开启自适应
-    xaxis_intaval=mpl.dates.HourLocator(byhour=(8,20)) #单位是小时
-    ax.xaxis.set_major_locator(xaxis_intaval)
-    ax.set_xticklabels([' '])
-
-    ax.bar(TCDC_t,np.squeeze(TCDC['data']),width=0.20,color='#82B1FF',label='总云量')
-    ax.bar(LCDC_t,np.squeeze(LCDC['data']),width=0.125,color='#2962FF',label='低云量')
-    ax.tick_params(length=10)    
-    ax.grid()
-    ax.grid(axis='x',c='black')
-    miloc = mpl.dates.HourLocator(byhour=(11,14,17,23,2,5)) #单位是小时
-    ax.xaxis.set_minor_locator(miloc)
-    ax.grid(axis='x', which='minor')    
-    plt.xlim(time_all[0],time_all[-1])
-    plt.ylim(0,100)
-    ax.legend(fontsize=10,loc='upper right')
-    ax.set_ylabel('云量 (%)', fontsize=15)
-
-    if(draw_VIS==False):
-        xstklbls = mpl.dates.DateFormatter('%m月%d日%H时')
-        ax.xaxis.set_major_formatter(xstklbls)
-        for label in ax.get_xticklabels():
+            self.issue_text.set_text(utl.cn_time(initial_time1 - timedelta(hours=2), "%Y年%m月%d日%H时")+'发布')
+        for label in self.ax_time.get_xticklabels():
             label.set_rotation(30)
             label.set_horizontalalignment('center')
-        
-        #发布信息————————————————————————————————————————————————
-        ax = plt.axes([0.05,0.08,.94,.05])
-        ax.axis([0, 10, 0, 10])
-        ax.axis('off')
-        utl.add_logo_extra_in_axes(pos=[0.7,0.23,.05,.05],which='nmc', size='Xlarge')
-        ax.text(7.5, 33,(initial_time1 - timedelta(hours=2)).strftime("%Y年%m月%d日%H时")+'发布',size=15)
 
-    if(draw_VIS==True):
-        #能见度——————————————————————————————————————
-        # draw main figure
-        ax = plt.axes([0.05,0.15,.94,.15])
-
-        #VIS=pd.read_csv(dir_all['VIS_SC']+last_file[model])
-        for ifhour in VIS['forecast_period'].values:
-            if (ifhour == VIS['forecast_period'].values[0] ):
-                VIS_t=(initial_time2
-                    +timedelta(hours=ifhour))
-            else:
-                VIS_t=np.append(VIS_t,
-                                (initial_time2
-                                +timedelta(hours=ifhour)))
+        #出图——————————————————————————————————————————————————————————
+        if(output_dir != None ):
+            isExists=os.path.exists(output_dir)
+            if not isExists:
+                os.makedirs(output_dir)
+            output_path=(output_dir+extra_info['output_head_name']+
+                initial_time1.strftime("%Y%m%d%H")+
+                '00'+extra_info['output_tail_name']+'.jpg')
+            with instrument.span('save'):
+                self.fig.savefig(output_path, dpi=200,bbox_inches='tight')
+            return output_path
+        plt.show()
+        return None
 
-        #开启自适应
-        xaxis_intaval=mpl.dates.HourLocator(byhour=(8,20)) #单位是小时
-        ax.xaxis.set_major_locator(xaxis_intaval)
+    def close(self):
+        utl.close_figure(self.fig)
 
-        ax.fill_between(VIS_t, np.squeeze(VIS['data']), -100,facecolor='#B3E5FC')
-        ax.fill_between(VIS_t, np.squeeze(VIS['data']), 1,facecolor='#81D4FA')
-        ax.fill_between(VIS_t, np.squeeze(VIS['data']), 3,facecolor='#4FC3F7')
-        ax.fill_between(VIS_t, np.squeeze(VIS['data']), 5,facecolor='#29B6F6')
-        ax.fill_between(VIS_t, np.squeeze(VIS['data']), 10,facecolor='#03A9F4')
-        ax.fill_between(VIS_t, np.squeeze(VIS['data']), 15,facecolor='#039BE5')
-        ax.fill_between(VIS_t, np.squeeze(VIS['data']), 20,facecolor='#0288D1')
-        ax.fill_between(VIS_t, np.squeeze(VIS['data']), 25,facecolor='#0277BD')
-        ax.fill_between(VIS_t, np.squeeze(VIS['data']), 30,facecolor='#01579B')
-        ax.fill_between(VIS_t, np.squeeze(VIS['data']), 100,facecolor='#FFFFFF')
 
-        ax.plot(VIS_t,np.squeeze(VIS['data']))
-        if(drw_thr == True):
-            ax.plot([VIS_t[0],VIS_t[-1]],[5,5],c='#4CAF50',label='能见度一般影响',linewidth=1)
-            ax.plot([VIS_t[0],VIS_t[-1]],[3,3],c='#FFEB3B',label='能见度较大影响',linewidth=1)
-            ax.plot([VIS_t[0],VIS_t[-1]],[1,1],c='#F44336',label='能见度高影响',linewidth=1)
-            ax.legend(fontsize=10,loc='upper right')
-
-        xstklbls = mpl.dates.DateFormatter('%m月%d日%H时')
-        ax.xaxis.set_major_formatter(xstklbls)
-        for label in ax.get_xticklabels():
-            label.set_rotation(30)
-            label.set_horizontalalignment('center')
-        ax.tick_params(length=10)
-        ax.grid()
-        ax.grid(axis='x',c='black')
-        miloc = mpl.dates.HourLocator(byhour=(11,14,17,23,2,5)) #单位是小时
-        ax.xaxis.set_minor_locator(miloc)
-        ax.grid(axis='x', which='minor')    
-        plt.xlim(time_all[0],time_all[-1])
-        plt.ylim(0,25)
-        ax.set_ylabel('能见度 （km）', fontsize=15)
-            #发布信息————————————————————————————————————————————————
-        ax = plt.axes([0.05,0.08,.94,.05])
-        ax.axis([0, 10, 0, 10])
-        ax.axis('off')
-        utl.add_logo_extra_in_axes(pos=[0.7,0.06,.05,.05],which='nmc', size='Xlarge')
-        ax.text(7.5, 0.1,
-                (initial_time2 - timedelta(hours=2)).strftime("%Y年%m月%d日%H时")+'发布',size=15)
+@instrument.traced('draw')
+def draw_Station_Synthetical_Forecast_From_Cassandra(
+            t2m=None,Td2m=None,AT=None,u10m=None,v10m=None,u100m=None,v100m=None,
+            gust10m=None,wsp10m=None,wsp100m=None,r03=None,TCDC=None,LCDC=None,
+            draw_VIS=False,VIS=None,drw_thr=False,
+            time_all=None,
+            model=None,points=None,
+            output_dir=None,extra_info={
+            'output_head_name':' ',
+            'output_tail_name':' ',
+            'point_name':' ',
+            'upper_wind':False,
+            'upper_wind_lev':'800'}):
 
-    #出图——————————————————————————————————————————————————————————
-    if(output_dir != None ):
-        isExists=os.path.exists(output_dir)
-        if not isExists:
-            os.makedirs(output_dir)
-        plt.savefig(output_dir+extra_info['output_head_name']+
-        initial_time1.strftime("%Y%m%d%H")+
-        '00'+extra_info['output_tail_name']+'.jpg', dpi=200,bbox_inches='tight')
-    else:
-        plt.show()
+    template=MeteogramTemplate(draw_VIS=draw_VIS, drw_thr=drw_thr, interactive=(output_dir == None))
+    try:
+        template.render(
+            t2m=t2m,Td2m=Td2m,AT=AT,u10m=u10m,v10m=v10m,u100m=u100m,v100m=v100m,
+            gust10m=gust10m,wsp10m=wsp10m,wsp100m=wsp100m,r03=r03,TCDC=TCDC,LCDC=LCDC,
+            VIS=VIS,time_all=time_all,model=model,points=points,
+            output_dir=output_dir,extra_info=extra_info)
+    finally:
+        template.close()
 
 
+@instrument.traced('draw')
 def draw_Station_Snow_Synthetical_Forecast_From_Cassandra(
             TWC=None,AT=None,u10m=None,v10m=None,u100m=None,v100m=None,
             gust10m=None,wsp10m=None,wsp100m=None,SNOD1=None,SNOD2=None,SDEN=None,SN06=None,
@@ -314,32 +279,17 @@ def draw_Station_Snow_Synthetical_Forecast_From_Cassandra(
             'output_tail_name':' ',
             'point_name':' '}):
 
-    #if(sys.platform[0:3] == 'win'):
-    plt.rcParams['font.sans-serif'] = ['SimHei'] # 步骤一（替换sans-serif字体）
-    plt.rcParams['axes.unicode_minus'] = False  # 步骤二（解决坐标轴负数的负号显示问题）
-    if(sys.platform[0:3] == 'lin'):
-        locale.setlocale(locale.LC_CTYPE, 'zh_CN')
-    if(sys.platform[0:3] == 'win'):        
-        locale.setlocale(locale.LC_CTYPE, 'chinese')       
-
     initial_time1=pd.to_datetime(str(TWC['forecast_reference_time'].values)).replace(tzinfo=None).to_pydatetime()
     initial_time2=pd.to_datetime(str(VIS['forecast_reference_time'].values)).replace(tzinfo=None).to_pydatetime()
 
     # draw figure
-    fig=plt.figure(figsize=(12,16))
+    fig=utl.new_figure(figsize=(12,16), interactive=(output_dir == None))
     # draw main figure
     #风寒指数 体感温度————————————————————————————————————————————————
-    ax = plt.axes([0.05,0.83,.94,.15])
-    utl.add_public_title_sta(title=model+'预报 '+extra_info['point_name']+' ['+str(points['lon'][0])+','+str(points['lat'][0])+']',initial_time=initial_time1, fontsize=23)
+    ax = fig.add_axes([0.05,0.83,.94,.15])
+    utl.add_public_title_sta(title=model+'预报 '+extra_info['point_name']+' ['+str(points['lon'][0])+','+str(points['lat'][0])+']',initial_time=initial_time1, fontsize=23, ax=ax)
 
-    for ifhour in TWC['forecast_period'].values:
-        if (ifhour == TWC['forecast_period'].values[0] ):
-            TWC_t=(initial_time1
-                +timedelta(hours=ifhour))
-        else:
-            TWC_t=np.append(TWC_t,
-                            (initial_time1
-                            +timedelta(hours=ifhour)))
+    TWC_t=utl.forecast_time_axis(initial_time1, TWC['forecast_period'].values)
     #开启自适应
     xaxis_intaval=mpl.dates.HourLocator(byhour=(8,20)) #单位是小时
     ax.xaxis.set_major_locator(xaxis_intaval)
@@ -352,41 +302,20 @@ def draw_Station_Snow_Synthetical_Forecast_From_Cassandra(
     miloc = mpl.dates.HourLocator(byhour=(11,14,17,23,2,5)) #单位是小时
     ax.xaxis.set_minor_locator(miloc)
     ax.grid(axis='x', which='minor')
-    plt.xlim(time_all[0],time_all[-1])
-    plt.ylim(min([AT.values.min(),TWC.values.min()]),
+    ax.set_xlim(time_all[0],time_all[-1])
+    ax.set_ylim(min([AT.values.min(),TWC.values.min()]),
         max([AT.values.max(),TWC.values.max()]))
     ax.legend(fontsize=10,loc='upper right')
     ax.set_ylabel('2米体感温度 风寒指数 ($^\circ$C)', fontsize=15)
     
                       
     #10米风——————————————————————————————————————
-    ax = plt.axes([0.05,0.66,.94,.15])
-    for ifhour in u10m['forecast_period'].values:
-        if (ifhour == u10m['forecast_period'].values[0] ):
-            uv10m_t=(initial_time1
-                +timedelta(hours=ifhour))
-        else:
-            uv10m_t=np.append(uv10m_t,
-                            (initial_time1
-                            +timedelta(hours=ifhour)))
-
-    for ifhour in u100m['forecast_period'].values:
-        if (ifhour == u100m['forecast_period'].values[0] ):
-            uv100m_t=(initial_time1
-                +timedelta(hours=ifhour))
-        else:
-            uv100m_t=np.append(uv100m_t,
-                            (initial_time1
-                            +timedelta(hours=ifhour)))
+    ax = fig.add_axes([0.05,0.66,.94,.15])
+    uv10m_t=utl.forecast_time_axis(initial_time1, u10m['forecast_period'].values)
+
+    uv100m_t=utl.forecast_time_axis(initial_time1, u100m['forecast_period'].values)
             
-    for ifhour in gust10m['forecast_period'].values:
-        if (ifhour == gust10m['forecast_period'].values[0] ):
-            gust10m_t=(initial_time1
-                +timedelta(hours=ifhour))
-        else:
-            gust10m_t=np.append(gust10m_t,
-                            (initial_time1
-                            +timedelta(hours=ifhour)))
+    gust10m_t=utl.forecast_time_axis(initial_time1, gust10m['forecast_period'].values)
 
     ax.plot(uv10m_t, np.squeeze(wsp10m), c='#40C4FF',label='10米风',linewidth=3)
     ax.plot(uv100m_t,np.squeeze(wsp100m),c='#FF6F00',label='100米风',linewidth=3)
@@ -411,7 +340,7 @@ def draw_Station_Snow_Synthetical_Forecast_From_Cassandra(
     xaxis_intaval=mpl.dates.HourLocator(byhour=(8,20)) #单位是小时
     ax.xaxis.set_major_locator(xaxis_intaval)
     ax.set_xticklabels([' '])
-    plt.xlim(time_all[0],time_all[-1])    
+    ax.set_xlim(time_all[0],time_all[-1])    
     # add legend
     ax.legend(fontsize=10,loc='upper right')
     ax.tick_params(length=10)    
@@ -423,15 +352,8 @@ def draw_Station_Snow_Synthetical_Forecast_From_Cassandra(
     ax.set_ylabel('10米风 100米 风\n'+'风速 (m/s)', fontsize=15)
     #雪密度——————————————————————————————————————
     # draw main figure
-    ax = plt.axes([0.05,0.49,.94,.15])
-    for ifhour in SDEN['forecast_period'].values:
-        if (ifhour == SDEN['forecast_period'].values[0] ):
-            SDEN_t=(initial_time1
-                +timedelta(hours=ifhour))
-        else:
-            SDEN_t=np.append(SDEN_t,
-                            (initial_time1
-                            +timedelta(hours=ifhour)))
+    ax = fig.add_axes([0.05,0.49,.94,.15])
+    SDEN_t=utl.forecast_time_axis(initial_time1, SDEN['forecast_period'].values)
     #开启自适应
     xaxis_intaval=mpl.dates.HourLocator(byhour=(8,20)) #单位是小时
     ax.xaxis.set_major_locator(xaxis_intaval)
@@ -451,38 +373,17 @@ def draw_Station_Snow_Synthetical_Forecast_From_Cassandra(
     miloc = mpl.dates.HourLocator(byhour=(11,14,17,23,2,5)) #单位是小时
     ax.xaxis.set_minor_locator(miloc)
     ax.grid(axis='x', which='minor')    
-    plt.xlim(time_all[0],time_all[-1])
-    plt.ylim([np.squeeze(SDEN['data']).values.min(),np.squeeze(SDEN['data'].values.max())+2])
+    ax.set_xlim(time_all[0],time_all[-1])
+    ax.set_ylim([np.squeeze(SDEN['data']).values.min(),np.squeeze(SDEN['data'].values.max())+2])
     ax.set_ylabel('雪密度 (kg m-3)', fontsize=15)
     #积雪深度——————————————————————————————————————
     # draw main figure
-    ax = plt.axes([0.05,0.32,.94,.15])
-    for ifhour in SNOD1['forecast_period'].values:
-        if (ifhour == SNOD1['forecast_period'].values[0] ):
-            SNOD1_t=(initial_time1
-                +timedelta(hours=ifhour))
-        else:
-            SNOD1_t=np.append(SNOD1_t,
-                            (initial_time1
-                            +timedelta(hours=ifhour)))
+    ax = fig.add_axes([0.05,0.32,.94,.15])
+    SNOD1_t=utl.forecast_time_axis(initial_time1, SNOD1['forecast_period'].values)
     # draw main figure
-    for ifhour in SNOD2['forecast_period'].values:
-        if (ifhour == SNOD2['forecast_period'].values[0] ):
-            SNOD2_t=(initial_time1
-                +timedelta(hours=ifhour))
-        else:
-            SNOD2_t=np.append(SNOD2_t,
-                            (initial_time1
-                            +timedelta(hours=ifhour)))
-
-    for ifhour in SN06['forecast_period'].values:
-        if (ifhour == SN06['forecast_period'].values[0] ):
-            SN06_t=(initial_time1
-                +timedelta(hours=ifhour))
-        else:
-            SN06_t=np.append(SN06_t,
-                            (initial_time1
-                            +timedelta(hours=ifhour)))
+    SNOD2_t=utl.forecast_time_axis(initial_time1, SNOD2['forecast_period'].values)
+
+    SN06_t=utl.forecast_time_axis(initial_time1, SN06['forecast_period'].values)
     #开启自适应
     xaxis_intaval=mpl.dates.HourLocator(byhour=(8,20)) #单位是小时
     ax.xaxis.set_major_locator(xaxis_intaval)
@@ -500,56 +401,42 @@ def draw_Station_Snow_Synthetical_Forecast_From_Cassandra(
     miloc = mpl.dates.HourLocator(byhour=(11,14,17,23,2,5)) #单位是小时
     ax.xaxis.set_minor_locator(miloc)
     ax.grid(axis='x', which='minor')    
-    plt.xlim(time_all[0],time_all[-1])
-    plt.ylim(0,100)
+    ax.set_xlim(time_all[0],time_all[-1])
+    ax.set_ylim(0,100)
     ax.legend(fontsize=10,loc='upper right')
-    plt.ylim(min([np.squeeze(SNOD1['data']).values.min(),np.squeeze(SNOD2['data']).values.min()]),
+    ax.set_ylim(min([np.squeeze(SNOD1['data']).values.min(),np.squeeze(SNOD2['data']).values.min()]),
         max([np.squeeze(SNOD1['data']).values.max(),np.squeeze(SNOD2['data']).values.max()])+5)
     ax.set_ylabel('积雪深度 (cm)\n'+'6小时降雪量(mm)', fontsize=15)
 
     if(draw_VIS==False):
-        xstklbls = mpl.dates.DateFormatter('%m月%d日%H时')
+        xstklbls = utl.cn_date_formatter('%m月%d日%H时')
         ax.xaxis.set_major_formatter(xstklbls)
         for label in ax.get_xticklabels():
             label.set_rotation(30)
             label.set_horizontalalignment('center')
         
         #发布信息————————————————————————————————————————————————
-        ax = plt.axes([0.05,0.08,.94,.05])
+        ax = fig.add_axes([0.05,0.08,.94,.05])
         ax.axis([0, 10, 0, 10])
         ax.axis('off')
-        utl.add_logo_extra_in_axes(pos=[0.7,0.23,.05,.05],which='nmc', size='Xlarge')
-        ax.text(7.5, 33,(initial_time1 - timedelta(hours=2)).strftime("%Y年%m月%d日%H时")+'发布',size=15)
+        utl.add_logo_extra_in_axes(pos=[0.7,0.23,.05,.05],which='nmc', size='Xlarge',fig=fig)
+        ax.text(7.5, 33,utl.cn_time(initial_time1 - timedelta(hours=2), "%Y年%m月%d日%H时")+'发布',size=15)
 
     if(draw_VIS==True):
         #能见度——————————————————————————————————————
         # draw main figure
-        ax = plt.axes([0.05,0.15,.94,.15])
+        ax = fig.add_axes([0.05,0.15,.94,.15])
 
         #VIS=pd.read_csv(dir_all['VIS_SC']+last_file[model])
-        for ifhour in VIS['forecast_period'].values:
-            if (ifhour == VIS['forecast_period'].values[0] ):
-                VIS_t=(initial_time2
-                    +timedelta(hours=ifhour))
-            else:
-                VIS_t=np.append(VIS_t,
-                                (initial_time2
-                                +timedelta(hours=ifhour)))
+        VIS_t=utl.forecast_time_axis(initial_time2, VIS['forecast_period'].values)
 
         #开启自适应
         xaxis_intaval=mpl.dates.HourLocator(byhour=(8,20)) #单位是小时
         ax.xaxis.set_major_locator(xaxis_intaval)
 
-        ax.fill_between(VIS_t, np.squeeze(VIS['data']), -100,facecolor='#B3E5FC')
-        ax.fill_between(VIS_t, np.squeeze(VIS['data']), 1,facecolor='#81D4FA')
-        ax.fill_between(VIS_t, np.squeeze(VIS['data']), 3,facecolor='#4FC3F7')
-        ax.fill_between(VIS_t, np.squeeze(VIS['data']), 5,facecolor='#29B6F6')
-        ax.fill_between(VIS_t, np.squeeze(VIS['data']), 10,facecolor='#03A9F4')
-        ax.fill_between(VIS_t, np.squeeze(VIS['data']), 15,facecolor='#039BE5')
-        ax.fill_between(VIS_t, np.squeeze(VIS['data']), 20,facecolor='#0288D1')
-        ax.fill_between(VIS_t, np.squeeze(VIS['data']), 25,facecolor='#0277BD')
-        ax.fill_between(VIS_t, np.squeeze(VIS['data']), 30,facecolor='#01579B')
-        ax.fill_between(VIS_t, np.squeeze(VIS['data']), 100,facecolor='#FFFFFF')
+        utl.banded_fill(ax, VIS_t, np.squeeze(VIS['data']),
+            levels=[-100,1,3,5,10,15,20,25,30,100],
+            colors=['#B3E5FC','#81D4FA','#4FC3F7','#29B6F6','#03A9F4','#039BE5','#0288D1','#0277BD','#01579B','#FFFFFF'])
 
         ax.plot(VIS_t,np.squeeze(VIS['data']))
         if(drw_thr == True):
@@ -558,7 +445,7 @@ def draw_Station_Snow_Synthetical_Forecast_From_Cassandra(
             ax.plot([VIS_t[0],VIS_t[-1]],[1,1],c='#F44336',label='能见度高影响',linewidth=1)
             ax.legend(fontsize=10,loc='upper right')
 
-        xstklbls = mpl.dates.DateFormatter('%m月%d日%H时')
+        xstklbls = utl.cn_date_formatter('%m月%d日%H时')
         ax.xaxis.set_major_formatter(xstklbls)
         for label in ax.get_xticklabels():
             label.set_rotation(30)
@@ -569,37 +456,44 @@ def draw_Station_Snow_Synthetical_Forecast_From_Cassandra(
         miloc = mpl.dates.HourLocator(byhour=(11,14,17,23,2,5)) #单位是小时
         ax.xaxis.set_minor_locator(miloc)
         ax.grid(axis='x', which='minor')    
-        plt.xlim(time_all[0],time_all[-1])
-        plt.ylim(0,25)
+        ax.set_xlim(time_all[0],time_all[-1])
+        ax.set_ylim(0,25)
         ax.set_ylabel('能见度 （km）', fontsize=15)
             #发布信息————————————————————————————————————————————————
-        ax = plt.axes([0.05,0.08,.94,.05])
+        ax = fig.add_axes([0.05,0.08,.94,.05])
         ax.axis([0, 10, 0, 10])
         ax.axis('off')
-        utl.add_logo_extra_in_axes(pos=[0.7,0.06,.05,.05],which='nmc', size='Xlarge')
+        utl.add_logo_extra_in_axes(pos=[0.7,0.06,.05,.05],which='nmc', size='Xlarge',fig=fig)
         ax.text(7.5, 0.1,
-                (initial_time2 - timedelta(hours=2)).strftime("%Y年%m月%d日%H时")+'发布',size=15)
+                utl.cn_time(initial_time2 - timedelta(hours=2), "%Y年%m月%d日%H时")+'发布',size=15)
 
     #出图——————————————————————————————————————————————————————————
     if(output_dir != None ):
         isExists=os.path.exists(output_dir)
         if not isExists:
             os.makedirs(output_dir)
-        plt.savefig(output_dir+extra_info['output_head_name']+
-        initial_time1.strftime("%Y%m%d%H")+
-        '00'+extra_info['output_tail_name']+'.jpg', dpi=200,bbox_inches='tight')
+        with instrument.span('save'):
+            fig.savefig(output_dir+extra_info['output_head_name']+
+            initial_time1.strftime("%Y%m%d%H")+
+            '00'+extra_info['output_tail_name']+'.jpg', dpi=200,bbox_inches='tight')
     else:
         plt.show()
+    utl.close_figure(fig)
 
 
+@instrument.traced('draw')
 def draw_sta_skewT(p=None,T=None,Td=None,wind_speed=None,wind_dir=None,u=None,v=None,
-    fcst_info=None,output_dir=None):
-    fig = plt.figure(figsize=(9, 9))
+    fcst_info=None,output_dir=None,parcel=None):
+
+    """
+    :param parcel: dict of lcl_pressure (hPa), lcl_temperature and prof
+                   (degC) of the column, like the result of
+                   convection.convective_indices for many stations,
+                   default computed here with metpy.
+    """
+    fig = utl.new_figure(figsize=(9, 9), interactive=(output_dir == None))
     skew = SkewT(fig, rotation=45)
 
-    plt.rcParams['font.sans-serif'] = ['SimHei'] # 步骤一（替换sans-serif字体）
-    plt.rcParams['axes.unicode_minus'] = False  # 步骤二（解决坐标轴负数的负号显示问题）
-
     # Plot the data using normal plotting functions, in this case using
     # log scaling in Y, as dictated by the typical meteorological plot.
     skew.plot(p, T, 'r')
@@ -613,11 +507,18 @@ def draw_sta_skewT(p=None,T=None,Td=None,wind_speed=None,wind_dir=None,u=None,v=
     # `p`, `T`, and `Td` to lift the parcel from the surface. If `p` was inverted,
     # i.e. start from low value, 250 mb, to a high value, 1000 mb, the `-1` index
     # should be selected.
-    lcl_pressure, lcl_temperature = mpcalc.lcl(p[0], T[0], Td[0])
+    if parcel is None:
+        lcl_pressure, lcl_temperature = mpcalc.lcl(p[0], T[0], Td[0])
+    else:
+        lcl_pressure = parcel['lcl_pressure']*units.hPa
+        lcl_temperature = parcel['lcl_temperature']*units.degC
     skew.plot(lcl_pressure, lcl_temperature, 'ko', markerfacecolor='black')
 
     # Calculate full parcel profile and add to plot as black line
-    prof = mpcalc.parcel_profile(p, T[0], Td[0]).to('degC')
+    if parcel is None:
+        prof = mpcalc.parcel_profile(p, T[0], Td[0]).to('degC')
+    else:
+        prof = np.asarray(parcel['prof'])*units.degC
     skew.plot(p, prof, 'k', linewidth=2)
 
     # Shade areas of CAPE and CIN
@@ -634,32 +535,31 @@ def draw_sta_skewT(p=None,T=None,Td=None,wind_speed=None,wind_dir=None,u=None,v=
     skew.plot_mixing_lines()
 
     #forecast information
-    bax=plt.axes([0.12,0.88,.25,.07],facecolor='#FFFFFFCC')
+    bax=fig.add_axes([0.12,0.88,.25,.07],facecolor='#FFFFFFCC')
     bax.axis('off')
     bax.axis([0, 10, 0, 10])
 
     initial_time = pd.to_datetime(
         str(fcst_info['forecast_reference_time'].values)).replace(tzinfo=None).to_pydatetime()
-    if(sys.platform[0:3] == 'lin'):
-        locale.setlocale(locale.LC_CTYPE, 'zh_CN')
-    if(sys.platform[0:3] == 'win'):        
-        locale.setlocale(locale.LC_CTYPE, 'chinese')
-    plt.text(2.5, 7.5,'起报时间: '+initial_time.strftime("%Y年%m月%d日%H时"),size=11)
-    plt.text(2.5, 5.0,'['+str(fcst_info.attrs['model'])+'] '+str(int(fcst_info['forecast_period'].values[0]))+'小时预报探空',size=11)
-    plt.text(2.5, 2.5,'预报点: '+str(fcst_info.attrs['points']['lon'])+
+    bax.text(2.5, 7.5,'起报时间: '+utl.cn_time(initial_time, "%Y年%m月%d日%H时"),size=11)
+    bax.text(2.5, 5.0,'['+str(fcst_info.attrs['model'])+'] '+str(int(fcst_info['forecast_period'].values[0]))+'小时预报探空',size=11)
+    bax.text(2.5, 2.5,'预报点: '+str(fcst_info.attrs['points']['lon'])+
         ', '+str(fcst_info.attrs['points']['lat']),size=11)
-    plt.text(2.5, 0.5,'www.nmc.cn',size=11)
-    utl.add_logo_extra_in_axes(pos=[0.1,0.88,.07,.07],which='nmc', size='Xlarge')
+    bax.text(2.5, 0.5,'www.nmc.cn',size=11)
+    utl.add_logo_extra_in_axes(pos=[0.1,0.88,.07,.07],which='nmc', size='Xlarge',fig=fig)
 
     # Show the plot
     if(output_dir != None ):
-        plt.savefig(output_dir+'时间剖面产品_起报时间_'+
-        str(fcst_info['forecast_reference_time'].values)[0:13]+
-        '_预报时效_'+str(int(fcst_info.attrs['forecast_period'].values))
-        +'.png', dpi=200,bbox_inches='tight')
+        with instrument.span('save'):
+            fig.savefig(output_dir+'时间剖面产品_起报时间_'+
+            str(fcst_info['forecast_reference_time'].values)[0:13]+
+            '_预报时效_'+str(int(fcst_info['forecast_period'].values[0]))+
+            fcst_info.attrs.get('output_tail_name','')+'.png', dpi=200,bbox_inches='tight')
     else:
         plt.show()
+    utl.close_figure(fig)
 
+@instrument.traced('draw')
 def draw_point_wind(U=None,V=None,
         model=None,
         output_dir=None,
@@ -667,29 +567,15 @@ def draw_point_wind(U=None,V=None,
         time_info=None,
         extra_info=None):
 
-    plt.rcParams['font.sans-serif'] = ['SimHei'] # 步骤一（替换sans-serif字体）
-    plt.rcParams['axes.unicode_minus'] = False  # 步骤二（解决坐标轴负数的负号显示问题）
-    if(sys.platform[0:3] == 'lin'):
-        locale.setlocale(locale.LC_CTYPE, 'zh_CN')
-    if(sys.platform[0:3] == 'win'):        
-        locale.setlocale(locale.LC_CTYPE, 'chinese')       
-
     initial_time=pd.to_datetime(str(time_info['forecast_reference_time'].values)).replace(tzinfo=None).to_pydatetime()
 
     # draw figure
-    fig=plt.figure(figsize=(12,12))
+    fig=utl.new_figure(figsize=(12,12), interactive=(output_dir == None))
     # draw main figure    
     #10米风——————————————————————————————————————
-    ax = plt.axes([0.1,0.2,.8,.7])
-    utl.add_public_title_sta(title=model+'预报 '+extra_info['point_name']+' ['+str(points['lon'][0])+','+str(points['lat'][0])+']',initial_time=initial_time, fontsize=21)
-    for ifhour in time_info['forecast_period'].values:
-        if (ifhour == time_info['forecast_period'].values[0] ):
-            uv_t=(initial_time
-                +timedelta(hours=ifhour))
-        else:
-            uv_t=np.append(uv_t,
-                            (initial_time
-                            +timedelta(hours=ifhour)))
+    ax = fig.add_axes([0.1,0.2,.8,.7])
+    utl.add_public_title_sta(title=model+'预报 '+extra_info['point_name']+' ['+str(points['lon'][0])+','+str(points['lat'][0])+']',initial_time=initial_time, fontsize=21, ax=ax)
+    uv_t=utl.forecast_time_axis(initial_time, time_info['forecast_period'].values)
 
     wsp=(U**2+V**2)**0.5
     ax.plot(uv_t, np.squeeze(wsp), c='#40C4FF',linewidth=3)
@@ -701,11 +587,11 @@ def draw_point_wind(U=None,V=None,
 
     xaxis_intaval=mpl.dates.HourLocator(byhour=(8,20)) #单位是小时
     ax.xaxis.set_major_locator(xaxis_intaval)
-    plt.xlim(uv_t[0],uv_t[-1])    
+    ax.set_xlim(uv_t[0],uv_t[-1])    
     # add legend
     ax.legend(fontsize=15,loc='upper right')
     ax.tick_params(length=10)   
-    xstklbls = mpl.dates.DateFormatter('%m月%d日%H时')
+    xstklbls = utl.cn_date_formatter('%m月%d日%H时')
     for label in ax.get_xticklabels():
         label.set_rotation(30)
         label.set_horizontalalignment('center')
@@ -719,7 +605,7 @@ def draw_point_wind(U=None,V=None,
     ax.grid(axis='x', which='minor')    
     ax.set_ylabel('风速 (m/s)', fontsize=15)
 
-    utl.add_logo_extra_in_axes(pos=[0.1,0.8,.1,.1],which='nmc', size='Xlarge')
+    utl.add_logo_extra_in_axes(pos=[0.1,0.8,.1,.1],which='nmc', size='Xlarge',fig=fig)
 
     #出图——————————————————————————————————————————————————————————
     if(output_dir != None ):
@@ -727,34 +613,30 @@ def draw_point_wind(U=None,V=None,
         if not isExists:
             os.makedirs(output_dir)
 
-        output_dir2=output_dir+model+'_起报时间_'+initial_time.strftime("%Y年%m月%d日%H时")+'/'
+        output_dir2=output_dir+model+'_起报时间_'+utl.cn_time(initial_time, "%Y年%m月%d日%H时")+'/'
         if(os.path.exists(output_dir2) == False):
             os.makedirs(output_dir2)
 
-        plt.savefig(output_dir2+model+'_'+extra_info['point_name']+'_'+extra_info['output_head_name']+
-        initial_time.strftime("%Y%m%d%H")+
-        '00'+extra_info['output_tail_name']+'.jpg', dpi=200,bbox_inches='tight')
+        with instrument.span('save'):
+            fig.savefig(output_dir2+model+'_'+extra_info['point_name']+'_'+extra_info['output_head_name']+
+            initial_time.strftime("%Y%m%d%H")+
+            '00'+extra_info['output_tail_name']+'.jpg', dpi=200,bbox_inches='tight')
     else:
         plt.show()
+    utl.close_figure(fig)
 
 
+@instrument.traced('draw')
 def draw_point_fcst(t2m=None,u10m=None,v10m=None,rn=None,
         model=None,
         output_dir=None,
         points=None,
         extra_info=None):
 
-    plt.rcParams['font.sans-serif'] = ['SimHei'] # 步骤一（替换sans-serif字体）
-    plt.rcParams['axes.unicode_minus'] = False  # 步骤二（解决坐标轴负数的负号显示问题）
-    if(sys.platform[0:3] == 'lin'):
-        locale.setlocale(locale.LC_CTYPE, 'zh_CN')
-    if(sys.platform[0:3] == 'win'):        
-        locale.setlocale(locale.LC_CTYPE, 'chinese')       
-
     initial_time=pd.to_datetime(str(t2m['forecast_reference_time'].values)).replace(tzinfo=None).to_pydatetime()
 
     # draw figure
-    fig=plt.figure(figsize=(16,4.5))
+    fig=utl.new_figure(figsize=(16,4.5), interactive=(output_dir == None))
     ax_t2m = HostAxes(fig,[0.1,0.28,.8,.62])
     ax_rn = ParasiteAxes(ax_t2m, sharex=ax_t2m)
     #其他信息
@@ -778,29 +660,15 @@ def draw_point_fcst(t2m=None,u10m=None,v10m=None,rn=None,
     #2米温度——————————————————————————————————————
     if(model == '中央台指导'):
         model='智能网格'
-    utl.add_public_title_sta(title=model+'预报 '+extra_info['point_name']+' ['+str(points['lon'][0])+','+str(points['lat'][0])+']',initial_time=initial_time, fontsize=21)
-    for ifhour in t2m['forecast_period'].values:
-        if (ifhour == t2m['forecast_period'].values[0] ):
-            t2m_t=(initial_time
-                +timedelta(hours=ifhour))
-        else:
-            t2m_t=np.append(t2m_t,
-                            (initial_time
-                            +timedelta(hours=ifhour)))
+    utl.add_public_title_sta(title=model+'预报 '+extra_info['point_name']+' ['+str(points['lon'][0])+','+str(points['lat'][0])+']',initial_time=initial_time, fontsize=21, ax=ax_t2m)
+    t2m_t=utl.forecast_time_axis(initial_time, t2m['forecast_period'].values)
 
     curve_t2m=ax_t2m.plot(t2m_t, np.squeeze(t2m['data'].values), c='#FF6600',linewidth=3,label='2m温度')
     ax_t2m.set_xlim(t2m_t[0],t2m_t[-1])
     ax_t2m.set_ylim(math.floor(t2m['data'].values.min()/5)*5-2,
         math.ceil(t2m['data'].values.max()/5)*5)
     #降水——————————————————————————————————————
-    for ifhour in rn['forecast_period'].values:
-        if (ifhour == rn['forecast_period'].values[0] ):
-            rn_t=(initial_time
-                +timedelta(hours=ifhour))
-        else:
-            rn_t=np.append(rn_t,
-                            (initial_time
-                            +timedelta(hours=ifhour)))
+    rn_t=utl.forecast_time_axis(initial_time, rn['forecast_period'].values)
     mask = (rn['data'] < 999)
     rn=rn['data'].where(mask)
     ax_rn.bar(rn_t,np.squeeze(rn.values),width=0.1,color='#00008B',
@@ -830,15 +698,8 @@ def draw_point_fcst(t2m=None,u10m=None,v10m=None,rn=None,
     ax_rn.axis['right'].label.set_fontsize(15)
     ax_rn.axis['right'].major_ticklabels.set_fontsize(15)
     #10米风——————————————————————————————————————
-    ax_uv = plt.axes([0.1,0.16,.8,.12])
-    for ifhour in u10m['forecast_period'].values:
-        if (ifhour == u10m['forecast_period'].values[0] ):
-            uv_t=(initial_time
-                +timedelta(hours=ifhour))
-        else:
-            uv_t=np.append(uv_t,
-                            (initial_time
-                            +timedelta(hours=ifhour)))
+    ax_uv = fig.add_axes([0.1,0.16,.8,.12])
+    uv_t=utl.forecast_time_axis(initial_time, u10m['forecast_period'].values)
 
     wsp=(u10m**2+v10m**2)**0.5
     #curve_uv=ax_uv.plot(uv_t, np.squeeze(wsp['data'].values), c='#696969',linewidth=3,label='10m风')
@@ -851,7 +712,7 @@ def draw_point_fcst(t2m=None,u10m=None,v10m=None,rn=None,
     #ax_uv.axis('off')
     ax_uv.set_yticklabels([' '])
     #logo
-    utl.add_logo_extra_in_axes(pos=[0.87,0.00,.1,.1],which='nmc', size='Xlarge')
+    utl.add_logo_extra_in_axes(pos=[0.87,0.00,.1,.1],which='nmc', size='Xlarge',fig=fig)
 
     #开启自适应
     xaxis_intaval=mpl.dates.HourLocator(byhour=(8,20)) #单位是小时
@@ -863,7 +724,7 @@ def draw_point_fcst(t2m=None,u10m=None,v10m=None,rn=None,
     ax_uv.grid(axis='x',which='both',ls='--')    
     ax_uv.set_ylabel('10m风', fontsize=15)
 
-    xstklbls = mpl.dates.DateFormatter('%m月%d日%H时')
+    xstklbls = utl.cn_date_formatter('%m月%d日%H时')
     for label in ax_uv.get_xticklabels():
         label.set_rotation(30)
         label.set_horizontalalignment('center')
@@ -876,12 +737,14 @@ def draw_point_fcst(t2m=None,u10m=None,v10m=None,rn=None,
         if not isExists:
             os.makedirs(output_dir)
 
-        output_dir2=output_dir+model+'_起报时间_'+initial_time.strftime("%Y年%m月%d日%H时")+'/'
+        output_dir2=output_dir+model+'_起报时间_'+utl.cn_time(initial_time, "%Y年%m月%d日%H时")+'/'
         if(os.path.exists(output_dir2) == False):
             os.makedirs(output_dir2)
 
-        plt.savefig(output_dir2+model+'_'+extra_info['point_name']+'_'+extra_info['output_head_name']+
-        initial_time.strftime("%Y%m%d%H")+
-        '00'+extra_info['output_tail_name']+'.jpg', dpi=200,bbox_inches='tight')
+        with instrument.span('save'):
+            fig.savefig(output_dir2+model+'_'+extra_info['point_name']+'_'+extra_info['output_head_name']+
+            initial_time.strftime("%Y%m%d%H")+
+            '00'+extra_info['output_tail_name']+'.jpg', dpi=200,bbox_inches='tight')
     else:
-        plt.show()
\ No newline at end of file
+        plt.show()
+    utl.close_figure(fig)
\ No newline at end of file
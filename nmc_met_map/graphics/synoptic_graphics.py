@@ -4,33 +4,69 @@
 # Distributed under the terms of the GPL V3 License.
 
 import numpy as np
-import matplotlib as mpl
-import matplotlib.pyplot as plt
-import cartopy.crs as ccrs
-import cartopy.feature as cfeature
-from cartopy.mpl.gridliner import LONGITUDE_FORMATTER, LATITUDE_FORMATTER
-from nmc_met_graphics.plot.china_map import add_china_map_2cartopy
-from nmc_met_graphics.cmap.cm import guide_cmaps
-from nmc_met_graphics.plot.util import add_model_title
+from nmc_met_map.lib.lazy import lazy_import, lazy_attr
+mpl = lazy_import('matplotlib')
+plt = lazy_import('matplotlib.pyplot')
+ccrs = lazy_import('cartopy.crs')
+cfeature = lazy_import('cartopy.feature')
+LONGITUDE_FORMATTER = lazy_attr('cartopy.mpl.gridliner', 'LONGITUDE_FORMATTER')
+LATITUDE_FORMATTER = lazy_attr('cartopy.mpl.gridliner', 'LATITUDE_FORMATTER')
+add_china_map_2cartopy = lazy_attr('nmc_met_graphics.plot.china_map', 'add_china_map_2cartopy')
+guide_cmaps = lazy_attr('nmc_met_graphics.cmap.cm', 'guide_cmaps')
+add_model_title = lazy_attr('nmc_met_graphics.plot.util', 'add_model_title')
 import nmc_met_map.lib.utility as utl
+from nmc_met_map.lib import instrument
+from nmc_met_map.lib import contour_export
 from datetime import datetime, timedelta
-import pandas as pd
-import locale
+pd = lazy_import('pandas')
 import sys
-from matplotlib.colors import BoundaryNorm,ListedColormap
-import nmc_met_graphics.cmap.ctables as dk_ctables
+BoundaryNorm = lazy_attr('matplotlib.colors', 'BoundaryNorm')
+ListedColormap = lazy_attr('matplotlib.colors', 'ListedColormap')
+dk_ctables = lazy_import('nmc_met_graphics.cmap.ctables')
 
+@instrument.traced('draw')
 def draw_gh_uv_mslp(gh=None, uv=None, mslp=None,
                     map_extent=(50, 150, 0, 65),
                     regrid_shape=20,
                     add_china=True,city=True,south_China_sea=True,
                     output_dir=None,Global=False):
 
-    plt.rcParams['font.sans-serif'] = ['SimHei'] # 步骤一（替换sans-serif字体）
-    plt.rcParams['axes.unicode_minus'] = False  # 步骤二（解决坐标轴负数的负号显示问题）
+    fig, ax, bax = gh_uv_mslp_figure(gh=gh, uv=uv,
+        map_extent=map_extent, add_china=add_china, city=city,
+        south_China_sea=south_China_sea, Global=Global,
+        interactive=(output_dir == None))
+    plots, artists = gh_uv_mslp_layers(fig, ax, bax, gh=gh, uv=uv, mslp=mslp,
+        regrid_shape=regrid_shape)
+
+    initial_time = pd.to_datetime(
+    str(gh['init_time'])).replace(tzinfo=None).to_pydatetime()
+
+    # show figure
+    if(output_dir != None):
+        with instrument.span('save'):
+            png_name=(output_dir+'最高温度_预报_'+
+            '起报时间_'+utl.cn_time(initial_time, "%Y年%m月%d日%H时")+
+            '预报时效_'+str(gh['fhour'])+'小时'+'.png')
+            fig.savefig(png_name, dpi=200)
+        contour_export.export_plots(plots, png_name)
+    
+    if(output_dir == None):
+        plt.show()
+    utl.close_figure(fig)
+
+def gh_uv_mslp_figure(gh=None, uv=None,
+                    map_extent=(50, 150, 0, 65),
+                    add_china=True,city=True,south_China_sea=True,
+                    Global=False,interactive=False):
+
+    """
+    Static part of draw_gh_uv_mslp (map, title, logo), drawn once
+    for all frames of an animation.
+    :return: fig, map axes, forecast information axes.
+    """
 
     # draw figure
-    plt.figure(figsize=(16,9))
+    fig = utl.new_figure(figsize=(16,9), interactive=interactive)
 
     # set data projection
     if(Global == True):
@@ -39,9 +75,9 @@ def draw_gh_uv_mslp(gh=None, uv=None, mslp=None,
         plotcrs = ccrs.AlbersEqualArea(central_latitude=(map_extent[2]+map_extent[3])/2., 
             central_longitude=(map_extent[0]+map_extent[1])/2., standard_parallels=[30., 60.])
  
-    ax = plt.axes([0.01,0.1,.98,.84], projection=plotcrs)
+    ax = fig.add_axes([0.01,0.1,.98,.84], projection=plotcrs)
     
-    plt.title('['+gh['model']+'] '+
+    ax.set_title('['+gh['model']+'] '+
     gh['lev']+'hPa 位势高度场, '+
     uv['lev']+'hPa 风场, 海平面气压场', 
         loc='left', fontsize=30)
@@ -63,16 +99,60 @@ def draw_gh_uv_mslp(gh=None, uv=None, mslp=None,
         utl.add_china_map_2cartopy_public(
             ax, name='river', edgecolor='#74b9ff', lw=0.8, zorder=105,alpha=0.5)
 
+    # grid lines
+    gl = ax.gridlines(
+        crs=datacrs, linewidth=2, color='gray', alpha=0.5, linestyle='--', zorder=40)
+    gl.xlocator = mpl.ticker.FixedLocator(np.arange(0, 360, 15))
+    gl.ylocator = mpl.ticker.FixedLocator(np.arange(-90, 90, 15))
+
+    #http://earthpy.org/cartopy_backgroung.html
+    #C:\ProgramData\Anaconda3\Lib\site-packages\cartopy\data\raster\natural_earth
+    ax.background_img(name='RD', resolution='high', cache=True)
+
+    #forecast information
+    bax=fig.add_axes([0.01,0.835,.25,.1],facecolor='#FFFFFFCC')
+    bax.set_yticks([])
+    bax.set_xticks([])
+    bax.axis([0, 10, 0, 10])
+    bax.text(2.5, 0.5,'www.nmc.cn',size=15)
+
+    # add south China sea
+    if south_China_sea:
+        utl.add_south_China_sea(pos=[0.85,0.13,.1,.2],fig=fig)
+
+    small_city=False
+    if(map_extent2[1]-map_extent2[0] < 25):
+        small_city=True
+    if city:
+        utl.add_city_on_map(ax,map_extent=map_extent2,transform=datacrs,zorder=110,size=13,small_city=small_city)
+
+    utl.add_logo_extra_in_axes(pos=[-0.01,0.835,.1,.1],which='nmc', size='Xlarge',fig=fig)
+    return fig, ax, bax
+
+def gh_uv_mslp_layers(fig, ax, bax, gh=None, uv=None, mslp=None,
+                    regrid_shape=20, colorbar=True):
+
+    """
+    Data part of draw_gh_uv_mslp, the animation frames remove the
+    artists and draw the next forecast hour on the same figure.
+    :param colorbar: add the color bar (once per figure).
+    :return: plots, list of the drawn artists.
+    """
+
+    datacrs = ccrs.PlateCarree()
+
     # define return plots
     plots = {}
+    artists = []
     # draw mean sea level pressure
+    clevs_mslp = np.arange(960, 1065, 5)
     if mslp is not None:
         x, y = np.meshgrid(mslp['lon'], mslp['lat'])
-        clevs_mslp = np.arange(960, 1065, 5)
         cmap = guide_cmaps(26)
         plots['mslp'] = ax.contourf(
             x, y, np.squeeze(mslp['data']), clevs_mslp,
             cmap=cmap, alpha=0.8, zorder=10, transform=datacrs)
+        artists.append(plots['mslp'])
 
     # draw -hPa wind bards
     if uv is not None:
@@ -83,6 +163,7 @@ def draw_gh_uv_mslp(gh=None, uv=None, mslp=None,
             x, y, u, v, length=6, regrid_shape=regrid_shape,
             transform=datacrs, fill_empty=False, sizes=dict(emptybarb=0.05),
             zorder=20)
+        artists.append(plots['uv'])
 
     # draw -hPa geopotential height
     if gh is not None:
@@ -91,66 +172,28 @@ def draw_gh_uv_mslp(gh=None, uv=None, mslp=None,
         plots['gh'] = ax.contour(
             x, y, np.squeeze(gh['data']), clevs_gh, colors='purple',
             linewidths=2, transform=datacrs, zorder=30)
-        plt.clabel(plots['gh'], inline=1, fontsize=20, fmt='%.0f',colors='black')
-
-    # grid lines
-    gl = ax.gridlines(
-        crs=datacrs, linewidth=2, color='gray', alpha=0.5, linestyle='--', zorder=40)
-    gl.xlocator = mpl.ticker.FixedLocator(np.arange(0, 360, 15))
-    gl.ylocator = mpl.ticker.FixedLocator(np.arange(-90, 90, 15))
-
-    #http://earthpy.org/cartopy_backgroung.html
-    #C:\ProgramData\Anaconda3\Lib\site-packages\cartopy\data\raster\natural_earth
-    ax.background_img(name='RD', resolution='high')
-
-    #forecast information
-    bax=plt.axes([0.01,0.835,.25,.1],facecolor='#FFFFFFCC')
-    bax.set_yticks([])
-    bax.set_xticks([])
-    bax.axis([0, 10, 0, 10])
+        artists.append(plots['gh'])
+        artists.extend(ax.clabel(plots['gh'], inline=1, fontsize=20, fmt='%.0f',colors='black'))
 
     initial_time = pd.to_datetime(
     str(gh['init_time'])).replace(tzinfo=None).to_pydatetime()
     fcst_time=initial_time+timedelta(hours=gh['fhour'])
     #发布时间
-    if(sys.platform[0:3] == 'lin'):
-        locale.setlocale(locale.LC_CTYPE, 'zh_CN')
-    if(sys.platform[0:3] == 'win'):        
-        locale.setlocale(locale.LC_CTYPE, 'chinese')
-    plt.text(2.5, 7.5,'起报时间: '+initial_time.strftime("%Y年%m月%d日%H时"),size=15)
-    plt.text(2.5, 5,'预报时间: '+fcst_time.strftime("%Y年%m月%d日%H时"),size=15)
-    plt.text(2.5, 2.5,'预报时效: '+str(gh['fhour'])+'小时',size=15)
-    plt.text(2.5, 0.5,'www.nmc.cn',size=15)
+    artists.append(bax.text(2.5, 7.5,'起报时间: '+utl.cn_time(initial_time, "%Y年%m月%d日%H时"),size=15))
+    artists.append(bax.text(2.5, 5,'预报时间: '+utl.cn_time(fcst_time, "%Y年%m月%d日%H时"),size=15))
+    artists.append(bax.text(2.5, 2.5,'预报时效: '+str(gh['fhour'])+'小时',size=15))
 
     # add color bar
-    cax=plt.axes([0.11,0.06,.86,.02])
-    cb = plt.colorbar(plots['mslp'], cax=cax, orientation='horizontal',
-                      ticks=clevs_mslp[:-1],
-                      extend='max',extendrect=False)
-    cb.ax.tick_params(labelsize='x-large')                      
-    cb.set_label('Mean sea level pressure (hPa)',size=20)
-
-    # add south China sea
-    if south_China_sea:
-        utl.add_south_China_sea(pos=[0.85,0.13,.1,.2])
-
-    small_city=False
-    if(map_extent2[1]-map_extent2[0] < 25):
-        small_city=True
-    if city:
-        utl.add_city_on_map(ax,map_extent=map_extent2,transform=datacrs,zorder=110,size=13,small_city=small_city)
-
-    utl.add_logo_extra_in_axes(pos=[-0.01,0.835,.1,.1],which='nmc', size='Xlarge')
-
-    # show figure
-    if(output_dir != None):
-        plt.savefig(output_dir+'最高温度_预报_'+
-        '起报时间_'+initial_time.strftime("%Y年%m月%d日%H时")+
-        '预报时效_'+str(gh['fhour'])+'小时'+'.png', dpi=200)
-    
-    if(output_dir == None):
-        plt.show()
+    if colorbar:
+        cax=fig.add_axes([0.11,0.06,.86,.02])
+        cb = fig.colorbar(plots['mslp'], cax=cax, orientation='horizontal',
+                          ticks=clevs_mslp[:-1],
+                          extend='max',extendrect=False)
+        cb.ax.tick_params(labelsize='x-large')                      
+        cb.set_label('Mean sea level pressure (hPa)',size=20)
+    return plots, artists
 
+@instrument.traced('draw')
 def draw_gh_uv_wsp(gh=None, uv=None, wsp=None,
                     map_extent=(50, 150, 0, 65),
                     regrid_shape=20,
@@ -179,11 +222,8 @@ def draw_gh_uv_wsp(gh=None, uv=None, wsp=None,
     :Examples:
     """
 
-    plt.rcParams['font.sans-serif'] = ['SimHei'] # 步骤一（替换sans-serif字体）
-    plt.rcParams['axes.unicode_minus'] = False  # 步骤二（解决坐标轴负数的负号显示问题）
-
     # draw figure
-    plt.figure(figsize=(16,9))
+    fig = utl.new_figure(figsize=(16,9), interactive=(output_dir == None))
 
     # set data projection
     if(Global == True):
@@ -192,9 +232,9 @@ def draw_gh_uv_wsp(gh=None, uv=None, wsp=None,
         plotcrs = ccrs.AlbersEqualArea(central_latitude=(map_extent[2]+map_extent[3])/2., 
             central_longitude=(map_extent[0]+map_extent[1])/2., standard_parallels=[30., 60.])
  
-    ax = plt.axes([0.01,0.1,.98,.84], projection=plotcrs)
+    ax = fig.add_axes([0.01,0.1,.98,.84], projection=plotcrs)
     
-    plt.title('['+gh['model']+'] '+
+    ax.set_title('['+gh['model']+'] '+
     gh['lev']+'hPa 位势高度场, '+
     uv['lev']+'hPa 风场, 风速', 
         loc='left', fontsize=30)
@@ -251,7 +291,7 @@ def draw_gh_uv_wsp(gh=None, uv=None, wsp=None,
         plots['gh'] = ax.contour(
             x, y, np.squeeze(gh['data']), clevs_gh, colors='black',
             linewidths=2, transform=datacrs, zorder=110)
-        plt.clabel(plots['gh'], inline=1, fontsize=20, fmt='%.0f',colors='black')
+        ax.clabel(plots['gh'], inline=1, fontsize=20, fmt='%.0f',colors='black')
 
     # grid lines
     gl = ax.gridlines(
@@ -261,10 +301,10 @@ def draw_gh_uv_wsp(gh=None, uv=None, wsp=None,
 
     #http://earthpy.org/cartopy_backgroung.html
     #C:\ProgramData\Anaconda3\Lib\site-packages\cartopy\data\raster\natural_earth
-    ax.background_img(name='RD', resolution='high')
+    ax.background_img(name='RD', resolution='high', cache=True)
 
     #forecast information
-    bax=plt.axes([0.01,0.835,.25,.1],facecolor='#FFFFFFCC')
+    bax=fig.add_axes([0.01,0.835,.25,.1],facecolor='#FFFFFFCC')
     bax.set_yticks([])
     bax.set_xticks([])
     bax.axis([0, 10, 0, 10])
@@ -273,19 +313,15 @@ def draw_gh_uv_wsp(gh=None, uv=None, wsp=None,
     str(gh['init_time'])).replace(tzinfo=None).to_pydatetime()
     fcst_time=initial_time+timedelta(hours=gh['fhour'])
     #发布时间
-    if(sys.platform[0:3] == 'lin'):
-        locale.setlocale(locale.LC_CTYPE, 'zh_CN')
-    if(sys.platform[0:3] == 'win'):        
-        locale.setlocale(locale.LC_CTYPE, 'chinese')
-    plt.text(2.5, 7.5,'起报时间: '+initial_time.strftime("%Y年%m月%d日%H时"),size=15)
-    plt.text(2.5, 5,'预报时间: '+fcst_time.strftime("%Y年%m月%d日%H时"),size=15)
-    plt.text(2.5, 2.5,'预报时效: '+str(gh['fhour'])+'小时',size=15)
-    plt.text(2.5, 0.5,'www.nmc.cn',size=15)
+    bax.text(2.5, 7.5,'起报时间: '+utl.cn_time(initial_time, "%Y年%m月%d日%H时"),size=15)
+    bax.text(2.5, 5,'预报时间: '+utl.cn_time(fcst_time, "%Y年%m月%d日%H时"),size=15)
+    bax.text(2.5, 2.5,'预报时效: '+str(gh['fhour'])+'小时',size=15)
+    bax.text(2.5, 0.5,'www.nmc.cn',size=15)
 
     # add color bar
     if(wsp != None):
-        cax=plt.axes([0.11,0.06,.86,.02])
-        cb = plt.colorbar(plots['wsp'], cax=cax, orientation='horizontal',
+        cax=fig.add_axes([0.11,0.06,.86,.02])
+        cb = fig.colorbar(plots['wsp'], cax=cax, orientation='horizontal',
                       ticks=clevs_wsp[:],
                       extend='max',extendrect=False)
         cb.ax.tick_params(labelsize='x-large')                      
@@ -293,7 +329,7 @@ def draw_gh_uv_wsp(gh=None, uv=None, wsp=None,
 
     # add south China sea
     if south_China_sea:
-        utl.add_south_China_sea(pos=[0.85,0.13,.1,.2])
+        utl.add_south_China_sea(pos=[0.85,0.13,.1,.2],fig=fig)
 
     small_city=False
     if(map_extent2[1]-map_extent2[0] < 25):
@@ -301,17 +337,22 @@ def draw_gh_uv_wsp(gh=None, uv=None, wsp=None,
     if city:
         utl.add_city_on_map(ax,map_extent=map_extent2,transform=datacrs,zorder=110,size=13,small_city=small_city)
 
-    utl.add_logo_extra_in_axes(pos=[-0.01,0.835,.1,.1],which='nmc', size='Xlarge')
+    utl.add_logo_extra_in_axes(pos=[-0.01,0.835,.1,.1],which='nmc', size='Xlarge',fig=fig)
 
     # show figure
     if(output_dir != None):
-        plt.savefig(output_dir+'高度场_风_预报_'+
-        '起报时间_'+initial_time.strftime("%Y年%m月%d日%H时")+
-        '预报时效_'+str(gh['fhour'])+'小时'+'.png', dpi=200)
+        with instrument.span('save'):
+            png_name=(output_dir+'高度场_风_预报_'+
+            '起报时间_'+utl.cn_time(initial_time, "%Y年%m月%d日%H时")+
+            '预报时效_'+str(gh['fhour'])+'小时'+'.png')
+            fig.savefig(png_name, dpi=200)
+        contour_export.export_plots(plots, png_name)
     
     if(output_dir == None):
         plt.show()
+    utl.close_figure(fig)
 
+@instrument.traced('draw')
 def draw_gh_uv_r6(gh=None, uv=None, r6=None,
                     map_extent=(50, 150, 0, 65),
                     regrid_shape=20,
@@ -340,11 +381,8 @@ def draw_gh_uv_r6(gh=None, uv=None, r6=None,
     :Examples:
     """
 
-    plt.rcParams['font.sans-serif'] = ['SimHei'] # 步骤一（替换sans-serif字体）
-    plt.rcParams['axes.unicode_minus'] = False  # 步骤二（解决坐标轴负数的负号显示问题）
-
     # draw figure
-    plt.figure(figsize=(16,9))
+    fig = utl.new_figure(figsize=(16,9), interactive=(output_dir == None))
 
     # set data projection
     if(Global == True):
@@ -353,9 +391,9 @@ def draw_gh_uv_r6(gh=None, uv=None, r6=None,
         plotcrs = ccrs.AlbersEqualArea(central_latitude=(map_extent[2]+map_extent[3])/2., 
             central_longitude=(map_extent[0]+map_extent[1])/2., standard_parallels=[30., 60.])
  
-    ax = plt.axes([0.01,0.1,.98,.84], projection=plotcrs)
+    ax = fig.add_axes([0.01,0.1,.98,.84], projection=plotcrs)
     
-    plt.title('['+gh['model']+'] '+
+    ax.set_title('['+gh['model']+'] '+
     gh['lev']+'hPa 位势高度场, '+
     uv['lev']+'hPa 风场, 6小时降水', 
         loc='left', fontsize=30)
@@ -405,7 +443,7 @@ def draw_gh_uv_r6(gh=None, uv=None, r6=None,
         plots['gh'] = ax.contour(
             x, y, np.squeeze(gh['data']), clevs_gh, colors='black',
             linewidths=2, transform=datacrs, zorder=30)
-        plt.clabel(plots['gh'], inline=1, fontsize=20, fmt='%.0f',colors='black')
+        ax.clabel(plots['gh'], inline=1, fontsize=20, fmt='%.0f',colors='black')
 
     # grid lines
     gl = ax.gridlines(
@@ -415,10 +453,10 @@ def draw_gh_uv_r6(gh=None, uv=None, r6=None,
 
     #http://earthpy.org/cartopy_backgroung.html
     #C:\ProgramData\Anaconda3\Lib\site-packages\cartopy\data\raster\natural_earth
-    ax.background_img(name='RD', resolution='high')
+    ax.background_img(name='RD', resolution='high', cache=True)
 
     #forecast information
-    bax=plt.axes([0.01,0.835,.25,.1],facecolor='#FFFFFFCC')
+    bax=fig.add_axes([0.01,0.835,.25,.1],facecolor='#FFFFFFCC')
     bax.set_yticks([])
     bax.set_xticks([])
     bax.axis([0, 10, 0, 10])
@@ -427,19 +465,15 @@ def draw_gh_uv_r6(gh=None, uv=None, r6=None,
     str(gh['init_time'])).replace(tzinfo=None).to_pydatetime()
     fcst_time=initial_time+timedelta(hours=gh['fhour'])
     #发布时间
-    if(sys.platform[0:3] == 'lin'):
-        locale.setlocale(locale.LC_CTYPE, 'zh_CN')
-    if(sys.platform[0:3] == 'win'):        
-        locale.setlocale(locale.LC_CTYPE, 'chinese')
-    plt.text(2.5, 7.5,'起报时间: '+initial_time.strftime("%Y年%m月%d日%H时"),size=15)
-    plt.text(2.5, 5,'预报时间: '+fcst_time.strftime("%Y年%m月%d日%H时"),size=15)
-    plt.text(2.5, 2.5,'预报时效: '+str(gh['fhour'])+'小时',size=15)
-    plt.text(2.5, 0.5,'www.nmc.cn',size=15)
+    bax.text(2.5, 7.5,'起报时间: '+utl.cn_time(initial_time, "%Y年%m月%d日%H时"),size=15)
+    bax.text(2.5, 5,'预报时间: '+utl.cn_time(fcst_time, "%Y年%m月%d日%H时"),size=15)
+    bax.text(2.5, 2.5,'预报时效: '+str(gh['fhour'])+'小时',size=15)
+    bax.text(2.5, 0.5,'www.nmc.cn',size=15)
 
     # add color bar
     if(r6 != None):
-        cax=plt.axes([0.11,0.06,.86,.02])
-        cb = plt.colorbar(plots['r6'], cax=cax, orientation='horizontal',
+        cax=fig.add_axes([0.11,0.06,.86,.02])
+        cb = fig.colorbar(plots['r6'], cax=cax, orientation='horizontal',
                       ticks=clevs_r6[:],
                       extend='max',extendrect=False)
         cb.ax.tick_params(labelsize='x-large')                      
@@ -447,7 +481,7 @@ def draw_gh_uv_r6(gh=None, uv=None, r6=None,
 
     # add south China sea
     if south_China_sea:
-        utl.add_south_China_sea(pos=[0.85,0.13,.1,.2])
+        utl.add_south_China_sea(pos=[0.85,0.13,.1,.2],fig=fig)
 
     small_city=False
     if(map_extent2[1]-map_extent2[0] < 25):
@@ -455,29 +489,31 @@ def draw_gh_uv_r6(gh=None, uv=None, r6=None,
     if city:
         utl.add_city_on_map(ax,map_extent=map_extent2,transform=datacrs,zorder=110,size=13,small_city=small_city)
 
-    utl.add_logo_extra_in_axes(pos=[-0.01,0.835,.1,.1],which='nmc', size='Xlarge')
+    utl.add_logo_extra_in_axes(pos=[-0.01,0.835,.1,.1],which='nmc', size='Xlarge',fig=fig)
 
     # show figure
     if(output_dir != None):
-        plt.savefig(output_dir+'高度场_风场_降水_预报_'+
-        '起报时间_'+initial_time.strftime("%Y年%m月%d日%H时")+
-        '预报时效_'+str(gh['fhour'])+'小时'+'.png', dpi=200)
+        with instrument.span('save'):
+            png_name=(output_dir+'高度场_风场_降水_预报_'+
+            '起报时间_'+utl.cn_time(initial_time, "%Y年%m月%d日%H时")+
+            '预报时效_'+str(gh['fhour'])+'小时'+'.png')
+            fig.savefig(png_name, dpi=200)
+        contour_export.export_plots(plots, png_name)
     
     if(output_dir == None):
         plt.show()      
+    utl.close_figure(fig)
 
 
+@instrument.traced('draw')
 def draw_PV_Div_uv(pv=None, uv=None, div=None,
                     map_extent=(50, 150, 0, 65),
                     regrid_shape=20,
                     add_china=True,city=False,south_China_sea=True,
                     output_dir=None,Global=False):
 
-    plt.rcParams['font.sans-serif'] = ['SimHei'] # 步骤一（替换sans-serif字体）
-    plt.rcParams['axes.unicode_minus'] = False  # 步骤二（解决坐标轴负数的负号显示问题）
-
     # draw figure
-    plt.figure(figsize=(16,9))
+    fig = utl.new_figure(figsize=(16,9), interactive=(output_dir == None))
 
     # set data projection
     if(Global == True):
@@ -486,9 +522,9 @@ def draw_PV_Div_uv(pv=None, uv=None, div=None,
         plotcrs = ccrs.AlbersEqualArea(central_latitude=(map_extent[2]+map_extent[3])/2., 
             central_longitude=(map_extent[0]+map_extent[1])/2., standard_parallels=[30., 60.])
  
-    ax = plt.axes([0.01,0.1,.98,.84], projection=plotcrs)
+    ax = fig.add_axes([0.01,0.1,.98,.84], projection=plotcrs)
     
-    plt.title('['+pv['model']+'] '+
+    ax.set_title('['+pv['model']+'] '+
     pv['lev']+'hPa 位涡扰动, 风场, 散度', 
         loc='left', fontsize=30)
         
@@ -518,7 +554,7 @@ def draw_PV_Div_uv(pv=None, uv=None, div=None,
         z=np.squeeze(div['data'])
         clevs_div = np.arange(-15, 16, 1)
         plots['div'] = ax.contourf(
-            x, y, z*1e5,clevs_div,cmap=plt.cm.PuOr,
+            x, y, z*1e5,clevs_div,cmap=mpl.cm.PuOr,
             transform=datacrs,alpha=0.5,extend='both')
 
     # draw -hPa wind bards
@@ -538,7 +574,7 @@ def draw_PV_Div_uv(pv=None, uv=None, div=None,
         plots['pv'] = ax.contour(
             x, y, np.squeeze(pv['data'])*1e6, clevs_pv, colors='black',
             linewidths=2, transform=datacrs, zorder=30)
-        plt.clabel(plots['pv'], inline=1, fontsize=20, fmt='%.0f',colors='black')
+        ax.clabel(plots['pv'], inline=1, fontsize=20, fmt='%.0f',colors='black')
 
     # grid lines
     gl = ax.gridlines(
@@ -548,10 +584,10 @@ def draw_PV_Div_uv(pv=None, uv=None, div=None,
 
     #http://earthpy.org/cartopy_backgroung.html
     #C:\ProgramData\Anaconda3\Lib\site-packages\cartopy\data\raster\natural_earth
-    ax.background_img(name='RD', resolution='high')
+    ax.background_img(name='RD', resolution='high', cache=True)
 
     #forecast information
-    bax=plt.axes([0.01,0.835,.25,.1],facecolor='#FFFFFFCC')
+    bax=fig.add_axes([0.01,0.835,.25,.1],facecolor='#FFFFFFCC')
     bax.set_yticks([])
     bax.set_xticks([])
     bax.axis([0, 10, 0, 10])
@@ -560,19 +596,15 @@ def draw_PV_Div_uv(pv=None, uv=None, div=None,
     str(pv['init_time'])).replace(tzinfo=None).to_pydatetime()
     fcst_time=initial_time+timedelta(hours=pv['fhour'])
     #发布时间
-    if(sys.platform[0:3] == 'lin'):
-        locale.setlocale(locale.LC_CTYPE, 'zh_CN')
-    if(sys.platform[0:3] == 'win'):        
-        locale.setlocale(locale.LC_CTYPE, 'chinese')
-    plt.text(2.5, 7.5,'起报时间: '+initial_time.strftime("%Y年%m月%d日%H时"),size=15)
-    plt.text(2.5, 5,'预报时间: '+fcst_time.strftime("%Y年%m月%d日%H时"),size=15)
-    plt.text(2.5, 2.5,'预报时效: '+str(pv['fhour'])+'小时',size=15)
-    plt.text(2.5, 0.5,'www.nmc.cn',size=15)
+    bax.text(2.5, 7.5,'起报时间: '+utl.cn_time(initial_time, "%Y年%m月%d日%H时"),size=15)
+    bax.text(2.5, 5,'预报时间: '+utl.cn_time(fcst_time, "%Y年%m月%d日%H时"),size=15)
+    bax.text(2.5, 2.5,'预报时效: '+str(pv['fhour'])+'小时',size=15)
+    bax.text(2.5, 0.5,'www.nmc.cn',size=15)
 
     # add color bar
     if(div != None):
-        cax=plt.axes([0.11,0.06,.86,.02])
-        cb = plt.colorbar(plots['div'], cax=cax, orientation='horizontal',
+        cax=fig.add_axes([0.11,0.06,.86,.02])
+        cb = fig.colorbar(plots['div'], cax=cax, orientation='horizontal',
                       ticks=clevs_div[:],
                       extend='both',extendrect=False)
         cb.ax.tick_params(labelsize='x-large')                      
@@ -580,7 +612,7 @@ def draw_PV_Div_uv(pv=None, uv=None, div=None,
 
     # add south China sea
     if south_China_sea:
-        utl.add_south_China_sea(pos=[0.85,0.13,.1,.2])
+        utl.add_south_China_sea(pos=[0.85,0.13,.1,.2],fig=fig)
 
     small_city=False
     if(map_extent2[1]-map_extent2[0] < 25):
@@ -588,13 +620,17 @@ def draw_PV_Div_uv(pv=None, uv=None, div=None,
     if city:
         utl.add_city_on_map(ax,map_extent=map_extent2,transform=datacrs,zorder=110,size=13,small_city=small_city)
 
-    utl.add_logo_extra_in_axes(pos=[-0.01,0.835,.1,.1],which='nmc', size='Xlarge')
+    utl.add_logo_extra_in_axes(pos=[-0.01,0.835,.1,.1],which='nmc', size='Xlarge',fig=fig)
 
     # show figure
     if(output_dir != None):
-        plt.savefig(output_dir+'位涡_风场_散度_预报_'+
-        '起报时间_'+initial_time.strftime("%Y年%m月%d日%H时")+
-        '预报时效_'+str(pv['fhour'])+'小时'+'.png', dpi=200)
+        with instrument.span('save'):
+            png_name=(output_dir+'位涡_风场_散度_预报_'+
+            '起报时间_'+utl.cn_time(initial_time, "%Y年%m月%d日%H时")+
+            '预报时效_'+str(pv['fhour'])+'小时'+'.png')
+            fig.savefig(png_name, dpi=200)
+        contour_export.export_plots(plots, png_name)
     
     if(output_dir == None):
-        plt.show()              
\ No newline at end of file
+        plt.show()              
+    utl.close_figure(fig)
\ No newline at end of file
@@ -1,32 +1,33 @@
 import numpy as np
-import matplotlib as mpl
-import matplotlib.pyplot as plt
-import cartopy.crs as ccrs
-import cartopy.feature as cfeature
-from cartopy.mpl.gridliner import LONGITUDE_FORMATTER, LATITUDE_FORMATTER
-from nmc_met_graphics.plot.china_map import add_china_map_2cartopy
-from nmc_met_graphics.cmap.cm import guide_cmaps
-from nmc_met_graphics.plot.util import add_model_title
+from nmc_met_map.lib.lazy import lazy_import, lazy_attr
+mpl = lazy_import('matplotlib')
+plt = lazy_import('matplotlib.pyplot')
+ccrs = lazy_import('cartopy.crs')
+cfeature = lazy_import('cartopy.feature')
+LONGITUDE_FORMATTER = lazy_attr('cartopy.mpl.gridliner', 'LONGITUDE_FORMATTER')
+LATITUDE_FORMATTER = lazy_attr('cartopy.mpl.gridliner', 'LATITUDE_FORMATTER')
+add_china_map_2cartopy = lazy_attr('nmc_met_graphics.plot.china_map', 'add_china_map_2cartopy')
+guide_cmaps = lazy_attr('nmc_met_graphics.cmap.cm', 'guide_cmaps')
+add_model_title = lazy_attr('nmc_met_graphics.plot.util', 'add_model_title')
 import nmc_met_map.lib.utility as utl
+from nmc_met_map.lib import instrument
 from datetime import datetime, timedelta
-import pandas as pd
-import locale
+pd = lazy_import('pandas')
 import sys
-from matplotlib.colors import BoundaryNorm,ListedColormap
-import nmc_met_graphics.cmap.ctables as dk_ctables
+BoundaryNorm = lazy_attr('matplotlib.colors', 'BoundaryNorm')
+ListedColormap = lazy_attr('matplotlib.colors', 'ListedColormap')
+dk_ctables = lazy_import('nmc_met_graphics.cmap.ctables')
 import nmc_met_map.lib.gy_ctables as gy_ctables
 
+@instrument.traced('draw')
 def draw_gh_uv_thetae(gh=None, uv=None, thetae=None,
                     map_extent=(50, 150, 0, 65),
                     regrid_shape=20,
                     add_china=True,city=True,south_China_sea=True,
                     output_dir=None,Global=False):
 
-    plt.rcParams['font.sans-serif'] = ['SimHei'] # 步骤一（替换sans-serif字体）
-    plt.rcParams['axes.unicode_minus'] = False  # 步骤二（解决坐标轴负数的负号显示问题）
-
     # draw figure
-    plt.figure(figsize=(16,9))
+    fig = utl.new_figure(figsize=(16,9), interactive=(output_dir == None))
 
     # set data projection
     if(Global == True):
@@ -35,9 +36,9 @@ def draw_gh_uv_thetae(gh=None, uv=None, thetae=None,
         plotcrs = ccrs.AlbersEqualArea(central_latitude=(map_extent[2]+map_extent[3])/2., 
             central_longitude=(map_extent[0]+map_extent[1])/2., standard_parallels=[30., 60.])
  
-    ax = plt.axes([0.01,0.1,.98,.84], projection=plotcrs)
+    ax = fig.add_axes([0.01,0.1,.98,.84], projection=plotcrs)
     
-    plt.title('['+gh['model']+'] '+
+    ax.set_title('['+gh['model']+'] '+
     gh['lev']+'hPa 位势高度场, '+
     uv['lev']+'hPa 风场, '+
     thetae['lev']+'hPa 相当位温', 
@@ -90,7 +91,7 @@ def draw_gh_uv_thetae(gh=None, uv=None, thetae=None,
         plots['gh'] = ax.contour(
             x, y, np.squeeze(gh['data']), clevs_gh, colors='black',
             linewidths=2, transform=datacrs, zorder=110)
-        plt.clabel(plots['gh'], inline=1, fontsize=20, fmt='%.0f',colors='black')
+        ax.clabel(plots['gh'], inline=1, fontsize=20, fmt='%.0f',colors='black')
 
     # grid lines
     gl = ax.gridlines(
@@ -100,10 +101,10 @@ def draw_gh_uv_thetae(gh=None, uv=None, thetae=None,
 
     #http://earthpy.org/cartopy_backgroung.html
     #C:\ProgramData\Anaconda3\Lib\site-packages\cartopy\data\raster\natural_earth
-    ax.background_img(name='RD', resolution='high')
+    ax.background_img(name='RD', resolution='high', cache=True)
 
     #forecast information
-    bax=plt.axes([0.01,0.835,.25,.1],facecolor='#FFFFFFCC')
+    bax=fig.add_axes([0.01,0.835,.25,.1],facecolor='#FFFFFFCC')
     bax.set_yticks([])
     bax.set_xticks([])
     bax.axis([0, 10, 0, 10])
@@ -112,25 +113,21 @@ def draw_gh_uv_thetae(gh=None, uv=None, thetae=None,
     str(gh['init_time'])).replace(tzinfo=None).to_pydatetime()
     fcst_time=initial_time+timedelta(hours=gh['fhour'])
     #发布时间
-    if(sys.platform[0:3] == 'lin'):
-        locale.setlocale(locale.LC_CTYPE, 'zh_CN')
-    if(sys.platform[0:3] == 'win'):        
-        locale.setlocale(locale.LC_CTYPE, 'chinese')
-    plt.text(2.5, 7.5,'起报时间: '+initial_time.strftime("%Y年%m月%d日%H时"),size=15)
-    plt.text(2.5, 5,'预报时间: '+fcst_time.strftime("%Y年%m月%d日%H时"),size=15)
-    plt.text(2.5, 2.5,'预报时效: '+str(gh['fhour'])+'小时',size=15)
-    plt.text(2.5, 0.5,'www.nmc.cn',size=15)
+    bax.text(2.5, 7.5,'起报时间: '+utl.cn_time(initial_time, "%Y年%m月%d日%H时"),size=15)
+    bax.text(2.5, 5,'预报时间: '+utl.cn_time(fcst_time, "%Y年%m月%d日%H时"),size=15)
+    bax.text(2.5, 2.5,'预报时效: '+str(gh['fhour'])+'小时',size=15)
+    bax.text(2.5, 0.5,'www.nmc.cn',size=15)
 
     # add color bar
     if(thetae != None):
-        cax=plt.axes([0.11,0.06,.86,.02])
-        cb = plt.colorbar(plots['thetae'], cax=cax, orientation='horizontal')
+        cax=fig.add_axes([0.11,0.06,.86,.02])
+        cb = fig.colorbar(plots['thetae'], cax=cax, orientation='horizontal')
         cb.ax.tick_params(labelsize='x-large')                      
         cb.set_label('Theta-E (K)',size=20)
 
     # add south China sea
     if south_China_sea:
-        utl.add_south_China_sea(pos=[0.85,0.13,.1,.2])
+        utl.add_south_China_sea(pos=[0.85,0.13,.1,.2],fig=fig)
 
     small_city=False
     if(map_extent2[1]-map_extent2[0] < 25):
@@ -138,29 +135,29 @@ def draw_gh_uv_thetae(gh=None, uv=None, thetae=None,
     if city:
         utl.add_city_on_map(ax,map_extent=map_extent2,transform=datacrs,zorder=110,size=13,small_city=small_city)
 
-    utl.add_logo_extra_in_axes(pos=[-0.01,0.835,.1,.1],which='nmc', size='Xlarge')
+    utl.add_logo_extra_in_axes(pos=[-0.01,0.835,.1,.1],which='nmc', size='Xlarge',fig=fig)
 
     # show figure
     if(output_dir != None):
-        plt.savefig(output_dir+'位势高度场_风场_相当位温_预报_'+
-        '起报时间_'+initial_time.strftime("%Y年%m月%d日%H时")+
-        '预报时效_'+str(gh['fhour'])+'小时'+'.png', dpi=200)
+        with instrument.span('save'):
+            fig.savefig(output_dir+'位势高度场_风场_相当位温_预报_'+
+            '起报时间_'+utl.cn_time(initial_time, "%Y年%m月%d日%H时")+
+            '预报时效_'+str(gh['fhour'])+'小时'+'.png', dpi=200)
     
     if(output_dir == None):
         plt.show()                
+    utl.close_figure(fig)
 
 
+@instrument.traced('draw')
 def draw_gh_uv_tmp(gh=None, uv=None, tmp=None,
                     map_extent=(50, 150, 0, 65),
                     regrid_shape=20,
                     add_china=True,city=True,south_China_sea=True,
                     output_dir=None,Global=False):
 
-    plt.rcParams['font.sans-serif'] = ['SimHei'] # 步骤一（替换sans-serif字体）
-    plt.rcParams['axes.unicode_minus'] = False  # 步骤二（解决坐标轴负数的负号显示问题）
-
     # draw figure
-    plt.figure(figsize=(16,9))
+    fig = utl.new_figure(figsize=(16,9), interactive=(output_dir == None))
 
     # set data projection
     if(Global == True):
@@ -169,9 +166,9 @@ def draw_gh_uv_tmp(gh=None, uv=None, tmp=None,
         plotcrs = ccrs.AlbersEqualArea(central_latitude=(map_extent[2]+map_extent[3])/2., 
             central_longitude=(map_extent[0]+map_extent[1])/2., standard_parallels=[30., 60.])
  
-    ax = plt.axes([0.01,0.1,.98,.84], projection=plotcrs)
+    ax = fig.add_axes([0.01,0.1,.98,.84], projection=plotcrs)
     
-    plt.title('['+gh['model']+'] '+
+    ax.set_title('['+gh['model']+'] '+
     gh['lev']+'hPa 位势高度场, '+
     uv['lev']+'hPa 风场, '+
     tmp['lev']+'hPa 温度', 
@@ -223,7 +220,7 @@ def draw_gh_uv_tmp(gh=None, uv=None, tmp=None,
         plots['gh'] = ax.contour(
             x, y, np.squeeze(gh['data']), clevs_gh, colors='black',
             linewidths=2, transform=datacrs, zorder=110)
-        plt.clabel(plots['gh'], inline=1, fontsize=20, fmt='%.0f',colors='black')
+        ax.clabel(plots['gh'], inline=1, fontsize=20, fmt='%.0f',colors='black')
 
     # grid lines
     gl = ax.gridlines(
@@ -233,10 +230,10 @@ def draw_gh_uv_tmp(gh=None, uv=None, tmp=None,
 
     #http://earthpy.org/cartopy_backgroung.html
     #C:\ProgramData\Anaconda3\Lib\site-packages\cartopy\data\raster\natural_earth
-    ax.background_img(name='RD', resolution='high')
+    ax.background_img(name='RD', resolution='high', cache=True)
 
     #forecast information
-    bax=plt.axes([0.01,0.835,.25,.1],facecolor='#FFFFFFCC')
+    bax=fig.add_axes([0.01,0.835,.25,.1],facecolor='#FFFFFFCC')
     bax.set_yticks([])
     bax.set_xticks([])
     bax.axis([0, 10, 0, 10])
@@ -245,25 +242,21 @@ def draw_gh_uv_tmp(gh=None, uv=None, tmp=None,
     str(gh['init_time'])).replace(tzinfo=None).to_pydatetime()
     fcst_time=initial_time+timedelta(hours=gh['fhour'])
     #发布时间
-    if(sys.platform[0:3] == 'lin'):
-        locale.setlocale(locale.LC_CTYPE, 'zh_CN')
-    if(sys.platform[0:3] == 'win'):        
-        locale.setlocale(locale.LC_CTYPE, 'chinese')
-    plt.text(2.5, 7.5,'起报时间: '+initial_time.strftime("%Y年%m月%d日%H时"),size=15)
-    plt.text(2.5, 5,'预报时间: '+fcst_time.strftime("%Y年%m月%d日%H时"),size=15)
-    plt.text(2.5, 2.5,'预报时效: '+str(gh['fhour'])+'小时',size=15)
-    plt.text(2.5, 0.5,'www.nmc.cn',size=15)
+    bax.text(2.5, 7.5,'起报时间: '+utl.cn_time(initial_time, "%Y年%m月%d日%H时"),size=15)
+    bax.text(2.5, 5,'预报时间: '+utl.cn_time(fcst_time, "%Y年%m月%d日%H时"),size=15)
+    bax.text(2.5, 2.5,'预报时效: '+str(gh['fhour'])+'小时',size=15)
+    bax.text(2.5, 0.5,'www.nmc.cn',size=15)
 
     # add color bar
     if(tmp != None):
-        cax=plt.axes([0.11,0.06,.86,.02])
-        cb = plt.colorbar(plots['tmp'], cax=cax, orientation='horizontal')
+        cax=fig.add_axes([0.11,0.06,.86,.02])
+        cb = fig.colorbar(plots['tmp'], cax=cax, orientation='horizontal')
         cb.ax.tick_params(labelsize='x-large')                      
         cb.set_label('Temperature ('+u'°C'+')',size=20)
 
     # add south China sea
     if south_China_sea:
-        utl.add_south_China_sea(pos=[0.85,0.13,.1,.2])
+        utl.add_south_China_sea(pos=[0.85,0.13,.1,.2],fig=fig)
 
     small_city=False
     if(map_extent2[1]-map_extent2[0] < 25):
@@ -271,13 +264,179 @@ def draw_gh_uv_tmp(gh=None, uv=None, tmp=None,
     if city:
         utl.add_city_on_map(ax,map_extent=map_extent2,transform=datacrs,zorder=110,size=13,small_city=small_city)
 
-    utl.add_logo_extra_in_axes(pos=[-0.01,0.835,.1,.1],which='nmc', size='Xlarge')
+    utl.add_logo_extra_in_axes(pos=[-0.01,0.835,.1,.1],which='nmc', size='Xlarge',fig=fig)
 
     # show figure
     if(output_dir != None):
-        plt.savefig(output_dir+'位势高度场_风场_温度_预报_'+
-        '起报时间_'+initial_time.strftime("%Y年%m月%d日%H时")+
-        '预报时效_'+str(gh['fhour'])+'小时'+'.png', dpi=200)
+        with instrument.span('save'):
+            fig.savefig(output_dir+'位势高度场_风场_温度_预报_'+
+            '起报时间_'+utl.cn_time(initial_time, "%Y年%m月%d日%H时")+
+            '预报时效_'+str(gh['fhour'])+'小时'+'.png', dpi=200)
     
     if(output_dir == None):
-        plt.show()                        
\ No newline at end of file
+        plt.show()                        
+    utl.close_figure(fig)
+
+# levels, colors, colour below / above the levels (None is transparent), title and label
+CONVECTIVE_STYLES = {
+    'CAPE': {'levels': [100, 250, 500, 1000, 1500, 2000, 2500, 3000, 4000],
+             'colors': ['#FFF9C4', '#FFF176', '#FFD54F', '#FFB300', '#FB8C00',
+                        '#F4511E', '#D81B60', '#8E24AA'],
+             'under': None, 'over': '#4A148C', 'title': '对流有效位能', 'label': 'CAPE (J/kg)'},
+    'CIN': {'levels': [-500, -300, -200, -100, -50, -25],
+            'colors': ['#1A237E', '#3949AB', '#5C6BC0', '#9FA8DA', '#C5CAE9'],
+            'under': '#0D1240', 'over': None, 'title': '对流抑制能量', 'label': 'CIN (J/kg)'},
+    'LI': {'levels': [-10, -8, -6, -4, -2, 0],
+           'colors': ['#B71C1C', '#E53935', '#FB8C00', '#FFCA28', '#FFF59D'],
+           'under': '#7F0000', 'over': None, 'title': '抬升指数', 'label': 'LI ($^\circ$C)'},
+    'K': {'levels': [28, 32, 36, 40, 44],
+          'colors': ['#C8E6C9', '#81C784', '#FFEE58', '#FF9800'],
+          'under': None, 'over': '#E64A19', 'title': 'K指数', 'label': 'K ($^\circ$C)'},
+    'LCL': {'levels': [500, 600, 700, 750, 800, 850, 900, 950, 1000],
+            'colors': ['#0D47A1', '#1565C0', '#1E88E5', '#42A5F5', '#64B5F6',
+                       '#90CAF9', '#BBDEFB', '#E3F2FD'],
+            'under': '#0A2F6B', 'over': None, 'title': '抬升凝结高度', 'label': 'LCL (hPa)'},
+    'LFC': {'levels': [400, 500, 600, 700, 750, 800, 850, 900, 950],
+            'colors': ['#1B5E20', '#2E7D32', '#388E3C', '#43A047', '#66BB6A',
+                       '#81C784', '#A5D6A7', '#C8E6C9'],
+            'under': '#0F3D12', 'over': '#E8F5E9', 'title': '自由对流高度', 'label': 'LFC (hPa)'},
+    'EL': {'levels': [100, 150, 200, 250, 300, 400, 500, 600],
+           'colors': ['#4A148C', '#6A1B9A', '#8E24AA', '#AB47BC', '#CE93D8',
+                      '#E1BEE7', '#F3E5F5'],
+           'under': '#311B92', 'over': None, 'title': '平衡高度', 'label': 'EL (hPa)'},
+}
+
+@instrument.traced('draw')
+def draw_convective_index(conv=None, gh=None, uv=None,
+                    map_extent=(50, 150, 0, 65),
+                    regrid_shape=20,
+                    add_china=True,city=True,south_China_sea=True,
+                    output_dir=None,Global=False):
+
+    style = CONVECTIVE_STYLES[conv['name']]
+    parcel_name = {'surface': '地面', 'mu': '最不稳定'}.get(conv['parcel'], conv['parcel'])
+
+    # draw figure
+    fig = utl.new_figure(figsize=(16,9), interactive=(output_dir == None))
+
+    # set data projection
+    if(Global == True):
+        plotcrs = ccrs.Robinson(central_longitude=115.)
+    else:
+        plotcrs = ccrs.AlbersEqualArea(central_latitude=(map_extent[2]+map_extent[3])/2., 
+            central_longitude=(map_extent[0]+map_extent[1])/2., standard_parallels=[30., 60.])
+ 
+    ax = fig.add_axes([0.01,0.1,.98,.84], projection=plotcrs)
+    
+    ax.set_title('['+gh['model']+'] '+
+    gh['lev']+'hPa 位势高度场, '+
+    uv['lev']+'hPa 风场, '+
+    parcel_name+'气块'+style['title'], 
+        loc='left', fontsize=30)
+        
+    datacrs = ccrs.PlateCarree()
+
+    #adapt to the map ratio
+    map_extent2=utl.adjust_map_ratio(ax,map_extent=map_extent,datacrs=datacrs)
+    #adapt to the map ratio
+
+    ax.add_feature(cfeature.OCEAN)
+    utl.add_china_map_2cartopy_public(
+        ax, name='coastline', edgecolor='gray', lw=0.8, zorder=105,alpha=0.5)
+    if add_china:
+        utl.add_china_map_2cartopy_public(
+            ax, name='province', edgecolor='gray', lw=0.5, zorder=105)
+        utl.add_china_map_2cartopy_public(
+            ax, name='nation', edgecolor='black', lw=0.8, zorder=105)
+        utl.add_china_map_2cartopy_public(
+            ax, name='river', edgecolor='#74b9ff', lw=0.8, zorder=105,alpha=0.5)
+
+    # define return plots
+    plots = {}
+    # draw convective index
+    if conv is not None:
+        x, y = np.meshgrid(conv['lon'], conv['lat'])
+        z=np.ma.masked_invalid(np.squeeze(conv['data']))
+        cmap=ListedColormap(style['colors'], conv['name'])
+        cmap.set_under(color=[1,1,1,0] if style['under'] is None else style['under'],
+                       alpha=0.0 if style['under'] is None else None)
+        cmap.set_over(color=[1,1,1,0] if style['over'] is None else style['over'],
+                      alpha=0.0 if style['over'] is None else None)
+        cmap.set_bad(color=[1,1,1,0],alpha=0.0)
+        norm = BoundaryNorm(style['levels'], ncolors=cmap.N, clip=False)
+
+        plots['conv'] = ax.pcolormesh(
+            x, y, z, norm=norm,
+            cmap=cmap, zorder=100,transform=datacrs,alpha=0.6)
+
+    # draw -hPa wind bards
+    if uv is not None:
+        x, y = np.meshgrid(uv['lon'], uv['lat'])
+        u = np.squeeze(uv['udata']) * 2.5
+        v = np.squeeze(uv['vdata']) * 2.5
+        plots['uv'] = ax.barbs(
+            x, y, u, v, length=6, regrid_shape=regrid_shape,
+            transform=datacrs, fill_empty=False, sizes=dict(emptybarb=0.05),
+            zorder=110)
+
+    # draw -hPa geopotential height
+    if gh is not None:
+        x, y = np.meshgrid(gh['lon'], gh['lat'])
+        clevs_gh = np.append(np.append(np.arange(0, 480, 4),np.append(np.arange(480, 584, 8), np.arange(580, 604, 4))), np.arange(604, 2000, 8))
+        plots['gh'] = ax.contour(
+            x, y, np.squeeze(gh['data']), clevs_gh, colors='black',
+            linewidths=2, transform=datacrs, zorder=110)
+        ax.clabel(plots['gh'], inline=1, fontsize=20, fmt='%.0f',colors='black')
+
+    # grid lines
+    gl = ax.gridlines(
+        crs=datacrs, linewidth=2, color='gray', alpha=0.5, linestyle='--', zorder=40)
+    gl.xlocator = mpl.ticker.FixedLocator(np.arange(0, 360, 15))
+    gl.ylocator = mpl.ticker.FixedLocator(np.arange(-90, 90, 15))
+
+    ax.background_img(name='RD', resolution='high', cache=True)
+
+    #forecast information
+    bax=fig.add_axes([0.01,0.835,.25,.1],facecolor='#FFFFFFCC')
+    bax.set_yticks([])
+    bax.set_xticks([])
+    bax.axis([0, 10, 0, 10])
+
+    initial_time = pd.to_datetime(
+    str(gh['init_time'])).replace(tzinfo=None).to_pydatetime()
+    fcst_time=initial_time+timedelta(hours=gh['fhour'])
+    #发布时间
+    bax.text(2.5, 7.5,'起报时间: '+utl.cn_time(initial_time, "%Y年%m月%d日%H时"),size=15)
+    bax.text(2.5, 5,'预报时间: '+utl.cn_time(fcst_time, "%Y年%m月%d日%H时"),size=15)
+    bax.text(2.5, 2.5,'预报时效: '+str(gh['fhour'])+'小时',size=15)
+    bax.text(2.5, 0.5,'www.nmc.cn',size=15)
+
+    # add color bar
+    if(conv != None):
+        cax=fig.add_axes([0.11,0.06,.86,.02])
+        cb = fig.colorbar(plots['conv'], cax=cax, orientation='horizontal')
+        cb.ax.tick_params(labelsize='x-large')                      
+        cb.set_label(style['label'],size=20)
+
+    # add south China sea
+    if south_China_sea:
+        utl.add_south_China_sea(pos=[0.85,0.13,.1,.2],fig=fig)
+
+    small_city=False
+    if(map_extent2[1]-map_extent2[0] < 25):
+        small_city=True
+    if city:
+        utl.add_city_on_map(ax,map_extent=map_extent2,transform=datacrs,zorder=110,size=13,small_city=small_city)
+
+    utl.add_logo_extra_in_axes(pos=[-0.01,0.835,.1,.1],which='nmc', size='Xlarge',fig=fig)
+
+    # show figure
+    if(output_dir != None):
+        with instrument.span('save'):
+            fig.savefig(output_dir+'位势高度场_风场_'+style['title']+'_预报_'+
+            '起报时间_'+utl.cn_time(initial_time, "%Y年%m月%d日%H时")+
+            '预报时效_'+str(gh['fhour'])+'小时'+'.png', dpi=200)
+    
+    if(output_dir == None):
+        plt.show()                
+    utl.close_figure(fig)
@@ -3,21 +3,50 @@
 """
 Synoptic analysis or diagnostic maps for numeric weather model.
 """
+import os
+from concurrent.futures import ProcessPoolExecutor
 import numpy as np
-from nmc_met_io.retrieve_micaps_server import get_model_grid,get_model_3D_grid
-from nmc_met_map.graphics import isentropic_graphics
+from nmc_met_map.lib.retrieve import get_model_grid,get_model_3D_grid
+from nmc_met_map.lib.lazy import lazy_import, lazy_attr
+isentropic_graphics = lazy_import('nmc_met_map.graphics.isentropic_graphics')
 import nmc_met_map.lib.utility as utl
-import metpy.calc as mpcalc
-from metpy.units import units
-import xarray as xr
-
+from nmc_met_map.lib import instrument, kernels
+mpcalc = lazy_import('metpy.calc')
+units = lazy_attr('metpy.units', 'units')
+xr = lazy_import('xarray')
+
+def _render_isentropic_levels(surfaces, map_extent, city, south_China_sea, output_dir, Global):
+    for isentrh, isentuv, isentprs in surfaces:
+        isentropic_graphics.draw_isentropic_uv(
+            isentrh=isentrh, isentuv=isentuv, isentprs=isentprs,
+            map_extent=map_extent, regrid_shape=20,
+            city=city,south_China_sea=south_China_sea,
+            output_dir=output_dir,Global=Global
+            )
+    return [isentrh['lev'] for isentrh, isentuv, isentprs in surfaces]
+
+@instrument.product
 def isentropic_uv(initial_time=None, fhour=6, day_back=0,model='ECMWF',
     isentlev=310,
     map_ratio=19/9,zoom_ratio=20,cntr_pnt=[102,34],
     levels=[1000, 950, 925, 900, 850, 800, 700,600,500,400,300,250,200,100],
     Global=False,
-    south_China_sea=True,area = '全国',city=False,output_dir=None
+    south_China_sea=True,area = '全国',city=False,output_dir=None,
+    max_workers=None,executor=None
      ):
+    """
+    Isentropic analysis, wind, relative humidity and pressure on the
+    isentropic surfaces.
+    The volumes are cropped to the map window before the interpolation,
+    all the surfaces are interpolated in one pass and rendered in a
+    process pool when output_dir is given.
+
+    :param isentlev: isentropic level (K), or list of them like [300, 305, 310, 315].
+    :param max_workers: render processes, the surfaces are split into
+                        one chunk per worker.
+    :param executor: concurrent.futures executor, like RenderPool().executor.
+    :return: list of the isentropic levels rendered.
+    """
     # micaps data directory
     try:
         data_dir = [utl.Cassandra_dir(data_type='high',data_source=model,var_name='RH',lvl=''),
@@ -54,20 +83,8 @@ def isentropic_uv(initial_time=None, fhour=6, day_back=0,model='ECMWF',
     lats = np.squeeze(rh['lat'].values)
     lons = np.squeeze(rh['lon'].values)
 
-    pres = np.array(levels)*100 * units('Pa')
-    tmp = t['data'].values.squeeze()*units('degC')
-    uwnd = u['data'].values.squeeze()*units.meter/units.second
-    vwnd = v['data'].values.squeeze()*units.meter/units.second
-    relh = rh['data'].values.squeeze()*units.meter/units.percent
-
-    isentlev = isentlev * units.kelvin
-
-    isent_anal = mpcalc.isentropic_interpolation(isentlev, pres, tmp,
-                                                 relh, uwnd, vwnd, axis=0)
-
-    isentprs, isentrh, isentu, isentv = isent_anal
-
     # prepare data
+    instrument.phase('crop')
     if(area != None):
         cntr_pnt,zoom_ratio=utl.get_map_area(area_name=area)
 
@@ -86,30 +103,64 @@ def isentropic_uv(initial_time=None, fhour=6, day_back=0,model='ECMWF',
     idx_y1 = np.where((lats > map_extent[2]-delt_y) & 
         (lats < map_extent[3]+delt_y))
     #- to solve the problem of labels on all the contours
+    # the interpolation is column by column, the window is interpolated only
+    window = (Ellipsis, slice(idx_y1[0][0], idx_y1[0][-1]+1), slice(idx_x1[0][0], idx_x1[0][-1]+1))
+
+    instrument.phase('derive')
+    pres = kernels.field(levels)*100 * units('Pa')
+    tmp = t['data'].values[window].squeeze()*units('degC')
+    uwnd = u['data'].values[window].squeeze()*units.meter/units.second
+    vwnd = v['data'].values[window].squeeze()*units.meter/units.second
+    relh = rh['data'].values[window].squeeze()*units.meter/units.percent
+
+    isentlevs = np.atleast_1d(isentlev)
+    isent_anal = mpcalc.isentropic_interpolation(isentlevs * units.kelvin, pres, tmp,
+                                                 relh, uwnd, vwnd, axis=0)
+
+    isentprs, isentrh, isentu, isentv = [np.array(value) for value in isent_anal]
+
     init_time = u.coords['forecast_reference_time'].values
-    isentrh = {
-        'lon': lons[idx_x1],
-        'lat': lats[idx_y1],
-        'data': np.array(isentrh)[0,idx_y1[0][0]:(idx_y1[0][-1]+1),idx_x1[0][0]:(idx_x1[0][-1]+1)],
-        'lev':str(isentlev),
-        'model':model,
-        'fhour':fhour,
-        'init_time':init_time}
-    isentuv = {
-        'lon': lons[idx_x1],
-        'lat': lats[idx_y1],
-        'isentu': np.array(isentu)[0,idx_y1[0][0]:(idx_y1[0][-1]+1),idx_x1[0][0]:(idx_x1[0][-1]+1)],
-        'isentv': np.array(isentv)[0,idx_y1[0][0]:(idx_y1[0][-1]+1),idx_x1[0][0]:(idx_x1[0][-1]+1)],
-        'lev':str(isentlev)}
-    isentprs = {
-        'lon': lons[idx_x1],
-        'lat': lats[idx_y1],
-        'data': np.array(isentprs)[0,idx_y1[0][0]:(idx_y1[0][-1]+1),idx_x1[0][0]:(idx_x1[0][-1]+1)],
-        'lev':str(isentlev)}
-
-    isentropic_graphics.draw_isentropic_uv(
-        isentrh=isentrh, isentuv=isentuv, isentprs=isentprs,
-        map_extent=map_extent, regrid_shape=20,
-        city=city,south_China_sea=south_China_sea,
-        output_dir=output_dir,Global=Global
-        )
\ No newline at end of file
+    surfaces = []
+    for i, lev in enumerate(isentlevs):
+        lev = str(lev * units.kelvin)
+        surfaces.append((
+            {'lon': lons[idx_x1],
+             'lat': lats[idx_y1],
+             'data': isentrh[i],
+             'lev':lev,
+             'model':model,
+             'fhour':fhour,
+             'init_time':init_time},
+            {'lon': lons[idx_x1],
+             'lat': lats[idx_y1],
+             'isentu': isentu[i],
+             'isentv': isentv[i],
+             'lev':lev},
+            {'lon': lons[idx_x1],
+             'lat': lats[idx_y1],
+             'data': isentprs[i],
+             'lev':lev}))
+
+    instrument.phase('draw')
+    # the interactive figures are shown one by one
+    if(output_dir == None):
+        max_workers = 1
+    max_workers=max(min(max_workers or os.cpu_count() or 1, len(surfaces)), 1)
+    size=-(-len(surfaces)//max_workers)
+    chunks=[surfaces[i:i+size] for i in range(0, len(surfaces), size)]
+    own_executor=executor is None and len(chunks) > 1
+    if own_executor:
+        executor=ProcessPoolExecutor(max_workers=len(chunks))
+    try:
+        if executor is None or len(chunks) == 1:
+            outputs=[_render_isentropic_levels(chunk, map_extent, city, south_China_sea, output_dir, Global)
+                     for chunk in chunks]
+        else:
+            futures=[executor.submit(_render_isentropic_levels, chunk, map_extent, city,
+                                     south_China_sea, output_dir, Global)
+                     for chunk in chunks]
+            outputs=[future.result() for future in futures]
+    finally:
+        if own_executor:
+            executor.shutdown(wait=True)
+    return [lev for chunk_outputs in outputs for lev in chunk_outputs]
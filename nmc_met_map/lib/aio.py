@@ -0,0 +1,171 @@
+# _*_ coding: utf-8 _*_
+
+"""
+  Asyncio counterparts of the retrieval functions.
+
+  The MICAPS client is blocking, so every single file request runs in a
+  shared thread pool and the 3D grid / multi-file functions fan out over
+  levels and files. Many products can be gathered in one event loop:
+
+  >>> async def main():
+  >>>     gh, u, v = await asyncio.gather(
+  >>>         aio.get_model_grid('ECMWF_HR/HGT/500/', '19083008.024'),
+  >>>         aio.get_model_grid('ECMWF_HR/UGRD/850/', '19083008.024'),
+  >>>         aio.get_model_grid('ECMWF_HR/VGRD/850/', '19083008.024'))
+"""
+
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from nmc_met_map.lib.lazy import lazy_import
+from nmc_met_map.lib import retrieve
+
+xr = lazy_import('xarray')
+
+_io_executor = None
+_cpu_executor = None
+_max_fetches = 128
+_semaphores = {}
+
+
+def set_executors(max_fetches=None, cpu_executor=None):
+    """
+    :param max_fetches: maximum number of file requests in flight.
+    :param cpu_executor: concurrent.futures executor for derivation and
+                         rendering, default is a process pool.
+    """
+    global _io_executor, _cpu_executor, _max_fetches
+    if max_fetches is not None:
+        _max_fetches = max_fetches
+        if _io_executor is not None:
+            _io_executor.shutdown(wait=False)
+        _io_executor = None
+        _semaphores.clear()
+    if cpu_executor is not None:
+        _cpu_executor = cpu_executor
+
+
+def _get_io_executor():
+    global _io_executor
+    if _io_executor is None:
+        _io_executor = ThreadPoolExecutor(max_workers=_max_fetches,
+                                          thread_name_prefix='nmc_met_map_io')
+    return _io_executor
+
+
+def _get_cpu_executor():
+    global _cpu_executor
+    if _cpu_executor is None:
+        _cpu_executor = ProcessPoolExecutor()
+    return _cpu_executor
+
+
+def _get_semaphore():
+    loop = asyncio.get_running_loop()
+    if loop not in _semaphores:
+        _semaphores[loop] = asyncio.Semaphore(_max_fetches)
+    return _semaphores[loop]
+
+
+async def _fetch(func, *args, **kwargs):
+    loop = asyncio.get_running_loop()
+    async with _get_semaphore():
+        return await loop.run_in_executor(
+            _get_io_executor(), functools.partial(func, *args, **kwargs))
+
+
+async def get_model_grid(directory, filename=None, suffix="*.024", **kwargs):
+    return await _fetch(retrieve.get_model_grid, directory,
+                        filename=filename, suffix=suffix, **kwargs)
+
+
+async def get_model_grids(directory, filenames, allExists=True, **kwargs):
+    grids = await asyncio.gather(
+        *[get_model_grid(directory, filename=filename, **kwargs) for filename in filenames])
+    dataset = [data for data in grids if data is not None]
+    if (allExists and len(dataset) < len(grids)) or len(dataset) == 0:
+        return None
+    return xr.concat(dataset, dim='time')
+
+
+async def get_model_points(directory, filenames, points, allExists=True, **kwargs):
+    data = await get_model_grids(directory, filenames, allExists=allExists, **kwargs)
+    if data is None:
+        return None
+    return data.interp(lon=('points', points['lon']), lat=('points', points['lat']))
+
+
+async def get_model_3D_grid(directory, filename, levels, allExists=True, **kwargs):
+    grids = await asyncio.gather(
+        *[get_model_grid(retrieve.level_directory(directory, level), filename=filename, **kwargs)
+          for level in levels])
+    dataset = [data for data in grids if data is not None]
+    if (allExists and len(dataset) < len(grids)) or len(dataset) == 0:
+        return None
+    return xr.concat(dataset, dim='level')
+
+
+async def get_model_3D_grids(directory, filenames, levels, allExists=True, **kwargs):
+    grids = await asyncio.gather(
+        *[get_model_3D_grid(directory, filename, levels, allExists=allExists, **kwargs)
+          for filename in filenames])
+    dataset = [data for data in grids if data is not None]
+    if (allExists and len(dataset) < len(grids)) or len(dataset) == 0:
+        return None
+    return xr.concat(dataset, dim='time')
+
+
+async def get_station_data(directory, filename=None, suffix="*.000", **kwargs):
+    return await _fetch(retrieve.get_station_data, directory,
+                        filename=filename, suffix=suffix, **kwargs)
+
+
+async def get_latest_initTime(directory, suffix="*.006"):
+    return await _fetch(retrieve.get_latest_initTime, directory, suffix=suffix)
+
+
+async def gather_fields(**fields):
+    """
+    Await all field requests concurrently.
+    >>> data = await gather_fields(gh=aio.get_model_grid(...), u=aio.get_model_grid(...))
+    :return: dict with the same keys.
+    """
+    names = list(fields.keys())
+    values = await asyncio.gather(*[fields[name] for name in names])
+    return dict(zip(names, values))
+
+
+async def run_in_executor(func, *args, **kwargs):
+    """
+    Run CPU heavy derivation or rendering in the cpu executor.
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        _get_cpu_executor(), functools.partial(func, *args, **kwargs))
+
+
+def _run_prefetched(product, grids, kwargs):
+    retrieve.install_prefetched(grids)
+    try:
+        return product(**kwargs)
+    finally:
+        retrieve.clear_prefetched()
+
+
+async def run_product(product, inputs=None, **kwargs):
+    """
+    Fetch all inputs of a product concurrently, then run the product
+    (derivation and drawing) in the cpu executor on the prefetched grids.
+    :param product: product function, like nmc_met_map.synoptic.gh_uv_mslp.
+    :param inputs: list of (directory, filename) the product reads.
+    :param kwargs: keyword arguments of the product.
+    >>> await aio.run_product(synoptic.gh_uv_mslp,
+    >>>     inputs=[('ECMWF_HR/HGT/500/', '19083008.024'), ...],
+    >>>     initial_time='19083008', fhour=24, output_dir='/tmp/')
+    """
+    grids = {}
+    if inputs:
+        values = await asyncio.gather(
+            *[get_model_grid(directory, filename=filename) for directory, filename in inputs])
+        grids = {_input: data for _input, data in zip(inputs, values) if data is not None}
+    return await run_in_executor(_run_prefetched, product, grids, kwargs)
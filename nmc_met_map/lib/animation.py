@@ -0,0 +1,233 @@
+# _*_ coding: utf-8 _*_
+
+"""
+  Animated loops of the forecast hours.
+
+  Every worker draws the static part of the product (map, title, logo,
+  background image) once, then for every forecast hour of its chunk
+  removes the data artists of the previous frame, draws the new data
+  (contourf, barbs, contours and labels, time text) and saves the frame.
+  The frames are encoded to GIF, WebP (pillow) or MP4 (ffmpeg).
+
+  >>> from nmc_met_map.lib import animation
+  >>> animation.animate('gh_uv_mslp', range(0, 241, 6), '/data/maps/gh_uv_mslp.gif',
+  >>>                   initial_time='19083008', fps=4)
+
+  python -m nmc_met_map.lib.animation gh_rain /data/maps/gh_rain.mp4 --initial_time 19083008 --fhours 6 240 6
+"""
+
+import os
+import time
+import shutil
+import inspect
+import argparse
+import tempfile
+import importlib
+import subprocess
+from concurrent.futures import ProcessPoolExecutor
+import nmc_met_map.lib.utility as utl
+
+# data of a forecast hour, static part and data part of the figure
+ANIMATIONS = {
+    'gh_uv_mslp': {'data': 'nmc_met_map.synoptic.gh_uv_mslp_data',
+                   'figure': 'nmc_met_map.graphics.synoptic_graphics.gh_uv_mslp_figure',
+                   'layers': 'nmc_met_map.graphics.synoptic_graphics.gh_uv_mslp_layers'},
+    'gh_rain': {'data': 'nmc_met_map.QPF.gh_rain_data',
+                'figure': 'nmc_met_map.graphics.QPF_graphics.gh_rain_figure',
+                'layers': 'nmc_met_map.graphics.QPF_graphics.gh_rain_layers'},
+}
+
+FORMATS = ('.gif', '.webp', '.mp4')
+
+
+def _import(func_path):
+    module_name, func_name = func_path.rsplit('.', 1)
+    return getattr(importlib.import_module(module_name), func_name)
+
+
+def _split_kwargs(func, kwargs):
+    names = inspect.signature(func).parameters
+    return {key: value for key, value in kwargs.items() if key in names}
+
+
+def remove_artists(artists):
+    """
+    Remove the data artists of a frame from the figure.
+    """
+    for artist in artists:
+        try:
+            if hasattr(artist, 'collections') and not hasattr(artist, 'get_paths'):
+                # contour set of matplotlib < 3.8
+                for collection in artist.collections:
+                    collection.remove()
+            else:
+                artist.remove()
+        except ValueError:
+            # clabel texts, removed with their contour set
+            pass
+
+
+def _render_frames(name, frames, frame_dir, kwargs, dpi=100):
+    """
+    Render a chunk of frames on one figure.
+    :param frames: list of (frame number, fhour).
+    :return: list of the frame numbers rendered.
+    """
+    spec = ANIMATIONS[name]
+    data_func, figure_func, layers_func = [
+        _import(spec[key]) for key in ('data', 'figure', 'layers')]
+
+    # defaults of the product, like atime of gh_rain
+    defaults = {key: param.default for key, param in inspect.signature(data_func).parameters.items()
+                if param.default is not inspect.Parameter.empty}
+    kwargs = dict(defaults, **kwargs)
+
+    fig = None
+    artists = []
+    rendered = []
+    try:
+        for index, fhour in frames:
+            data = data_func(fhour=fhour, **_split_kwargs(data_func, kwargs))
+            if data is None:
+                print('----%s fhour %s not found, frame skipped' % (name, fhour))
+                continue
+            draw_kwargs = dict(kwargs, **data)
+            if fig is None:
+                fig, ax, bax = figure_func(**_split_kwargs(figure_func, draw_kwargs))
+                first = True
+            else:
+                remove_artists(artists)
+                first = False
+            layers_kwargs = _split_kwargs(layers_func, draw_kwargs)
+            layers_kwargs['colorbar'] = first
+            plots, artists = layers_func(fig, ax, bax, **layers_kwargs)
+            fig.savefig(os.path.join(frame_dir, '%04d.png' % index), dpi=dpi)
+            rendered.append(index)
+    finally:
+        if fig is not None:
+            utl.close_figure(fig)
+    return rendered
+
+
+def encode(frame_paths, output_path, fps=2):
+    """
+    Encode the frames to an animation.
+    :param frame_paths: png files in order.
+    :param output_path: .gif, .webp or .mp4 file.
+    """
+    ext = os.path.splitext(output_path)[1].lower()
+    if ext not in FORMATS:
+        raise ValueError('Unknown animation format: '+ext)
+    if ext == '.mp4':
+        if shutil.which('ffmpeg') is None:
+            raise ValueError('ffmpeg is needed for mp4')
+        # ffmpeg reads a numbered sequence
+        seq_dir = tempfile.mkdtemp(prefix='frames_', dir=os.path.dirname(frame_paths[0]))
+        try:
+            for i, path in enumerate(frame_paths):
+                os.link(path, os.path.join(seq_dir, '%04d.png' % i))
+            subprocess.check_call(
+                ['ffmpeg', '-y', '-loglevel', 'error', '-framerate', str(fps),
+                 '-i', os.path.join(seq_dir, '%04d.png'),
+                 '-vf', 'scale=trunc(iw/2)*2:trunc(ih/2)*2',
+                 '-c:v', 'libx264', '-pix_fmt', 'yuv420p', output_path])
+        finally:
+            shutil.rmtree(seq_dir, ignore_errors=True)
+        return output_path
+
+    from PIL import Image
+    images = [Image.open(path) for path in frame_paths]
+    if ext == '.gif':
+        images = [image.convert('RGB').convert('P', palette=Image.ADAPTIVE) for image in images]
+    images[0].save(output_path, save_all=True, append_images=images[1:],
+                   duration=int(1000./fps), loop=0)
+    return output_path
+
+
+def animate(name, fhours, output_path, fps=2, dpi=100, max_workers=None,
+            executor=None, frame_dir=None, **kwargs):
+    """
+    Animated loop of a product.
+    :param name: 'gh_uv_mslp' or 'gh_rain'.
+    :param fhours: forecast hours of the frames.
+    :param output_path: .gif, .webp or .mp4 file.
+    :param fps: frames per second.
+    :param dpi: resolution of the frames, the figure is 16x9 inches.
+    :param max_workers: render processes, the frames are split into
+                        one chunk of consecutive fhours per worker.
+    :param executor: concurrent.futures executor, like RenderPool().executor.
+    :param frame_dir: keep the frames in this directory, default a temporary one.
+    :param kwargs: arguments of the product, like initial_time, model, gh_lev, area.
+    :return: dict of the path, number of frames and seconds.
+    """
+    if name not in ANIMATIONS:
+        raise ValueError('Unknown animation product: '+str(name))
+    if os.path.splitext(output_path)[1].lower() not in FORMATS:
+        raise ValueError('output_path should be .gif, .webp or .mp4')
+    kwargs.setdefault('south_China_sea', kwargs.get('area', '全国') == '全国')
+    kwargs.setdefault('city', False)
+
+    start = time.perf_counter()
+    frames = list(enumerate(fhours))
+    keep_frames = frame_dir is not None
+    if frame_dir is None:
+        frame_dir = tempfile.mkdtemp(prefix='animation_',
+                                     dir=os.path.dirname(os.path.abspath(output_path)))
+    elif not os.path.exists(frame_dir):
+        os.makedirs(frame_dir)
+
+    try:
+        max_workers = max(min(max_workers or os.cpu_count() or 1, len(frames)), 1)
+        size = -(-len(frames)//max_workers)
+        chunks = [frames[i:i+size] for i in range(0, len(frames), size)]
+        own_executor = executor is None and len(chunks) > 1
+        if own_executor:
+            executor = ProcessPoolExecutor(max_workers=len(chunks))
+        try:
+            if executor is None:
+                rendered = [_render_frames(name, chunk, frame_dir, kwargs, dpi)
+                            for chunk in chunks]
+            else:
+                futures = [executor.submit(_render_frames, name, chunk, frame_dir, kwargs, dpi)
+                           for chunk in chunks]
+                rendered = [future.result() for future in futures]
+        finally:
+            if own_executor:
+                executor.shutdown(wait=True)
+
+        indexes = sorted(index for chunk in rendered for index in chunk)
+        if not indexes:
+            raise ValueError('No frame rendered, the data may be missing')
+        encode([os.path.join(frame_dir, '%04d.png' % index) for index in indexes],
+               output_path, fps=fps)
+    finally:
+        if not keep_frames:
+            shutil.rmtree(frame_dir, ignore_errors=True)
+
+    seconds = time.perf_counter()-start
+    print('----%s: %d frames, %.1f s' % (output_path, len(indexes), seconds))
+    return {'path': output_path, 'frames': len(indexes), 'seconds': seconds}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='nmc_met_map forecast hour loops')
+    parser.add_argument('product', choices=sorted(ANIMATIONS))
+    parser.add_argument('output_path')
+    parser.add_argument('--fhours', type=int, nargs=3, default=[0, 240, 6],
+                        metavar=('START', 'STOP', 'STEP'))
+    parser.add_argument('--initial_time', default=None)
+    parser.add_argument('--model', default='ECMWF')
+    parser.add_argument('--area', default='全国')
+    parser.add_argument('--fps', type=float, default=2)
+    parser.add_argument('--dpi', type=int, default=100)
+    parser.add_argument('--max_workers', type=int, default=None)
+    args = parser.parse_args(argv)
+    start, stop, step = args.fhours
+    animate(args.product, range(start, stop+1, step), args.output_path,
+            fps=args.fps, dpi=args.dpi, max_workers=args.max_workers,
+            initial_time=args.initial_time, model=args.model, area=args.area)
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,429 @@
+# _*_ coding: utf-8 _*_
+
+"""
+  End to end benchmarks of the products against fixed synthetic data
+  served by the local stand-in MICAPS server (lib/micaps_standin.py).
+
+  Every run is done in a fresh process and records the wall time split
+  into the spans of lib/instrument.py (fetch / crop / derive / draw /
+  save), the peak RSS and (optionally) the tracemalloc peak and the
+  number of blocks still allocated at the end of the run. Results are stored as one json
+  file per commit and compared with a baseline.
+
+  python -m nmc_met_map.lib.benchmark --output_dir benchmarks/ --baseline benchmarks/abc1234.json
+
+  The import time of the package and of every product module is
+  measured with `python -X importtime` in a fresh interpreter:
+
+  python -m nmc_met_map.lib.benchmark --imports --no_micro --products
+
+  Stations per second of the station meteogram, one figure per station
+  against the figure template reused for all stations:
+
+  python -m nmc_met_map.lib.benchmark --meteogram 50 --no_micro --products
+
+  The products run in the floating point type of the package (float32
+  by default, see lib/kernels.py), the peak RSS of float64 is measured
+  with:
+
+  python -m nmc_met_map.lib.benchmark --dtype float64 --no_micro --products PV_Div_uv isentropic_uv
+"""
+
+import os
+import sys
+import json
+import time
+import timeit
+import argparse
+import platform
+import tempfile
+import importlib
+import subprocess
+import multiprocessing
+from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor
+
+# name: (product function, keyword arguments), the products of test_draw.py
+from nmc_met_map.lib.micaps_standin import INITIAL_TIME, TEST_DRAW_PRODUCTS as PRODUCTS
+
+# spans of lib/instrument.py, the exclusive times add up to the total
+SPANS = ('fetch', 'crop', 'derive', 'draw', 'save')
+
+
+class _RecordSink(object):
+    """
+    Keep the span records of the product runs.
+    """
+
+    def __init__(self):
+        self.records = []
+
+    def emit(self, record):
+        self.records.append(record)
+
+
+def _start_standin():
+    from nmc_met_map.lib import micaps_standin
+    from nmc_met_map.lib import retrieve
+    retrieve.set_missing_ttl(0)
+    server = micaps_standin.start_server(initial_times=[INITIAL_TIME], fhours=micaps_standin.FHOURS)
+    micaps_standin.configure_client(*server.server_address)
+    return server
+
+
+def _run_product(func, kwargs, trace_alloc=False):
+    """
+    Run one product in this (fresh) process.
+    """
+    import resource
+    import matplotlib
+    matplotlib.use('Agg')
+    server = _start_standin()
+    from nmc_met_map.lib import instrument
+    module_name, func_name = func.rsplit('.', 1)
+    # a product not decorated yet is timed as derive
+    product = instrument.product(getattr(importlib.import_module(module_name), func_name))
+    sink = instrument.add_sink(_RecordSink())
+
+    if trace_alloc:
+        import tracemalloc
+        tracemalloc.start()
+    output_dir = tempfile.mkdtemp(prefix='nmc_met_map_bench_')
+    kwargs = dict(kwargs, output_dir=os.path.join(output_dir, ''))
+    product(**kwargs)
+    record = sink.records[-1]
+
+    result = {'total': record['total']}
+    for name in SPANS:
+        result[name] = record['spans'].get(name, 0.)
+    result['outputs'] = len(os.listdir(output_dir))
+    from nmc_met_map.lib import kernels
+    result['dtype'] = kernels.DTYPE.__name__
+    # ru_maxrss is KB on linux
+    result['peak_rss_mb'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss/1024.
+    if trace_alloc:
+        snapshot = tracemalloc.take_snapshot()
+        result['alloc_peak_mb'] = tracemalloc.get_traced_memory()[1]/1024./1024.
+        # blocks still allocated at the end of the run, not all allocations
+        result['live_blocks'] = sum(stat.count for stat in snapshot.statistics('filename'))
+        tracemalloc.stop()
+    server.shutdown()
+    return result
+
+
+def _run_micro(number=5):
+    """
+    Micro benchmarks of hot helpers, seconds per call.
+    """
+    import matplotlib
+    matplotlib.use('Agg')
+    import cartopy.crs as ccrs
+    import nmc_met_map.lib.utility as utl
+    server = _start_standin()
+    result = {}
+
+    plotcrs = ccrs.AlbersEqualArea(central_latitude=34, central_longitude=102,
+                                   standard_parallels=[30., 60.])
+    datacrs = ccrs.PlateCarree()
+    fig = utl.new_figure(figsize=(16, 9))
+    ax = fig.add_axes([0.0, 0.0, 1, 1], projection=plotcrs)
+    result['adjust_map_ratio'] = min(timeit.repeat(
+        lambda: utl.adjust_map_ratio(ax, map_extent=[70, 140, 8, 60], datacrs=datacrs),
+        number=number, repeat=3))/number
+    utl.close_figure(fig)
+
+    filenames = [INITIAL_TIME+'.%03d' % fhour for fhour in range(3, 75, 3)]
+    points = {'lon': [116.3833, 110.0], 'lat': [39.9, 32]}
+    result['get_model_points_gy'] = min(timeit.repeat(
+        lambda: utl.get_model_points_gy('NWFD_SCMOC/TMP/2M_ABOVE_GROUND/', filenames, points),
+        number=1, repeat=3))
+    server.shutdown()
+    return result
+
+
+def _meteogram_data(stations, t_range=(0, 84), t_gap=3, seed=0):
+    """
+    Synthetic point series of Station_Synthetical_Forecast_data for
+    a batch of stations, the last dimension is the points.
+    """
+    import numpy as np
+    import xarray as xr
+    import nmc_met_map.lib.utility as utl
+    rng = np.random.RandomState(seed)
+    init = datetime.strptime('20'+INITIAL_TIME, '%Y%m%d%H')
+    fhours = np.arange(t_range[0], t_range[1], t_gap)
+    cycle = np.sin(2*np.pi*(fhours[:, None]+8)/24.)
+
+    def series(values):
+        return xr.Dataset({'data': (('time', 'points'), values)},
+                          coords={'forecast_reference_time': np.datetime64(init),
+                                  'forecast_period': ('time', fhours)})
+
+    def random(scale, offset=0.):
+        return offset+scale*rng.rand(len(fhours), stations)
+
+    t2m = series(15+8*cycle+random(10, -5))
+    Td2m = t2m['data'].values-random(8, 1)
+    u10m, v10m = series(random(16, -8)), series(random(16, -8))
+    u100m, v100m = series(random(24, -12)), series(random(24, -12))
+    wsp10m = (u10m['data']**2+v10m['data']**2)**0.5
+    wsp100m = (u100m['data']**2+v100m['data']**2)**0.5
+    return {'t2m': t2m, 'Td2m': Td2m, 'AT': t2m['data']-0.65*wsp10m+1,
+            'u10m': u10m, 'v10m': v10m, 'u100m': u100m, 'v100m': v100m,
+            'gust10m': series(wsp10m.values*1.5), 'wsp10m': wsp10m, 'wsp100m': wsp100m,
+            'r03': series(np.maximum(random(12, -6), 0)),
+            'TCDC': series(random(100)), 'LCDC': series(random(50)),
+            'VIS': series(random(30)), 'time_all': utl.forecast_time_axis(init, fhours)}
+
+
+def _run_meteogram(stations=20):
+    """
+    Stations per second of the station meteogram, a new figure for every
+    station (draw_Station_Synthetical_Forecast_From_Cassandra) against
+    one MeteogramTemplate for all stations.
+    """
+    import matplotlib
+    matplotlib.use('Agg')
+    from nmc_met_map import sta
+    from nmc_met_map.graphics import sta_graphics
+    data = _meteogram_data(stations)
+    points = {'lon': [100+0.1*i for i in range(stations)], 'lat': [30.]*stations}
+    extra_infos = [{'output_head_name': ' ', 'output_tail_name': '_%d' % i, 'point_name': ' '}
+                   for i in range(stations)]
+    output_dir = os.path.join(tempfile.mkdtemp(prefix='nmc_met_map_bench_'), '')
+
+    start = time.perf_counter()
+    for i in range(stations):
+        station = {name: value if name == 'time_all' else sta._station_slice(value, i)
+                   for name, value in data.items()}
+        sta_graphics.draw_Station_Synthetical_Forecast_From_Cassandra(
+            draw_VIS=True, drw_thr=True, model='ECMWF',
+            points={'lon': [points['lon'][i]], 'lat': [points['lat'][i]]},
+            output_dir=output_dir, extra_info=extra_infos[i], **station)
+    per_station = time.perf_counter()-start
+
+    start = time.perf_counter()
+    sta._render_meteograms(data, points, extra_infos, 'ECMWF', output_dir, True, True)
+    template = time.perf_counter()-start
+    return {'stations': stations, 'per_station_sps': stations/per_station,
+            'template_sps': stations/template, 'speedup': per_station/template}
+
+
+def _in_fresh_process(func, *args):
+    ctx = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=1, mp_context=ctx) as executor:
+        return executor.submit(func, *args).result()
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'], stderr=subprocess.DEVNULL,
+            cwd=os.path.dirname(os.path.abspath(__file__))).decode().strip()
+    except Exception:
+        return 'unknown'
+
+
+IMPORT_MODULES = ['nmc_met_map', 'nmc_met_map.synoptic', 'nmc_met_map.moisture',
+                  'nmc_met_map.thermal', 'nmc_met_map.dynamic', 'nmc_met_map.elements',
+                  'nmc_met_map.QPF', 'nmc_met_map.isentropic', 'nmc_met_map.crossection',
+                  'nmc_met_map.synthetical', 'nmc_met_map.sta', 'nmc_met_map.lib.scheduler',
+                  'nmc_met_map.lib.jobgraph']
+
+
+def import_time(module_name, repeat=3):
+    """
+    Import a module in a fresh interpreter.
+    :return: dict of wall seconds (fastest of repeat), cumulative
+             import seconds reported by -X importtime and the slowest
+             top level packages pulled in.
+    """
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        proc = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import '+module_name],
+                              stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                              universal_newlines=True)
+        wall = time.perf_counter()-start
+        if proc.returncode != 0:
+            raise ImportError(proc.stderr.strip().splitlines()[-1])
+        if best is None or wall < best['wall']:
+            # import time: self [us] | cumulative | imported package
+            packages = {}
+            total = 0
+            for line in proc.stderr.splitlines():
+                if not line.startswith('import time:') or '|' not in line:
+                    continue
+                fields = line[len('import time:'):].split('|')
+                try:
+                    cumulative = int(fields[1])
+                except ValueError:
+                    continue
+                name = fields[2].strip()
+                if name == module_name:
+                    total = cumulative
+                # nested imports are indented, keep the largest per package
+                package = name.split('.')[0]
+                if fields[2].startswith('   ') and package != 'nmc_met_map':
+                    packages[package] = max(packages.get(package, 0), cumulative)
+            heaviest = sorted(packages.items(), key=lambda item: -item[1])[:5]
+            best = {'wall': wall, 'import': total/1e6,
+                    'heaviest': [[name, us/1e6] for name, us in heaviest]}
+    return best
+
+
+def run_import_benchmarks(modules=None, repeat=3):
+    """
+    :param modules: list of module names, default IMPORT_MODULES.
+    :return: dict of module name and import_time result.
+    """
+    if modules is None:
+        modules = IMPORT_MODULES
+    results = {}
+    for name in modules:
+        try:
+            results[name] = import_time(name, repeat=repeat)
+        except Exception as e:
+            print('----%s import failed: %s' % (name, e))
+            continue
+        print('import %s: %.3fs (%s)' % (name, results[name]['import'], ', '.join(
+            '%s %.3f' % (package, seconds) for package, seconds in results[name]['heaviest'])))
+    return results
+
+
+def run_benchmarks(products=None, repeat=3, trace_alloc=True, micro=True, imports=False,
+                   meteogram=0, dtype=None):
+    """
+    :param products: list of names in PRODUCTS, default all.
+    :param repeat: runs of every product, the fastest one is kept.
+    :param trace_alloc: one more run with tracemalloc for the allocations.
+    :param imports: also measure the import time of the modules.
+    :param meteogram: number of stations of the meteogram benchmark, 0 to skip.
+    :param dtype: 'float32' or 'float64', floating point type of the runs,
+                  default the one of the environment.
+    :return: dict of results.
+    """
+    from nmc_met_map.lib import kernels
+    if dtype is not None:
+        # the fresh processes read it at import
+        os.environ[kernels._ENV] = kernels._dtype(dtype).__name__
+    if products is None:
+        products = list(PRODUCTS.keys())
+    results = {'commit': git_commit(), 'date': datetime.now().isoformat(),
+               'python': platform.python_version(), 'machine': platform.machine(),
+               'dtype': os.environ.get(kernels._ENV) or 'float32',
+               'products': {}, 'micro': {}, 'imports': {}, 'meteogram': {}}
+    for name in products:
+        func, kwargs = PRODUCTS[name]
+        try:
+            runs = [_in_fresh_process(_run_product, func, kwargs) for _ in range(repeat)]
+        except Exception as e:
+            print('----%s failed: %s' % (name, e))
+            continue
+        best = min(runs, key=lambda run: run['total'])
+        best['peak_rss_mb'] = max(run['peak_rss_mb'] for run in runs)
+        if trace_alloc:
+            traced = _in_fresh_process(_run_product, func, kwargs, True)
+            best['alloc_peak_mb'] = traced['alloc_peak_mb']
+            best['live_blocks'] = traced['live_blocks']
+        results['products'][name] = best
+        print('%s: %.2fs (%s), %.0f MB' % (
+            name, best['total'], ', '.join('%s %.2f' % (span, best[span]) for span in SPANS),
+            best['peak_rss_mb']))
+    if micro:
+        results['micro'] = _in_fresh_process(_run_micro)
+    if imports:
+        results['imports'] = run_import_benchmarks(repeat=repeat)
+    if meteogram > 0:
+        results['meteogram'] = _in_fresh_process(_run_meteogram, meteogram)
+        print('meteogram: %.2f stations/s per station, %.2f stations/s template (x%.1f)' % (
+            results['meteogram']['per_station_sps'], results['meteogram']['template_sps'],
+            results['meteogram']['speedup']))
+    return results
+
+
+def save_results(results, output_dir):
+    if not os.path.exists(output_dir):
+        os.makedirs(output_dir)
+    name = results['commit']
+    if results.get('dtype', 'float32') != 'float32':
+        name += '_'+results['dtype']
+    path = os.path.join(output_dir, name+'.json')
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(results, f, indent=1)
+    return path
+
+
+def compare_results(current, baseline, threshold=0.1,
+                    metrics=('total',)+SPANS+('peak_rss_mb',)):
+    """
+    :param threshold: relative increase flagged as regression.
+    :return: list of (name, metric, baseline value, current value, ratio).
+    """
+    if current.get('dtype', 'float32') != baseline.get('dtype', 'float32'):
+        print('----baseline is %s, the runs are %s' % (baseline.get('dtype', 'float32'),
+                                                     current.get('dtype', 'float32')))
+    regressions = []
+    for name, result in current['products'].items():
+        old = baseline['products'].get(name)
+        if old is None:
+            continue
+        for metric in metrics:
+            if metric in result and metric in old and old[metric] > 0 and \
+                    result[metric] > old[metric]*(1+threshold):
+                regressions.append((name, metric, old[metric], result[metric],
+                                    result[metric]/old[metric]))
+    for name, value in current['micro'].items():
+        old = baseline['micro'].get(name)
+        if old is not None and old > 0 and value > old*(1+threshold):
+            regressions.append((name, 'time', old, value, value/old))
+    for name, result in current.get('imports', {}).items():
+        old = baseline.get('imports', {}).get(name)
+        if old is not None and old['import'] > 0 and \
+                result['import'] > old['import']*(1+threshold):
+            regressions.append((name, 'import', old['import'], result['import'],
+                                result['import']/old['import']))
+    # stations per second, lower is worse
+    for metric in ('per_station_sps', 'template_sps'):
+        value = current.get('meteogram', {}).get(metric)
+        old = baseline.get('meteogram', {}).get(metric)
+        if value is not None and old is not None and value > 0 and \
+                value < old/(1+threshold):
+            regressions.append(('meteogram', metric, old, value, value/old))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='nmc_met_map product benchmarks')
+    parser.add_argument('--products', nargs='*', default=None)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--output_dir', default='benchmarks')
+    parser.add_argument('--baseline', default=None)
+    parser.add_argument('--threshold', type=float, default=0.1)
+    parser.add_argument('--no_alloc', action='store_true')
+    parser.add_argument('--no_micro', action='store_true')
+    parser.add_argument('--imports', action='store_true')
+    parser.add_argument('--meteogram', type=int, default=0, metavar='STATIONS',
+                        help='stations of the meteogram benchmark')
+    parser.add_argument('--dtype', choices=['float32', 'float64'], default=None,
+                        help='floating point type of the runs')
+    args = parser.parse_args(argv)
+
+    results = run_benchmarks(products=args.products, repeat=args.repeat,
+                             trace_alloc=not args.no_alloc, micro=not args.no_micro,
+                             imports=args.imports, meteogram=args.meteogram,
+                             dtype=args.dtype)
+    print('results: '+save_results(results, args.output_dir))
+    if args.baseline is not None:
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)
+        regressions = compare_results(results, baseline, threshold=args.threshold)
+        for name, metric, old, new, ratio in regressions:
+            print('REGRESSION %s %s: %.3f -> %.3f (x%.2f)' % (name, metric, old, new, ratio))
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
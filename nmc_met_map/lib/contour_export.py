@@ -0,0 +1,277 @@
+# _*_ coding: utf-8 _*_
+
+"""
+  Export the contour sets of the products as vectors, alongside the PNGs.
+
+  The contour and contourf sets drawn by the graphics (gh isolines,
+  mslp fills, rain fills...) are serialised with their levels, so the
+  web and GIS systems use the same contours as the images instead of
+  contouring the grids again.
+
+  <png name>.geojson      FeatureCollection of all contour sets, lines
+                          with 'level', polygons with 'lower' and 'upper'.
+  <png name>_mvt/z/x/y.pbf  Mapbox vector tiles, one layer per contour set
+                          (needs mapbox_vector_tile and shapely).
+
+  The export is off by default:
+  >>> from nmc_met_map.lib import contour_export
+  >>> contour_export.configure(formats=('geojson', 'mvt'), tolerance=0.02)
+  or
+  export NMC_MET_MAP_CONTOUR_EXPORT=geojson,mvt
+"""
+
+import os
+import json
+import numpy as np
+from nmc_met_map.lib.lazy import lazy_import
+from nmc_met_map.lib import instrument
+mpl = lazy_import('matplotlib')
+ccrs = lazy_import('cartopy.crs')
+
+_ENV = 'NMC_MET_MAP_CONTOUR_EXPORT'
+
+FORMATS = ('geojson', 'mvt')
+
+_config = {
+    'formats': tuple(name for name in os.environ.get(_ENV, '').split(',') if name),
+    'tolerance': 0.02,
+    'zooms': (3, 4, 5, 6),
+    'decimals': 4,
+}
+
+
+def configure(formats=None, tolerance=None, zooms=None, decimals=None):
+    """
+    :param formats: list of 'geojson' and 'mvt', empty to stop the export.
+    :param tolerance: simplification tolerance in degrees, 0 keeps all vertices.
+    :param zooms: zoom levels of the vector tiles.
+    :param decimals: decimals of the GeoJSON coordinates.
+    """
+    if formats is not None:
+        for name in formats:
+            if name not in FORMATS:
+                raise ValueError('Unknown export format: '+str(name))
+        _config['formats'] = tuple(formats)
+    if tolerance is not None:
+        _config['tolerance'] = tolerance
+    if zooms is not None:
+        _config['zooms'] = tuple(zooms)
+    if decimals is not None:
+        _config['decimals'] = decimals
+
+
+def simplify(xy, tolerance):
+    """
+    Ramer-Douglas-Peucker simplification of a line.
+    :param xy: (n, 2) array of vertices.
+    :param tolerance: maximum distance of the removed vertices to the line.
+    :return: the kept vertices, the end points are always kept.
+    """
+    n = len(xy)
+    if tolerance <= 0 or n < 3:
+        return xy
+    keep = np.zeros(n, dtype=bool)
+    keep[0] = keep[-1] = True
+    stack = [(0, n-1)]
+    while stack:
+        i0, i1 = stack.pop()
+        if i1 <= i0+1:
+            continue
+        seg = xy[i1]-xy[i0]
+        pts = xy[i0+1:i1]-xy[i0]
+        length = np.hypot(seg[0], seg[1])
+        if length == 0:
+            # closed ring, distance to the end point
+            dist = np.hypot(pts[:, 0], pts[:, 1])
+        else:
+            dist = np.abs(seg[0]*pts[:, 1]-seg[1]*pts[:, 0])/length
+        k = int(np.argmax(dist))
+        if dist[k] > tolerance:
+            keep[i0+1+k] = True
+            stack.append((i0, i0+1+k))
+            stack.append((i0+1+k, i1))
+    return xy[keep]
+
+
+def _level_paths(cs):
+    """
+    :return: list of the paths of every level (lines) or band (fills).
+    """
+    if isinstance(cs, mpl.collections.Collection):
+        # matplotlib >= 3.8, one compound path per level
+        return [[path] for path in cs.get_paths()]
+    return [collection.get_paths() for collection in cs.collections]
+
+
+def _to_lonlat(cs, xy):
+    ax = cs.axes
+    trans = cs.get_transform()-ax.transData
+    if not trans.is_affine or not np.allclose(trans.get_matrix(), np.eye(3)):
+        xy = trans.transform(xy)
+    projection = getattr(ax, 'projection', None)
+    if projection is not None and not (
+            isinstance(projection, ccrs.PlateCarree) and
+            projection.proj4_params.get('lon_0', 0) == 0):
+        xy = ccrs.PlateCarree().transform_points(projection, xy[:, 0], xy[:, 1])[:, :2]
+    return xy
+
+
+def _signed_area(ring):
+    x, y = ring[:, 0], ring[:, 1]
+    return 0.5*np.sum(x[:-1]*y[1:]-x[1:]*y[:-1])
+
+
+def _polygons(rings):
+    """
+    Group the rings of a band into polygons with holes by nesting,
+    outer rings counterclockwise, holes clockwise (GeoJSON).
+    :return: list of polygons, [outer, hole, hole...].
+    """
+    rings = sorted(rings, key=lambda ring: -abs(_signed_area(ring)))
+    polygons = []
+    for ring in rings:
+        owner = None
+        for polygon in polygons:
+            if mpl.path.Path(polygon[0]).contains_point(ring[0]) and \
+                    not any(mpl.path.Path(hole).contains_point(ring[0]) for hole in polygon[1:]):
+                owner = polygon
+        area = _signed_area(ring)
+        if owner is None:
+            polygons.append([ring if area > 0 else ring[::-1]])
+        else:
+            owner.append(ring if area < 0 else ring[::-1])
+    return polygons
+
+
+def _bound(value):
+    value = float(value)
+    return value if np.isfinite(value) else None
+
+
+def contour_features(cs, name, tolerance=None, decimals=None):
+    """
+    GeoJSON features of a matplotlib contour set.
+    :param cs: ContourSet of ax.contour or ax.contourf.
+    :param name: name of the contour set, like 'gh'.
+    :param tolerance: simplification tolerance in degrees.
+    :return: list of features, MultiLineString of every level,
+             MultiPolygon of every band.
+    """
+    tolerance = _config['tolerance'] if tolerance is None else tolerance
+    decimals = _config['decimals'] if decimals is None else decimals
+    bounds = getattr(cs, '_levels', cs.levels)
+    features = []
+    for i, paths in enumerate(_level_paths(cs)):
+        parts = []
+        for path in paths:
+            if len(path.vertices) == 0:
+                continue
+            for part in path.to_polygons(closed_only=cs.filled):
+                part = simplify(_to_lonlat(cs, np.asarray(part, dtype=float)), tolerance)
+                if len(part) >= (4 if cs.filled else 2):
+                    parts.append(np.round(part, decimals))
+        if not parts:
+            continue
+        if cs.filled:
+            geometry = {'type': 'MultiPolygon',
+                        'coordinates': [[ring.tolist() for ring in polygon]
+                                        for polygon in _polygons(parts)]}
+            properties = {'name': name, 'lower': _bound(bounds[i]),
+                          'upper': _bound(bounds[i+1])}
+        else:
+            geometry = {'type': 'MultiLineString',
+                        'coordinates': [part.tolist() for part in parts]}
+            properties = {'name': name, 'level': _bound(cs.levels[i])}
+        features.append({'type': 'Feature', 'geometry': geometry, 'properties': properties})
+    return features
+
+
+def write_geojson(features, path):
+    with open(path, 'w') as f:
+        json.dump({'type': 'FeatureCollection', 'features': features}, f,
+                  separators=(',', ':'))
+    return path
+
+
+def write_mvt(features, output_dir, zooms=None):
+    """
+    Mapbox vector tiles of the features, one layer for every name.
+    :return: number of tiles written.
+    """
+    try:
+        import mapbox_vector_tile
+        from shapely.geometry import shape, box
+        from shapely.ops import transform
+    except ImportError:
+        raise ImportError('mapbox_vector_tile and shapely are needed for the MVT export')
+    from nmc_met_map.lib import tiles
+
+    zooms = _config['zooms'] if zooms is None else zooms
+    geometries = []
+    for feature in features:
+        geometry = transform(tiles.mercator, shape(feature['geometry']))
+        if not geometry.is_valid:
+            geometry = geometry.buffer(0)
+        properties = {key: value for key, value in feature['properties'].items()
+                      if value is not None}
+        geometries.append((geometry, properties))
+    if not geometries:
+        return 0
+
+    lon0, lat0, lon1, lat1 = np.array([shape(feature['geometry']).bounds
+                                       for feature in features]).T
+    map_extent = [lon0.min(), lon1.max(), lat0.min(), lat1.max()]
+    count = 0
+    for z in zooms:
+        for _, x, y in tiles.tiles_for_extent(map_extent, z):
+            bounds = tiles.tile_bounds(z, x, y)
+            tile_box = box(bounds[0], bounds[2], bounds[1], bounds[3])
+            layers = {}
+            for geometry, properties in geometries:
+                if not geometry.intersects(tile_box):
+                    continue
+                clipped = geometry.intersection(tile_box)
+                if clipped.is_empty:
+                    continue
+                layers.setdefault(properties['name'], []).append(
+                    {'geometry': clipped, 'properties': properties})
+            if not layers:
+                continue
+            data = mapbox_vector_tile.encode(
+                [{'name': layer, 'features': layer_features}
+                 for layer, layer_features in layers.items()],
+                default_options={'quantize_bounds': (bounds[0], bounds[2], bounds[1], bounds[3]),
+                                 'extents': 4096})
+            path = os.path.join(output_dir, str(z), str(x), '%d.pbf' % y)
+            if not os.path.exists(os.path.dirname(path)):
+                os.makedirs(os.path.dirname(path))
+            with open(path, 'wb') as f:
+                f.write(data)
+            count += 1
+    return count
+
+
+def export_plots(plots, png_path, formats=None):
+    """
+    Export the contour sets of the plots of a graphics function.
+    :param plots: dict of the artists, the contour sets are exported.
+    :param png_path: path of the image, the exports are named after it.
+    :param formats: default the configured formats.
+    :return: list of the written paths.
+    """
+    formats = _config['formats'] if formats is None else formats
+    if not formats:
+        return []
+    with instrument.span('export'):
+        features = []
+        for name, artist in plots.items():
+            if isinstance(artist, mpl.contour.ContourSet):
+                features.extend(contour_features(artist, name))
+        base = os.path.splitext(png_path)[0]
+        written = []
+        if 'geojson' in formats:
+            written.append(write_geojson(features, base+'.geojson'))
+        if 'mvt' in formats:
+            write_mvt(features, base+'_mvt')
+            written.append(base+'_mvt')
+    return written
@@ -0,0 +1,427 @@
+# _*_ coding: utf-8 _*_
+
+"""
+  Vectorised column physics for the convective diagnostics.
+
+  All functions work on plain numpy arrays with the levels on the first
+  axis, like the 'data' of get_model_3D_grid without the time axis
+  (level, lat, lon) or the station columns (level, points). Pressure is
+  in hPa, temperature and dewpoint in degC, there are no pint units in
+  the loops, the loops run over the levels only.
+
+  The formulas and constants are those of metpy.calc (lcl, parcel_profile,
+  cape_cin, k_index, lifted_index), the moist adiabats are integrated with
+  Runge-Kutta steps instead of odeint, the thermodynamic formulas are
+  those of lib/kernels.py. check_against_metpy compares the
+  results of some columns with metpy.
+
+  >>> from nmc_met_map.lib import convection
+  >>> index = convection.convective_indices(levels, t, rh=rh)
+  >>> index['CAPE'].shape, index['prof'].shape
+  ((lat, lon), (level, lat, lon))
+"""
+
+import numpy as np
+# the thermodynamic formulas are shared with the drivers
+from nmc_met_map.lib.kernels import (
+    RD, CP_D, KAPPA, EPSILON, LV, ZERO_C, saturation_vapor_pressure, dewpoint,
+    dewpoint_from_rh, mixing_ratio, saturation_mixing_ratio,
+    equivalent_potential_temperature, virtual_temperature)
+
+INDICES = ('CAPE', 'CIN', 'LCL', 'LFC', 'EL', 'LI', 'K')
+
+
+def _level_axis(p, like):
+    """
+    Pressure of the levels broadcast to the shape of a column array.
+    """
+    p = np.asarray(p, dtype=float)
+    if p.ndim == 1:
+        p = p.reshape((-1,)+(1,)*(np.ndim(like)-1))
+    return p
+
+
+def _level_index(p, value):
+    index = np.nonzero(np.isclose(np.asarray(p, dtype=float), value))[0]
+    if len(index) == 0:
+        raise ValueError('Level %s hPa is needed' % value)
+    return index[0]
+
+
+def lcl(p0, t0, td0, max_iters=50, eps=1e-5):
+    """
+    Lifting condensation level, fixed point iteration of metpy.calc.lcl.
+    :param p0: pressure of the parcel (hPa).
+    :param t0: temperature of the parcel (degC).
+    :param td0: dewpoint of the parcel (degC).
+    :return: pressure (hPa) and temperature (degC) of the LCL.
+    """
+    p0, t0, td0 = np.broadcast_arrays(*[np.asarray(a, dtype=float) for a in (p0, t0, td0)])
+    w = mixing_ratio(saturation_vapor_pressure(td0), p0)
+    tk = t0+ZERO_C
+    p_lcl = p0
+    for _ in range(max_iters):
+        td = dewpoint(p_lcl*w/(EPSILON+w))+ZERO_C
+        p_new = p0*(td/tk)**(1./KAPPA)
+        done = np.all(~(np.abs(p_new-p_lcl) > eps))
+        p_lcl = p_new
+        if done:
+            break
+    # the LCL is not below the parcel
+    p_lcl = np.minimum(p_lcl, p0)
+    return p_lcl, dewpoint(p_lcl*w/(EPSILON+w))
+
+
+def _moist_dtdlnp(p, tk):
+    rs = saturation_mixing_ratio(p, tk-ZERO_C)
+    return (RD*tk+LV*rs)/(CP_D+LV*LV*rs*EPSILON/(RD*tk*tk))
+
+
+def moist_lapse(p0, t0, p1, step=0.02):
+    """
+    Temperature of saturated parcels lifted along the pseudo-adiabats,
+    Runge-Kutta steps in ln(p).
+    :param p0: start pressure (hPa), array or number.
+    :param t0: start temperature (degC).
+    :param p1: end pressure (hPa).
+    :param step: largest step in ln(p), 0.02 is ~20 hPa at 1000 hPa.
+    :return: temperature at p1 (degC).
+    """
+    x0 = np.log(np.asarray(p0, dtype=float))
+    x1 = np.log(np.asarray(p1, dtype=float))
+    span = x1-x0
+    n = int(np.ceil(np.nanmax(np.abs(span))/step)) if np.any(np.isfinite(span)) else 0
+    tk = np.asarray(t0, dtype=float)+ZERO_C
+    if n == 0:
+        return tk-ZERO_C
+    h = span/n
+    x = x0
+    for _ in range(n):
+        k1 = _moist_dtdlnp(np.exp(x), tk)
+        k2 = _moist_dtdlnp(np.exp(x+h/2), tk+h/2*k1)
+        k3 = _moist_dtdlnp(np.exp(x+h/2), tk+h/2*k2)
+        k4 = _moist_dtdlnp(np.exp(x+h), tk+h*k3)
+        tk = tk+h/6*(k1+2*k2+2*k3+k4)
+        x = x+h
+    return tk-ZERO_C
+
+
+def parcel_profile(p, t0, td0, p0=None):
+    """
+    Temperature of a parcel lifted dry adiabatically to the LCL and moist
+    adiabatically above.
+    :param p: pressure of the levels (hPa), decreasing.
+    :param t0: temperature of the parcel (degC), shape of one level.
+    :param td0: dewpoint of the parcel (degC).
+    :param p0: pressure of the parcel, default the first level. Levels
+               below the parcel are nan.
+    :return: profile (level, ...) in degC, pressure and temperature of the LCL.
+    """
+    p = np.asarray(p, dtype=float)
+    t0 = np.asarray(t0, dtype=float)
+    if p0 is None:
+        p0 = p[0]
+    p0 = np.broadcast_to(np.asarray(p0, dtype=float), t0.shape)
+    p_lcl, t_lcl = lcl(p0, t0, td0)
+
+    prof = np.empty((len(p),)+t0.shape)
+    # the moist parcel moves up from the LCL level by level
+    state_p = p_lcl
+    state_t = t_lcl
+    for k, pk in enumerate(p):
+        above = pk < state_p
+        if np.any(above):
+            target = np.where(above, pk, state_p)
+            state_t = moist_lapse(state_p, state_t, target)
+            state_p = target
+        dry = (t0+ZERO_C)*(pk/p0)**KAPPA-ZERO_C
+        prof[k] = np.where(pk > p0, np.nan, np.where(pk < p_lcl, state_t, dry))
+    return prof, p_lcl, t_lcl
+
+
+def _take_level(a, index):
+    """
+    Values of the columns at their level index (...).
+    """
+    return np.take_along_axis(a, index[None], axis=0)[0]
+
+
+def _less_or_close(a, b):
+    return (a < b) | np.isclose(a, b)
+
+
+def _segment_integral(x0, x1, d0, d1, lo, hi):
+    """
+    Integral of the linear d over the part [lo, hi] of the segment [x1, x0]
+    (x is ln(p), x1 < x0).
+    """
+    a = np.maximum(x1, lo)
+    b = np.minimum(x0, hi)
+    width = b-a
+    with np.errstate(invalid='ignore', divide='ignore'):
+        da = d0+(d1-d0)*(a-x0)/(x1-x0)
+        db = d0+(d1-d0)*(b-x0)/(x1-x0)
+        area = (da+db)/2*width
+    return np.where((width > 0) & np.isfinite(area), area, 0.)
+
+
+def cape_cin(p, t, td, prof):
+    """
+    CAPE and CIN of the parcel, as metpy.calc.cape_cin (which_lfc='bottom',
+    which_el='top'): the parcel and the environment are compared in
+    virtual temperature, CAPE between the LFC and the EL, CIN between the
+    parcel and the LFC (0 if positive). As the trapezoids of metpy, the
+    integrals stop at the last level or crossing of the profiles inside
+    the limits.
+    :param p: pressure of the levels (hPa), decreasing.
+    :param t: temperature of the environment (level, ...) in degC.
+    :param td: dewpoint of the environment (degC).
+    :param prof: parcel_profile, the parcel starts at its lowest finite
+                 level, the levels below it are left out.
+    :return: dict of CAPE, CIN (J/kg), LFC and EL (hPa, nan if none).
+    """
+    p = np.asarray(p, dtype=float)
+    pk = _level_axis(p, t)
+    x = np.log(p)
+    nlev = len(p)
+    valid = np.isfinite(t) & np.isfinite(td) & np.isfinite(prof)
+    k0 = np.argmax(valid, axis=0)
+    p0 = p[k0]
+    t0 = _take_level(t, k0)
+    td0 = _take_level(td, k0)
+
+    # the mixing ratio of the parcel is that of its dewpoint below the
+    # LCL, saturated above
+    p_lcl, _ = lcl(p0, t0, td0)
+    w = np.where(pk > p_lcl, saturation_mixing_ratio(p0, td0), saturation_mixing_ratio(pk, prof))
+    tv = virtual_temperature(t, saturation_mixing_ratio(pk, td))
+    prof_v = virtual_temperature(prof, w)
+    d = np.where(valid, prof_v-tv, np.nan)
+
+    # metpy takes the LCL of the virtual temperatures for the LFC and the EL
+    p_lcl_lfc, _ = lcl(p0, _take_level(prof_v, k0), td0)
+    p_lcl_el, _ = lcl(p0, _take_level(tv, k0), td0)
+    # the first segment is left out when the profiles start together
+    skip_first = np.isclose(_take_level(prof_v, k0)+ZERO_C, _take_level(tv, k0)+ZERO_C)
+
+    # crossings of the profiles, going up
+    any_up = np.zeros(p0.shape, dtype=bool)
+    any_down = np.zeros(p0.shape, dtype=bool)
+    p_up = np.full(p0.shape, np.nan)
+    p_down = np.full(p0.shape, np.nan)
+    crossings = []
+    for k in range(nlev-1):
+        first = k0 == k
+        da, db = d[k], d[k+1]
+        cross = valid[k] & valid[k+1] & (np.sign(da) != np.sign(db))
+        if not np.any(cross):
+            continue
+        with np.errstate(invalid='ignore', divide='ignore', over='ignore'):
+            pc = np.where(cross, np.exp((db*x[k]-da*x[k+1])/(db-da)), np.nan)
+        up = cross & (db > 0) & ~(first & skip_first)
+        p_up = np.where(up & np.isnan(p_up) & (pc < p_lcl_lfc), pc, p_up)
+        any_up |= up
+        # the crossings of the first segment are not integration points
+        node = cross & ~first
+        down = node & (db < 0)
+        p_down = np.where(down, pc, p_down)
+        any_down |= down
+        crossings.append((pc, node))
+
+    # LFC, the lowest crossing to a warmer parcel above the LCL; the LCL
+    # if the parcel is only warmer above it and no EL is below it
+    positive = np.any(valid & (pk < p_lcl_lfc) & (d > 0) & ~np.isclose(prof_v, tv), axis=0)
+    lfc_p = np.where(np.isfinite(p_up), p_up,
+                     np.where(any_up,
+                              np.where(any_down & (p_down > p_lcl_lfc), np.nan, p_lcl_lfc),
+                              np.where(positive, p_lcl_lfc, np.nan)))
+    # EL, the highest crossing to a colder parcel above the LCL, the top
+    # level if the parcel is still warmer there
+    has_lfc = np.isfinite(lfc_p)
+    el_p = np.where((d[-1] > 0) | ~any_down | ~(p_down < p_lcl_el), p[-1], p_down)
+    el_p = np.where(has_lfc, el_p, np.nan)
+
+    # limits of the integrals, levels or crossings inside [EL, LFC] and
+    # [LFC, parcel]
+    x_top = np.full(p0.shape, np.inf)
+    x_lfc = np.full(p0.shape, -np.inf)
+    x_cin = np.full(p0.shape, np.inf)
+    points = [(np.broadcast_to(p[k], p0.shape), valid[k]) for k in range(nlev)]+crossings
+    for pn, ok in points:
+        with np.errstate(invalid='ignore'):
+            xn = np.log(pn)
+        x_lfc = np.where(ok & _less_or_close(pn, lfc_p), np.maximum(x_lfc, xn), x_lfc)
+        x_top = np.where(ok & _less_or_close(el_p, pn), np.minimum(x_top, xn), x_top)
+        x_cin = np.where(ok & _less_or_close(lfc_p, pn), np.minimum(x_cin, xn), x_cin)
+
+    x0 = np.log(p0)
+    cape = np.zeros(p0.shape)
+    cin = np.zeros(p0.shape)
+    for k in range(nlev-1):
+        cape += _segment_integral(x[k], x[k+1], d[k], d[k+1], x_top, x_lfc)
+        cin += _segment_integral(x[k], x[k+1], d[k], d[k+1], x_cin, x0)
+    cape = np.where(has_lfc, RD*cape, 0.)
+    cin = np.where(has_lfc, np.minimum(RD*cin, 0.), 0.)
+    return {'CAPE': cape, 'CIN': cin, 'LFC': lfc_p, 'EL': el_p}
+
+
+def k_index(p, t, td):
+    """
+    K index, (T850-T500)+Td850-(T700-Td700).
+    """
+    i850, i700, i500 = [_level_index(p, value) for value in (850, 700, 500)]
+    return (t[i850]-t[i500])+td[i850]-(t[i700]-td[i700])
+
+
+def lifted_index(p, t, prof):
+    """
+    Lifted index, T500 of the environment minus T500 of the parcel.
+    """
+    i500 = _level_index(p, 500)
+    return t[i500]-prof[i500]
+
+
+def _sort_levels(p, *columns):
+    p = np.asarray(p, dtype=float)
+    order = np.argsort(-p)
+    return (p[order],)+tuple(None if c is None else np.asarray(c, dtype=float)[order]
+                             for c in columns)
+
+
+def convective_indices(p, t, td=None, rh=None, parcel='surface', depth=300., psfc=None):
+    """
+    Convective diagnostics of all columns.
+    :param p: pressure of the levels (hPa).
+    :param t: temperature (level, ...) in degC.
+    :param td: dewpoint (degC), or rh.
+    :param rh: relative humidity (%).
+    :param parcel: 'surface', the parcel of the lowest level above the
+                   ground, or 'mu', the most unstable parcel (highest
+                   theta-e) of the lowest depth hPa above the ground.
+    :param psfc: surface pressure (hPa) of the columns (...), the levels
+                 below the ground are left out. Default all the levels
+                 are above the ground.
+    :return: dict of CAPE, CIN (J/kg), LCL, LFC, EL (hPa), LI, K (degC)
+             of shape (...), and the levels, dewpoint and parcel
+             profile (level, ...) used, nan below the ground.
+    """
+    if td is None:
+        if rh is None:
+            raise ValueError('td or rh is needed')
+        p, t, rh = _sort_levels(p, t, rh)
+        td = dewpoint_from_rh(t, rh)
+    else:
+        p, t, td = _sort_levels(p, t, td)
+
+    pk = _level_axis(p, t)
+    if psfc is not None:
+        below = pk > np.asarray(psfc, dtype=float)
+        t = np.where(below, np.nan, t)
+        td = np.where(below, np.nan, td)
+    valid = np.isfinite(t) & np.isfinite(td)
+    ground = np.argmax(valid, axis=0)
+
+    if parcel == 'surface':
+        index = ground
+    elif parcel == 'mu':
+        theta_e = equivalent_potential_temperature(pk, t, td)
+        theta_e = np.where(valid & (pk >= p[ground]-depth), theta_e, -np.inf)
+        index = np.argmax(theta_e, axis=0)
+    else:
+        raise ValueError('parcel should be surface or mu')
+    p0 = p[index]
+    t0 = _take_level(t, index)
+    td0 = _take_level(td, index)
+
+    prof, p_lcl, t_lcl = parcel_profile(p, t0, td0, p0=p0)
+    result = cape_cin(p, t, td, prof)
+    result['LCL'] = p_lcl
+    result['LI'] = lifted_index(p, t, prof)
+    try:
+        result['K'] = k_index(p, t, td)
+    except ValueError:
+        result['K'] = np.full(t.shape[1:], np.nan)
+    result.update({'levels': p, 'td': td, 'prof': prof, 'lcl_temperature': t_lcl})
+    return result
+
+
+def _soundings(n, seed):
+    """
+    Synthetic soundings, surface temperature 15-35 degC, different lapse
+    rates, tropopauses, low inversions and dry layers.
+    """
+    rng = np.random.RandomState(seed)
+    p = np.array([1000, 975, 950, 925, 900, 850, 800, 750, 700, 650, 600,
+                  550, 500, 450, 400, 350, 300, 250, 200, 150, 100], dtype=float)
+    z = 44330.*(1-(p/1013.25)**0.1903)
+    t0 = rng.uniform(15, 35, n)
+    lapse = rng.uniform(5.5, 9., n)/1000.
+    z_trop = rng.uniform(11000, 16000, n)
+    t = t0-lapse*np.minimum(z[:, None], z_trop)+0.001*np.maximum(z[:, None]-z_trop, 0)
+    z_inv = rng.uniform(500, 2500, n)
+    t += (rng.uniform(size=n) < 0.4)*rng.uniform(1, 6, n)*np.exp(-((z[:, None]-z_inv)/400.)**2)
+    t += rng.normal(0, 0.7, t.shape)
+    spread = rng.uniform(0.5, 6, n)+rng.uniform(0, 25, n)*(1-p[:, None]/1000.)**rng.uniform(0.5, 2, n)
+    return p, t, t-spread-np.abs(rng.normal(0, 2, t.shape))
+
+
+# largest differences to metpy, absolute and relative to the value of
+# metpy. The saturation vapor pressure of metpy >= 1.6 moves the LCL up to
+# ~1 hPa, an LFC at the LCL next to a level then ends the integrals one
+# level apart, ~1% of CAPE and ~15 J/kg of CIN.
+TOLERANCE = {'LCL': (1., 0.), 'prof': (0.5, 0.), 'CAPE': (20., 0.01), 'CIN': (15., 0.)}
+
+
+def check_against_metpy(p=None, t=None, td=None, columns=None, tolerance=TOLERANCE):
+    """
+    Compare some columns with metpy.calc. CAPE and CIN are compared on
+    the parcel profile of metpy: where the parcel just touches the
+    environment, the small difference of the profiles (prof) can move
+    the LFC of metpy and change CAPE by thousands of J/kg.
+    :param p: pressure of the levels (hPa), default 60 synthetic soundings.
+    :param t: temperature (level, ...) in degC.
+    :param td: dewpoint (degC).
+    :param columns: list of column indexes of t[:, ...], default 10 columns
+                    (all the synthetic soundings).
+    :param tolerance: dict of (absolute, relative) largest differences,
+                      ValueError if they are exceeded, None not to check.
+    :return: dict of the largest absolute differences.
+    """
+    import metpy.calc as mpcalc
+    from metpy.units import units
+    synthetic = p is None
+    if synthetic:
+        p, t, td = _soundings(60, 0)
+    p, t, td = _sort_levels(p, t, td)
+    flat_t = t.reshape(len(p), -1)
+    flat_td = td.reshape(len(p), -1)
+    if columns is None and synthetic:
+        columns = np.arange(flat_t.shape[1])
+    elif columns is None:
+        columns = np.linspace(0, flat_t.shape[1]-1, min(10, flat_t.shape[1])).astype(int)
+    ours = convective_indices(p, flat_t[:, columns], td=flat_td[:, columns])
+    diff = {'LCL': 0., 'prof': 0., 'CAPE': 0., 'CIN': 0.}
+    exceeded = set()
+    for i, column in enumerate(columns):
+        pu = p*units.hPa
+        tu = flat_t[:, column]*units.degC
+        tdu = flat_td[:, column]*units.degC
+        p_lcl, _ = mpcalc.lcl(pu[0], tu[0], tdu[0])
+        prof = mpcalc.parcel_profile(pu, tu[0], tdu[0]).to('degC')
+        cape, cin = mpcalc.cape_cin(pu, tu, tdu, prof)
+        same = cape_cin(p, flat_t[:, column], flat_td[:, column], prof.m)
+        pairs = {'LCL': (ours['LCL'][i], p_lcl.m_as('hPa')),
+                 'prof': (ours['prof'][:, i], prof.m),
+                 'CAPE': (same['CAPE'], cape.m_as('J/kg')),
+                 'CIN': (same['CIN'], cin.m_as('J/kg'))}
+        for name, (value, theirs) in pairs.items():
+            error = np.abs(value-theirs)
+            diff[name] = max(diff[name], float(np.nanmax(error)))
+            if tolerance is not None:
+                atol, rtol = tolerance[name]
+                if np.any(error > atol+rtol*np.abs(theirs)):
+                    exceeded.add(name)
+    if exceeded:
+        raise ValueError('Differences to metpy over the tolerance: ' +
+                         ', '.join('%s %.3g' % (name, diff[name]) for name in sorted(exceeded)))
+    return diff
@@ -0,0 +1,205 @@
+# _*_ coding: utf-8 _*_
+
+"""
+  Derived fields computed once and shared between the products.
+
+  Every derived variable is registered with the kernel that computes it
+  and the fields it depends on, raw fields of the model (u, v, t, rh,
+  pressure of the levels) or other derived variables. The value is kept
+  under (model, initial time, fhour, levels, variable, region) and a
+  hash of the raw fields it is computed from, so a new version of the
+  input files (or other values for the same key) is computed again
+  instead of served from the cache. The products of a run that need
+  the same variable on the same region
+  (the dewpoint and theta-e of the cross-sections, the dewpoint of the
+  station products, the wind speed of the wind maps) compute it once,
+  the dependencies too (theta-e and qv share the dewpoint).
+
+  >>> from nmc_met_map.lib import derived
+  >>> key = dict(model='ECMWF', init_time='19083008', fhour=24, levels=levels,
+  >>>            region=('section', (20, 120), (50, 130)))
+  >>> theta_e = derived.field('theta_e', {'p': p, 't': t, 'rh': rh}, **key)
+
+  The values are shared, they are read-only arrays. The cache keeps the
+  most recently used values up to max_bytes:
+  >>> derived.configure(max_bytes=512*1024*1024)
+"""
+
+import hashlib
+import threading
+from collections import OrderedDict
+import numpy as np
+from nmc_met_map.lib import kernels
+
+# variable name: kernel and the names of its dependencies, in the order of the kernel arguments
+DERIVED = {}
+
+_config = {'max_bytes': 256*1024*1024}
+
+_cache = OrderedDict()
+_cache_lock = threading.Lock()
+_stats = {'hit': 0, 'miss': 0, 'evicted': 0, 'bytes': 0}
+
+
+def register_derived(name, func, depends):
+    """
+    Register a derived variable.
+    :param name: variable name, like 'td'.
+    :param func: kernel, called with the dependencies in order.
+    :param depends: names of the raw fields or of other derived variables.
+    """
+    DERIVED[name] = {'func': func, 'depends': tuple(depends)}
+
+
+# u, v: wind (m/s); t: temperature (degC); rh: relative humidity (%);
+# p: pressure (hPa) broadcast to t
+register_derived('wsp', kernels.wind_speed, ('u', 'v'))
+register_derived('td', kernels.dewpoint_from_rh, ('t', 'rh'))
+register_derived('rh_from_td', kernels.relative_humidity_from_dewpoint, ('t', 'td'))
+register_derived('theta_e', kernels.equivalent_potential_temperature, ('p', 't', 'td'))
+register_derived('qv', kernels.specific_humidity_from_dewpoint, ('p', 'td'))
+
+
+def configure(max_bytes=None):
+    """
+    :param max_bytes: memory of the cached values, 0 to stop caching.
+    """
+    if max_bytes is not None:
+        _config['max_bytes'] = max_bytes
+        with _cache_lock:
+            _evict()
+
+
+def clear():
+    with _cache_lock:
+        _cache.clear()
+        _stats['bytes'] = 0
+
+
+def stats():
+    """
+    :return: dict of the hits, misses, evicted values and bytes in the cache.
+    """
+    with _cache_lock:
+        return dict(_stats, values=len(_cache))
+
+
+def _evict():
+    while _cache and _stats['bytes'] > _config['max_bytes']:
+        _, value = _cache.popitem(last=False)
+        _stats['bytes'] -= value.nbytes
+        _stats['evicted'] += 1
+
+
+def _hashable(value):
+    if value is None or isinstance(value, (str, int, float)):
+        return value
+    if isinstance(value, dict):
+        return tuple(sorted((key, _hashable(item)) for key, item in value.items()))
+    if isinstance(value, np.ndarray) and value.ndim == 0:
+        return _hashable(value.item())
+    if hasattr(value, '__iter__'):
+        return tuple(_hashable(item) for item in value)
+    if hasattr(value, 'item'):
+        return value.item()
+    return str(value)
+
+
+def field_key(name, model=None, init_time=None, fhour=None, levels=None, region=None,
+              inputs=None):
+    """
+    :param inputs: hash of the raw fields, see raw_fingerprint.
+    :return: the cache key of a variable.
+    """
+    if init_time is not None and not isinstance(init_time, str):
+        init_time = str(np.asarray(init_time).reshape(-1)[0])
+    return (_hashable(model), init_time, _hashable(fhour), _hashable(levels), name,
+            _hashable(region), kernels.DTYPE.__name__, inputs)
+
+
+def _raw_depends(name, raw):
+    """
+    :return: sorted names of the raw fields the variable is computed from.
+    """
+    names = set()
+    for depend in DERIVED[name]['depends']:
+        if depend in raw:
+            names.add(depend)
+        elif depend in DERIVED:
+            names.update(_raw_depends(depend, raw))
+        else:
+            raise ValueError('%s needs the raw field %s' % (name, depend))
+    return sorted(names)
+
+
+def raw_fingerprint(raw, names=None):
+    """
+    sha1 of the shapes and values of the raw fields.
+    :param raw: dict of arrays.
+    :param names: names of the fields, default all.
+    """
+    sha1 = hashlib.sha1()
+    for name in sorted(raw) if names is None else names:
+        value = np.ascontiguousarray(raw[name])
+        sha1.update(('%s%s%s' % (name, value.dtype.str, value.shape)).encode('utf-8'))
+        sha1.update(value.tobytes())
+    return sha1.hexdigest()
+
+
+def field(name, raw, model=None, init_time=None, fhour=None, levels=None, region=None):
+    """
+    A derived variable, computed once for its key and raw fields.
+    :param name: variable name in DERIVED.
+    :param raw: dict of the raw fields the variable depends on, arrays or
+                functions returning them, a derived variable given in raw
+                is not computed.
+    :param model: model name.
+    :param init_time: initial time, like '19083008'.
+    :param fhour: forecast hour, or list of them for time sections.
+    :param levels: level(s) of the fields.
+    :param region: region of the fields, like a map extent
+                   [lonmin, lonmax, latmin, latmax], ('section', st_point, ed_point)
+                   or the points dictionary of the stations.
+    :return: read-only array.
+    """
+    if name not in DERIVED:
+        raise ValueError('Unknown derived variable: '+str(name))
+    # like the dewpoint of the models that have it
+    raw = {depend: kernels.field(raw[depend]() if callable(raw[depend]) else raw[depend])
+           for depend in _raw_depends(name, raw)}
+    return _field(name, raw, {}, dict(model=model, init_time=init_time, fhour=fhour,
+                                      levels=levels, region=region))
+
+
+def _field(name, raw, prints, where):
+    """
+    :param raw: dict of the raw arrays, in the floating point type of the package.
+    :param prints: dict of the raw_fingerprint of the names of _raw_depends, filled in.
+    :param where: keyword arguments of field_key.
+    """
+    names = tuple(_raw_depends(name, raw))
+    if names not in prints:
+        prints[names] = raw_fingerprint(raw, names)
+    key = field_key(name, inputs=prints[names], **where)
+    with _cache_lock:
+        value = _cache.get(key)
+        if value is not None:
+            _cache.move_to_end(key)
+            _stats['hit'] += 1
+            return value
+
+    args = [raw[depend] if depend in raw else _field(depend, raw, prints, where)
+            for depend in DERIVED[name]['depends']]
+    value = np.asarray(DERIVED[name]['func'](*args))
+    value.flags.writeable = False
+
+    with _cache_lock:
+        if key not in _cache:
+            _stats['miss'] += 1
+            if value.nbytes <= _config['max_bytes']:
+                _cache[key] = value
+                _stats['bytes'] += value.nbytes
+                _evict()
+        else:
+            value = _cache[key]
+    return value
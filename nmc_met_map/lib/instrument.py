@@ -0,0 +1,295 @@
+# _*_ coding: utf-8 _*_
+
+"""
+  Timing spans and profiling of the product pipeline.
+
+  Every product function is decorated with @product. During a product
+  run the time goes to the spans fetch (server requests), crop, derive
+  (the default phase of a product), draw and save. Nested spans are
+  counted exclusively, so the span times add up to the total.
+  Nothing is recorded until a sink is added or a profiler is set.
+
+  >>> from nmc_met_map.lib import instrument
+  >>> instrument.add_sink(instrument.LogSink())
+  >>> instrument.add_sink(instrument.JSONSink('/data/log/nmc_met_map_spans.jsonl'))
+  >>> instrument.add_sink(instrument.PrometheusTextfileSink('/var/lib/node_exporter/nmc_met_map.prom'))
+  >>> instrument.set_profiler('cprofile', output_dir='/data/log/profile/')
+
+  The profiler can also be set by the environment variable
+  NMC_MET_MAP_PROFILE=cprofile or pyinstrument.
+"""
+
+import os
+import json
+import time
+import logging
+import functools
+import threading
+from datetime import datetime
+
+logger = logging.getLogger('nmc_met_map')
+
+_sinks = []
+_profiler = {'name': os.environ.get('NMC_MET_MAP_PROFILE') or None,
+             'output_dir': os.environ.get('NMC_MET_MAP_PROFILE_DIR', '.')}
+_local = threading.local()
+
+
+def _enabled():
+    return len(_sinks) > 0 or _profiler['name'] is not None
+
+
+def add_sink(sink):
+    """
+    :param sink: object with emit(record) method, record is a dict of
+                 product, start time, total seconds and span seconds.
+    """
+    _sinks.append(sink)
+    return sink
+
+
+def clear_sinks():
+    del _sinks[:]
+
+
+def set_profiler(name, output_dir='.'):
+    """
+    :param name: 'cprofile', 'pyinstrument' or None to disable.
+    :param output_dir: directory of the profile files.
+    """
+    if name not in (None, 'cprofile', 'pyinstrument'):
+        raise ValueError('Unknown profiler: '+str(name))
+    _profiler['name'] = name
+    _profiler['output_dir'] = output_dir
+
+
+class _NullSpan(object):
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class _Span(object):
+
+    def __init__(self, run, name):
+        self.run = run
+        self.name = name
+
+    def __enter__(self):
+        self.run.stack.append([self.name, time.perf_counter(), 0.])
+        return self
+
+    def __exit__(self, *args):
+        self.run.close(self.run.stack.pop())
+        return False
+
+
+class _Run(object):
+
+    def __init__(self, name):
+        self.name = name
+        self.times = {}
+        self.start_time = datetime.now()
+        self.start = time.perf_counter()
+        # the bottom of the stack is the current phase of the product
+        self.stack = [['derive', self.start, 0.]]
+
+    def close(self, item, now=None):
+        name, start, inner = item
+        if now is None:
+            now = time.perf_counter()
+        elapsed = now-start
+        self.times[name] = self.times.get(name, 0.)+elapsed-inner
+        if self.stack:
+            self.stack[-1][2] += elapsed
+
+    def phase(self, name):
+        now = time.perf_counter()
+        base = self.stack[0]
+        self.times[base[0]] = self.times.get(base[0], 0.)+now-base[1]-base[2]
+        self.stack[0] = [name, now, 0.]
+
+    def finish(self):
+        now = time.perf_counter()
+        while len(self.stack) > 1:
+            self.close(self.stack.pop(), now)
+        self.close(self.stack.pop(), now)
+        return {'product': self.name,
+                'start': self.start_time.isoformat(),
+                'total': now-self.start,
+                'spans': self.times}
+
+
+def _current_run():
+    return getattr(_local, 'run', None)
+
+
+def span(name):
+    """
+    Time a block of the product run.
+    >>> with instrument.span('fetch'):
+    >>>     ...
+    """
+    run = _current_run()
+    if run is None:
+        return _NULL_SPAN
+    return _Span(run, name)
+
+
+def phase(name):
+    """
+    Switch the current phase of the product run, like 'crop' after the
+    data are retrieved. The phase lasts until the next phase or the end
+    of the product.
+    """
+    run = _current_run()
+    if run is not None:
+        run.phase(name)
+
+
+def traced(name):
+    """
+    Decorator, time the function as a span.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if _current_run() is None:
+                return func(*args, **kwargs)
+            with span(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def _start_profiler():
+    if _profiler['name'] == 'cprofile':
+        import cProfile
+        profiler = cProfile.Profile()
+        profiler.enable()
+        return profiler
+    if _profiler['name'] == 'pyinstrument':
+        try:
+            from pyinstrument import Profiler
+        except ImportError:
+            logger.warning('pyinstrument is not installed, profile skipped')
+            return None
+        profiler = Profiler()
+        profiler.start()
+        return profiler
+    return None
+
+
+def _stop_profiler(profiler, name, start_time):
+    output_dir = _profiler['output_dir']
+    if not os.path.exists(output_dir):
+        os.makedirs(output_dir)
+    path = os.path.join(output_dir, name+'_'+start_time.strftime('%Y%m%d%H%M%S%f'))
+    if _profiler['name'] == 'cprofile':
+        profiler.disable()
+        profiler.dump_stats(path+'.prof')
+    else:
+        profiler.stop()
+        with open(path+'.html', 'w', encoding='utf-8') as f:
+            f.write(profiler.output_html())
+
+
+def product(func):
+    """
+    Decorator of the product functions, record the spans of a run and
+    send them to the sinks.
+    """
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        if not _enabled() or _current_run() is not None:
+            return func(*args, **kwargs)
+        run = _Run(func.__name__)
+        _local.run = run
+        profiler = _start_profiler()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            if profiler is not None:
+                _stop_profiler(profiler, run.name, run.start_time)
+            _local.run = None
+            record = run.finish()
+            for sink in _sinks:
+                try:
+                    sink.emit(record)
+                except Exception as e:
+                    logger.warning('span sink failed: %s', e)
+    return wrapper
+
+
+class LogSink(object):
+    """
+    One log line per product run:
+    gh_uv_mslp 12.31s fetch=8.02 crop=0.05 derive=0.11 draw=3.10 save=1.03
+    """
+
+    def __init__(self, log=None, level=logging.INFO):
+        self.log = log if log is not None else logger
+        self.level = level
+
+    def emit(self, record):
+        spans = ' '.join('%s=%.2f' % (name, seconds)
+                         for name, seconds in sorted(record['spans'].items()))
+        self.log.log(self.level, '%s %.2fs %s', record['product'], record['total'], spans)
+
+
+class JSONSink(object):
+    """
+    Append one json line per product run.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def emit(self, record):
+        with self._lock:
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(record)+'\n')
+
+
+class PrometheusTextfileSink(object):
+    """
+    Counters in the Prometheus text format for the node_exporter
+    textfile collector, the file is rewritten after every run.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.runs = {}
+        self.seconds = {}
+        self.last = {}
+        self._lock = threading.Lock()
+
+    def emit(self, record):
+        name = record['product']
+        with self._lock:
+            self.runs[name] = self.runs.get(name, 0)+1
+            self.last[name] = record['total']
+            for span_name, seconds in record['spans'].items():
+                key = (name, span_name)
+                self.seconds[key] = self.seconds.get(key, 0.)+seconds
+            lines = ['# TYPE nmc_met_map_product_runs_total counter']
+            lines += ['nmc_met_map_product_runs_total{product="%s"} %d' % (product, n)
+                      for product, n in sorted(self.runs.items())]
+            lines += ['# TYPE nmc_met_map_product_last_seconds gauge']
+            lines += ['nmc_met_map_product_last_seconds{product="%s"} %.6f' % (product, seconds)
+                      for product, seconds in sorted(self.last.items())]
+            lines += ['# TYPE nmc_met_map_span_seconds_total counter']
+            lines += ['nmc_met_map_span_seconds_total{product="%s",span="%s"} %.6f' % (
+                product, span_name, seconds)
+                for (product, span_name), seconds in sorted(self.seconds.items())]
+            tmp_path = self.path+'.tmp'
+            with open(tmp_path, 'w') as f:
+                f.write('\n'.join(lines)+'\n')
+            os.replace(tmp_path, self.path)
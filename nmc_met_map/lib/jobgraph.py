@@ -0,0 +1,265 @@
+# _*_ coding: utf-8 _*_
+
+"""
+  Dependency aware product jobs with incremental re-render.
+
+  Every rendered job writes a manifest (json) with the exact input files
+  and their fingerprints, the parameters and the output files. Running
+  the suite again only re-renders the jobs whose manifest is missing,
+  whose parameters or outputs changed, or whose inputs changed.
+
+  With a local mirror of the server, the inputs are compared by their
+  modification time and size. The server listing only gives the size of
+  every file (one request per directory, no file is read), which does not
+  change when a grid of the same shape is replaced. So without a local
+  mirror, the inputs whose size is unchanged are read again and compared
+  with the content hash recorded when the job was rendered; verify=False
+  skips this and trusts the listing.
+
+  >>> from nmc_met_map.lib.jobgraph import JobGraph
+  >>> graph = JobGraph(output_dir='/data/maps/')
+  >>> jobs = graph.jobs(['gh_uv_mslp', 'gh_uv_rh'], '19083008', range(0, 73, 6))
+  >>> graph.plan(jobs)        # dry run, list of (job, reason)
+  >>> graph.run(jobs)
+  >>> graph.plan(jobs, verify=False)  # only the server listing
+"""
+
+import os
+import json
+import shutil
+import hashlib
+from concurrent.futures import ProcessPoolExecutor
+import nmc_met_map.lib.utility as utl
+from nmc_met_map.lib import retrieve
+from nmc_met_map.lib.scheduler import PRODUCTS, product_dirs, run_job
+
+
+def job_name(job):
+    name, model, initial_time, fhour = job
+    return '%s_%s_%s_%03d' % (name, model, initial_time, int(fhour))
+
+
+def job_kwargs(job, output_dir):
+    name, model, initial_time, fhour = job
+    kwargs = dict(PRODUCTS[name]['kwargs'])
+    kwargs.update(initial_time=initial_time, fhour=fhour, model=model,
+                  output_dir=output_dir)
+    return kwargs
+
+
+def params_hash(job):
+    """
+    hash of the product function and its parameters (output_dir excluded).
+    """
+    kwargs = job_kwargs(job, None)
+    del kwargs['output_dir']
+    text = json.dumps([PRODUCTS[job[0]]['func'], kwargs], sort_keys=True, default=str,
+                      ensure_ascii=False)
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+
+def input_fingerprint(directory, filename, local_root=None, listing=None):
+    """
+    Current fingerprint of an input file, from its metadata.
+    With a local mirror of the server, the modification time and size are
+    used, otherwise the size in the server listing.
+    :param listing: listing of the directory (retrieve.get_file_listing),
+                    requested if not given.
+    :return: fingerprint string, None if the file not exists.
+    """
+    if local_root is not None:
+        path = os.path.join(local_root, directory, filename)
+        if not os.path.isfile(path):
+            return None
+        stat = os.stat(path)
+        return 'mtime:%d:%d' % (stat.st_mtime_ns, stat.st_size)
+    if listing is None:
+        listing = retrieve.get_file_listing(directory)
+    if filename not in listing:
+        return None
+    return 'list:%s' % listing[filename]
+
+
+def content_fingerprint(directory, filename):
+    """
+    Fingerprint of the content of an input file, the file is read.
+    :return: fingerprint string, None if the file not exists.
+    """
+    # not from the local cache of nmc_met_io, which keeps the old file
+    if directory.startswith('SURFACE/'):
+        data = retrieve.get_station_data(directory, filename=filename, cache=False)
+    else:
+        data = retrieve.get_model_grid(directory, filename=filename, cache=False)
+    if data is None:
+        return None
+    return retrieve.data_fingerprint(data)
+
+
+def _render(job, staging_dir, output_dir, local_root, fresh=False):
+    """
+    Run one job in a private staging directory, record the inputs,
+    move the outputs to output_dir and return the manifest.
+    :param fresh: read the inputs from the server, not from the local cache.
+    """
+    if not os.path.exists(staging_dir):
+        os.makedirs(staging_dir)
+    with retrieve.record_inputs(fresh=fresh) as inputs:
+        # the products join output_dir and the file name directly
+        run_job(PRODUCTS[job[0]]['func'], job_kwargs(job, os.path.join(staging_dir, '')))
+
+    listings = {}
+    for item in inputs:
+        if local_root is None and item['directory'] not in listings:
+            listings[item['directory']] = retrieve.get_file_listing(item['directory'])
+        item['fingerprint'] = input_fingerprint(
+            item['directory'], item['filename'], local_root=local_root,
+            listing=listings.get(item['directory']))
+
+    outputs = []
+    for name in sorted(os.listdir(staging_dir)):
+        shutil.move(os.path.join(staging_dir, name), os.path.join(output_dir, name))
+        outputs.append(name)
+    shutil.rmtree(staging_dir, ignore_errors=True)
+    return {'job': list(job), 'func': PRODUCTS[job[0]]['func'],
+            'params_hash': params_hash(job), 'inputs': inputs, 'outputs': outputs}
+
+
+class JobGraph(object):
+
+    def __init__(self, output_dir, manifest_dir=None, local_root=None):
+        """
+        :param output_dir: output directory of the products.
+        :param manifest_dir: directory of the manifests,
+                             default is output_dir/.manifest.
+        :param local_root: local mirror of the MICAPS directories, if given
+                           the inputs are compared by modification time,
+                           otherwise by the server listing and contents.
+        """
+        self.output_dir = output_dir
+        if manifest_dir is None:
+            manifest_dir = os.path.join(output_dir, '.manifest')
+        self.manifest_dir = manifest_dir
+        self.local_root = local_root
+        self._listings = {}
+        self._contents = {}
+        for path in (output_dir, manifest_dir):
+            if not os.path.exists(path):
+                os.makedirs(path)
+
+    def jobs(self, products, initial_time, fhours, models=['ECMWF']):
+        """
+        :return: list of jobs (product, model, initial_time, fhour).
+        """
+        return [(name, model, initial_time, int(fhour))
+                for model in models for name in products for fhour in fhours]
+
+    def manifest_path(self, job):
+        return os.path.join(self.manifest_dir, job_name(job)+'.json')
+
+    def load_manifest(self, job):
+        path = self.manifest_path(job)
+        if not os.path.isfile(path):
+            return None
+        with open(path, encoding='utf-8') as f:
+            return json.load(f)
+
+    def _listing(self, directory):
+        if directory not in self._listings:
+            self._listings[directory] = retrieve.get_file_listing(directory)
+        return self._listings[directory]
+
+    def _content(self, directory, filename):
+        if (directory, filename) not in self._contents:
+            self._contents[(directory, filename)] = content_fingerprint(directory, filename)
+        return self._contents[(directory, filename)]
+
+    def stale_reason(self, job, verify=None):
+        """
+        :param verify: also read the inputs and compare their contents,
+                       default is True without a local mirror.
+        :return: reason to re-render the job, None if it is up to date.
+        """
+        manifest = self.load_manifest(job)
+        if manifest is None:
+            return 'no manifest'
+        if manifest['params_hash'] != params_hash(job):
+            return 'parameters changed'
+        if len(manifest['outputs']) == 0:
+            return 'no output'
+        for name in manifest['outputs']:
+            if not os.path.isfile(os.path.join(self.output_dir, name)):
+                return 'output missing: '+name
+
+        # the inputs the product read last time
+        _, model, initial_time, fhour = job
+        recorded = {(item['directory'], item['filename']) for item in manifest['inputs']}
+        for directory in product_dirs(job[0], model):
+            if (directory, utl.model_filename(initial_time, fhour)) not in recorded:
+                return 'input not recorded: '+directory
+        for item in manifest['inputs']:
+            listing = None if self.local_root is not None else self._listing(item['directory'])
+            fingerprint = input_fingerprint(item['directory'], item['filename'],
+                                            local_root=self.local_root, listing=listing)
+            if fingerprint != item['fingerprint']:
+                return 'input changed: '+item['directory']+item['filename']
+        if verify is None:
+            verify = self.local_root is None
+        if verify:
+            for item in manifest['inputs']:
+                if self._content(item['directory'], item['filename']) != item.get('content'):
+                    return 'input content changed: '+item['directory']+item['filename']
+        return None
+
+    def plan(self, jobs, verify=None):
+        """
+        Dry run.
+        :param verify: also read the inputs and compare their contents,
+                       default is True without a local mirror.
+        :return: list of (job, reason) which would be re-rendered.
+        """
+        # the server listings and contents are requested once per plan
+        self._listings = {}
+        self._contents = {}
+        plan = []
+        for job in jobs:
+            reason = self.stale_reason(job, verify=verify)
+            if reason is not None:
+                plan.append((job, reason))
+        return plan
+
+    def run(self, jobs, dry_run=False, max_workers=None, force=False, verify=None):
+        """
+        Re-render the stale jobs and write their manifests.
+        :param dry_run: only print and return the plan.
+        :param force: re-render all jobs.
+        :param verify: also read the inputs and compare their contents,
+                       default is True without a local mirror.
+        :return: list of (job, reason) re-rendered (or would be).
+        """
+        if force:
+            plan = [(job, 'forced') for job in jobs]
+        else:
+            plan = self.plan(jobs, verify=verify)
+        if dry_run:
+            for job, reason in plan:
+                print('%s: %s' % (job_name(job), reason))
+            return plan
+
+        staging_root = os.path.join(self.manifest_dir, 'staging')
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            # a changed input must not be read from the local cache again
+            futures = [(job, executor.submit(
+                _render, job, os.path.join(staging_root, job_name(job)),
+                self.output_dir, self.local_root, reason.startswith('input')))
+                for job, reason in plan]
+            for job, future in futures:
+                try:
+                    manifest = future.result()
+                except Exception as e:
+                    print('----%s failed: %s' % (job_name(job), e))
+                    continue
+                tmp_path = self.manifest_path(job)+'.tmp'
+                with open(tmp_path, 'w', encoding='utf-8') as f:
+                    json.dump(manifest, f, ensure_ascii=False, indent=1)
+                os.replace(tmp_path, self.manifest_path(job))
+        return plan
@@ -0,0 +1,481 @@
+# _*_ coding: utf-8 _*_
+
+"""
+  Numeric kernels of the thermodynamic and kinematic formulas of the
+  drivers (crossection.py, synoptic.PV_Div_uv, synthetical.py, sta.py).
+
+  The kernels work on plain numpy arrays and keep their dtype, the
+  drivers take the data out of the xarray with field() (DTYPE) and
+  only put units back where the graphics need them. Units are fixed:
+  pressure in hPa (Pa for the vertical derivatives), temperature and
+  dewpoint in degC, relative humidity in %, wind in m/s, grid deltas in
+  metres, latitude in degrees.
+
+  The formulas and constants are those of metpy.calc, the horizontal
+  derivatives are the second order finite differences of
+  metpy.calc.first_derivative on the grid deltas of a sphere, without
+  the map factor corrections. check_against_metpy compares every kernel
+  with metpy.
+
+  >>> from nmc_met_map.lib import kernels
+  >>> td = kernels.dewpoint_from_rh(kernels.field(t['data'].values), kernels.field(rh['data'].values))
+  >>> dx, dy = kernels.lat_lon_grid_deltas(lon, lat)
+  >>> avor = kernels.absolute_vorticity(u, v, dx, dy, lat[:, None])
+
+  DTYPE is the floating point type of the whole package: the grids are
+  cast to it when they are retrieved (lib/retrieve.py), cropped and
+  derived in it and plotted from it. The default is float32, the
+  grids of the MICAPS files are float32 already, so the retrieval loses
+  nothing and the 3D volumes and every field derived from them take
+  half the memory of float64. float32 keeps 7 significant digits:
+      temperature, dewpoint, theta, theta-e    1e-5 K
+      geopotential height (5880 gpm)           5e-4 gpm
+      pressure, mslp                           1e-4 hPa
+      wind, wind speed                         1e-6 m/s
+      vorticity, divergence, advection, PV     1e-6 to 5e-5 of the largest
+                                               value of the field, the
+                                               finite differences subtract
+                                               close neighbours
+  all far below the contour intervals of the maps. Long sums (means or
+  accumulations over many grids) should accumulate in float64, like
+  np.mean(x, dtype=np.float64). For float64 everywhere:
+  >>> kernels.set_dtype('float64')
+  or
+  export NMC_MET_MAP_DTYPE=float64
+"""
+
+import os
+import numpy as np
+
+_ENV = 'NMC_MET_MAP_DTYPE'
+
+DTYPES = ('float32', 'float64')
+
+
+def _dtype(name):
+    name = np.dtype(name).name
+    if name not in DTYPES:
+        raise ValueError('dtype should be float32 or float64, not '+name)
+    return np.dtype(name).type
+
+
+DTYPE = _dtype(os.environ.get(_ENV) or 'float32')
+
+RD = 287.04749097718457         # J/(kg K)
+CP_D = 1004.6662184201462       # J/(kg K)
+KAPPA = RD/CP_D
+EPSILON = 0.6219569100577033
+LV = 2.50084e6                  # J/kg
+ZERO_C = 273.15
+SAT_PRESSURE_0C = 6.112         # hPa
+G = 9.80665                     # m/s**2
+OMEGA = 7.292115e-5             # rad/s
+EARTH_RADIUS = 6370997.         # m, the sphere of pyproj used by metpy
+MS_TO_KT = 1./0.514444
+
+
+def set_dtype(dtype):
+    """
+    :param dtype: 'float32' or 'float64', the floating point type of the package.
+    """
+    global DTYPE
+    DTYPE = _dtype(dtype)
+
+
+def cast(data):
+    """
+    Cast the floating point data of a retrieved grid to DTYPE, the
+    coordinates (lon, lat, level) are not changed.
+    :param data: xarray Dataset or DataArray, numpy array, or None.
+    """
+    if data is None:
+        return None
+    if hasattr(data, 'data_vars'):
+        for name in list(data.data_vars):
+            if np.issubdtype(data[name].dtype, np.floating) and data[name].dtype != DTYPE:
+                data[name] = data[name].astype(DTYPE)
+        return data
+    if np.issubdtype(data.dtype, np.floating) and data.dtype != DTYPE:
+        return data.astype(DTYPE)
+    return data
+
+
+def field(values, dtype=None):
+    """
+    The data of a driver as a plain array of the kernels.
+    :param values: numpy array, xarray values or list.
+    :param dtype: default DTYPE.
+    """
+    return np.asarray(values, dtype=DTYPE if dtype is None else dtype)
+
+
+def saturation_vapor_pressure(t):
+    """
+    :param t: temperature (degC).
+    :return: saturation vapor pressure (hPa), Bolton 1980.
+    """
+    return SAT_PRESSURE_0C*np.exp(17.67*t/(t+243.5))
+
+
+def dewpoint(e):
+    """
+    :param e: vapor pressure (hPa).
+    :return: dewpoint (degC).
+    """
+    val = np.log(e/SAT_PRESSURE_0C)
+    return 243.5*val/(17.67-val)
+
+
+def dewpoint_from_rh(t, rh):
+    """
+    :param t: temperature (degC).
+    :param rh: relative humidity (%), like the RH of the models.
+    :return: dewpoint (degC).
+    """
+    rh = np.clip(rh, 0.1, None)/100.
+    return dewpoint(rh*saturation_vapor_pressure(t))
+
+
+def relative_humidity_from_dewpoint(t, td):
+    """
+    :return: relative humidity (fraction), as metpy.calc.relative_humidity_from_dewpoint.
+    """
+    return saturation_vapor_pressure(td)/saturation_vapor_pressure(t)
+
+
+def mixing_ratio(e, p):
+    return EPSILON*e/(p-e)
+
+
+def saturation_mixing_ratio(p, t):
+    return mixing_ratio(saturation_vapor_pressure(t), p)
+
+
+def specific_humidity_from_dewpoint(p, td):
+    """
+    :param p: pressure (hPa).
+    :param td: dewpoint (degC).
+    :return: specific humidity (kg/kg).
+    """
+    w = saturation_mixing_ratio(p, td)
+    return w/(1+w)
+
+
+def virtual_temperature(t, w):
+    """
+    :param t: temperature (degC).
+    :param w: mixing ratio (kg/kg).
+    :return: virtual temperature (degC), as metpy.calc.virtual_temperature.
+    """
+    return (t+ZERO_C)*(w+EPSILON)/(EPSILON*(1+w))-ZERO_C
+
+
+def potential_temperature(p, t):
+    """
+    :return: potential temperature (K).
+    """
+    return (t+ZERO_C)*(1000./p)**KAPPA
+
+
+def equivalent_potential_temperature(p, t, td):
+    """
+    :return: equivalent potential temperature (K), Bolton 1980.
+    """
+    tk = t+ZERO_C
+    tdk = td+ZERO_C
+    e = saturation_vapor_pressure(td)
+    r = mixing_ratio(e, p)
+    t_l = 56+1./(1./(tdk-56)+np.log(tk/tdk)/800.)
+    th_l = tk*(1000./(p-e))**KAPPA*(tk/t_l)**(0.28*r)
+    return th_l*np.exp(r*(1+0.448*r)*(3036./t_l-1.78))
+
+
+def wind_speed(u, v):
+    return np.hypot(u, v)
+
+
+def wind_direction(u, v):
+    """
+    Meteorological wind direction (degrees, where the wind blows from),
+    as metpy.calc.wind_direction, calm winds are 0.
+    """
+    wdir = (270.-np.degrees(np.arctan2(v, u))) % 360.
+    wdir = np.where(wdir <= 0, 360., wdir)
+    return np.where((u == 0) & (v == 0), 0., wdir).astype(np.result_type(u, v), copy=False)
+
+
+def lat_lon_grid_deltas(lon, lat, dtype=None):
+    """
+    Distances between the grid points on the sphere, as
+    metpy.calc.lat_lon_grid_deltas.
+    :param lon: longitudes (degrees), 1D or 2D (lat, lon).
+    :param lat: latitudes (degrees), 1D or 2D (lat, lon).
+    :return: dx (lat, lon-1) and dy (lat-1, lon) in metres, negative
+             towards the west and the south.
+    """
+    lon = np.asarray(lon, dtype=float)
+    lat = np.asarray(lat, dtype=float)
+    if lon.ndim == 1 and lat.ndim == 1:
+        lon, lat = np.meshgrid(lon, lat)
+    lon = np.radians(lon)
+    lat = np.radians(lat)
+
+    def distance(lon0, lat0, lon1, lat1):
+        # haversine
+        a = np.sin((lat1-lat0)/2)**2+np.cos(lat0)*np.cos(lat1)*np.sin((lon1-lon0)/2)**2
+        return 2*EARTH_RADIUS*np.arcsin(np.sqrt(np.clip(a, 0, 1)))
+
+    dlon = (lon[:, 1:]-lon[:, :-1]+np.pi) % (2*np.pi)-np.pi
+    dx = np.where(dlon < 0, -1., 1.)*distance(lon[:, :-1], lat[:, :-1], lon[:, 1:], lat[:, 1:])
+    dy = np.where(lat[1:, :] < lat[:-1, :], -1., 1.)*distance(
+        lon[:-1, :], lat[:-1, :], lon[1:, :], lat[1:, :])
+    dtype = DTYPE if dtype is None else dtype
+    return dx.astype(dtype), dy.astype(dtype)
+
+
+def _take(a, axis, start, stop):
+    index = [slice(None)]*a.ndim
+    index[a.ndim+axis] = slice(start, stop)
+    return a[tuple(index)]
+
+
+def first_derivative(f, delta, axis=-1):
+    """
+    Derivative along an axis, second order finite differences of
+    metpy.calc.first_derivative: centred inside, one-sided at the edges.
+    :param f: array, at least 3 points along the axis.
+    :param delta: spacing of the points, n-1 along the axis, broadcast
+                  to f from the right (dx of lat_lon_grid_deltas for
+                  axis=-1, dy for axis=-2, diff of the levels reshaped
+                  to (level-1, 1, 1) for axis=0 of (level, lat, lon)).
+    :param axis: axis of f.
+    """
+    f = np.asarray(f)
+    axis = axis-f.ndim if axis >= 0 else axis
+    if f.shape[axis] < 3:
+        raise ValueError('f should have at least 3 points along the axis')
+    delta = np.asarray(delta)
+    if np.issubdtype(f.dtype, np.floating):
+        delta = delta.astype(f.dtype, copy=False)
+
+    d0 = _take(delta, axis, None, -1)
+    d1 = _take(delta, axis, 1, None)
+    combined = d0+d1
+    center = (-d1/(combined*d0)*_take(f, axis, None, -2) +
+              (d1-d0)/(d0*d1)*_take(f, axis, 1, -1) +
+              d0/(combined*d1)*_take(f, axis, 2, None))
+
+    d0 = _take(delta, axis, 0, 1)
+    d1 = _take(delta, axis, 1, 2)
+    combined = d0+d1
+    left = (-(combined+d0)/(combined*d0)*_take(f, axis, 0, 1) +
+            combined/(d0*d1)*_take(f, axis, 1, 2) -
+            d0/(combined*d1)*_take(f, axis, 2, 3))
+
+    d0 = _take(delta, axis, -2, -1)
+    d1 = _take(delta, axis, -1, None)
+    combined = d0+d1
+    right = (d1/(combined*d0)*_take(f, axis, -3, -2) -
+             combined/(d0*d1)*_take(f, axis, -2, -1) +
+             (combined+d1)/(combined*d1)*_take(f, axis, -1, None))
+
+    return np.concatenate((left, center, right), axis=axis)
+
+
+def coriolis_parameter(lat):
+    """
+    :param lat: latitude (degrees).
+    :return: 2*Omega*sin(lat) (1/s).
+    """
+    return 2*OMEGA*np.sin(np.radians(lat))
+
+
+def vorticity(u, v, dx, dy):
+    """
+    Relative vorticity (1/s) of (..., lat, lon) winds.
+    """
+    return first_derivative(v, dx, axis=-1)-first_derivative(u, dy, axis=-2)
+
+
+def absolute_vorticity(u, v, dx, dy, lat):
+    """
+    Absolute vorticity (1/s) of (..., lat, lon) winds.
+    :param lat: latitude (degrees) broadcast to the winds, like lat[:, None].
+    """
+    f = coriolis_parameter(lat)
+    if np.issubdtype(np.asarray(u).dtype, np.floating):
+        f = np.asarray(f, dtype=np.asarray(u).dtype)
+    return vorticity(u, v, dx, dy)+f
+
+
+def divergence(u, v, dx, dy):
+    """
+    Horizontal divergence (1/s) of (..., lat, lon) winds.
+    """
+    return first_derivative(u, dx, axis=-1)+first_derivative(v, dy, axis=-2)
+
+
+def advection(s, u, v, dx, dy):
+    """
+    Horizontal advection of a (..., lat, lon) scalar, -(u ds/dx + v ds/dy).
+    """
+    return -(u*first_derivative(s, dx, axis=-1)+v*first_derivative(s, dy, axis=-2))
+
+
+def smooth_n_point(f, n=5, passes=1):
+    """
+    5 or 9 point smoother of the last two axes, as metpy.calc.smooth_n_point,
+    the points on the edges are not changed.
+    """
+    if n == 9:
+        center, side, corner = 0.25, 0.125, 0.0625
+    elif n == 5:
+        center, side, corner = 0.5, 0.125, 0.
+    else:
+        raise ValueError('n should be 5 or 9')
+    out = np.array(f, copy=True)
+    for _ in range(passes):
+        inner = center*out[..., 1:-1, 1:-1]+side*(
+            out[..., :-2, 1:-1]+out[..., 2:, 1:-1]+out[..., 1:-1, :-2]+out[..., 1:-1, 2:])
+        if corner:
+            inner += corner*(out[..., :-2, :-2]+out[..., :-2, 2:]+out[..., 2:, :-2]+out[..., 2:, 2:])
+        out[..., 1:-1, 1:-1] = inner
+    return out
+
+
+def potential_vorticity_baroclinic(theta, p, u, v, dx, dy, lat):
+    """
+    Baroclinic potential vorticity (K m**2/(kg s), 1e-6 is 1 PVU) of
+    (level, lat, lon) fields, as metpy.calc.potential_vorticity_baroclinic.
+    :param theta: potential temperature (K).
+    :param p: pressure of the levels (Pa).
+    :param lat: latitude (degrees) broadcast to the winds, like lat[:, None].
+    """
+    theta = np.asarray(theta)
+    dp = np.diff(np.asarray(p)).reshape((-1,)+(1,)*(theta.ndim-1))
+    avor = absolute_vorticity(u, v, dx, dy, lat)
+    dthetadp = first_derivative(theta, dp, axis=0)
+    dthetadx = first_derivative(theta, dx, axis=-1)
+    dthetady = first_derivative(theta, dy, axis=-2)
+    dudp = first_derivative(u, dp, axis=0)
+    dvdp = first_derivative(v, dp, axis=0)
+    return -G*(dudp*dthetady-dvdp*dthetadx+avor*dthetadp)
+
+
+def _relative_difference(ours, theirs):
+    ours = np.asarray(ours, dtype=float)
+    theirs = np.asarray(theirs, dtype=float)
+    scale = np.nanmax(np.abs(theirs))
+    return float(np.nanmax(np.abs(ours-theirs))/(scale if scale > 0 else 1.))
+
+
+# largest differences relative to the largest value of metpy, for float32.
+# metpy >= 1.6 has another saturation vapor pressure, the moisture
+# kernels differ up to 3e-3 from it
+TOLERANCE = {'dewpoint_from_rh': 5e-3, 'relative_humidity_from_dewpoint': 5e-3,
+             'specific_humidity_from_dewpoint': 5e-3, 'potential_temperature': 1e-5,
+             'equivalent_potential_temperature': 1e-3, 'wind_speed': 1e-6,
+             'wind_direction': 1e-6, 'lat_lon_grid_deltas': 1e-6, 'absolute_vorticity': 1e-4,
+             'divergence': 2e-4, 'advection': 2e-4, 'smooth_n_point': 1e-6,
+             'potential_vorticity_baroclinic': 1e-4}
+
+
+def check_against_metpy(lon=None, lat=None, levels=None, seed=0, dtype=None,
+                        tolerance=TOLERANCE):
+    """
+    Compare the kernels with metpy.calc on smooth synthetic fields.
+    :param lon: longitudes of the grid, default 70-140E every 0.5 degree.
+    :param lat: latitudes of the grid, default 60-10N every 0.5 degree.
+    :param levels: pressure levels (hPa).
+    :param tolerance: dict of the largest relative difference of every
+                      kernel, ValueError if they are exceeded, None not
+                      to check.
+    :return: dict of the largest differences relative to the largest
+             value of metpy, 1e-7 to 1e-4 for float32.
+    """
+    import metpy.calc as mpcalc
+    from metpy.units import units
+    lon = np.arange(70, 140.1, 0.5) if lon is None else np.asarray(lon, dtype=float)
+    lat = np.arange(60, 9.9, -0.5) if lat is None else np.asarray(lat, dtype=float)
+    levels = np.array([1000, 925, 850, 700, 500, 300, 200], dtype=float) \
+        if levels is None else np.asarray(levels, dtype=float)
+
+    rng = np.random.RandomState(seed)
+    x, y = np.meshgrid(np.radians(lon), np.radians(lat))
+    shape = (len(levels),)+x.shape
+    wave = np.sin(3*x+rng.uniform(0, 6))*np.cos(2*y+rng.uniform(0, 6))
+    p3 = levels[:, None, None]*np.ones(shape)
+    t = 30-60*(1-(levels[:, None, None]/1000.)**0.5)-20*np.sin(y)+3*wave
+    rh = np.clip(60+35*wave*np.cos(levels[:, None, None]/200.), 1, 100)
+    u = 10+25*np.cos(2*y)*(1100-levels[:, None, None])/1000.+8*wave
+    v = 12*np.sin(2*x)*np.cos(y)+np.zeros(shape)
+
+    f = [field(a, dtype) for a in (p3, t, rh, u, v)]
+    fp, ft, frh, fu, fv = f
+    # metpy < 1.0 names and argument orders, like the drivers used
+    old_api = hasattr(mpcalc, 'dewpoint_rh')
+    diff = {}
+    td = dewpoint_from_rh(ft, frh)
+    if old_api:
+        td_m = mpcalc.dewpoint_rh(t*units.degC, rh*units.percent).m_as('degC')
+        q_m = mpcalc.specific_humidity_from_dewpoint(td_m*units.degC, p3*units.hPa)
+    else:
+        td_m = mpcalc.dewpoint_from_relative_humidity(t*units.degC, rh*units.percent).m_as('degC')
+        q_m = mpcalc.specific_humidity_from_dewpoint(p3*units.hPa, td_m*units.degC)
+    diff['dewpoint_from_rh'] = _relative_difference(td, td_m)
+    diff['relative_humidity_from_dewpoint'] = _relative_difference(
+        relative_humidity_from_dewpoint(ft, td),
+        mpcalc.relative_humidity_from_dewpoint(t*units.degC, td_m*units.degC).m_as(''))
+    diff['specific_humidity_from_dewpoint'] = _relative_difference(
+        specific_humidity_from_dewpoint(fp, td), q_m.m_as(''))
+    diff['potential_temperature'] = _relative_difference(
+        potential_temperature(fp, ft),
+        mpcalc.potential_temperature(p3*units.hPa, t*units.degC).m_as('K'))
+    diff['equivalent_potential_temperature'] = _relative_difference(
+        equivalent_potential_temperature(fp, ft, td),
+        mpcalc.equivalent_potential_temperature(
+            p3*units.hPa, t*units.degC, td_m*units.degC).m_as('K'))
+    diff['wind_speed'] = _relative_difference(
+        wind_speed(fu, fv), mpcalc.wind_speed(u*units('m/s'), v*units('m/s')).m_as('m/s'))
+    diff['wind_direction'] = _relative_difference(
+        wind_direction(fu, fv), mpcalc.wind_direction(u*units('m/s'), v*units('m/s')).m_as('deg'))
+
+    dx, dy = lat_lon_grid_deltas(lon, lat, dtype=fu.dtype)
+    dx_m, dy_m = mpcalc.lat_lon_grid_deltas(lon, lat)
+    diff['lat_lon_grid_deltas'] = max(_relative_difference(dx, dx_m.m_as('m')),
+                                      _relative_difference(dy, dy_m.m_as('m')))
+    lat2 = field(lat[:, None], fu.dtype)
+    uu = u*units('m/s')
+    vv = v*units('m/s')
+    dx_m = dx_m[None]
+    dy_m = dy_m[None]
+    lat_m = {('lats' if old_api else 'latitude'): lat[:, None]*units.degree}
+    diff['absolute_vorticity'] = _relative_difference(
+        absolute_vorticity(fu, fv, dx, dy, lat2),
+        mpcalc.absolute_vorticity(uu, vv, dx=dx_m, dy=dy_m, **lat_m).m_as('1/s'))
+    diff['divergence'] = _relative_difference(
+        divergence(fu, fv, dx, dy), mpcalc.divergence(uu, vv, dx=dx_m, dy=dy_m).m_as('1/s'))
+    tt = t*units.delta_degC
+    if old_api:
+        adv_m = mpcalc.advection(tt, [uu, vv], (dx_m, dy_m), dim_order='yx')
+    else:
+        adv_m = mpcalc.advection(tt, u=uu, v=vv, dx=dx_m, dy=dy_m)
+    diff['advection'] = _relative_difference(advection(ft, fu, fv, dx, dy),
+                                             adv_m.m_as('delta_degC/s'))
+    diff['smooth_n_point'] = _relative_difference(
+        smooth_n_point(ft, 9, 2), mpcalc.smooth_n_point(t, 9, 2))
+
+    theta = potential_temperature(fp, ft)
+    theta_m = mpcalc.potential_temperature(p3*units.hPa, t*units.degC)
+    pv_m = mpcalc.potential_vorticity_baroclinic(theta_m, p3*units.hPa, uu, vv,
+                                                 dx=dx_m, dy=dy_m, **lat_m)
+    diff['potential_vorticity_baroclinic'] = _relative_difference(
+        potential_vorticity_baroclinic(theta, field(levels*100., fu.dtype), fu, fv, dx, dy, lat2),
+        pv_m.m_as('K m**2/(kg s)'))
+
+    if tolerance is not None:
+        exceeded = [name for name, value in diff.items() if not value <= tolerance[name]]
+        if exceeded:
+            raise ValueError('Differences to metpy over the tolerance: ' +
+                             ', '.join('%s %.3g' % (name, diff[name]) for name in sorted(exceeded)))
+    return diff
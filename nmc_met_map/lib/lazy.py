@@ -0,0 +1,114 @@
+# _*_ coding: utf-8 _*_
+
+"""
+  Deferred import of heavy dependencies (metpy, cartopy, matplotlib,
+  scipy, xarray, nmc_met_graphics...). The module is imported at the
+  first attribute access, so `import nmc_met_map.synoptic` and short
+  lived jobs do not pay for modules they never use.
+
+  >>> plt = lazy_import('matplotlib.pyplot')
+  >>> units = lazy_attr('metpy.units', 'units')
+"""
+
+import types
+import importlib
+
+
+def _import_attr(module_name, name):
+    module = importlib.import_module(module_name)
+    try:
+        return getattr(module, name)
+    except AttributeError:
+        # not yet imported sub module, like metpy.calc of metpy
+        return importlib.import_module(module_name+'.'+name)
+
+
+class _LazyModule(types.ModuleType):
+
+    def __init__(self, name):
+        super(_LazyModule, self).__init__(name)
+        self.__dict__['_lazy_module'] = None
+
+    def _load(self):
+        module = self.__dict__['_lazy_module']
+        if module is None:
+            module = importlib.import_module(self.__name__)
+            self.__dict__['_lazy_module'] = module
+        return module
+
+    def __getattr__(self, name):
+        module = self._load()
+        try:
+            return getattr(module, name)
+        except AttributeError:
+            if name.startswith('__'):
+                raise
+            return importlib.import_module(module.__name__+'.'+name)
+
+    def __dir__(self):
+        return dir(self._load())
+
+    def __repr__(self):
+        return '<lazy module %r>' % self.__name__
+
+
+def lazy_import(name):
+    """
+    :param name: full module name, like 'metpy.calc'.
+    :return: module proxy, the module is imported at first use.
+    """
+    return _LazyModule(name)
+
+
+class _LazyAttr(object):
+    """
+    Proxy of a module attribute (function, class or object).
+    """
+
+    __slots__ = ('_module_name', '_name', '_obj')
+
+    def __init__(self, module_name, name):
+        object.__setattr__(self, '_module_name', module_name)
+        object.__setattr__(self, '_name', name)
+        object.__setattr__(self, '_obj', None)
+
+    def _resolve(self):
+        obj = object.__getattribute__(self, '_obj')
+        if obj is None:
+            obj = _import_attr(object.__getattribute__(self, '_module_name'),
+                               object.__getattribute__(self, '_name'))
+            object.__setattr__(self, '_obj', obj)
+        return obj
+
+    def __getattr__(self, name):
+        return getattr(self._resolve(), name)
+
+    def __call__(self, *args, **kwargs):
+        return self._resolve()(*args, **kwargs)
+
+    def __getitem__(self, key):
+        return self._resolve()[key]
+
+    def __mul__(self, other):
+        return self._resolve()*other
+
+    def __rmul__(self, other):
+        return other*self._resolve()
+
+    def __truediv__(self, other):
+        return self._resolve()/other
+
+    def __rtruediv__(self, other):
+        return other/self._resolve()
+
+    def __repr__(self):
+        return repr(self._resolve())
+
+
+def lazy_attr(module_name, name):
+    """
+    :param module_name: full module name, like 'metpy.units'.
+    :param name: attribute name, like 'units'.
+    :return: proxy of the attribute, the module is imported at first use.
+    """
+    return _LazyAttr(module_name, name)
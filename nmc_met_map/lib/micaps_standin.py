@@ -0,0 +1,576 @@
+# _*_ coding: utf-8 _*_
+
+"""
+  Local stand-in of the MICAPS GDS data service for benchmarks and
+  regression runs off the production network.
+
+  The server answers the same /DataService requests as the real service
+  (getData, getLatestDataName, getFileList) with protobuf replies. Files
+  are either generated on the fly (deterministic synthetic fields, same
+  directory and file names always give the same data) or read from a
+  fixture directory written by generate_fixtures. getFileList lists the
+  size of every file in bytes, like the real service. A file can be
+  replaced (Catalog.replace_file, or a new file in the fixture
+  directory) to check that the incremental runs notice the change.
+
+  >>> from nmc_met_map.lib import micaps_standin
+  >>> server = micaps_standin.start_server(initial_times=['19083008'],
+  >>>                                      fhours=range(0, 73, 3), latency=0.05)
+  >>> micaps_standin.configure_client(*server.server_address)
+  >>> synoptic.gh_uv_mslp(initial_time='19083008', fhour=24, output_dir='/tmp/')
+  >>> server.shutdown()
+"""
+
+import os
+import re
+import time
+import zlib
+import fnmatch
+import threading
+import urllib.parse
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import numpy as np
+from nmc_met_io import DataBlock_pb2
+from nmc_met_io import retrieve_micaps_server as micaps
+
+# 278 bytes diamond 4 grid head, same as nmc_met_io
+GRID_HEAD_DTYPE = [
+    ('discriminator', 'S4'), ('type', 'i2'),
+    ('modelName', 'S20'), ('element', 'S50'),
+    ('description', 'S30'), ('level', 'f4'),
+    ('year', 'i4'), ('month', 'i4'), ('day', 'i4'),
+    ('hour', 'i4'), ('timezone', 'i4'),
+    ('period', 'i4'), ('startLongitude', 'f4'),
+    ('endLongitude', 'f4'), ('longitudeGridSpace', 'f4'),
+    ('longitudeGridNumber', 'i4'),
+    ('startLatitude', 'f4'), ('endLatitude', 'f4'),
+    ('latitudeGridSpace', 'f4'),
+    ('latitudeGridNumber', 'i4'),
+    ('isolineStartValue', 'f4'),
+    ('isolineEndValue', 'f4'),
+    ('isolineSpace', 'f4'),
+    ('perturbationNumber', 'i2'),
+    ('ensembleTotalNumber', 'i2'),
+    ('minute', 'i2'), ('second', 'i2'),
+    ('Extent', 'S92')]
+
+# 288 bytes station head
+STATION_HEAD_DTYPE = [
+    ('discriminator', 'S4'), ('type', 'i2'),
+    ('description', 'S100'),
+    ('level', 'f4'), ('levelDescription', 'S50'),
+    ('year', 'i4'), ('month', 'i4'), ('day', 'i4'),
+    ('hour', 'i4'), ('minute', 'i4'), ('second', 'i4'),
+    ('Timezone', 'i4'), ('id_type', 'i2'), ('extent', 'S98')]
+
+# standard atmosphere, level: (height in dagpm, temperature in degC)
+_STANDARD_LEVELS = np.array([1000, 925, 850, 700, 500, 300, 200, 100])
+_STANDARD_HGT = np.array([11, 76, 146, 301, 558, 916, 1178, 1620])
+_STANDARD_TMP = np.array([15, 10, 5, -5, -21, -44, -56, -56])
+
+# variable name in directory: (base value, amplitude, lower bound)
+_VARIABLES = [
+    ('HGT', None, 8., None),
+    ('TMP', None, 8., None),
+    ('DPT', 8., 10., None),
+    ('THETASE', 330., 15., None),
+    ('UGRD', 5., 15., None),
+    ('VGRD', 0., 15., None),
+    ('VVEL', 0., 0.5, None),
+    ('RH', 60., 40., 0.),
+    ('SPFH', 8., 6., 0.),
+    ('WVFL', 5., 5., 0.),
+    ('PRMSL', 1010., 15., None),
+    ('PRES', 950., 60., None),
+    ('PWAT', 30., 25., 0.),
+    ('TCWV', 30., 25., 0.),
+    ('RAIN', 0., 30., 0.),
+    ('SNOW', 0., 5., 0.),
+    ('GUST', 8., 10., 0.),
+    ('CDC', 50., 50., 0.),
+    ('VIS', 15., 15., 0.),
+    ('BLI', 0., 6., None),
+    ('MAXIMUM_TEMPERATURE', 25., 12., None),
+    ('MINIMUM_TEMPERATURE', 12., 12., None),
+    ('BRIGHTNESS', 260., 40., None),
+    ('MET_10', 260., 40., None)]
+
+# element id: (type code, base value, amplitude), see nmc_met_io
+_STATION_ELEMENTS = [
+    (201, 5, 180., 180.), (203, 5, 4., 4.),
+    (401, 5, 1010., 15.), (601, 5, 15., 15.),
+    (801, 5, 8., 10.), (1001, 5, 2., 2.),
+    (1201, 5, 15000., 15000.), (1401, 5, 50., 50.)]
+
+
+def _seed(*names):
+    return zlib.crc32('/'.join(str(name) for name in names).encode('utf-8'))
+
+
+def _level_of(directory):
+    for part in reversed(directory.strip('/').split('/')):
+        if re.fullmatch(r'\d+(\.\d+)?', part):
+            return float(part)
+    return 0.
+
+
+def _parse_filename(filename):
+    """
+    :return: (initial time, forecast hour) of 'YYMMDDHH.FFF',
+             or (observation time, 0) of 'YYYYMMDDHHMMSS.000'.
+    """
+    name, ext = filename.split('.')
+    if len(name) == 14:
+        return datetime.strptime(name, '%Y%m%d%H%M%S'), 0
+    return datetime.strptime(name, '%y%m%d%H'), int(ext)
+
+
+def is_station_directory(directory):
+    return directory.strip('/').split('/')[0] in ('SURFACE', 'UPPER_AIR')
+
+
+def synthetic_field(directory, filename, lon, lat):
+    """
+    Deterministic smooth field for a grid file.
+    :return: 2D float32 array (lat, lon).
+    """
+    level = _level_of(directory)
+    init_time, fhour = _parse_filename(filename)
+    base, amp, lower = 0., 1., None
+    for name, _base, _amp, _lower in _VARIABLES:
+        if name in directory.upper():
+            base, amp, lower = _base, _amp, _lower
+            if name in ('HGT', 'TMP') and level > 0:
+                table = _STANDARD_HGT if name == 'HGT' else _STANDARD_TMP
+                base = float(np.interp(np.log(level), np.log(_STANDARD_LEVELS[::-1]),
+                                       table[::-1]))
+            elif name == 'TMP':
+                base = 15.
+            break
+
+    rs = np.random.RandomState(_seed(directory.strip('/'), init_time.strftime('%Y%m%d%H')))
+    x, y = np.meshgrid(np.deg2rad(lon), np.deg2rad(lat))
+    field = np.zeros(x.shape)
+    # waves moving eastward with the forecast hour
+    for k in range(1, 5):
+        phase_x, phase_y = rs.uniform(0, 2*np.pi, 2)
+        field += (np.sin(k*(x-fhour*np.pi/180.)+phase_x) *
+                  np.cos((k+1)*y+phase_y)/k)
+    field = base+amp*field/1.5
+    if lower is not None:
+        field = np.maximum(field, lower)
+    return field.astype(np.float32)
+
+
+def grid_bytes(directory, filename, extent=[0., 359., -90., 90.], resolution=1.):
+    """
+    Encode a synthetic grid file as MICAPS diamond 4 bytes.
+    """
+    init_time, fhour = _parse_filename(filename)
+    lon = np.arange(extent[0], extent[1]+resolution/2., resolution)
+    lat = np.arange(extent[2], extent[3]+resolution/2., resolution)
+    head = np.zeros(1, dtype=GRID_HEAD_DTYPE)
+    head['discriminator'] = b'mdfs'
+    head['type'] = 4
+    head['modelName'] = directory.strip('/').split('/')[0].encode('utf-8')[:20]
+    head['element'] = directory.strip('/').encode('utf-8')[:50]
+    head['level'] = _level_of(directory)
+    head['year'], head['month'], head['day'] = init_time.year, init_time.month, init_time.day
+    head['hour'] = init_time.hour
+    head['timezone'] = 8
+    head['period'] = fhour
+    head['startLongitude'], head['endLongitude'] = lon[0], lon[-1]
+    head['longitudeGridSpace'], head['longitudeGridNumber'] = resolution, len(lon)
+    head['startLatitude'], head['endLatitude'] = lat[0], lat[-1]
+    head['latitudeGridSpace'], head['latitudeGridNumber'] = resolution, len(lat)
+    return head.tobytes()+synthetic_field(directory, filename, lon, lat).tobytes()
+
+
+def station_bytes(directory, filename, n_station=2000):
+    """
+    Encode a synthetic station file (id_type 0) as MICAPS bytes.
+    Station IDs, positions are fixed, the elements change with time.
+    """
+    obs_time, _ = _parse_filename(filename)
+    rs = np.random.RandomState(_seed('stations'))
+    # 北京, 上海, 广州 first
+    fixed_ids = [54511, 58367, 59287]
+    ids = np.setdiff1d(rs.randint(50000, 60000, n_station*2), fixed_ids)[:n_station-3]
+    ids = np.concatenate([fixed_ids, ids]).astype(np.int32)
+    lon = rs.uniform(73, 135, len(ids)).astype(np.float32)
+    lat = rs.uniform(18, 53, len(ids)).astype(np.float32)
+    lon[:3], lat[:3] = [116.47, 121.43, 113.48], [39.8, 31.17, 23.21]
+    rs = np.random.RandomState(_seed(directory.strip('/'), filename))
+
+    head = np.zeros(1, dtype=STATION_HEAD_DTYPE)
+    head['discriminator'] = b'mdfs'
+    head['type'] = 1
+    head['description'] = directory.strip('/').encode('utf-8')[:100]
+    head['year'], head['month'], head['day'] = obs_time.year, obs_time.month, obs_time.day
+    head['hour'], head['minute'], head['second'] = obs_time.hour, obs_time.minute, obs_time.second
+    head['Timezone'] = 8
+    head['id_type'] = 0
+
+    parts = [head.tobytes(), np.int32(len(ids)).tobytes(),
+             np.int16(len(_STATION_ELEMENTS)).tobytes()]
+    for element_id, type_code, _, _ in _STATION_ELEMENTS:
+        parts += [np.int16(element_id).tobytes(), np.int16(type_code).tobytes()]
+    record_head_dtype = [('ID', 'i4'), ('lon', 'f4'), ('lat', 'f4'), ('numb', 'i2')]
+    values = [base+amp*np.sin(np.deg2rad(lon*3+obs_time.hour*15)+rs.uniform(0, 2*np.pi))
+              for _, _, base, amp in _STATION_ELEMENTS]
+    for i in range(len(ids)):
+        record_head = np.array([(ids[i], lon[i], lat[i], len(_STATION_ELEMENTS))],
+                               dtype=record_head_dtype)
+        parts.append(record_head.tobytes())
+        for j, (element_id, _, _, _) in enumerate(_STATION_ELEMENTS):
+            parts += [np.int16(element_id).tobytes(), np.float32(values[j][i]).tobytes()]
+    return b''.join(parts)
+
+
+class Catalog(object):
+
+    def __init__(self, initial_times=None, fhours=range(0, 241, 3), obs_times=None,
+                 fixture_root=None, extent=[0., 359., -90., 90.], resolution=1.):
+        """
+        Files the stand-in server holds.
+        :param initial_times: list of model initial times, like '19083008',
+                              default is the latest 08 and 20 runs.
+        :param fhours: forecast hours of every run.
+        :param obs_times: list of observation datetime objects,
+                          default is every hour of the latest 3 days.
+        :param fixture_root: read files from this directory instead of
+                             generating them (see generate_fixtures).
+        :param extent: [lonmin, lonmax, latmin, latmax] of synthetic grids.
+        :param resolution: grid spacing of synthetic grids.
+        """
+        now = datetime.now().replace(minute=0, second=0, microsecond=0)
+        if initial_times is None:
+            last = now.replace(hour=8) if now.hour >= 20 else now.replace(hour=20)-timedelta(days=1)
+            initial_times = [(last-timedelta(hours=12*i)).strftime('%y%m%d%H') for i in range(4)]
+        if obs_times is None:
+            obs_times = [now-timedelta(hours=i) for i in range(72)]
+        self.model_files = ['%s.%03d' % (t, int(f)) for t in initial_times for f in fhours]
+        self.obs_files = [t.strftime('%Y%m%d%H')+'0000.000' for t in obs_times]
+        self.fixture_root = fixture_root
+        self.extent = extent
+        self.resolution = resolution
+        self.replaced = {}
+        self._sizes = {}
+
+    def replace_file(self, directory, filename, data):
+        """
+        Serve data (bytes) for the file instead of the generated one.
+        """
+        self.replaced[(directory.strip('/'), filename)] = data
+
+    def list_files(self, directory):
+        if self.fixture_root is not None:
+            path = os.path.join(self.fixture_root, directory.strip('/'))
+            if not os.path.isdir(path):
+                return []
+            return sorted(name for name in os.listdir(path)
+                          if os.path.isfile(os.path.join(path, name)))
+        if is_station_directory(directory):
+            return self.obs_files
+        return self.model_files
+
+    def latest(self, directory, filter):
+        names = [name for name in self.list_files(directory) if fnmatch.fnmatch(name, filter)]
+        if len(names) == 0:
+            return ''
+        return max(names, key=lambda name: _parse_filename(name)[0])
+
+    def read(self, directory, filename):
+        """
+        :return: file bytes, None if not exists.
+        """
+        if filename not in self.list_files(directory):
+            return None
+        if (directory.strip('/'), filename) in self.replaced:
+            return self.replaced[(directory.strip('/'), filename)]
+        if self.fixture_root is not None:
+            with open(os.path.join(self.fixture_root, directory.strip('/'), filename), 'rb') as f:
+                return f.read()
+        if is_station_directory(directory):
+            return station_bytes(directory, filename)
+        return grid_bytes(directory, filename, extent=self.extent, resolution=self.resolution)
+
+    def file_size(self, directory, filename):
+        """
+        :return: size of the file in bytes, without generating it.
+        """
+        if (directory.strip('/'), filename) in self.replaced:
+            return len(self.replaced[(directory.strip('/'), filename)])
+        if self.fixture_root is not None:
+            return os.path.getsize(os.path.join(self.fixture_root, directory.strip('/'), filename))
+        # all synthetic files of a kind have the same size
+        kind = 'station' if is_station_directory(directory) else 'grid'
+        if kind not in self._sizes:
+            self._sizes[kind] = len(self.read(directory, filename))
+        return self._sizes[kind]
+
+
+def generate_fixtures(root, directories, initial_times, fhours, obs_times=[],
+                      extent=[0., 359., -90., 90.], resolution=1.):
+    """
+    Write synthetic files to root/<directory>/<filename>.
+    :param directories: list of MICAPS directories, like utl.Cassandra_dir(...).
+    :return: number of files written.
+    """
+    catalog = Catalog(initial_times=initial_times, fhours=fhours, obs_times=obs_times,
+                      extent=extent, resolution=resolution)
+    n_file = 0
+    for directory in directories:
+        path = os.path.join(root, directory.strip('/'))
+        if not os.path.exists(path):
+            os.makedirs(path)
+        for filename in catalog.list_files(directory):
+            with open(os.path.join(path, filename), 'wb') as f:
+                f.write(catalog.read(directory, filename))
+            n_file += 1
+    return n_file
+
+
+class _Handler(BaseHTTPRequestHandler):
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        server = self.server
+        url = urllib.parse.urlparse(self.path)
+        query = urllib.parse.parse_qs(url.query, keep_blank_values=True)
+        request_type = query.get('requestType', [''])[0]
+        directory = query.get('directory', [''])[0]
+        filename = query.get('fileName', [''])[0]
+        filter = query.get('filter', [''])[0]
+
+        with server.stats_lock:
+            server.stats[request_type] = server.stats.get(request_type, 0)+1
+        if server.latency > 0:
+            time.sleep(server.latency*(1.+server.jitter*server.random.uniform(-1, 1)))
+        if url.path != '/DataService':
+            self.send_error(404)
+            return
+        if server.failure_rate > 0 and server.random.uniform() < server.failure_rate:
+            with server.stats_lock:
+                server.stats['failed'] = server.stats.get('failed', 0)+1
+            self.send_error(500)
+            return
+
+        if request_type == 'getData':
+            result = DataBlock_pb2.ByteArrayResult()
+            data = server.catalog.read(directory, filename)
+            if data is None:
+                result.errorCode = 1
+                result.errorMessage = 'file not exists'
+            else:
+                result.errorCode = 0
+                result.byteArray = data
+        elif request_type == 'getLatestDataName':
+            result = DataBlock_pb2.StringResult()
+            result.errorCode = 0
+            result.name = server.catalog.latest(directory, filter)
+        elif request_type == 'getFileList':
+            result = DataBlock_pb2.MapResult()
+            result.errorCode = 0
+            for name in server.catalog.list_files(directory):
+                result.resultMap[name] = str(server.catalog.file_size(directory, name))
+        else:
+            self.send_error(400)
+            return
+
+        body = result.SerializeToString()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/octet-stream')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def start_server(host='127.0.0.1', port=0, catalog=None, latency=0., jitter=0.,
+                 failure_rate=0., seed=0, **kwargs):
+    """
+    Start the stand-in server in a background thread.
+    :param port: 0 for a free port, see server.server_address.
+    :param catalog: Catalog object, or built from kwargs.
+    :param latency: seconds to wait before every reply.
+    :param jitter: relative random change of the latency, 0 to 1.
+    :param failure_rate: fraction of requests answered with http 500.
+    :param seed: random seed of latency jitter and failures.
+    :return: server, call server.shutdown() to stop.
+    """
+    server = ThreadingHTTPServer((host, port), _Handler)
+    server.daemon_threads = True
+    server.catalog = catalog if catalog is not None else Catalog(**kwargs)
+    server.latency = latency
+    server.jitter = jitter
+    server.failure_rate = failure_rate
+    server.random = np.random.RandomState(seed)
+    server.stats = {}
+    server.stats_lock = threading.Lock()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server
+
+
+_client_init = None
+
+
+def configure_client(host, port):
+    """
+    Point nmc_met_io (and so every product) to the given server,
+    instead of GDS_IP and GDS_PORT of the config file.
+    """
+    global _client_init
+    if _client_init is None:
+        _client_init = micaps.GDSDataService.__init__
+
+    def __init__(self, *args, **kwargs):
+        try:
+            _client_init(self, *args, **kwargs)
+        except Exception:
+            # no config file is needed for the stand-in server
+            pass
+        self.gdsIp = host
+        self.gdsPort = str(port)
+
+    micaps.GDSDataService.__init__ = __init__
+
+
+def restore_client():
+    global _client_init
+    if _client_init is not None:
+        micaps.GDSDataService.__init__ = _client_init
+        _client_init = None
+
+
+INITIAL_TIME = '19083008'
+# every hour, the station products read hours like 4, 7, 10
+FHOURS = range(0, 241)
+
+# name: (product function, keyword arguments), the calls of test_draw.py
+# on the run of the stand-in server (a fixed initial time instead of day_back)
+TEST_DRAW_PRODUCTS = {
+    'Station_Synthetical_Forecast_From_Cassandra': (
+        'nmc_met_map.sta.Station_Synthetical_Forecast_From_Cassandra',
+        {'model': '中央台指导', 'points': {'lon': [113.59], 'lat': [22.14]},
+         't_range': [4, 80], 'drw_thr': True, 'initTime': [INITIAL_TIME, INITIAL_TIME]}),
+    'gh_uv_r6_华中': ('nmc_met_map.synoptic.gh_uv_r6',
+                    {'model': 'NCEP_GFS', 'area': '华中', 'initial_time': INITIAL_TIME}),
+    'Miller_Composite_Chart': ('nmc_met_map.synthetical.Miller_Composite_Chart',
+                               {'initial_time': INITIAL_TIME}),
+    'isentropic_uv': ('nmc_met_map.isentropic.isentropic_uv', {'initial_time': INITIAL_TIME}),
+    'PV_Div_uv': ('nmc_met_map.synoptic.PV_Div_uv', {'initial_time': INITIAL_TIME}),
+    'Crosssection_Wind_Theta_e_RH': ('nmc_met_map.crossection.Crosssection_Wind_Theta_e_RH',
+                                     {'model': 'GRAPES_GFS', 'initial_time': INITIAL_TIME}),
+    'Crosssection_Wind_Theta_e_absv': ('nmc_met_map.crossection.Crosssection_Wind_Theta_e_absv',
+                                       {'model': 'ECMWF', 'initial_time': INITIAL_TIME}),
+    'low_level_wind': ('nmc_met_map.elements.low_level_wind',
+                       {'model': 'ECMWF', 'initial_time': INITIAL_TIME}),
+    'mslp_gust10m': ('nmc_met_map.elements.mslp_gust10m',
+                     {'model': 'ECMWF', 'initial_time': INITIAL_TIME}),
+    'T2m_mslp_uv10m': ('nmc_met_map.elements.T2m_mslp_uv10m',
+                       {'model': 'GRAPES_GFS', 'initial_time': INITIAL_TIME}),
+    'T2m_all_type': ('nmc_met_map.elements.T2m_all_type',
+                     {'model': '中央台指导预报', 'initial_time': INITIAL_TIME}),
+    'mslp_rain_snow': ('nmc_met_map.QPF.mslp_rain_snow',
+                       {'model': 'GRAPES_GFS', 'initial_time': INITIAL_TIME}),
+    'gh_rain': ('nmc_met_map.QPF.gh_rain', {'model': 'GRAPES_GFS', 'initial_time': INITIAL_TIME}),
+    'gh_uv_tmp': ('nmc_met_map.thermal.gh_uv_tmp',
+                  {'model': 'GRAPES_GFS', 'initial_time': INITIAL_TIME}),
+    'gh_uv_thetae': ('nmc_met_map.thermal.gh_uv_thetae',
+                     {'model': 'GRAPES_GFS', 'initial_time': INITIAL_TIME}),
+    'gh_uv_wvfl': ('nmc_met_map.moisture.gh_uv_wvfl',
+                   {'model': 'GRAPES_GFS', 'initial_time': INITIAL_TIME}),
+    'gh_uv_spfh': ('nmc_met_map.moisture.gh_uv_spfh',
+                   {'model': 'GRAPES_GFS', 'initial_time': INITIAL_TIME}),
+    'gh_uv_rh': ('nmc_met_map.moisture.gh_uv_rh', {'model': 'NCEP_GFS', 'initial_time': INITIAL_TIME}),
+    'gh_uv_pwat': ('nmc_met_map.moisture.gh_uv_pwat',
+                   {'model': 'NCEP_GFS', 'initial_time': INITIAL_TIME}),
+    'gh_uv_VVEL': ('nmc_met_map.dynamic.gh_uv_VVEL',
+                   {'model': 'NCEP_GFS', 'initial_time': INITIAL_TIME}),
+    'gh_uv_r6': ('nmc_met_map.synoptic.gh_uv_r6', {'model': 'NCEP_GFS', 'initial_time': INITIAL_TIME}),
+    'gh_uv_wsp': ('nmc_met_map.synoptic.gh_uv_wsp', {'model': 'NCEP_GFS', 'initial_time': INITIAL_TIME}),
+    'gh_uv_mslp': ('nmc_met_map.synoptic.gh_uv_mslp',
+                   {'model': 'NCEP_GFS', 'initial_time': INITIAL_TIME}),
+    'sta_SkewT': ('nmc_met_map.sta.sta_SkewT', {}),
+    'Time_Crossection_rh_uv_t': ('nmc_met_map.crossection.Time_Crossection_rh_uv_t',
+                                 {'initTime': INITIAL_TIME}),
+    'Time_Crossection_rh_uv_theta_e': ('nmc_met_map.crossection.Time_Crossection_rh_uv_theta_e',
+                                       {'initTime': INITIAL_TIME}),
+    'Crosssection_Wind_Theta_e_Qv': ('nmc_met_map.crossection.Crosssection_Wind_Theta_e_Qv',
+                                     {'model': 'GRAPES_GFS', 'initial_time': INITIAL_TIME}),
+}
+
+
+def check_products(products=None, output_dir=None, **kwargs):
+    """
+    Run the products of test_draw.py end to end against the stand-in server.
+    A product passes when it raises no error and saves at least one image.
+    :param products: list of names in TEST_DRAW_PRODUCTS, default all.
+    :param output_dir: directory of the images, default a temporary one.
+    :param kwargs: arguments of start_server, like latency or failure_rate.
+    :return: dict of the product name and None, or the reason it failed.
+    """
+    import shutil
+    import tempfile
+    import importlib
+    import traceback
+    import matplotlib
+    matplotlib.use('Agg')
+
+    if products is None:
+        products = list(TEST_DRAW_PRODUCTS.keys())
+    keep_output = output_dir is not None
+    if output_dir is None:
+        output_dir = tempfile.mkdtemp(prefix='standin_check_')
+    kwargs.setdefault('initial_times', [INITIAL_TIME])
+    kwargs.setdefault('fhours', FHOURS)
+    server = start_server(**kwargs)
+    configure_client(*server.server_address)
+    results = {}
+    try:
+        for name in products:
+            func_path, product_kwargs = TEST_DRAW_PRODUCTS[name]
+            module_name, func_name = func_path.rsplit('.', 1)
+            product_dir = os.path.join(output_dir, name)
+            os.makedirs(product_dir, exist_ok=True)
+            try:
+                func = getattr(importlib.import_module(module_name), func_name)
+                func(output_dir=product_dir+'/', **product_kwargs)
+            except Exception:
+                results[name] = traceback.format_exc(limit=-3)
+            else:
+                results[name] = None if os.listdir(product_dir) else 'no image saved'
+            print('----%s: %s' % (name, 'ok' if results[name] is None else 'FAILED'))
+    finally:
+        restore_client()
+        server.shutdown()
+        if not keep_output:
+            shutil.rmtree(output_dir, ignore_errors=True)
+    return results
+
+
+def main(argv=None):
+    import argparse
+    parser = argparse.ArgumentParser(
+        description='Run the products of test_draw.py against the stand-in MICAPS server')
+    parser.add_argument('--products', nargs='*', default=None,
+                        help='names in TEST_DRAW_PRODUCTS, default all')
+    parser.add_argument('--output_dir', default=None)
+    parser.add_argument('--latency', type=float, default=0.)
+    parser.add_argument('--failure_rate', type=float, default=0.)
+    args = parser.parse_args(argv)
+    results = check_products(products=args.products, output_dir=args.output_dir,
+                             latency=args.latency, failure_rate=args.failure_rate)
+    failed = [name for name, error in results.items() if error is not None]
+    for name in failed:
+        print('----%s\n%s' % (name, results[name]))
+    print('----%d products, %d failed' % (len(results), len(failed)))
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
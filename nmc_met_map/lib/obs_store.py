@@ -0,0 +1,204 @@
+# _*_ coding: utf-8 _*_
+
+"""
+  Local columnar store for hourly station observations (SURFACE/PLOT).
+
+  Every hourly file is fetched from the MICAPS server only once and written
+  into a daily partition, one array per column, sorted by (ID, time).
+  A station series over any window is then read back with a binary search
+  on the ID column of each partition instead of scanning the whole network.
+"""
+
+import os
+import threading
+from collections import OrderedDict
+from datetime import datetime, timedelta
+import numpy as np
+from nmc_met_map.lib.lazy import lazy_import
+from nmc_met_map.lib.retrieve import get_station_data
+
+pd = lazy_import('pandas')
+
+# the most recently read daily partitions, by path
+_partition_cache = OrderedDict()
+_partition_lock = threading.Lock()
+_config = {'max_partitions': 32}
+
+
+def configure(max_partitions=None):
+    """
+    :param max_partitions: daily partitions kept in memory, 0 to keep none.
+    """
+    if max_partitions is not None:
+        _config['max_partitions'] = max_partitions
+        with _partition_lock:
+            _evict()
+
+
+def _evict():
+    while len(_partition_cache) > _config['max_partitions']:
+        _partition_cache.popitem(last=False)
+
+
+def default_store_dir():
+    return os.path.join(os.path.expanduser('~'), '.nmc_met_map', 'obs_store')
+
+
+def obs_filename(obs_time):
+    """
+    Construct the hourly observation file name, like '20190514080000.000'.
+    :param obs_time: datetime object.
+    """
+    return obs_time.strftime('%Y%m%d%H')+'0000.000'
+
+
+class ObsStore(object):
+
+    def __init__(self, root_dir=None, directory='SURFACE/PLOT/'):
+        """
+        :param root_dir: local directory of the store,
+                         default is ~/.nmc_met_map/obs_store.
+        :param directory: observation directory on the MICAPS server.
+        """
+        if root_dir is None:
+            root_dir = default_store_dir()
+        self.directory = directory
+        self.root_dir = os.path.join(root_dir, directory.strip('/').replace('/', '_'))
+        if not os.path.exists(self.root_dir):
+            os.makedirs(self.root_dir)
+
+    def _partition_path(self, obs_time):
+        return os.path.join(self.root_dir, obs_time.strftime('%Y%m%d')+'.npz')
+
+    def _load_partition(self, path):
+        """
+        load one daily partition, cached by the file modification time.
+        :return: dict of column arrays, or None if the partition not exists.
+        """
+        if not os.path.isfile(path):
+            return None
+        mtime = os.path.getmtime(path)
+        with _partition_lock:
+            cached = _partition_cache.get(path)
+            if cached is not None and cached[0] == mtime:
+                _partition_cache.move_to_end(path)
+                return cached[1]
+        with np.load(path, allow_pickle=False) as npz:
+            columns = {name: npz[name] for name in npz.files}
+        # the stores written before kept the ID as integers
+        columns['ID'] = columns['ID'].astype(str)
+        with _partition_lock:
+            _partition_cache[path] = (mtime, columns)
+            _partition_cache.move_to_end(path)
+            _evict()
+        return columns
+
+    def has(self, obs_time):
+        columns = self._load_partition(self._partition_path(obs_time))
+        if columns is None:
+            return False
+        return np.datetime64(obs_time, 's') in columns['_hours']
+
+    def ingest(self, obs_times):
+        """
+        Fetch the hourly files which are not yet in the store.
+        Stop at the first file which is not available on the server.
+        :param obs_times: datetime object or list of datetime objects.
+        :return: number of hours newly ingested.
+        """
+        if isinstance(obs_times, datetime):
+            obs_times = [obs_times]
+
+        # group new records by daily partition, write each partition once
+        new_frames = {}
+        for obs_time in obs_times:
+            if self.has(obs_time):
+                continue
+            try:
+                obs_data = get_station_data(self.directory, filename=obs_filename(obs_time))
+            except Exception:
+                obs_data = None
+            if obs_data is None or len(obs_data) == 0:
+                break
+            path = self._partition_path(obs_time)
+            new_frames.setdefault(path, []).append((obs_time, obs_data))
+
+        n_new = 0
+        for path, frames in new_frames.items():
+            self._write_partition(path, frames)
+            n_new += len(frames)
+        return n_new
+
+    def _write_partition(self, path, frames):
+        old = self._load_partition(path)
+        tables = []
+        hours = []
+        if old is not None:
+            tables.append(pd.DataFrame({name: values for name, values in old.items()
+                                        if name != '_hours'}))
+            hours.append(old['_hours'])
+
+        for obs_time, obs_data in frames:
+            table = obs_data.drop(columns=[c for c in ('time', 'ID') if c in obs_data.columns])
+            table = table.apply(pd.to_numeric, errors='coerce')
+            # the IDs are kept as strings, like 54511 or the regional stations A1234
+            table.insert(0, 'ID', obs_data['ID'].astype(str).values)
+            table['time'] = np.datetime64(obs_time, 's').astype(np.int64)
+            tables.append(table)
+            hours.append(np.array([np.datetime64(obs_time, 's')]))
+
+        table = pd.concat(tables, ignore_index=True, sort=False)
+        order = np.lexsort((table['time'].values, table['ID'].values))
+        columns = {str(name): table[name].values[order] for name in table.columns}
+        columns['ID'] = columns['ID'].astype(str)
+        columns['time'] = columns['time'].astype(np.int64)
+        for name in columns:
+            if name not in ('ID', 'time'):
+                columns[name] = columns[name].astype(np.float64)
+        columns['_hours'] = np.unique(np.concatenate(hours)).astype('datetime64[s]')
+
+        tmp_path = path+'.tmp.npz'
+        np.savez(tmp_path, **columns)
+        os.replace(tmp_path, path)
+
+    def get_series(self, obs_ID, start_time, end_time, columns=None):
+        """
+        Read the time series of one station.
+        :param obs_ID: station ID, like 54511 or 'A1234'.
+        :param start_time: datetime object, included.
+        :param end_time: datetime object, included.
+        :param columns: list of element columns to read, None for all.
+        :return: pandas DataFrame indexed by observation time.
+        """
+        start = np.datetime64(start_time, 's').astype(np.int64)
+        end = np.datetime64(end_time, 's').astype(np.int64)
+
+        pieces = []
+        day = datetime(start_time.year, start_time.month, start_time.day)
+        while day <= end_time:
+            part = self._load_partition(self._partition_path(day))
+            day = day+timedelta(days=1)
+            if part is None:
+                continue
+            # the partition is sorted by (ID, time)
+            i0 = np.searchsorted(part['ID'], str(obs_ID), side='left')
+            i1 = np.searchsorted(part['ID'], str(obs_ID), side='right')
+            if i1 <= i0:
+                continue
+            times = part['time'][i0:i1]
+            j0 = i0+np.searchsorted(times, start, side='left')
+            j1 = i0+np.searchsorted(times, end, side='right')
+            if j1 <= j0:
+                continue
+            names = [name for name in part if name not in ('_hours', 'time')]
+            if columns is not None:
+                names = ['ID']+[name for name in columns if name in part]
+            piece = pd.DataFrame({name: part[name][j0:j1] for name in names})
+            piece.index = pd.to_datetime(part['time'][j0:j1], unit='s')
+            pieces.append(piece)
+
+        if len(pieces) == 0:
+            return pd.DataFrame()
+        series = pd.concat(pieces, sort=False)
+        series.index.name = 'time'
+        return series
@@ -0,0 +1,278 @@
+# _*_ coding: utf-8 _*_
+
+"""
+  Pre-warmed worker pool for rendering.
+
+  The pool boots once, imports matplotlib / cartopy and the graphics
+  modules, loads the fonts, the shapefiles, the logos and the background
+  image, then forks the workers. Every render task only pays for the data
+  and the drawing, the preloaded state is shared copy-on-write.
+
+  >>> from nmc_met_map.lib.render_pool import RenderPool
+  >>> with RenderPool(max_workers=4) as pool:
+  >>>     results = pool.sweep('nmc_met_map.synoptic.gh_uv_mslp', range(0, 73, 6),
+  >>>                          initial_time='19083008', output_dir='/data/maps/')
+  >>>     print(pool.memory())
+
+  The executor can also run the scheduler jobs:
+  >>> Scheduler(output_dir='/data/maps/', executor=pool.executor)
+
+  With method='forkserver' the resources are preloaded in the fork server
+  (the parent process stays light), with method='fork' they are
+  preloaded in the current process before the workers are forked.
+"""
+
+import os
+import time
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from nmc_met_map.lib.scheduler import run_job
+
+# set in the fork server process, the module is imported there as preload
+_PRELOAD_ENV = 'NMC_MET_MAP_RENDER_PRELOAD'
+
+GRAPHICS_MODULES = ['QPF_graphics', 'crossection_graphics', 'dynamic_graphics',
+                    'elements_graphics', 'isentropic_graphics', 'moisture_graphics',
+                    'sta_graphics', 'synoptic_graphics', 'synthetical_graphics',
+                    'thermal_graphics']
+
+SHAPEFILES = ['coastline', 'province', 'nation', 'river']
+
+LOGOS = ['resource/logo/nmc_medium.png', 'resource/logo/cma_medium.png',
+         'resource/logo/nmc_large.png', 'resource/logo/cma_large.png']
+
+CITIES = ['resource/city_province.000', 'resource/small_city.000']
+
+_preloaded = {}
+
+
+def preload(shapefiles=SHAPEFILES, background=True, fonts=('SimHei', 'SimHei-Bold')):
+    """
+    Import and load everything the products need before drawing.
+    Failed steps are printed and skipped, the products load them again
+    when they need them.
+    :param shapefiles: names of utl.china_map_geometries to parse.
+    :param background: load the background image of ax.background_img.
+    :param fonts: font families to look up and load.
+    :return: dict of seconds of every step.
+    """
+    if _preloaded:
+        return _preloaded
+    import importlib
+
+    def step(name, func):
+        start = time.perf_counter()
+        try:
+            func()
+        except Exception as e:
+            print('----preload %s failed: %s' % (name, e))
+        _preloaded[name] = time.perf_counter()-start
+
+    def load_modules():
+        import matplotlib
+        matplotlib.use('Agg')
+        import matplotlib.pyplot
+        import cartopy.crs
+        import cartopy.feature
+        for name in GRAPHICS_MODULES:
+            importlib.import_module('nmc_met_map.graphics.'+name)
+        for name in ('synoptic', 'moisture', 'thermal', 'dynamic', 'elements', 'QPF',
+                     'isentropic', 'crossection', 'synthetical', 'sta'):
+            importlib.import_module('nmc_met_map.'+name)
+        # resolve the heavy lazy imports of the modules
+        import metpy.calc
+        import metpy.plots
+        import scipy.ndimage
+        import scipy.interpolate
+        import xarray
+        import pandas
+
+    def load_fonts():
+        from matplotlib import font_manager
+        from matplotlib.backends.backend_agg import get_hinting_flag
+        for family in fonts:
+            path = font_manager.findfont(
+                font_manager.FontProperties(family=family), fallback_to_default=False)
+            font_manager.get_font(path).set_text('起报时间', 0.0, flags=get_hinting_flag())
+
+    def load_shapefiles():
+        import nmc_met_map.lib.utility as utl
+        for name in shapefiles:
+            utl.china_map_geometries(name)
+
+    def load_resources():
+        import nmc_met_map.lib.utility as utl
+        for fpath in LOGOS:
+            utl.read_resource_image(fpath)
+        for fpath in CITIES:
+            utl.read_resource_micaps_17(fpath)
+
+    def load_ocean():
+        import cartopy.feature as cfeature
+        # geometries are cached by cartopy
+        for _ in cfeature.OCEAN.geometries():
+            pass
+
+    def load_background():
+        import cartopy.crs as ccrs
+        import nmc_met_map.lib.utility as utl
+        fig = utl.new_figure(figsize=(1, 1))
+        try:
+            ax = fig.add_axes([0, 0, 1, 1], projection=ccrs.PlateCarree())
+            ax.background_img(name='RD', resolution='high', cache=True)
+        finally:
+            utl.close_figure(fig)
+
+    step('modules', load_modules)
+    step('fonts', load_fonts)
+    step('shapefiles', load_shapefiles)
+    step('resources', load_resources)
+    step('ocean', load_ocean)
+    if background:
+        step('background', load_background)
+
+    # move the preloaded objects out of the collected generations, so the
+    # garbage collector of the workers does not touch (and copy) the pages
+    import gc
+    gc.collect()
+    if hasattr(gc, 'freeze'):
+        gc.freeze()
+    return _preloaded
+
+
+def memory_usage(pid='self'):
+    """
+    Memory of a process from /proc/<pid>/smaps_rollup (linux).
+    pss is the proportional share of the shared pages, so with
+    copy-on-write sharing the sum of pss of the workers is much
+    smaller than the sum of rss.
+    :return: dict of rss, pss, shared and private memory in MB,
+             None if not available.
+    """
+    fields = {'Rss': 'rss', 'Pss': 'pss', 'Shared_Clean': 'shared_clean',
+              'Shared_Dirty': 'shared_dirty', 'Private_Clean': 'private_clean',
+              'Private_Dirty': 'private_dirty'}
+    try:
+        with open('/proc/%s/smaps_rollup' % pid) as f:
+            lines = f.readlines()
+    except (IOError, OSError):
+        return None
+    usage = {}
+    for line in lines:
+        items = line.split()
+        if len(items) >= 2 and items[0].rstrip(':') in fields:
+            usage[fields[items[0].rstrip(':')]] = int(items[1])/1024.
+    usage['shared'] = usage.get('shared_clean', 0.)+usage.get('shared_dirty', 0.)
+    usage['private'] = usage.get('private_clean', 0.)+usage.get('private_dirty', 0.)
+    return usage
+
+
+def _worker_init():
+    # fork: preloaded in the parent; forkserver: preloaded in the server
+    if not _preloaded:
+        preload()
+
+
+def _render_task(func_path, kwargs):
+    start = time.perf_counter()
+    run_job(func_path, kwargs)
+    return {'pid': os.getpid(), 'seconds': time.perf_counter()-start}
+
+
+def _worker_memory(delay):
+    # keep the worker busy, so every worker of the pool answers once
+    time.sleep(delay)
+    return os.getpid(), memory_usage()
+
+
+class RenderPool(object):
+
+    def __init__(self, max_workers=None, method='forkserver', preload_kwargs=None):
+        """
+        :param max_workers: number of render processes, default cpu count.
+        :param method: 'forkserver' or 'fork', start method of the workers.
+        :param preload_kwargs: keyword arguments of preload (method='fork').
+                               The fork server preloads with the defaults.
+        """
+        if method not in ('fork', 'forkserver'):
+            raise ValueError('method should be fork or forkserver')
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.method = method
+        ctx = multiprocessing.get_context(method)
+        if method == 'forkserver':
+            # the fork server imports this module and preloads on import,
+            # it is started with the first worker (only once per process)
+            os.environ[_PRELOAD_ENV] = '1'
+            ctx.set_forkserver_preload(['nmc_met_map.lib.render_pool'])
+        else:
+            preload(**(preload_kwargs or {}))
+        self.executor = ProcessPoolExecutor(
+            max_workers=self.max_workers, mp_context=ctx, initializer=_worker_init)
+        try:
+            self.boot_seconds = self._boot()
+        finally:
+            os.environ.pop(_PRELOAD_ENV, None)
+
+    def _boot(self):
+        # start the fork server and all workers now, not at the first task
+        start = time.perf_counter()
+        futures = [self.executor.submit(_worker_memory, 0.05)
+                   for _ in range(self.max_workers)]
+        for future in futures:
+            future.result()
+        return time.perf_counter()-start
+
+    def submit(self, func_path, **kwargs):
+        """
+        :param func_path: product function, like 'nmc_met_map.synoptic.gh_uv_mslp'.
+        :return: future of dict of worker pid and render seconds.
+        """
+        return self.executor.submit(_render_task, func_path, kwargs)
+
+    def sweep(self, func_path, fhours, **kwargs):
+        """
+        Render a product for all forecast hours.
+        :return: list of (fhour, dict of pid and seconds or the exception).
+        """
+        futures = [(fhour, self.submit(func_path, fhour=fhour, **kwargs)) for fhour in fhours]
+        results = []
+        for fhour, future in futures:
+            try:
+                results.append((fhour, future.result()))
+            except Exception as e:
+                print('----%s fhour %s failed: %s' % (func_path, fhour, e))
+                results.append((fhour, e))
+        return results
+
+    def memory(self):
+        """
+        Memory accounting of the workers, to check the copy-on-write sharing
+        of the preloaded state.
+        :return: dict of every worker (pid: memory_usage) and the total
+                 rss, pss, shared and private memory in MB.
+        """
+        futures = [self.executor.submit(_worker_memory, 0.2) for _ in range(self.max_workers)]
+        workers = {}
+        for future in futures:
+            pid, usage = future.result()
+            if usage is not None:
+                workers[pid] = usage
+        total = {}
+        for usage in workers.values():
+            for key, value in usage.items():
+                total[key] = total.get(key, 0.)+value
+        return {'workers': workers, 'total': total}
+
+    def shutdown(self, wait=True):
+        self.executor.shutdown(wait=wait)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.shutdown()
+        return False
+
+
+if os.environ.get(_PRELOAD_ENV):
+    preload()
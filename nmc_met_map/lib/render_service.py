@@ -0,0 +1,329 @@
+# _*_ coding: utf-8 _*_
+
+"""
+  On-demand rendering service for ad-hoc maps.
+
+  GET /render?product=gh_uv_mslp&model=ECMWF&initial_time=19083008&fhour=24&area=华北&gh_lev=500&uv_lev=850
+      returns the image of the product. Without initial_time the latest
+      run with all inputs on the server is used.
+  GET /products
+      products and the parameters they accept (json).
+  GET /stats
+      cache hits, misses and coalesced requests (json).
+
+  Rendered images are cached by the product parameters, identical
+  requests in flight are rendered once, misses are rendered in a
+  bounded worker pool.
+
+  python -m nmc_met_map.lib.render_service --port 8080 --cache_dir /data/render_cache --standin
+  python -m nmc_met_map.lib.render_service --port 8080 --cache_dir /data/render_cache --gds 127.0.0.1:8081
+"""
+
+import os
+import re
+import json
+import shutil
+import inspect
+import hashlib
+import argparse
+import importlib
+import threading
+from urllib.parse import urlparse, parse_qs
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from concurrent.futures import ProcessPoolExecutor
+import nmc_met_map.lib.utility as utl
+from nmc_met_map.lib.scheduler import PRODUCTS, latest_available, run_job
+
+_CONTENT_TYPES = {'.png': 'image/png', '.jpg': 'image/jpeg', '.jpeg': 'image/jpeg'}
+
+
+class ServiceBusy(Exception):
+    pass
+
+
+def product_params(name):
+    """
+    :return: dict of the parameters a product accepts in a request
+             and their default values.
+    """
+    module_name, func_name = PRODUCTS[name]['func'].rsplit('.', 1)
+    func = getattr(importlib.import_module(module_name), func_name)
+    params = {}
+    for param in inspect.signature(func).parameters.values():
+        if param.name in ('model', 'initial_time', 'fhour', 'area') or \
+                param.name.endswith('_lev'):
+            default = param.default if param.default is not inspect.Parameter.empty else None
+            params[param.name] = PRODUCTS[name]['kwargs'].get(param.name, default)
+    return params
+
+
+def request_kwargs(query):
+    """
+    Check the request and build the keyword arguments of the product.
+    :param query: dict of the request parameters.
+    :return: product name, keyword arguments (without output_dir).
+    """
+    name = query.get('product')
+    if name not in PRODUCTS:
+        raise ValueError('Unknown product: '+str(name))
+    params = product_params(name)
+    unknown = set(query.keys())-set(params.keys())-set(['product'])
+    if unknown:
+        raise ValueError('Unknown parameters: '+', '.join(sorted(unknown)))
+
+    kwargs = dict(PRODUCTS[name]['kwargs'])
+    for key, value in query.items():
+        if key != 'product':
+            kwargs[key] = value
+    kwargs['model'] = kwargs.get('model') or params.get('model') or 'ECMWF'
+    try:
+        kwargs['fhour'] = int(kwargs.get('fhour', params.get('fhour') or 0))
+    except ValueError:
+        raise ValueError('fhour should be an integer')
+    if 'area' in kwargs:
+        try:
+            utl.get_map_area(area_name=kwargs['area'])
+        except KeyError:
+            raise ValueError('Unknown area: '+kwargs['area'])
+    for key in kwargs:
+        if key.endswith('_lev') and not re.match(r'^\d+$', str(kwargs[key])):
+            raise ValueError(key+' should be a level in hPa, like 500')
+
+    if kwargs.get('initial_time') is None:
+        # the cache key needs the actual run, not the wall clock guess of the product
+        kwargs['initial_time'] = latest_available(name, kwargs['model'], kwargs['fhour'])
+        if kwargs['initial_time'] is None:
+            raise ValueError('No run of '+kwargs['model']+' with all inputs of '+name)
+    elif not re.match(r'^\d{8}$', kwargs['initial_time']):
+        raise ValueError('initial_time should be like 19083008')
+    return name, kwargs
+
+
+def cache_key(name, kwargs):
+    text = json.dumps([PRODUCTS[name]['func'], kwargs], sort_keys=True, default=str,
+                      ensure_ascii=False)
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+
+def _render_to(func, kwargs, target_dir):
+    """
+    Render the product into target_dir, the directory appears
+    (os.rename) only when the product is complete.
+    """
+    staging_dir = '%s.%d.tmp' % (target_dir, os.getpid())
+    if os.path.exists(staging_dir):
+        shutil.rmtree(staging_dir)
+    os.makedirs(staging_dir)
+    try:
+        run_job(func, dict(kwargs, output_dir=os.path.join(staging_dir, '')))
+        if len(os.listdir(staging_dir)) == 0:
+            raise ValueError('No image rendered, the data may be missing')
+        try:
+            os.rename(staging_dir, target_dir)
+        except OSError:
+            # rendered by another worker meanwhile
+            if not os.path.isdir(target_dir):
+                raise
+    finally:
+        shutil.rmtree(staging_dir, ignore_errors=True)
+    return target_dir
+
+
+def _init_worker(gds):
+    if gds is not None:
+        from nmc_met_map.lib import micaps_standin
+        micaps_standin.configure_client(*gds)
+
+
+class RenderService(object):
+
+    def __init__(self, cache_dir, max_workers=2, max_pending=16, timeout=600,
+                 executor=None, gds=None):
+        """
+        :param cache_dir: directory of the rendered images.
+        :param max_workers: render processes.
+        :param max_pending: maximum different renders in flight,
+                            more requests are answered with 503.
+        :param timeout: seconds to wait for a render.
+        :param executor: concurrent.futures executor, like RenderPool().executor,
+                         default is a process pool.
+        :param gds: (host, port) of the MICAPS server (mirror or stand-in)
+                    the workers read from, default is the config file.
+        """
+        self.cache_dir = cache_dir
+        if not os.path.exists(cache_dir):
+            os.makedirs(cache_dir)
+        self.max_pending = max_pending
+        self.timeout = timeout
+        if executor is None:
+            executor = ProcessPoolExecutor(max_workers=max_workers, initializer=_init_worker,
+                                           initargs=(gds,))
+        self.executor = executor
+        self.inflight = {}
+        self.stats = {'hit': 0, 'miss': 0, 'coalesced': 0, 'failed': 0, 'busy': 0}
+        self._lock = threading.Lock()
+
+    def cached_image(self, key):
+        """
+        :return: path of the cached image, None if not rendered.
+        """
+        target_dir = os.path.join(self.cache_dir, key)
+        if not os.path.isdir(target_dir):
+            return None
+        for name in sorted(os.listdir(target_dir)):
+            if os.path.splitext(name)[1].lower() in _CONTENT_TYPES:
+                return os.path.join(target_dir, name)
+        return None
+
+    def _count(self, name):
+        with self._lock:
+            self.stats[name] += 1
+
+    def render(self, query):
+        """
+        :param query: dict of the request parameters.
+        :return: path of the image, 'hit', 'miss' or 'coalesced'.
+        """
+        name, kwargs = request_kwargs(query)
+        key = cache_key(name, kwargs)
+        path = self.cached_image(key)
+        if path is not None:
+            self._count('hit')
+            return path, 'hit'
+
+        with self._lock:
+            future = self.inflight.get(key)
+            if future is not None:
+                self.stats['coalesced'] += 1
+                status = 'coalesced'
+            else:
+                if len(self.inflight) >= self.max_pending:
+                    self.stats['busy'] += 1
+                    raise ServiceBusy('Too many renders in flight, try again later')
+                future = self.executor.submit(_render_to, PRODUCTS[name]['func'], kwargs,
+                                              os.path.join(self.cache_dir, key))
+                self.inflight[key] = future
+                future.add_done_callback(lambda f: self._done(key, f))
+                self.stats['miss'] += 1
+                status = 'miss'
+        try:
+            future.result(timeout=self.timeout)
+        except Exception:
+            if status == 'miss':
+                self._count('failed')
+            raise
+        path = self.cached_image(key)
+        if path is None:
+            raise ValueError('No image rendered')
+        return path, status
+
+    def _done(self, key, future):
+        with self._lock:
+            if self.inflight.get(key) is future:
+                del self.inflight[key]
+
+    def shutdown(self):
+        self.executor.shutdown(wait=True)
+
+
+class _Handler(BaseHTTPRequestHandler):
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            BaseHTTPRequestHandler.log_message(self, format, *args)
+
+    def _send(self, code, body, content_type, headers={}):
+        self.send_response(code)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        for key, value in headers.items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_json(self, code, data):
+        self._send(code, json.dumps(data, ensure_ascii=False, default=str).encode('utf-8'),
+                   'application/json; charset=utf-8')
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        query = {key: values[-1] for key, values in parse_qs(url.query).items()}
+        service = self.server.service
+        try:
+            if url.path == '/render':
+                path, status = service.render(query)
+                with open(path, 'rb') as f:
+                    body = f.read()
+                self._send(200, body, _CONTENT_TYPES[os.path.splitext(path)[1].lower()],
+                           {'X-Cache': status})
+            elif url.path == '/products':
+                self._send_json(200, {name: product_params(name) for name in sorted(PRODUCTS)})
+            elif url.path == '/stats':
+                with service._lock:
+                    stats = dict(service.stats, inflight=len(service.inflight))
+                self._send_json(200, stats)
+            else:
+                self._send_json(404, {'error': 'Unknown path: '+url.path})
+        except ValueError as e:
+            self._send_json(400, {'error': str(e)})
+        except ServiceBusy as e:
+            self._send_json(503, {'error': str(e)})
+        except Exception as e:
+            self._send_json(500, {'error': '%s: %s' % (type(e).__name__, e)})
+
+
+def start_service(service, host='127.0.0.1', port=8080, verbose=False):
+    """
+    Serve the RenderService in a background thread.
+    :return: server, call server.shutdown() to stop.
+    """
+    server = ThreadingHTTPServer((host, port), _Handler)
+    server.daemon_threads = True
+    server.service = service
+    server.verbose = verbose
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='nmc_met_map on-demand rendering service')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--cache_dir', default='render_cache')
+    parser.add_argument('--max_workers', type=int, default=2)
+    parser.add_argument('--max_pending', type=int, default=16)
+    parser.add_argument('--gds', default=None, help='host:port of a local MICAPS mirror')
+    parser.add_argument('--standin', action='store_true',
+                        help='serve synthetic data from the local stand-in server')
+    parser.add_argument('--verbose', action='store_true')
+    args = parser.parse_args(argv)
+
+    gds = None
+    if args.standin:
+        from nmc_met_map.lib import micaps_standin
+        standin = micaps_standin.start_server()
+        gds = standin.server_address[:2]
+    elif args.gds is not None:
+        host, port = args.gds.rsplit(':', 1)
+        gds = (host, int(port))
+    if gds is not None:
+        # latest_available runs in this process
+        _init_worker(gds)
+
+    service = RenderService(args.cache_dir, max_workers=args.max_workers,
+                            max_pending=args.max_pending, gds=gds)
+    server = start_service(service, host=args.host, port=args.port, verbose=args.verbose)
+    print('----serving on http://%s:%d/' % server.server_address[:2])
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.shutdown()
+        service.shutdown()
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
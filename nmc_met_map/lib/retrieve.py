@@ -0,0 +1,320 @@
+# _*_ coding: utf-8 _*_
+
+"""
+  Retrieval functions used by the product drivers.
+
+  Same signatures as nmc_met_io.retrieve_micaps_server, but the 3D grid,
+  multi-file series and point functions are built on the single grid
+  function of this module, so every file request passes one place.
+  Grids fetched in advance (see nmc_met_map.lib.aio) are served from
+  the prefetch table without going to the server again.
+
+  Files found missing (model still running) are remembered for a short
+  time, repeat requests return None at once instead of waiting for the
+  server again. The record of a directory is dropped when
+  get_latest_initTime shows that a newer run has arrived.
+
+  Inside record_inputs(), every file read is recorded with a fingerprint
+  of its content (see nmc_met_map.lib.jobgraph). get_file_listing gives
+  the files of a directory without reading them.
+
+  The data of the grids are cast to the floating point type of the
+  package (kernels.DTYPE, float32 by default) once, when they arrive.
+"""
+
+import time
+import hashlib
+import threading
+from contextlib import contextmanager
+import numpy as np
+from nmc_met_map.lib.lazy import lazy_import
+from nmc_met_map.lib import instrument, kernels
+
+xr = lazy_import('xarray')
+micaps = lazy_import('nmc_met_io.retrieve_micaps_server')
+DataBlock_pb2 = lazy_import('nmc_met_io.DataBlock_pb2')
+
+_prefetched = {}
+_prefetched_lock = threading.Lock()
+
+_missing = {}
+_missing_lock = threading.Lock()
+_missing_ttl = 120.
+_latest_initTime = {}
+_missing_stats = {'skipped': 0, 'recorded': 0, 'invalidated': 0}
+
+_recorder = threading.local()
+
+
+def _key(directory, filename):
+    return (directory.rstrip('/'), filename)
+
+
+def level_directory(directory, level):
+    if directory[-1] == '/':
+        return directory+str(int(level)).strip()
+    return directory+'/'+str(int(level)).strip()
+
+
+def install_prefetched(grids):
+    """
+    :param grids: dict, {(directory, filename): xarray Dataset}.
+    """
+    with _prefetched_lock:
+        for (directory, filename), data in grids.items():
+            if data is not None:
+                _prefetched[_key(directory, filename)] = kernels.cast(data)
+
+
+def clear_prefetched():
+    with _prefetched_lock:
+        _prefetched.clear()
+
+
+def data_fingerprint(data):
+    """
+    sha1 of the values and coordinates of a Dataset or DataFrame.
+    """
+    sha1 = hashlib.sha1()
+    if hasattr(data, 'data_vars'):
+        for name in sorted(list(data.coords)+list(data.data_vars)):
+            sha1.update(str(name).encode('utf-8'))
+            sha1.update(np.ascontiguousarray(data[name].values).tobytes())
+    else:
+        sha1.update(data.to_csv().encode('utf-8'))
+    return sha1.hexdigest()
+
+
+@contextmanager
+def record_inputs(fresh=False):
+    """
+    Record the files read in the with block.
+    >>> with record_inputs() as inputs:
+    >>>     synoptic.gh_uv_mslp(initial_time='19083008', fhour=24)
+    >>> inputs  # [{'directory':..., 'filename':..., 'content':...}, ...]
+    :param fresh: read the files from the server, not from the local
+                  cache of nmc_met_io (which keeps a replaced file).
+    """
+    inputs = []
+    previous = getattr(_recorder, 'inputs', None), getattr(_recorder, 'fresh', False)
+    _recorder.inputs, _recorder.fresh = inputs, fresh
+    try:
+        yield inputs
+    finally:
+        _recorder.inputs, _recorder.fresh = previous
+
+
+def _record(directory, filename, data):
+    inputs = getattr(_recorder, 'inputs', None)
+    if inputs is None or data is None:
+        return
+    inputs.append({'directory': directory, 'filename': filename,
+                   'content': data_fingerprint(data)})
+
+
+def get_file_listing(directory):
+    """
+    Files of a server directory, with the value the server lists for
+    each one (the size on the GDS service), in one request and without
+    reading the files.
+    :return: dict of file name and listed value, empty if the directory
+             can not be listed.
+    """
+    with instrument.span('fetch'):
+        status, response = micaps.GDSDataService().getFileList(directory)
+    if status != 200 or response is None:
+        return {}
+    result = DataBlock_pb2.MapResult()
+    result.ParseFromString(response)
+    return {name: value for name, value in result.resultMap.items() if value != 'D'}
+
+
+def set_missing_ttl(ttl):
+    """
+    :param ttl: seconds to remember a missing file, 0 to disable.
+    """
+    global _missing_ttl
+    _missing_ttl = ttl
+    if ttl <= 0:
+        clear_missing()
+
+
+def _variable_directory(directory):
+    """
+    The directory of the variable, without the level, like 'ECMWF_HR/TMP'
+    of 'ECMWF_HR/TMP/850'.
+    """
+    directory = directory.rstrip('/')
+    parent, _, level = directory.rpartition('/')
+    if parent and level.replace('.', '', 1).isdigit():
+        return parent.rstrip('/')
+    return directory
+
+
+def clear_missing(directory=None):
+    """
+    Forget missing files of the variable of the directory (all its level
+    sub directories, a new run seen on '.../850' is also new on '.../500'),
+    or all directories.
+    """
+    with _missing_lock:
+        if directory is None:
+            keys = list(_missing.keys())
+        else:
+            directory = _variable_directory(directory)
+            keys = [key for key in _missing
+                    if key[0] == directory or key[0].startswith(directory+'/')]
+        for key in keys:
+            del _missing[key]
+        _missing_stats['invalidated'] += len(keys)
+
+
+def missing_stats():
+    """
+    :return: dict, number of skipped fetches, recorded and invalidated
+             missing files, and the missing files currently remembered.
+    """
+    with _missing_lock:
+        stats = dict(_missing_stats)
+        stats['size'] = len(_missing)
+    return stats
+
+
+def _is_missing(directory, filename):
+    if filename is None or _missing_ttl <= 0:
+        return False
+    key = _key(directory, filename)
+    with _missing_lock:
+        recorded = _missing.get(key)
+        if recorded is None:
+            return False
+        if time.time()-recorded > _missing_ttl:
+            del _missing[key]
+            return False
+        _missing_stats['skipped'] += 1
+    return True
+
+
+def _record_missing(directory, filename):
+    if filename is None or _missing_ttl <= 0:
+        return
+    with _missing_lock:
+        _missing[_key(directory, filename)] = time.time()
+        _missing_stats['recorded'] += 1
+
+
+def _fetch_or_missing(func, directory, filename, **kwargs):
+    if _is_missing(directory, filename):
+        return None
+    if getattr(_recorder, 'fresh', False):
+        kwargs.setdefault('cache', False)
+    with instrument.span('fetch'):
+        data = func(directory, filename=filename, **kwargs)
+    if data is None:
+        _record_missing(directory, filename)
+    return data
+
+
+def get_model_grid(directory, filename=None, suffix="*.024", **kwargs):
+    """
+    Retrieve numeric model grid forecast from MICAPS cassandra service.
+    :param directory: the data directory on the service.
+    :param filename: the data filename, if none, will be the latest file.
+    :param suffix: the filename filter pattern when filename is None.
+    :return: xarray Dataset, or None if not exists.
+    """
+    data = None
+    if filename is not None:
+        data = _prefetched.get(_key(directory, filename))
+    if data is None:
+        data = kernels.cast(_fetch_or_missing(micaps.get_model_grid, directory, filename,
+                                              suffix=suffix, **kwargs))
+    _record(directory, filename, data)
+    return data
+
+
+def get_model_grids(directory, filenames, allExists=True, **kwargs):
+    """
+    Retrieve multiple time model grids from MICAPS cassandra service.
+    :param allExists: all files should exist, or return None.
+    """
+    dataset = []
+    for filename in filenames:
+        data = get_model_grid(directory, filename=filename, **kwargs)
+        if data is not None:
+            dataset.append(data)
+        elif allExists:
+            return None
+    if len(dataset) == 0:
+        return None
+    return xr.concat(dataset, dim='time')
+
+
+def get_model_points(directory, filenames, points, allExists=True, **kwargs):
+    """
+    Retrieve point time series from MICAPS cassandra service.
+    :param points: dictionary, {'lon':[...], 'lat':[...]}.
+    """
+    data = get_model_grids(directory, filenames, allExists=allExists, **kwargs)
+    if data is None:
+        return None
+    return data.interp(lon=('points', points['lon']), lat=('points', points['lat']))
+
+
+def get_model_3D_grid(directory, filename, levels, allExists=True, **kwargs):
+    """
+    Retrieve 3D numeric model grid forecast (one file on every level).
+    """
+    dataset = []
+    for level in levels:
+        data = get_model_grid(level_directory(directory, level), filename=filename, **kwargs)
+        if data is not None:
+            dataset.append(data)
+        elif allExists:
+            return None
+    if len(dataset) == 0:
+        return None
+    return xr.concat(dataset, dim='level')
+
+
+def get_model_3D_grids(directory, filenames, levels, allExists=True, **kwargs):
+    """
+    Retrieve 3D numeric model grids for multiple files.
+    """
+    dataset = []
+    for filename in filenames:
+        data = get_model_3D_grid(directory, filename, levels, allExists=allExists, **kwargs)
+        if data is not None:
+            dataset.append(data)
+        elif allExists:
+            return None
+    if len(dataset) == 0:
+        return None
+    return xr.concat(dataset, dim='time')
+
+
+def get_station_data(directory, filename=None, suffix="*.000", **kwargs):
+    """
+    Retrieve station data from MICAPS cassandra service.
+    """
+    data = _fetch_or_missing(micaps.get_station_data, directory, filename,
+                             suffix=suffix, **kwargs)
+    _record(directory, filename, data)
+    return data
+
+
+def get_latest_initTime(directory, suffix="*.006"):
+    """
+    Get the latest initial time string, like '19083008', of the directory.
+    The missing files of the directory are forgotten when a newer run arrives.
+    """
+    with instrument.span('fetch'):
+        initTime = micaps.get_latest_initTime(directory, suffix=suffix)
+    if initTime is None:
+        return None
+    key = directory.rstrip('/')
+    previous = _latest_initTime.get(key)
+    _latest_initTime[key] = initTime
+    if previous is not None and initTime != previous:
+        clear_missing(directory)
+    return initTime
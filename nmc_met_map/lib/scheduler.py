@@ -0,0 +1,212 @@
+# _*_ coding: utf-8 _*_
+
+"""
+  Arrival driven product scheduler.
+
+  Instead of guessing the model run from the wall clock
+  (utl.filename_day_back_model), the scheduler watches the input
+  directories of the registered products with get_latest_initTime.
+  As soon as all inputs of (product, initial time, forecast hour) are on
+  the server, the job is queued once and rendered in a worker pool.
+
+  >>> from nmc_met_map.lib import scheduler
+  >>> sched = scheduler.Scheduler(output_dir='/data/maps/', fhours=range(0, 73, 6))
+  >>> sched.run_forever()
+"""
+
+import time
+import importlib
+from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor
+import nmc_met_map.lib.utility as utl
+from nmc_met_map.lib.retrieve import get_latest_initTime
+
+# product name: module function and inputs (data_type, var_name, level)
+PRODUCTS = {}
+
+
+def register_product(name, func, inputs, **kwargs):
+    """
+    Register a product for the scheduler.
+    :param name: product name, like 'gh_uv_mslp'.
+    :param func: function path, like 'nmc_met_map.synoptic.gh_uv_mslp'.
+    :param inputs: list of (data_type, var_name, level) the product reads,
+                   resolved with utl.Cassandra_dir for each model.
+    :param kwargs: default keyword arguments of the product function.
+    """
+    PRODUCTS[name] = {'func': func, 'inputs': list(inputs), 'kwargs': kwargs}
+
+
+register_product('gh_uv_mslp', 'nmc_met_map.synoptic.gh_uv_mslp',
+                 [('high', 'HGT', '500'), ('high', 'UGRD', '850'),
+                  ('high', 'VGRD', '850'), ('surface', 'PRMSL', None)])
+register_product('gh_uv_wsp', 'nmc_met_map.synoptic.gh_uv_wsp',
+                 [('high', 'HGT', '500'), ('high', 'UGRD', '850'), ('high', 'VGRD', '850')])
+register_product('gh_uv_rh', 'nmc_met_map.moisture.gh_uv_rh',
+                 [('high', 'HGT', '500'), ('high', 'UGRD', '850'),
+                  ('high', 'VGRD', '850'), ('high', 'RH', '850')])
+register_product('gh_uv_spfh', 'nmc_met_map.moisture.gh_uv_spfh',
+                 [('high', 'HGT', '500'), ('high', 'UGRD', '850'),
+                  ('high', 'VGRD', '850'), ('high', 'SPFH', '850')])
+register_product('gh_uv_tmp', 'nmc_met_map.thermal.gh_uv_tmp',
+                 [('high', 'HGT', '500'), ('high', 'UGRD', '850'),
+                  ('high', 'VGRD', '850'), ('high', 'TMP', '850')])
+register_product('gh_uv_VVEL', 'nmc_met_map.dynamic.gh_uv_VVEL',
+                 [('high', 'HGT', '500'), ('high', 'UGRD', '850'),
+                  ('high', 'VGRD', '850'), ('high', 'VVEL', '850')])
+register_product('convective_index', 'nmc_met_map.thermal.convective_index',
+                 [('high', 'HGT', '500'), ('high', 'UGRD', '850'), ('high', 'VGRD', '850'),
+                  ('high', 'TMP', '1000'), ('high', 'TMP', '500'), ('high', 'RH', '1000')],
+                 index='CAPE')
+
+
+def product_dirs(name, model):
+    """
+    :return: list of MICAPS directories the product reads for the model.
+    """
+    try:
+        return [utl.Cassandra_dir(data_type=data_type, data_source=model, var_name=var_name, lvl=lvl)
+                for data_type, var_name, lvl in PRODUCTS[name]['inputs']]
+    except KeyError:
+        raise ValueError('Can not find all directories needed')
+
+
+def latest_available(name, model, fhour, latest_cache=None):
+    """
+    Latest initial time for which every input of the product has the
+    forecast hour file, or None.
+    :param latest_cache: dict shared by the calls of one poll.
+    """
+    if latest_cache is None:
+        latest_cache = {}
+    init_times = []
+    suffix = '*.%03d' % fhour
+    for directory in product_dirs(name, model):
+        key = (directory, suffix)
+        if key not in latest_cache:
+            try:
+                latest_cache[key] = get_latest_initTime(directory, suffix=suffix)
+            except Exception:
+                latest_cache[key] = None
+        if latest_cache[key] is None:
+            return None
+        init_times.append(latest_cache[key])
+    # all inputs are ready for the oldest of the latest runs
+    return min(init_times, key=lambda t: datetime.strptime(t, '%y%m%d%H'))
+
+
+def run_job(func, kwargs):
+    """
+    Run a product function in this process.
+    :param func: dotted path of the function, like PRODUCTS[name]['func'].
+    :param kwargs: keyword arguments of the function.
+    """
+    module_name, func_name = func.rsplit('.', 1)
+    return getattr(importlib.import_module(module_name), func_name)(**kwargs)
+
+
+class Scheduler(object):
+
+    def __init__(self, products=None, models=['ECMWF'], fhours=range(0, 73, 6),
+                 output_dir=None, poll_interval=60, max_workers=None, executor=None,
+                 max_attempts=3):
+        """
+        :param products: list of registered product names, default all.
+        :param models: list of model names.
+        :param fhours: forecast hours to render.
+        :param output_dir: output directory passed to the products.
+        :param poll_interval: seconds between two polls of the server.
+        :param max_workers: worker processes for rendering.
+        :param executor: concurrent.futures executor, default is a process pool.
+        :param max_attempts: tries of a failing job, it is not submitted
+                             again for its initial time after that.
+        """
+        if products is None:
+            products = list(PRODUCTS.keys())
+        self.products = products
+        self.models = models
+        self.fhours = list(fhours)
+        self.output_dir = output_dir
+        self.poll_interval = poll_interval
+        if executor is None:
+            executor = ProcessPoolExecutor(max_workers=max_workers)
+        self.executor = executor
+        self.submitted = set()
+        self.running = {}
+        self.max_attempts = max_attempts
+        # job: (number of failed tries, last exception)
+        self.failed = {}
+
+    def latest_available(self, name, model, fhour, latest_cache):
+        return latest_available(name, model, fhour, latest_cache)
+
+    def ready_jobs(self):
+        """
+        :return: list of (product, model, initial_time, fhour) ready to render
+                 and not yet submitted.
+        """
+        jobs = []
+        latest_cache = {}
+        for model in self.models:
+            for name in self.products:
+                for fhour in self.fhours:
+                    initial_time = self.latest_available(name, model, fhour, latest_cache)
+                    if initial_time is None:
+                        continue
+                    job = (name, model, initial_time, fhour)
+                    if job not in self.submitted:
+                        jobs.append(job)
+        return jobs
+
+    def submit(self, job):
+        name, model, initial_time, fhour = job
+        product = PRODUCTS[name]
+        kwargs = dict(product['kwargs'])
+        kwargs.update(initial_time=initial_time, fhour=fhour, model=model,
+                      output_dir=self.output_dir)
+        self.submitted.add(job)
+        self.running[job] = self.executor.submit(run_job, product['func'], kwargs)
+
+    def collect(self):
+        """
+        Collect finished jobs, a failed job will be tried again in the next
+        poll, up to max_attempts tries.
+        :return: list of finished jobs.
+        """
+        finished = []
+        for job, future in list(self.running.items()):
+            if not future.done():
+                continue
+            del self.running[job]
+            exception = future.exception()
+            if exception is not None:
+                attempts = self.failed.get(job, (0, None))[0]+1
+                self.failed[job] = (attempts, exception)
+                if attempts < self.max_attempts:
+                    self.submitted.discard(job)
+                    print('----%s failed (%d/%d): %s' % (str(job), attempts, self.max_attempts, exception))
+                else:
+                    print('----%s failed %d times, given up: %s' % (str(job), attempts, exception))
+            else:
+                self.failed.pop(job, None)
+                finished.append(job)
+        return finished
+
+    def poll_once(self):
+        """
+        Collect finished jobs and submit the new ready ones.
+        :return: list of jobs submitted.
+        """
+        self.collect()
+        jobs = self.ready_jobs()
+        for job in jobs:
+            self.submit(job)
+        return jobs
+
+    def run_forever(self):
+        try:
+            while True:
+                self.poll_once()
+                time.sleep(self.poll_interval)
+        finally:
+            self.executor.shutdown(wait=True)
@@ -0,0 +1,521 @@
+# _*_ coding: utf-8 _*_
+
+"""
+  XYZ (Web-Mercator) tile pyramid of the scalar fields for web display.
+
+  The filled layer of the products (mslp, rh, pwat, thetae, rain, T2m)
+  is drawn directly into 256x256 tiles at several zoom levels, without
+  the base map, titles and logos. Tiles without data or with only
+  transparent pixels are not written.
+
+  output_dir/<layer>/<model>/<initial_time>/<fhour>/<z>/<x>/<y>.png
+  output_dir/<layer>/<model>/<initial_time>/<fhour>/tiles.json
+  output_dir/<layer>/.store/
+
+  Every tile is keyed by the hash of the grid points it covers. The
+  rendered tiles are kept in the store, so a tile whose data did not
+  change (an fhour rendered again, a dry region of the rain, the same
+  field at another fhour) is linked from the store instead of drawn,
+  only the tiles affected by the new data are rendered. prune_store
+  drops the stored tiles no fhour links to anymore, after the runs
+  older than the newest keep_runs are removed.
+
+  >>> from nmc_met_map.lib import tiles
+  >>> tiles.product_tiles('mslp', initial_time='19083008', fhour=24,
+  >>>                     zooms=(3, 4, 5, 6), output_dir='/data/tiles/')
+  >>> tiles.sweep_tiles('rain', range(6, 73, 6), initial_time='19083008',
+  >>>                   output_dir='/data/tiles/', atime=6, keep_runs=4)
+
+  python -m nmc_met_map.lib.tiles mslp --initial_time 19083008 --fhour 24 --output_dir /data/tiles/
+  python -m nmc_met_map.lib.tiles mslp --fhour 24 --output_dir /data/tiles/ --keep_runs 4
+"""
+
+import os
+import json
+import math
+import time
+import shutil
+import hashlib
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from nmc_met_map.lib.retrieve import get_model_grid
+from nmc_met_map.lib.lazy import lazy_import, lazy_attr
+import nmc_met_map.lib.utility as utl
+mpl = lazy_import('matplotlib')
+dk_ctables = lazy_import('nmc_met_graphics.cmap.ctables')
+guide_cmaps = lazy_attr('nmc_met_graphics.cmap.cm', 'guide_cmaps')
+
+TILE_SIZE = 256
+
+# changes the hash of every tile, increase when a style changes
+STYLE_VERSION = 1
+
+EARTH_RADIUS = 6378137.
+
+MAX_LAT = 85.0511287798
+
+# data directory of the layers, lvl of the high levels is the lev argument
+LAYERS = {
+    'mslp': {'data_type': 'surface', 'var_name': 'PRMSL'},
+    'rh': {'data_type': 'high', 'var_name': 'RH', 'lev': '850'},
+    'pwat': {'data_type': 'surface', 'var_name': 'TCWV'},
+    'thetae': {'data_type': 'high', 'var_name': 'THETAE', 'lev': '850'},
+    'rain': {'data_type': 'surface', 'var_name': 'RAIN%02d'},
+    'T2m': {'data_type': 'surface', 'var_name': 'T2m'},
+}
+
+
+def layer_style(layer, atime=6):
+    """
+    Colors of the layers, the same as the graphics of the products.
+    :return: plot method ('contourf' or 'pcolormesh'), keyword arguments of the plot.
+    """
+    if layer == 'mslp':
+        return 'contourf', {'levels': np.arange(960, 1065, 5), 'cmap': guide_cmaps(26),
+                            'alpha': 0.8}
+    if layer == 'rh':
+        cmap, norm = dk_ctables.cm_relative_humidity_nws()
+    elif layer == 'pwat':
+        pos = np.concatenate((np.arange(25), np.arange(26, 84, 2)))
+        cmap, norm = dk_ctables.cm_precipitable_water_nws(pos=pos)
+    elif layer == 'thetae':
+        cmap, norm = dk_ctables.cm_thetae(), None
+    elif layer == 'rain':
+        cmap, norm = dk_ctables.cm_qpf_nws(atime=atime)
+    elif layer == 'T2m':
+        cmap, norm = dk_ctables.cm_high_temperature_nws(), None
+    else:
+        raise ValueError('Unknown layer: '+str(layer))
+    cmap.set_under(color=[0, 0, 0, 0], alpha=0.0)
+    return 'pcolormesh', {'cmap': cmap, 'norm': norm, 'alpha': 0.5}
+
+
+def mercator(lon, lat):
+    """
+    :return: Web-Mercator x, y (m) of the longitude and latitude.
+    """
+    lat = np.clip(lat, -MAX_LAT, MAX_LAT)
+    x = np.radians(lon)*EARTH_RADIUS
+    y = np.log(np.tan(np.pi/4.+np.radians(lat)/2.))*EARTH_RADIUS
+    return x, y
+
+
+def lonlat_to_tile(lon, lat, z):
+    """
+    :return: x, y of the tile containing the point at zoom level z.
+    """
+    n = 2**z
+    lat = max(min(lat, MAX_LAT), -MAX_LAT)
+    x = int((lon+180.)/360.*n)
+    y = int((1.-math.asinh(math.tan(math.radians(lat)))/math.pi)/2.*n)
+    return min(max(x, 0), n-1), min(max(y, 0), n-1)
+
+
+def tile_lonlat(z, x, y):
+    """
+    :return: [lon_min, lon_max, lat_min, lat_max] of the tile.
+    """
+    n = 2.**z
+    lat_max = math.degrees(math.atan(math.sinh(math.pi*(1-2*y/n))))
+    lat_min = math.degrees(math.atan(math.sinh(math.pi*(1-2*(y+1)/n))))
+    return [x/n*360.-180., (x+1)/n*360.-180., lat_min, lat_max]
+
+
+def tile_bounds(z, x, y):
+    """
+    :return: [x_min, x_max, y_min, y_max] of the tile in Web-Mercator (m).
+    """
+    extent = tile_lonlat(z, x, y)
+    x0, y0 = mercator(extent[0], extent[2])
+    x1, y1 = mercator(extent[1], extent[3])
+    return [float(x0), float(x1), float(y0), float(y1)]
+
+
+def tiles_for_extent(map_extent, z):
+    """
+    :param map_extent: [lon_min, lon_max, lat_min, lat_max].
+    :return: list of (z, x, y) of the tiles covering the extent.
+    """
+    x0, y0 = lonlat_to_tile(map_extent[0], map_extent[3], z)
+    x1, y1 = lonlat_to_tile(map_extent[1], map_extent[2], z)
+    return [(z, x, y) for x in range(x0, x1+1) for y in range(y0, y1+1)]
+
+
+def area_extent(area='全国', map_ratio=19/9):
+    """
+    :return: map extent of the area, the same as the products.
+    """
+    cntr_pnt, zoom_ratio = utl.get_map_area(area_name=area)
+    return [cntr_pnt[0]-zoom_ratio*map_ratio, cntr_pnt[0]+zoom_ratio*map_ratio,
+            cntr_pnt[1]-zoom_ratio, cntr_pnt[1]+zoom_ratio]
+
+
+def crop_field(field, map_extent, halo=1.5):
+    """
+    Grid points of the field in the extent, with halo grid intervals
+    around it, so the tiles are filled to the edges.
+    :return: dict of lon, lat and data, None if no grid point in the extent.
+    """
+    lon, lat = field['lon'], field['lat']
+    dlon = abs(lon[1]-lon[0])*halo if len(lon) > 1 else 0.
+    dlat = abs(lat[1]-lat[0])*halo if len(lat) > 1 else 0.
+    idx_x = np.where((lon >= map_extent[0]-dlon) & (lon <= map_extent[1]+dlon))[0]
+    idx_y = np.where((lat >= map_extent[2]-dlat) & (lat <= map_extent[3]+dlat))[0]
+    if len(idx_x) < 2 or len(idx_y) < 2:
+        return None
+    return {'lon': lon[idx_x[0]:idx_x[-1]+1],
+            'lat': lat[idx_y[0]:idx_y[-1]+1],
+            'data': field['data'][idx_y[0]:idx_y[-1]+1, idx_x[0]:idx_x[-1]+1]}
+
+
+def get_layer_field(layer, filename, model='ECMWF', lev=None, atime=6):
+    """
+    Retrieve the field of a layer from micaps server.
+    :return: dict of lon, lat and data (2D), None if not exists.
+    """
+    if layer not in LAYERS:
+        raise ValueError('Unknown layer: '+str(layer))
+    info = LAYERS[layer]
+    var_name = info['var_name'] % atime if '%' in info['var_name'] else info['var_name']
+    try:
+        if info['data_type'] == 'high':
+            data_dir = utl.Cassandra_dir(data_type='high', data_source=model,
+                                         var_name=var_name, lvl=lev or info['lev'])
+        else:
+            data_dir = utl.Cassandra_dir(data_type='surface', data_source=model,
+                                         var_name=var_name)
+    except KeyError:
+        raise ValueError('Can not find all directories needed')
+
+    grid = get_model_grid(data_dir, filename=filename)
+    if grid is None:
+        return None
+    data = np.array(np.squeeze(grid['data'].values), dtype=np.float32)
+    if layer == 'rain':
+        data[data < 0.1] = np.nan
+    return {'lon': grid.coords['lon'].values, 'lat': grid.coords['lat'].values,
+            'data': data}
+
+
+def tile_key(layer, field, z, x, y, atime=6):
+    """
+    :return: hash of the grid points and the style of the tile,
+             None if the tile has no data.
+    """
+    sub = crop_field(field, tile_lonlat(z, x, y))
+    if sub is None or np.all(np.isnan(sub['data'])):
+        return None
+    key = hashlib.sha1(('%s/%d/%d/%d/%d/%d/%d' % (
+        layer, z, x, y, atime, TILE_SIZE, STYLE_VERSION)).encode('utf-8'))
+    for name in ('lon', 'lat', 'data'):
+        key.update(np.ascontiguousarray(sub[name], dtype=np.float32).tobytes())
+    return key.hexdigest()
+
+
+def _store_path(store_dir, key, suffix='.png'):
+    return os.path.join(store_dir, key[:2], key+suffix)
+
+
+def draw_tile(layer, field, z, x, y, atime=6, size=TILE_SIZE):
+    """
+    Draw the layer in a tile.
+    :return: rgba array (size, size, 4), None if all pixels are transparent.
+    """
+    sub = crop_field(field, tile_lonlat(z, x, y))
+    if sub is None:
+        return None
+    method, kwargs = layer_style(layer, atime=atime)
+    bounds = tile_bounds(z, x, y)
+
+    fig = utl.new_figure(figsize=(1, 1), dpi=size)
+    try:
+        fig.patch.set_alpha(0)
+        ax = fig.add_axes([0, 0, 1, 1])
+        ax.set_axis_off()
+        mx, my = mercator(*np.meshgrid(sub['lon'], sub['lat']))
+        if method == 'contourf':
+            ax.contourf(mx, my, sub['data'], kwargs['levels'], cmap=kwargs['cmap'],
+                        alpha=kwargs['alpha'])
+        else:
+            ax.pcolormesh(mx, my, sub['data'], cmap=kwargs['cmap'], norm=kwargs['norm'],
+                          alpha=kwargs['alpha'], shading='auto')
+        ax.set_xlim(bounds[0], bounds[1])
+        ax.set_ylim(bounds[2], bounds[3])
+        fig.canvas.draw()
+        rgba = np.array(fig.canvas.buffer_rgba())
+    finally:
+        utl.close_figure(fig)
+    if rgba[:, :, 3].max() == 0:
+        return None
+    return rgba
+
+
+def _render_tiles(layer, field, tiles, store_dir, atime=6):
+    """
+    Render the tiles into the store, an empty tile is kept as an
+    empty marker file.
+    :param tiles: list of (key, z, x, y).
+    :return: number of tiles drawn, number of empty tiles.
+    """
+    drawn = empty = 0
+    for key, z, x, y in tiles:
+        rgba = draw_tile(layer, field, z, x, y, atime=atime)
+        path = _store_path(store_dir, key, '.png' if rgba is not None else '.empty')
+        if not os.path.exists(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        staging = '%s.%d.tmp' % (path, os.getpid())
+        if rgba is None:
+            open(staging, 'wb').close()
+            empty += 1
+        else:
+            mpl.image.imsave(staging, rgba, format='png')
+            drawn += 1
+        os.replace(staging, path)
+    return drawn, empty
+
+
+def _link(src, dst):
+    if os.path.lexists(dst):
+        os.remove(dst)
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copyfile(src, dst)
+
+
+def render_layer_tiles(layer, field, output_dir, store_dir, zooms=(3, 4, 5, 6),
+                       map_extent=None, atime=6, max_workers=None, executor=None):
+    """
+    Render the tile pyramid of a field.
+    :param field: dict of lon, lat and data (2D).
+    :param output_dir: directory of the z/x/y.png tiles.
+    :param store_dir: directory of the rendered tiles, shared by the fhours.
+    :param zooms: zoom levels.
+    :param map_extent: [lon_min, lon_max, lat_min, lat_max], default the extent of the field.
+    :param max_workers: render processes, 1 renders in this process.
+    :param executor: concurrent.futures executor, like RenderPool().executor.
+    :return: dict of number of tiles drawn, reused from the store and empty.
+    """
+    if map_extent is None:
+        map_extent = [float(np.min(field['lon'])), float(np.max(field['lon'])),
+                      float(np.min(field['lat'])), float(np.max(field['lat']))]
+    field = crop_field(field, map_extent, halo=3)
+    if field is None:
+        raise ValueError('No grid point of the field in the map extent')
+
+    # hash the tiles, only the tiles not in the store are drawn
+    tiles, todo = [], []
+    stats = {'drawn': 0, 'reused': 0, 'empty': 0}
+    for z in zooms:
+        for _, x, y in tiles_for_extent(map_extent, z):
+            key = tile_key(layer, field, z, x, y, atime=atime)
+            if key is None:
+                stats['empty'] += 1
+                continue
+            tiles.append((key, z, x, y))
+            if not os.path.exists(_store_path(store_dir, key)) and \
+                    not os.path.exists(_store_path(store_dir, key, '.empty')):
+                todo.append((key, z, x, y))
+
+    if todo:
+        max_workers = max_workers or os.cpu_count() or 1
+        own_executor = executor is None and max_workers > 1 and len(todo) > 1
+        if own_executor:
+            executor = ProcessPoolExecutor(max_workers=max_workers)
+        try:
+            if executor is None:
+                chunks = [todo]
+                results = [_render_tiles(layer, field, todo, store_dir, atime)]
+            else:
+                # several chunks per worker, the large zooms are not equal in cost
+                nchunk = min(len(todo), max_workers*4)
+                chunks = [todo[i::nchunk] for i in range(nchunk)]
+                futures = [executor.submit(_render_tiles, layer, field, chunk, store_dir, atime)
+                           for chunk in chunks]
+                results = [future.result() for future in futures]
+        finally:
+            if own_executor:
+                executor.shutdown(wait=True)
+        drawn = sum(result[0] for result in results)
+    else:
+        drawn = 0
+
+    # link the tiles of this fhour from the store
+    index, empty_keys = {}, []
+    for key, z, x, y in tiles:
+        src = _store_path(store_dir, key)
+        if not os.path.exists(src):
+            stats['empty'] += 1
+            empty_keys.append(key)
+            continue
+        dst = os.path.join(output_dir, str(z), str(x), '%d.png' % y)
+        if not os.path.exists(os.path.dirname(dst)):
+            os.makedirs(os.path.dirname(dst))
+        _link(src, dst)
+        index.setdefault(str(z), []).append([x, y])
+    stats['drawn'] = drawn
+    stats['reused'] = sum(len(value) for value in index.values())-drawn
+
+    if not os.path.exists(output_dir):
+        os.makedirs(output_dir)
+    with open(os.path.join(output_dir, 'tiles.json'), 'w') as f:
+        # the empty markers of the store are not linked, keep their keys
+        json.dump({'layer': layer, 'zooms': list(zooms), 'map_extent': map_extent,
+                   'tile_size': TILE_SIZE, 'tiles': index, 'empty': empty_keys}, f)
+    return stats
+
+
+def prune_store(layer_dir, keep_runs=None):
+    """
+    Remove the tiles of the store no fhour uses anymore: the png files
+    not linked from an fhour directory (link count 1) and the empty
+    markers not listed in a tiles.json. Not to be run while tiles of
+    the layer are rendered. Without hard links (tiles copied) all png
+    files are removed and drawn again when needed.
+    :param layer_dir: directory of the layer, like output_dir/mslp.
+    :param keep_runs: also remove the runs of every model but the
+                      newest keep_runs, None keeps all runs.
+    :return: dict of number of runs and store files removed.
+    """
+    store_dir = os.path.join(layer_dir, '.store')
+    stats = {'runs': 0, 'tiles': 0}
+    empty_keys = set()
+    for model in sorted(os.listdir(layer_dir)):
+        model_dir = os.path.join(layer_dir, model)
+        if model == '.store' or not os.path.isdir(model_dir):
+            continue
+        # the initial times 'YYMMDDHH' sort in time order
+        runs = sorted(name for name in os.listdir(model_dir)
+                      if os.path.isdir(os.path.join(model_dir, name)))
+        if keep_runs is not None:
+            for run in runs[:max(len(runs)-keep_runs, 0)]:
+                shutil.rmtree(os.path.join(model_dir, run), ignore_errors=True)
+                stats['runs'] += 1
+            runs = runs[max(len(runs)-keep_runs, 0):]
+        for run in runs:
+            run_dir = os.path.join(model_dir, run)
+            for fhour in os.listdir(run_dir):
+                path = os.path.join(run_dir, fhour, 'tiles.json')
+                if os.path.isfile(path):
+                    with open(path) as f:
+                        empty_keys.update(json.load(f).get('empty', []))
+
+    if not os.path.isdir(store_dir):
+        return stats
+    for prefix in os.listdir(store_dir):
+        prefix_dir = os.path.join(store_dir, prefix)
+        for name in os.listdir(prefix_dir):
+            path = os.path.join(prefix_dir, name)
+            key, suffix = os.path.splitext(name)
+            if suffix == '.png':
+                unused = os.stat(path).st_nlink <= 1
+            elif suffix == '.empty':
+                unused = key not in empty_keys
+            else:
+                # staging file of a render that did not finish
+                unused = True
+            if unused:
+                os.remove(path)
+                stats['tiles'] += 1
+    return stats
+
+
+def _layer_dir(output_dir, layer, lev=None):
+    return os.path.join(output_dir, layer+('' if lev is None else '_'+str(lev)))
+
+
+def product_tiles(layer, initial_time=None, fhour=6, day_back=0, model='ECMWF',
+                  lev=None, atime=6, zooms=(3, 4, 5, 6), area='全国', map_extent=None,
+                  output_dir=None, max_workers=None, executor=None):
+    """
+    Tile pyramid of a scalar field.
+    :param layer: 'mslp', 'rh', 'pwat', 'thetae', 'rain' or 'T2m'.
+    :param lev: level of rh and thetae, like '850'.
+    :param atime: accumulation hours of rain.
+    :param area: map area of the tiles, like '全国' (see utl.get_map_area).
+    :param map_extent: [lon_min, lon_max, lat_min, lat_max], overrides area.
+    :return: dict of number of tiles drawn, reused and empty, None if no data.
+    """
+    if output_dir is None:
+        raise ValueError('output_dir is needed for tiles')
+    if(initial_time != None):
+        filename = utl.model_filename(initial_time, fhour)
+    else:
+        filename = utl.filename_day_back_model(day_back=day_back, fhour=fhour)
+
+    start = time.perf_counter()
+    field = get_layer_field(layer, filename, model=model, lev=lev, atime=atime)
+    if field is None:
+        print('----%s %s not found' % (layer, filename))
+        return None
+    if map_extent is None:
+        map_extent = area_extent(area)
+
+    run = filename.split('.')[0]
+    layer_dir = _layer_dir(output_dir, layer, lev)
+    stats = render_layer_tiles(
+        layer, field, os.path.join(layer_dir, model, run, '%03d' % fhour),
+        os.path.join(layer_dir, '.store'), zooms=zooms, map_extent=map_extent,
+        atime=atime, max_workers=max_workers, executor=executor)
+    stats['seconds'] = time.perf_counter()-start
+    print('----%s %s %03d: %d drawn, %d reused, %d empty, %.1f s' % (
+        layer, run, fhour, stats['drawn'], stats['reused'], stats['empty'], stats['seconds']))
+    return stats
+
+
+def sweep_tiles(layer, fhours, prune=False, keep_runs=None, **kwargs):
+    """
+    Tile pyramids of all forecast hours, see product_tiles.
+    :param prune: remove the unused tiles of the store afterwards.
+    :param keep_runs: remove the runs but the newest keep_runs afterwards,
+                      and the tiles of the store they used.
+    :return: list of (fhour, stats).
+    """
+    max_workers = kwargs.pop('max_workers', None) or os.cpu_count() or 1
+    executor = kwargs.pop('executor', None)
+    own_executor = executor is None and max_workers > 1
+    if own_executor:
+        # one pool for all fhours
+        executor = ProcessPoolExecutor(max_workers=max_workers)
+    try:
+        results = [(fhour, product_tiles(layer, fhour=fhour, max_workers=max_workers,
+                                         executor=executor, **kwargs)) for fhour in fhours]
+    finally:
+        if own_executor:
+            executor.shutdown(wait=True)
+    if prune or keep_runs is not None:
+        layer_dir = _layer_dir(kwargs['output_dir'], layer, kwargs.get('lev'))
+        if os.path.isdir(layer_dir):
+            stats = prune_store(layer_dir, keep_runs=keep_runs)
+            print('----%s: %d runs and %d stored tiles removed' % (
+                layer, stats['runs'], stats['tiles']))
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='nmc_met_map tile pyramid')
+    parser.add_argument('layer', choices=sorted(LAYERS))
+    parser.add_argument('--output_dir', required=True)
+    parser.add_argument('--model', default='ECMWF')
+    parser.add_argument('--initial_time', default=None)
+    parser.add_argument('--fhour', type=int, nargs='+', default=[6])
+    parser.add_argument('--zooms', type=int, nargs='+', default=[3, 4, 5, 6])
+    parser.add_argument('--area', default='全国')
+    parser.add_argument('--lev', default=None)
+    parser.add_argument('--atime', type=int, default=6)
+    parser.add_argument('--max_workers', type=int, default=None)
+    parser.add_argument('--prune', action='store_true',
+                        help='remove the unused tiles of the store')
+    parser.add_argument('--keep_runs', type=int, default=None,
+                        help='remove the runs but the newest KEEP_RUNS and their tiles')
+    args = parser.parse_args(argv)
+    sweep_tiles(args.layer, args.fhour, initial_time=args.initial_time, model=args.model,
+                zooms=tuple(args.zooms), area=args.area, lev=args.lev, atime=args.atime,
+                output_dir=args.output_dir, max_workers=args.max_workers,
+                prune=args.prune, keep_runs=args.keep_runs)
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
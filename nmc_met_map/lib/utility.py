@@ -6,35 +6,114 @@
 
 import itertools
 import string
-import pkg_resources
+import functools
+import threading
+from nmc_met_map.lib.lazy import lazy_import, lazy_attr
+pkg_resources = lazy_import('pkg_resources')
 import numpy as np
-import pandas as pd
-import cartopy.crs as ccrs
-from cartopy.mpl.gridliner import LONGITUDE_FORMATTER, LATITUDE_FORMATTER
-import matplotlib.pyplot as plt
-import matplotlib.patheffects as mpatheffects
-import matplotlib.ticker as mticker
-from cartopy.io.shapereader import Reader
-import locale
-import cartopy.feature as cfeature
+pd = lazy_import('pandas')
+ccrs = lazy_import('cartopy.crs')
+LONGITUDE_FORMATTER = lazy_attr('cartopy.mpl.gridliner', 'LONGITUDE_FORMATTER')
+LATITUDE_FORMATTER = lazy_attr('cartopy.mpl.gridliner', 'LATITUDE_FORMATTER')
+plt = lazy_import('matplotlib.pyplot')
+mpatheffects = lazy_import('matplotlib.patheffects')
+mticker = lazy_import('matplotlib.ticker')
+Reader = lazy_attr('cartopy.io.shapereader', 'Reader')
+cfeature = lazy_import('cartopy.feature')
 import sys
 ########
 import re
 import http.client
 from datetime import datetime, timedelta
 import numpy as np
-import xarray as xr
-import pandas as pd
-from nmc_met_io import DataBlock_pb2
-from nmc_met_io.config import _get_config_from_rcfile
+xr = lazy_import('xarray')
+pd = lazy_import('pandas')
+DataBlock_pb2 = lazy_import('nmc_met_io.DataBlock_pb2')
+_get_config_from_rcfile = lazy_attr('nmc_met_io.config', '_get_config_from_rcfile')
 import math
 import struct
-from nmc_met_io.retrieve_micaps_server import get_model_grids
-from scipy.ndimage import gaussian_filter
-from scipy.interpolate import griddata
-import matplotlib as mpl
+from nmc_met_map.lib.retrieve import get_model_grids
+gaussian_filter = lazy_attr('scipy.ndimage', 'gaussian_filter')
+griddata = lazy_attr('scipy.interpolate', 'griddata')
+mpl = lazy_import('matplotlib')
+Figure = lazy_attr('matplotlib.figure', 'Figure')
+FigureCanvasAgg = lazy_attr('matplotlib.backends.backend_agg', 'FigureCanvasAgg')
 import os.path
 
+_font_lock = threading.Lock()
+_font_ready = []
+
+def set_font():
+    """
+    中文字体(SimHei)和坐标轴负号, 只在进程中设置一次, 绘图时不再修改rcParams.
+    """
+    if _font_ready:
+        return
+    with _font_lock:
+        if not _font_ready:
+            mpl.rcParams['font.sans-serif'] = ['SimHei'] # 步骤一（替换sans-serif字体）
+            mpl.rcParams['axes.unicode_minus'] = False  # 步骤二（解决坐标轴负数的负号显示问题）
+            _font_ready.append(True)
+
+def new_figure(figsize=None, dpi=None, interactive=False, **kwargs):
+    """
+    New figure on the Agg canvas. The figure is not managed by pyplot,
+    so products can be drawn in threads and nothing is left in pyplot.
+    :param figsize: figure size in inches.
+    :param interactive: pyplot figure for plt.show() (output_dir is None).
+    :return: `matplotlib.figure.Figure`
+    """
+    set_font()
+    if interactive:
+        return plt.figure(figsize=figsize, dpi=dpi, **kwargs)
+    fig = Figure(figsize=figsize, dpi=dpi, **kwargs)
+    FigureCanvasAgg(fig)
+    return fig
+
+def close_figure(fig):
+    """
+    Release the figure and all its artists.
+    """
+    plt_module = sys.modules.get('matplotlib.pyplot')
+    if plt_module is not None:
+        plt_module.close(fig)
+    fig.clear()
+
+def cn_time(time, fmt="%Y年%m月%d日%H时"):
+    """
+    Format time with Chinese characters, independent of the locale
+    (no locale.setlocale), only the % directives are passed to strftime.
+    :param time: datetime.
+    :param fmt: format, like "%Y年%m月%d日%H时".
+    """
+    return re.sub('%[a-zA-Z%]', lambda m: time.strftime(m.group(0)), fmt)
+
+def cn_date_formatter(fmt='%m月%d日%H时'):
+    """
+    Date tick formatter with Chinese characters, see cn_time.
+    """
+    return mticker.FuncFormatter(
+        lambda x, pos=None: cn_time(mpl.dates.num2date(x).replace(tzinfo=None), fmt))
+
+def forecast_time_axis(initial_time, forecast_period):
+    """
+    Valid times of the forecast hours in one vectorised step,
+    the axes of the same run and hours are computed once.
+    :param initial_time: datetime of the model run.
+    :param forecast_period: forecast hours, like t2m['forecast_period'].values.
+    :return: datetime64 array (read only, shared by the same hours).
+    """
+    return _forecast_time_axis(
+        np.datetime64(initial_time, 'm'),
+        tuple(np.asarray(forecast_period, dtype=float).ravel().tolist()))
+
+@functools.lru_cache(maxsize=256)
+def _forecast_time_axis(initial_time, forecast_period):
+    minutes = np.round(np.array(forecast_period)*60.).astype('timedelta64[m]')
+    time_axis = initial_time+minutes
+    time_axis.setflags(write=False)
+    return time_axis
+
 def obs_radar_filename(time='none', product_name='CREF'):
     """
         Construct obsed radar file name.
@@ -51,26 +130,29 @@ def obs_radar_filename(time='none', product_name='CREF'):
     else:
         return 'ACHN.'+product_name+'000.'+time[0:8] + '.'+time[8:14]+'.LATLON'
 
-def add_obs_title(title, obs_time, fontsize=20, multilines=False, atime=0):
+def add_obs_title(title, obs_time, fontsize=20, multilines=False, atime=0, ax=None):
     """
     Add the title information to the plot.
     :param obs_time: obsed time.
     :param title: str, the plot content information.
     :param fontsize: font size.
     :param multilines: multilines for title.
+    :param ax: axes of the title, default is the current pyplot axes.
     :return: None.
     """
+    if ax is None:
+        ax = plt.gca()
     if isinstance(obs_time, np.datetime64):
         obs_time = pd.to_datetime(
             str(obs_time)).replace(tzinfo=None).to_pydatetime()
     obs_time = obs_time.strftime("Observed at %Y/%m/%dT%H:%M")
     if multilines:
         title = title + '\n' + obs_time
-        plt.title(title, loc='left', fontsize=fontsize)
+        ax.set_title(title, loc='left', fontsize=fontsize)
     else:
         time_str = obs_time
-        plt.title(title, loc='left', fontsize=fontsize)
-        plt.title(time_str, loc='right', fontsize=fontsize-2)
+        ax.set_title(title, loc='left', fontsize=fontsize)
+        ax.set_title(time_str, loc='right', fontsize=fontsize-2)
 
 def add_logo_extra(fig, x=10, y=10, zorder=100,
              which='nmc', size='medium', **kwargs):
@@ -98,12 +180,11 @@ def add_logo_extra(fig, x=10, y=10, zorder=100,
     except KeyError:
         raise ValueError('Unknown logo size or selection')
 
-    logo = plt.imread(pkg_resources.resource_filename(
-        'nmc_met_publish_map', fpath))
+    logo = read_resource_image(fpath)
     return fig.figimage(logo, x, y, zorder=zorder, **kwargs)
 
 def add_logo_extra_in_axes(pos=[0.1,0.1,.2,.4],
-             which='nmc', size='medium', **kwargs):
+             which='nmc', size='medium', fig=None, **kwargs):
     """
     :axes_pos:[left,bottom,increase_left,increase_right]
     :param which: Which logo to plot 'nmc', 'cmc'
@@ -111,6 +192,7 @@ def add_logo_extra_in_axes(pos=[0.1,0.1,.2,.4],
                  'small' for 40 px square
                  'medium' for 75 px square
                  'large' for 150 px square.
+    :param fig: figure of the logo, default is the current pyplot figure.
     :param kwargs:
     """
     fname_suffix = {
@@ -123,10 +205,11 @@ def add_logo_extra_in_axes(pos=[0.1,0.1,.2,.4],
     except KeyError:
         raise ValueError('Unknown logo size or selection')
 
-    logo = plt.imread(pkg_resources.resource_filename(
-        'nmc_met_publish_map', fpath))
+    logo = read_resource_image(fpath)
 
-    ax = plt.axes(pos)
+    if fig is None:
+        fig = plt.gcf()
+    ax = fig.add_axes(pos)
     ax.imshow(logo,alpha=0.6)
     ax.axis('off')
 
@@ -148,8 +231,7 @@ def add_city_on_map(ax,map_extent=[70,140,15,55],size=7,small_city=False,zorder=
             fpath = "resource/" + fname
         except KeyError:
             raise ValueError('can not find the file small_city.000 in the resources')
-        city = read_micaps_17(pkg_resources.resource_filename(
-            'nmc_met_publish_map', fpath))
+        city = read_resource_micaps_17(fpath)
 
         lon=city['lon'].values.astype(np.float)
         lat=city['lat'].values.astype(np.float)
@@ -168,17 +250,12 @@ def add_city_on_map(ax,map_extent=[70,140,15,55],size=7,small_city=False,zorder=
     except KeyError:
         raise ValueError('can not find the file city_province.000 in the resources')
 
-    city = read_micaps_17(pkg_resources.resource_filename(
-        'nmc_met_publish_map', fpath))
+    city = read_resource_micaps_17(fpath)
 
     lon=city['lon'].values.astype(np.float)/100.
     lat=city['lat'].values.astype(np.float)/100.
     city_names=city['Name'].values
 
-     # 步骤一（替换sans-serif字体） #得删除C:\Users\HeyGY\.matplotlib 然后重启vs，刷新该缓存目录获得新的字体
-    plt.rcParams['font.sans-serif'] = ['SimHei']     
-    plt.rcParams['axes.unicode_minus'] = False  # 步骤二（解决坐标轴负数的负号显示问题）
-
     for i in range(0,len(city_names)):
         if((lon[i] > map_extent[0]+dlon*0.05) and (lon[i] < map_extent[1]-dlon*0.05) and
         (lat[i] > map_extent[2]+dlat*0.05) and (lat[i] < map_extent[3]-dlat*0.05)):
@@ -191,18 +268,31 @@ def add_city_on_map(ax,map_extent=[70,140,15,55],size=7,small_city=False,zorder=
             ax.scatter(int(lon[i])+100*(lon[i]-int(lon[i]))/60., int(lat[i])+100*(lat[i]-int(lat[i]))/60., c='black', s=5, alpha=0.5, zorder=zorder,**kwargs)
     return
 
-def add_china_map_2cartopy_public(ax, name='province', facecolor='none',
-                           edgecolor='c', lw=2, **kwargs):
+@functools.lru_cache(maxsize=None)
+def read_resource_image(fpath):
     """
-    Draw china boundary on cartopy map.
-    :param ax: matplotlib axes instance.
-    :param name: map name.
-    :param facecolor: fill color, default is none.
-    :param edgecolor: edge color.
-    :param lw: line width.
-    :return: None
+    Read image in the resources (logo), cached in the process.
+    :param fpath: path in the resources, like 'resource/logo/nmc_medium.png'.
+    """
+    return plt.imread(pkg_resources.resource_filename(
+        'nmc_met_publish_map', fpath))
+
+@functools.lru_cache(maxsize=None)
+def read_resource_micaps_17(fpath):
     """
+    Read micaps 17 file in the resources (city list), cached in the process.
+    The returned DataFrame is shared, do not modify it.
+    """
+    return read_micaps_17(pkg_resources.resource_filename(
+        'nmc_met_publish_map', fpath))
 
+@functools.lru_cache(maxsize=None)
+def china_map_geometries(name='province'):
+    """
+    Geometries of the shapefile in the resources, parsed once in the process.
+    :param name: map name, see add_china_map_2cartopy_public.
+    :return: tuple of shapely geometries.
+    """
     # map name
     names = {'nation': "NationalBorder", 'province': "Province",
              'county': "County", 'river': "hyd1_4l",
@@ -212,15 +302,28 @@ def add_china_map_2cartopy_public(ax, name='province', facecolor='none',
     # get shape filename
     shpfile = pkg_resources.resource_filename(
         'nmc_met_publish_map', "/resource/shapefile/" + names[name] + ".shp")
+    return tuple(Reader(shpfile).geometries())
+
+def add_china_map_2cartopy_public(ax, name='province', facecolor='none',
+                           edgecolor='c', lw=2, **kwargs):
+    """
+    Draw china boundary on cartopy map.
+    :param ax: matplotlib axes instance.
+    :param name: map name.
+    :param facecolor: fill color, default is none.
+    :param edgecolor: edge color.
+    :param lw: line width.
+    :return: None
+    """
 
     # add map
     ax.add_geometries(
-        Reader(shpfile).geometries(), ccrs.PlateCarree(),
+        china_map_geometries(name), ccrs.PlateCarree(),
         facecolor=facecolor, edgecolor=edgecolor, lw=lw, **kwargs)
 
 def add_public_title(title, initial_time,
                     fhour=0, fontsize=20, multilines=False,atime=24,
-                    English=False):
+                    English=False, ax=None):
     """
     Add the title information to the plot.
     :param title: str, the plot content information.
@@ -229,27 +332,22 @@ def add_public_title(title, initial_time,
     :param fontsize: font size.
     :param multilines: multilines for title.
     :param atime: accumulating time.
+    :param ax: axes of the title, default is the current pyplot axes.
     :return: None.
     """
-    plt.rcParams['font.sans-serif'] = ['SimHei'] # 步骤一（替换sans-serif字体）
-    plt.rcParams['axes.unicode_minus'] = False  # 步骤二（解决坐标轴负数的负号显示问题）
+    if ax is None:
+        ax = plt.gca()
 
     if isinstance(initial_time, np.datetime64):
         initial_time = pd.to_datetime(
             str(initial_time)).replace(tzinfo=None).to_pydatetime()
 
-    if(sys.platform[0:3] == 'win'):
-        locale.setlocale(locale.LC_CTYPE, 'chinese')
-
-    if(sys.platform[0:3] == 'lin'):
-        locale.setlocale(locale.LC_CTYPE, 'zh_CN')
-
 
     if(English == False):
         start_time = initial_time + timedelta(hours=fhour-atime)
-        start_time_str=start_time.strftime("%Y年%m月%d日%H时")
+        start_time_str=cn_time(start_time, "%Y年%m月%d日%H时")
         valid_time = initial_time + timedelta(hours=fhour)
-        valid_time_str=valid_time.strftime('%m月%d日%H时')
+        valid_time_str=cn_time(valid_time, '%m月%d日%H时')
         time_str=start_time_str+'至'+valid_time_str
     else:
         start_time = initial_time + timedelta(hours=fhour-atime)
@@ -259,15 +357,17 @@ def add_public_title(title, initial_time,
         time_str=start_time_str+' to '+valid_time_str
 
 
-    plt.title(title, loc='left', fontsize=fontsize)
-    plt.title(time_str, loc='right', fontsize=fontsize-6)
+    ax.set_title(title, loc='left', fontsize=fontsize)
+    ax.set_title(time_str, loc='right', fontsize=fontsize-6)
 
-def add_south_China_sea(map_extent=[107,120,2,20],pos=[0.1,0.1,.2,.4], **kwargs):
+def add_south_China_sea(map_extent=[107,120,2,20],pos=[0.1,0.1,.2,.4], fig=None, **kwargs):
 
     # draw main figure
     plotcrs = ccrs.PlateCarree(
     central_longitude=100.)
-    ax = plt.axes(pos, projection=plotcrs)
+    if fig is None:
+        fig = plt.gcf()
+    ax = fig.add_axes(pos, projection=plotcrs)
     datacrs = ccrs.PlateCarree()
     ax.set_extent(map_extent, crs=datacrs)
     ax.add_feature(cfeature.OCEAN)
@@ -312,7 +412,7 @@ def adjust_map_ratio(ax,map_extent=None,datacrs=None):
     return map_extent2
 
 def add_public_title_obs(title=None, initial_time=None,valid_hour=0, fontsize=20, multilines=False,
-                           shw_period=True):
+                           shw_period=True, ax=None):
 
     """
     Add the title information to the plot.
@@ -323,32 +423,27 @@ def add_public_title_obs(title=None, initial_time=None,valid_hour=0, fontsize=20
     :param multilines: multilines for title.
     :param atime: accumulating time.
     :shw_period: whether show the obs period
+    :param ax: axes of the title, default is the current pyplot axes.
     :return: None.
     """
-    plt.rcParams['font.sans-serif'] = ['SimHei'] # 步骤一（替换sans-serif字体）
-    plt.rcParams['axes.unicode_minus'] = False  # 步骤二（解决坐标轴负数的负号显示问题）
+    if ax is None:
+        ax = plt.gca()
 
     if isinstance(initial_time, np.datetime64):
         initial_time = pd.to_datetime(
             str(initial_time)).replace(tzinfo=None).to_pydatetime()
 
-    if(sys.platform[0:3] == 'win'):
-        locale.setlocale(locale.LC_CTYPE, 'chinese')
-
-    if(sys.platform[0:3] == 'lin'):
-        locale.setlocale(locale.LC_CTYPE, 'zh_CN')
-
-    obs_time_str=initial_time.strftime("%m月%d日%H时%M分")
+    obs_time_str=cn_time(initial_time, "%m月%d日%H时%M分")
     valid_time = initial_time - timedelta(hours=valid_hour)
-    valid_time_str=valid_time.strftime('%Y年%m月%d日%H时%M分')
+    valid_time_str=cn_time(valid_time, '%Y年%m月%d日%H时%M分')
 
     if(shw_period == False):
         time_str=obs_time_str
     else:    
         time_str=valid_time_str+'至'+obs_time_str
 
-    plt.title(title, loc='left', fontsize=fontsize)
-    plt.title(time_str, loc='right', fontsize=fontsize-6)
+    ax.set_title(title, loc='left', fontsize=fontsize)
+    ax.set_title(time_str, loc='right', fontsize=fontsize-6)
 
 def get_map_area(area_name):
 
@@ -534,7 +629,7 @@ def wind2UV(Winddir=None,Windsp=None):
 
     return U,V
 
-def add_public_title_sta(title=None, initial_time=None,fontsize=20,English=False):
+def add_public_title_sta(title=None, initial_time=None,fontsize=20,English=False, ax=None):
 
     """
     Add the title information to the plot.
@@ -544,30 +639,79 @@ def add_public_title_sta(title=None, initial_time=None,fontsize=20,English=False
     :param fontsize: font size.
     :param atime: accumulating time.
     :shw_period: whether show the obs period
+    :param ax: axes of the title, default is the current pyplot axes.
     :return: None.
     """
-    plt.rcParams['font.sans-serif'] = ['SimHei'] # 步骤一（替换sans-serif字体）
-    plt.rcParams['axes.unicode_minus'] = False  # 步骤二（解决坐标轴负数的负号显示问题）
+    if ax is None:
+        ax = plt.gca()
 
     if isinstance(initial_time, np.datetime64):
         initial_time = pd.to_datetime(
             str(initial_time)).replace(tzinfo=None).to_pydatetime()
 
-    if(sys.platform[0:3] == 'win'):
-        locale.setlocale(locale.LC_CTYPE, 'chinese')
-
-    if(sys.platform[0:3] == 'lin'):
-        locale.setlocale(locale.LC_CTYPE, 'zh_CN')
-
     if(English == False):
-        initial_time_str=initial_time.strftime("%Y年%m月%d日%H时")
+        initial_time_str=cn_time(initial_time, "%Y年%m月%d日%H时")
         time_str='起报时间：'+initial_time_str
     else:
         initial_time_str=initial_time.strftime("%Y%m%d%H")
         time_str='Initial Time：'+initial_time_str
 
-    plt.title(title, loc='left', fontsize=fontsize)
-    plt.title(time_str, loc='right', fontsize=fontsize-6)
+    ax.set_title(title, loc='left', fontsize=fontsize)
+    ax.set_title(time_str, loc='right', fontsize=fontsize-6)
+
+def banded_fill(ax, x, y, levels, colors, **kwargs):
+
+    """
+    Colour bands under a curve in one PolyCollection, looks the same as
+    ax.fill_between(x, y, levels[i], facecolor=colors[i]) for every level
+    in increasing order, without the overlapping polygons. The bands are
+    not antialiased, which would leave a light seam where two bands meet
+    (the curve drawn over the bands hides the jagged top edge).
+    :param x: x of the curve (numbers or times).
+    :param y: y of the curve.
+    :param levels: increasing thresholds, under the curve the part between
+                   levels[i] and levels[i+1] is filled with colors[i].
+                   The part between the curve and the last level, above
+                   or below the curve, is filled with the last colour.
+    :param colors: colours of the levels, one for every level.
+    :return: PolyCollection.
+    """
+    levels = np.asarray(levels, dtype=float)
+    if len(levels) != len(colors) or np.any(np.diff(levels) <= 0):
+        raise ValueError('levels should be increasing, one colour for every level')
+
+    ax.xaxis.update_units(x)
+    xs = np.asarray(ax.convert_xunits(x), dtype=float).ravel()
+    ys = np.asarray(y, dtype=float).ravel()
+
+    # add the crossings of the curve and the levels, the curve is then
+    # linear between the points and stays in one band
+    y0, y1 = ys[:-1, None], ys[1:, None]
+    seg, lev = np.nonzero(((y0 < levels) & (y1 > levels)) | ((y0 > levels) & (y1 < levels)))
+    frac = (levels[lev]-ys[seg])/(ys[seg+1]-ys[seg])
+    xr = np.concatenate([xs, xs[seg]+frac*(xs[seg+1]-xs[seg])])
+    yr = np.concatenate([ys, levels[lev]])
+    order = np.argsort(xr, kind='mergesort')
+    xr, yr = xr[order], yr[order]
+
+    verts = []
+    facecolors = []
+    for i in range(len(levels)):
+        if i < len(levels)-1:
+            upper = np.clip(yr, levels[i], levels[i+1])
+            if not np.any(upper > levels[i]):
+                continue
+        else:
+            upper = yr
+        verts.append(np.column_stack([np.concatenate([xr, xr[::-1]]),
+            np.concatenate([upper, np.full(len(xr), levels[i])])]))
+        facecolors.append(colors[i])
+
+    kwargs.setdefault('antialiased', False)
+    collection = mpl.collections.PolyCollection(verts, facecolors=facecolors, **kwargs)
+    ax.add_collection(collection, autolim=True)
+    ax.autoscale_view()
+    return collection
 
 def Cassandra_dir(data_type=None,data_source=None,var_name=None,lvl=None
     ):
@@ -800,8 +944,11 @@ def get_model_points_gy(directory, filenames, points, allExists=True,fill_null=F
         grid_x=np.array(data['lon'].values)
         grid_y=np.array(data['lat'].values)
         x,y=np.meshgrid(data['lon'].values, data['lat'].values)
-        idx_x=np.squeeze(np.where((grid_x > points['lon'][0]-6) & (grid_x < points['lon'][0]+6)))
-        idx_y=np.squeeze(np.where((grid_y > points['lat'][0]-5) & (grid_y < points['lat'][0]+5)))
+        # one region around all points, filled once for a batch of stations
+        lon0,lon1=np.min(points['lon'])-6,np.max(points['lon'])+6
+        lat0,lat1=np.min(points['lat'])-5,np.max(points['lat'])+5
+        idx_x=np.squeeze(np.where((grid_x > lon0) & (grid_x < lon1)))
+        idx_y=np.squeeze(np.where((grid_y > lat0) & (grid_y < lat1)))
         x2,y2=np.meshgrid(grid_x[idx_x[0]:idx_x[-1]], grid_y[idx_y[0]:idx_y[-1]])
         nx2=len(idx_x)
         ny2=len(idx_y)
@@ -812,8 +959,8 @@ def get_model_points_gy(directory, filenames, points, allExists=True,fill_null=F
             temp2=np.squeeze(temp[it,:,:])
             temp2=temp2.reshape(dims[1]*dims[2])
             idx_ok=np.squeeze(np.where((temp2 != Null_value) & 
-                (x < points['lon'][0]+6) & (x > points['lon'][0]-6) &
-                (y < points['lat'][0]+5) & (y > points['lat'][0]-5)))
+                (x < lon1) & (x > lon0) &
+                (y < lat1) & (y > lat0)))
 
             n_ok=len(idx_ok)
             data_new=griddata(np.squeeze(np.dstack(([y[idx_ok],x[idx_ok]]))), temp2[idx_ok], (y2,x2))
@@ -826,6 +973,60 @@ def get_model_points_gy(directory, filenames, points, allExists=True,fill_null=F
     else:
         return None
 
+def _axis_weights(axis, values):
+    """
+    Lower index and weight of the upper neighbour of values on a grid axis,
+    increasing or decreasing.
+    """
+    n = len(axis)
+    if axis[0] > axis[-1]:
+        i, w, outside = _axis_weights(axis[::-1], values)
+        return n-2-i, 1.-w, outside
+    i = np.clip(np.searchsorted(axis, values)-1, 0, n-2)
+    w = (values-axis[i])/(axis[i+1]-axis[i])
+    outside = (values < axis[0]) | (values > axis[-1])
+    return i, w, outside
+
+def interp_points(lon, lat, data, points):
+    """
+    Bilinear interpolation of grids to points, as data.interp(lon=..., lat=...)
+    of xarray, the weights are computed once for all the fields.
+    :param lon: longitudes of the grid.
+    :param lat: latitudes of the grid.
+    :param data: array (..., lat, lon), like several 3D fields stacked.
+    :param points: dictionary, {'lon':[...], 'lat':[...]}.
+    :return: array (..., points), nan outside the grid.
+    """
+    ix, wx, out_x = _axis_weights(np.asarray(lon, dtype=float), np.asarray(points['lon'], dtype=float))
+    iy, wy, out_y = _axis_weights(np.asarray(lat, dtype=float), np.asarray(points['lat'], dtype=float))
+    data = np.asarray(data)
+    if not np.issubdtype(data.dtype, np.floating):
+        data = data.astype(float)
+    # in the dtype of the grids, the volume is not copied to float64
+    wx = wx.astype(data.dtype)
+    wy = wy.astype(data.dtype)
+    result = (data[..., iy, ix]*(1-wy)*(1-wx)+data[..., iy+1, ix]*wy*(1-wx)+
+              data[..., iy, ix+1]*(1-wy)*wx+data[..., iy+1, ix+1]*wy*wx)
+    result[..., out_x | out_y] = np.nan
+    return result
+
+def halo_window(idx, size, halo=0, align=1):
+    """
+    Window of a grid axis around the cropped points, with a halo for the
+    smoothing kernels and finite differences: the values computed on the
+    window are the values of the whole grid at least halo points inside
+    the window edges (the edges of the grid are the same).
+    :param idx: indexes of the cropped points, like idx_x1[0].
+    :param size: length of the grid axis.
+    :param halo: points added on both sides, clipped to the grid.
+    :param align: the start is a multiple of align, like the barb skip,
+                  so the subsampled points are those of the whole grid.
+    :return: slice.
+    """
+    start = max(int(idx[0])-halo, 0)
+    start -= start % align
+    return slice(start, min(int(idx[-1])+1+halo, size))
+
 def gy_cm_rain_nws(atime=24, pos=None):
     """
     Rainfall color map.
@@ -4,12 +4,15 @@
 Synoptic analysis or diagnostic maps for numeric weather model.
 """
 import numpy as np
-from nmc_met_io.retrieve_micaps_server import get_model_grid
-from nmc_met_map.graphics import moisture_graphics
+from nmc_met_map.lib.retrieve import get_model_grid
+from nmc_met_map.lib.lazy import lazy_import, lazy_attr
+moisture_graphics = lazy_import('nmc_met_map.graphics.moisture_graphics')
 import nmc_met_map.lib.utility as utl
-from metpy.units import units
-import metpy.calc as mpcalc
+from nmc_met_map.lib import instrument
+units = lazy_attr('metpy.units', 'units')
+mpcalc = lazy_import('metpy.calc')
 
+@instrument.product
 def gh_uv_pwat(initial_time=None, fhour=6, day_back=0,model='ECMWF',
     gh_lev='500',uv_lev='850',
     map_ratio=19/9,zoom_ratio=20,cntr_pnt=[102,34],
@@ -52,6 +55,7 @@ def gh_uv_pwat(initial_time=None, fhour=6, day_back=0,model='ECMWF',
 
 
     # prepare data
+    instrument.phase('crop')
 
     if(area != None):
         cntr_pnt,zoom_ratio=utl.get_map_area(area_name=area)
@@ -100,6 +104,7 @@ def gh_uv_pwat(initial_time=None, fhour=6, day_back=0,model='ECMWF',
         output_dir=output_dir,Global=Global)
 
 
+@instrument.product
 def gh_uv_rh(initial_time=None, fhour=6, day_back=0,model='ECMWF',
     gh_lev='500',uv_lev='850',rh_lev='850',
     map_ratio=19/9,zoom_ratio=20,cntr_pnt=[102,34],
@@ -144,6 +149,7 @@ def gh_uv_rh(initial_time=None, fhour=6, day_back=0,model='ECMWF',
 
 
     # prepare data
+    instrument.phase('crop')
 
     if(area != None):
         cntr_pnt,zoom_ratio=utl.get_map_area(area_name=area)
@@ -193,6 +199,7 @@ def gh_uv_rh(initial_time=None, fhour=6, day_back=0,model='ECMWF',
         output_dir=output_dir,Global=Global)
 
 
+@instrument.product
 def gh_uv_spfh(initial_time=None, fhour=6, day_back=0,model='ECMWF',
     gh_lev='500',uv_lev='850',spfh_lev='850',
     map_ratio=19/9,zoom_ratio=20,cntr_pnt=[102,34],
@@ -237,6 +244,7 @@ def gh_uv_spfh(initial_time=None, fhour=6, day_back=0,model='ECMWF',
 
 
     # prepare data
+    instrument.phase('crop')
 
     if(area != None):
         cntr_pnt,zoom_ratio=utl.get_map_area(area_name=area)
@@ -285,6 +293,7 @@ def gh_uv_spfh(initial_time=None, fhour=6, day_back=0,model='ECMWF',
         city=city,south_China_sea=south_China_sea,
         output_dir=output_dir,Global=Global)
 
+@instrument.product
 def gh_uv_wvfl(initial_time=None, fhour=6, day_back=0,model='ECMWF',
     gh_lev='500',uv_lev='850',wvfl_lev='850',
     map_ratio=19/9,zoom_ratio=20,cntr_pnt=[102,34],
@@ -330,6 +339,7 @@ def gh_uv_wvfl(initial_time=None, fhour=6, day_back=0,model='ECMWF',
 
 
     # prepare data
+    instrument.phase('crop')
 
     if(area != None):
         cntr_pnt,zoom_ratio=utl.get_map_area(area_name=area)
@@ -1,22 +1,29 @@
 import numpy as np
-import pandas as pd
+from nmc_met_map.lib.lazy import lazy_import, lazy_attr
+pd = lazy_import('pandas')
 from datetime import datetime, timedelta
 import math
 import os
-import xarray as xr
-import metpy.calc as mpcalc
-from metpy.units import units
-from nmc_met_io.retrieve_micaps_server import get_model_points,get_model_3D_grid,get_latest_initTime,get_model_3D_grids,get_station_data
+from concurrent.futures import ProcessPoolExecutor
+xr = lazy_import('xarray')
+mpcalc = lazy_import('metpy.calc')
+units = lazy_attr('metpy.units', 'units')
+from nmc_met_map.lib.retrieve import get_model_points,get_model_3D_grid,get_latest_initTime,get_model_3D_grids,get_station_data
 import nmc_met_map.lib.utility as utl
-from nmc_met_map.graphics import sta_graphics
-import matplotlib.pyplot as plt
-import metpy.calc as mpcalc
-from metpy.cbook import get_test_data
-from metpy.plots import add_metpy_logo, SkewT
-from metpy.units import units
-from scipy.stats import norm
-from scipy.interpolate import LinearNDInterpolator
-
+from nmc_met_map.lib import instrument, kernels, derived
+from nmc_met_map.lib import convection
+from nmc_met_map.lib.obs_store import ObsStore
+sta_graphics = lazy_import('nmc_met_map.graphics.sta_graphics')
+plt = lazy_import('matplotlib.pyplot')
+mpcalc = lazy_import('metpy.calc')
+get_test_data = lazy_attr('metpy.cbook', 'get_test_data')
+add_metpy_logo = lazy_attr('metpy.plots', 'add_metpy_logo')
+SkewT = lazy_attr('metpy.plots', 'SkewT')
+units = lazy_attr('metpy.units', 'units')
+norm = lazy_attr('scipy.stats', 'norm')
+LinearNDInterpolator = lazy_attr('scipy.interpolate', 'LinearNDInterpolator')
+
+@instrument.product
 def Station_Synthetical_Forecast_From_Cassandra(
         model='ECMWF',
         output_dir=None,
@@ -31,6 +38,27 @@ def Station_Synthetical_Forecast_From_Cassandra(
             'point_name':' '}
             ):
 
+    data=Station_Synthetical_Forecast_data(
+        model=model,t_range=t_range,t_gap=t_gap,points=points,initTime=initTime)
+
+    sta_graphics.draw_Station_Synthetical_Forecast_From_Cassandra(
+            draw_VIS=draw_VIS,drw_thr=drw_thr,
+            model=model,points=points,
+            output_dir=output_dir,extra_info=extra_info,**data)
+
+def Station_Synthetical_Forecast_data(
+        model='ECMWF',
+        t_range=[0,84],
+        t_gap=3,
+        points={'lon':[116.3833], 'lat':[39.9]},
+        initTime=None):
+
+    """
+    Retrieve the point series of the station synthetical forecast,
+    all points are read in one pass (also used by the batch of stations).
+    :return: dict of the fields, the last dimension is the points.
+    """
+
     #+get all the directories needed
     try:
         dir_rqd=[ 
@@ -90,26 +118,23 @@ def Station_Synthetical_Forecast_From_Cassandra(
 
     fhours = np.arange(t_range[0], t_range[1], t_gap)
 
-    for ifhour in fhours:
-        if (ifhour == fhours[0] ):
-            time_all=datetime(y_s['SCMOC'],m_s['SCMOC'],d_s['SCMOC'],h_s['SCMOC'])+timedelta(hours=int(ifhour))
-        else:
-            time_all=np.append(time_all,datetime(y_s['SCMOC'],m_s['SCMOC'],d_s['SCMOC'],h_s['SCMOC'])+timedelta(hours=int(ifhour)))            
+    time_all=utl.forecast_time_axis(datetime(y_s['SCMOC'],m_s['SCMOC'],d_s['SCMOC'],h_s['SCMOC']), fhours)
 
     filenames = [last_file[model]+'.'+str(fhour).zfill(3) for fhour in fhours]
     t2m=utl.get_model_points_gy(dir_rqd[9], filenames, points,allExists=False)
     
     if(name_opt[0] == 'rh2m'):
         rh2m=utl.get_model_points_gy(dir_opt[0], filenames, points,allExists=False)
-        Td2m=mpcalc.dewpoint_rh(t2m['data'].values*units('degC'),rh2m['data'].values/100.)
+        Td2m=derived.field('td',{'t':t2m['data'].values,'rh':rh2m['data'].values},
+            model=model,init_time=last_file[model],fhour=fhours,levels='2m',region=points)
         p_vapor=(rh2m['data'].values/100.)*6.105*(math.e**((17.27*t2m['data'].values/(237.7+t2m['data'].values))))
 
     if(name_opt[0] == 'Td2m'):
         Td2m=utl.get_model_points_gy(dir_opt[0], filenames, points,allExists=False)        
-        rh2m=mpcalc.relative_humidity_from_dewpoint(t2m['data'].values* units('degC'),
-                Td2m['data'].values* units('degC'))
-        p_vapor=(np.array(rh2m))*6.105*(math.e**((17.27*t2m['data'].values/(237.7+t2m['data'].values))))
-        Td2m=np.array(Td2m['data'].values)* units('degC')
+        rh2m=derived.field('rh_from_td',{'t':t2m['data'].values,'td':Td2m['data'].values},
+            model=model,init_time=last_file[model],fhour=fhours,levels='2m',region=points)
+        p_vapor=rh2m*6.105*(math.e**((17.27*t2m['data'].values/(237.7+t2m['data'].values))))
+        Td2m=kernels.field(Td2m['data'].values)
 
     u10m=utl.get_model_points_gy(dir_rqd[10], filenames, points,allExists=False)
     v10m=utl.get_model_points_gy(dir_rqd[11], filenames, points,allExists=False)
@@ -163,15 +188,108 @@ def Station_Synthetical_Forecast_From_Cassandra(
             filenames = [last_file[model]+'.'+str(fhour+12).zfill(3) for fhour in fhours]
         gust10m=utl.get_model_points_gy(dir_rqd[1], filenames, points,allExists=False)        
         
-    sta_graphics.draw_Station_Synthetical_Forecast_From_Cassandra(
-            t2m=t2m,Td2m=Td2m,AT=AT,u10m=u10m,v10m=v10m,u100m=u100m,v100m=v100m,
-            gust10m=gust10m,wsp10m=wsp10m,wsp100m=wsp100m,r03=r03,TCDC=TCDC,LCDC=LCDC,
-            draw_VIS=draw_VIS,VIS=VIS,drw_thr=drw_thr,
-            time_all=time_all,
-            model=model,points=points,
-            output_dir=output_dir,extra_info=extra_info)
+    return {'t2m':t2m,'Td2m':Td2m,'AT':AT,'u10m':u10m,'v10m':v10m,'u100m':u100m,'v100m':v100m,
+            'gust10m':gust10m,'wsp10m':wsp10m,'wsp100m':wsp100m,'r03':r03,'TCDC':TCDC,'LCDC':LCDC,
+            'VIS':VIS,'time_all':time_all}
+
+# templates of the meteogram, one for every worker process
+_meteogram_templates={}
+
+def _station_slice(value, index):
+    """
+    Data of the points of the index list, the points dimension is kept.
+    """
+    if hasattr(value, 'isel'):
+        return value.isel(points=list(index))
+    return value[..., list(index)]
+
+def _render_meteograms(data, points, extra_infos, model, output_dir, draw_VIS, drw_thr):
+    key=(draw_VIS, drw_thr)
+    template=_meteogram_templates.get(key)
+    if template is None:
+        template=sta_graphics.MeteogramTemplate(draw_VIS=draw_VIS, drw_thr=drw_thr)
+        _meteogram_templates[key]=template
+    outputs=[]
+    for i in range(len(points['lon'])):
+        station={name:_station_slice(value, [i]) for name, value in data.items() if name != 'time_all'}
+        try:
+            outputs.append(template.render(
+                time_all=data['time_all'],model=model,
+                points={'lon':[points['lon'][i]], 'lat':[points['lat'][i]]},
+                output_dir=output_dir,extra_info=extra_infos[i],**station))
+        except Exception as e:
+            print('----station [%s,%s] failed: %s' % (points['lon'][i], points['lat'][i], e))
+            outputs.append(None)
+    return outputs
+
+@instrument.product
+def Station_Synthetical_Forecast_batch(
+        model='ECMWF',
+        output_dir=None,
+        t_range=[0,84],
+        t_gap=3,
+        points={'lon':[116.3833], 'lat':[39.9]},
+        initTime=None,
+        draw_VIS=True,drw_thr=False,
+        extra_info=None,
+        max_workers=None,executor=None):
+
+    """
+    Station synthetical forecast of many stations. The point series of
+    all stations are retrieved once, every worker builds the meteogram
+    once (MeteogramTemplate) and only redraws the data of its stations.
+    :param points: {'lon':[...], 'lat':[...]} of the stations.
+    :param extra_info: list of extra_info of every station, default the
+                       output_tail_name is the position of the station.
+    :param max_workers: render processes, the stations are split into
+                        one chunk per worker.
+    :param executor: concurrent.futures executor, like RenderPool().executor.
+    :return: list of the image paths, None for the failed stations.
+    """
+
+    if(output_dir == None):
+        raise ValueError('output_dir is needed for a batch of stations')
+    n_sta=len(points['lon'])
+    if(extra_info == None):
+        extra_info=[{'output_head_name':' ',
+                     'output_tail_name':'_%.2f_%.2f' % (points['lon'][i], points['lat'][i]),
+                     'point_name':' '} for i in range(n_sta)]
+    if(len(extra_info) != n_sta):
+        raise ValueError('extra_info should have one item for every station')
+
+    data=Station_Synthetical_Forecast_data(
+        model=model,t_range=t_range,t_gap=t_gap,points=points,initTime=initTime)
+    instrument.phase('draw')
+
+    max_workers=max(min(max_workers or os.cpu_count() or 1, n_sta), 1)
+    size=-(-n_sta//max_workers)
+    chunks=[]
+    for i0 in range(0, n_sta, size):
+        index=list(range(i0, min(i0+size, n_sta)))
+        chunk={name:value if name == 'time_all' else _station_slice(value, index)
+               for name, value in data.items()}
+        chunk_points={'lon':[points['lon'][i] for i in index], 'lat':[points['lat'][i] for i in index]}
+        chunks.append((chunk, chunk_points, [extra_info[i] for i in index]))
+
+    own_executor=executor is None and len(chunks) > 1
+    if own_executor:
+        executor=ProcessPoolExecutor(max_workers=len(chunks))
+    try:
+        if executor is None:
+            outputs=[_render_meteograms(chunk, chunk_points, chunk_info, model, output_dir, draw_VIS, drw_thr)
+                     for chunk, chunk_points, chunk_info in chunks]
+        else:
+            futures=[executor.submit(_render_meteograms, chunk, chunk_points, chunk_info,
+                                     model, output_dir, draw_VIS, drw_thr)
+                     for chunk, chunk_points, chunk_info in chunks]
+            outputs=[future.result() for future in futures]
+    finally:
+        if own_executor:
+            executor.shutdown(wait=True)
+    return [path for chunk_outputs in outputs for path in chunk_outputs]
 
 
+@instrument.product
 def Station_Snow_Synthetical_Forecast_From_Cassandra(
         model='ECMWF',
         output_dir=None,
@@ -243,26 +361,23 @@ def Station_Snow_Synthetical_Forecast_From_Cassandra(
 
     fhours = np.arange(t_range[0], t_range[1], t_gap)
 
-    for ifhour in fhours:
-        if (ifhour == fhours[0] ):
-            time_all=datetime(y_s['SCMOC'],m_s['SCMOC'],d_s['SCMOC'],h_s['SCMOC'])+timedelta(hours=int(ifhour))
-        else:
-            time_all=np.append(time_all,datetime(y_s['SCMOC'],m_s['SCMOC'],d_s['SCMOC'],h_s['SCMOC'])+timedelta(hours=int(ifhour)))            
+    time_all=utl.forecast_time_axis(datetime(y_s['SCMOC'],m_s['SCMOC'],d_s['SCMOC'],h_s['SCMOC']), fhours)
 
     filenames = [last_file[model]+'.'+str(fhour).zfill(3) for fhour in fhours]
     t2m=utl.get_model_points_gy(dir_rqd[9], filenames, points,allExists=False)
     
     if(name_opt[0] == 'rh2m'):
         rh2m=utl.get_model_points_gy(dir_opt[0], filenames, points,allExists=False)
-        Td2m=mpcalc.dewpoint_rh(t2m['data'].values*units('degC'),rh2m['data'].values/100.)
+        Td2m=derived.field('td',{'t':t2m['data'].values,'rh':rh2m['data'].values},
+            model=model,init_time=last_file[model],fhour=fhours,levels='2m',region=points)
         p_vapor=(rh2m['data'].values/100.)*6.105*(math.e**((17.27*t2m['data'].values/(237.7+t2m['data'].values))))
 
     if(name_opt[0] == 'Td2m'):
         Td2m=utl.get_model_points_gy(dir_opt[0], filenames, points,allExists=False)        
-        rh2m=mpcalc.relative_humidity_from_dewpoint(t2m['data'].values* units('degC'),
-                Td2m['data'].values* units('degC'))
-        p_vapor=(np.array(rh2m))*6.105*(math.e**((17.27*t2m['data'].values/(237.7+t2m['data'].values))))
-        Td2m=np.array(Td2m['data'].values)* units('degC')
+        rh2m=derived.field('rh_from_td',{'t':t2m['data'].values,'td':Td2m['data'].values},
+            model=model,init_time=last_file[model],fhour=fhours,levels='2m',region=points)
+        p_vapor=rh2m*6.105*(math.e**((17.27*t2m['data'].values/(237.7+t2m['data'].values))))
+        Td2m=kernels.field(Td2m['data'].values)
 
     #SN06_ensm=utl.get_model_points_gy(dir_rqd[12], filenames, points,allExists=False)
     '''
@@ -356,14 +471,16 @@ def Station_Snow_Synthetical_Forecast_From_Cassandra(
             
 
 
-import matplotlib.pyplot as plt
-import pandas as pd
+plt = lazy_import('matplotlib.pyplot')
+pd = lazy_import('pandas')
 
-import metpy.calc as mpcalc
-from metpy.cbook import get_test_data
-from metpy.plots import add_metpy_logo, SkewT
-from metpy.units import units
+mpcalc = lazy_import('metpy.calc')
+get_test_data = lazy_attr('metpy.cbook', 'get_test_data')
+add_metpy_logo = lazy_attr('metpy.plots', 'add_metpy_logo')
+SkewT = lazy_attr('metpy.plots', 'SkewT')
+units = lazy_attr('metpy.units', 'units')
 
+@instrument.product
 def sta_SkewT(model='ECMWF',points={'lon':[116.3833], 'lat':[39.9]},
     levels=[1000, 950, 925, 900, 850, 800, 700,600,500,400,300,250,200,150,100],
     fhour=3,output_dir=None):
@@ -397,15 +514,16 @@ def sta_SkewT(model='ECMWF',points={'lon':[116.3833], 'lat':[39.9]},
     RH_4D=get_model_3D_grid(directory=data_dir[4][0:-1],filename=filename,levels=levels, allExists=False)
     RH_2D=RH_4D.interp(lon=('points', points['lon']), lat=('points', points['lat']))
 
-    wind_dir_2D=mpcalc.wind_direction(u_2D['data'].values* units.meter / units.second,
-        v_2D['data'].values* units.meter / units.second)
-    wsp10m_2D=(u_2D['data']**2+v_2D['data']**2)**0.5
-    Td2m=mpcalc.dewpoint_rh(TMP_2D['data'].values*units('degC'),RH_2D['data'].values/100.)
+    wind_dir_2D=kernels.wind_direction(kernels.field(u_2D['data'].values),
+        kernels.field(v_2D['data'].values))
+    column=dict(model=model,init_time=initTime,fhour=fhour,levels=levels,region=points)
+    wsp10m_2D=derived.field('wsp',{'u':u_2D['data'].values,'v':v_2D['data'].values},**column)
+    Td2m=derived.field('td',{'t':TMP_2D['data'].values,'rh':RH_2D['data'].values},**column)
 
     p = np.squeeze(levels) * units.hPa
     T = np.squeeze(TMP_2D['data'].values) * units.degC
     Td = np.squeeze(np.array(Td2m)) * units.degC
-    wind_speed = np.squeeze(wsp10m_2D.values) * units.meter
+    wind_speed = np.squeeze(wsp10m_2D) * units.meter
     wind_dir = np.squeeze(np.array(wind_dir_2D)) * units.degrees
     u=np.squeeze(u_2D['data'].values)* units.meter
     v=np.squeeze(v_2D['data'].values)* units.meter
@@ -418,16 +536,134 @@ def sta_SkewT(model='ECMWF',points={'lon':[116.3833], 'lat':[39.9]},
 
     sta_graphics.draw_sta_skewT(
         p=p,T=T,Td=Td,wind_speed=wind_speed,wind_dir=wind_dir,u=u,v=v,
-        fcst_info=fcst_info)
-
+        fcst_info=fcst_info,output_dir=output_dir)
+
+def _render_skewTs(stations, init_time, fhour, model, output_dir):
+    outputs=[]
+    for station in stations:
+        fcst_info=xr.DataArray(station['u'][np.newaxis,:],dims=['time','level'],
+                        coords={'forecast_reference_time':init_time,
+                                'forecast_period':('time',[fhour])},
+                        attrs={'points':{'lon':[station['lon']], 'lat':[station['lat']]},
+                               'model':model,
+                               'output_tail_name':station['output_tail_name']})
+        try:
+            sta_graphics.draw_sta_skewT(
+                p=station['p']*units.hPa,T=station['T']*units.degC,Td=station['Td']*units.degC,
+                wind_speed=station['wind_speed']*units.meter,wind_dir=station['wind_dir']*units.degrees,
+                u=station['u']*units.meter,v=station['v']*units.meter,
+                fcst_info=fcst_info,output_dir=output_dir,parcel=station['parcel'])
+            outputs.append(station['output_tail_name'])
+        except Exception as e:
+            print('----station [%s,%s] failed: %s' % (station['lon'], station['lat'], e))
+            outputs.append(None)
+    return outputs
+
+@instrument.product
+def sta_SkewT_batch(model='ECMWF',points={'lon':[116.3833], 'lat':[39.9]},
+    levels=[1000, 950, 925, 900, 850, 800, 700,600,500,400,300,250,200,150,100],
+    fhour=3,initTime=None,output_dir=None,max_workers=None,executor=None):
+
+    """
+    Skew-T diagrams of many stations from one fetch of the 3D grids.
+    The columns of all stations are interpolated at once, the dewpoint,
+    wind direction and parcel profiles are computed in bulk
+    (lib/convection.py), the diagrams are rendered in a process pool.
+    :param points: {'lon':[...], 'lat':[...]} of the stations.
+    :param max_workers: render processes, the stations are split into
+                        one chunk per worker.
+    :param executor: concurrent.futures executor, like RenderPool().executor.
+    :return: list of the output_tail_name of every station of points,
+             None for the stations outside the grid and the failed ones.
+    """
+
+    if(output_dir == None):
+        raise ValueError('output_dir is needed for a batch of stations')
+    try:
+        data_dir = [utl.Cassandra_dir(data_type='high',data_source=model,var_name='TMP',lvl=''),
+                    utl.Cassandra_dir(data_type='high',data_source=model,var_name='UGRD',lvl=''),
+                    utl.Cassandra_dir(data_type='high',data_source=model,var_name='VGRD',lvl=''),
+                    utl.Cassandra_dir(data_type='high',data_source=model,var_name='HGT',lvl=''),
+                    utl.Cassandra_dir(data_type='high',data_source=model,var_name='RH',lvl='')]
+    except KeyError:
+        raise ValueError('Can not find all directories needed')
 
+    if(initTime == None):
+        initTime = get_latest_initTime(data_dir[0][0:-1]+"850")
+    filename = initTime+'.'+str(fhour).zfill(3)
+    # every volume is read once for all stations
+    grids=[]
+    for directory in data_dir:
+        grid=get_model_3D_grid(directory=directory[0:-1],filename=filename,levels=levels)
+        if grid is None:
+            return None
+        grids.append(grid)
+
+    instrument.phase('crop')
+    TMP_4D=grids[0]
+    init_time=np.asarray(TMP_4D.coords['forecast_reference_time'].values).reshape(-1)[0]
+    # T, u, v, HGT, RH of all stations (variable, level, points)
+    columns=utl.interp_points(TMP_4D['lon'].values, TMP_4D['lat'].values,
+        np.stack([grid['data'].values[0] for grid in grids]), points)
+    p=np.asarray(TMP_4D['level'].values, dtype=float)
+    order=np.argsort(-p)
+    p=p[order]
+    T,u,v,HGT,RH=[column[order] for column in columns]
+
+    instrument.phase('derive')
+    column=dict(model=model,init_time=init_time,fhour=fhour,levels=p,region=points)
+    Td=derived.field('td',{'t':T,'rh':RH},**column)
+    wind_speed=derived.field('wsp',{'u':u,'v':v},**column)
+    wind_dir=kernels.wind_direction(u,v)
+    diag=convection.convective_indices(p,T,td=Td)
+
+    n_sta=len(points['lon'])
+    # the stations inside the grid, by their position in points
+    rendered=[i for i in range(n_sta) if np.all(np.isfinite(T[:,i]))]
+    stations=[{'lon':points['lon'][i],'lat':points['lat'][i],
+               'output_tail_name':'_%.2f_%.2f' % (points['lon'][i], points['lat'][i]),
+               'p':p,'T':T[:,i],'Td':Td[:,i],'u':u[:,i],'v':v[:,i],
+               'wind_speed':wind_speed[:,i],'wind_dir':wind_dir[:,i],
+               'parcel':{'lcl_pressure':diag['LCL'][i],
+                         'lcl_temperature':diag['lcl_temperature'][i],
+                         'prof':diag['prof'][:,i]}}
+              for i in rendered]
+    if len(stations) < n_sta:
+        print('----%d stations outside the grid skipped' % (n_sta-len(stations)))
+
+    instrument.phase('draw')
+    max_workers=max(min(max_workers or os.cpu_count() or 1, len(stations)), 1)
+    size=-(-len(stations)//max_workers) if stations else 1
+    chunks=[stations[i:i+size] for i in range(0, len(stations), size)]
+    fhour_real=int(TMP_4D['forecast_period'].values[0])
+    own_executor=executor is None and len(chunks) > 1
+    if own_executor:
+        executor=ProcessPoolExecutor(max_workers=len(chunks))
+    try:
+        if executor is None:
+            outputs=[_render_skewTs(chunk, init_time, fhour_real, model, output_dir)
+                     for chunk in chunks]
+        else:
+            futures=[executor.submit(_render_skewTs, chunk, init_time, fhour_real, model, output_dir)
+                     for chunk in chunks]
+            outputs=[future.result() for future in futures]
+    finally:
+        if own_executor:
+            executor.shutdown(wait=True)
+    names=[None]*n_sta
+    for i, name in zip(rendered, [name for chunk_outputs in outputs for name in chunk_outputs]):
+        names[i]=name
+    return names
+
+
+@instrument.product
 def point_wind_time_fcst_according_to_3D_wind(
         model='ECMWF',
         output_dir=None,
         t_range=[0,60],
         t_gap=3,
         points={'lon':[116.3833], 'lat':[39.9], 'altitude':[1351]},
-        initTime=None,draw_obs=True,obs_ID=54511,day_back=0,
+        initTime=None,draw_obs=True,obs_ID=54511,day_back=0,obs_store_dir=None,
         extra_info={
             'output_head_name':' ',
             'output_tail_name':' ',
@@ -460,29 +696,12 @@ def point_wind_time_fcst_according_to_3D_wind(
     #obs
     if(draw_obs == True):
         initial_time=pd.to_datetime(str(V_4D['forecast_reference_time'].values)).replace(tzinfo=None).to_pydatetime()
-        sign=0
-        for ifhour in V_4D['forecast_period'].values:
-            temp=(initial_time+timedelta(hours=ifhour))
-            filenames_obs=temp.strftime("%Y%m%d%H")+'0000.000'
-            try:
-                obs_data=get_station_data('SURFACE/PLOT/',filename=filenames_obs)
-            except:
-                break
-
-            if(obs_data is not None):
-                temp=obs_data.where(obs_data['ID']==obs_ID).dropna(how='all')
-                if ((ifhour == V_4D['forecast_period'].values[0]) or ((ifhour > V_4D['forecast_period'].values[0]) and (sign==0))):
-                    if(len(temp) > 0):
-                        sta_obs_data=obs_data.where(obs_data['ID']==obs_ID).dropna(how='all').reset_index()
-                        sign=1
-                else:
-                    if(len(temp) > 0):
-                        sta_obs_data=sta_obs_data.append(temp).reset_index()
-            if(obs_data is None):
-                break
-        try:
-            sta_obs_data
-        except:
+        obs_times=[initial_time+timedelta(hours=int(ifhour)) for ifhour in V_4D['forecast_period'].values]
+        #每个逐小时文件只下载一次, 之后按站号和时间直接读取
+        store=ObsStore(root_dir=obs_store_dir)
+        store.ingest(obs_times)
+        sta_obs_data=store.get_series(obs_ID,obs_times[0],obs_times[-1])
+        if(len(sta_obs_data) == 0):
             draw_obs=False
 
     delt_xy=HGT_4D['lon'].values[1]-HGT_4D['lon'].values[0]
@@ -526,6 +745,7 @@ def point_wind_time_fcst_according_to_3D_wind(
         extra_info=extra_info
             )        
 
+@instrument.product
 def point_fcst(
         model='ECMWF',
         output_dir=None,
@@ -567,6 +787,7 @@ def point_fcst(
         extra_info=extra_info
             )                 
 
+@instrument.product
 def point_fcst_according_to_3D_field(
         model='ECMWF',
         output_dir=None,
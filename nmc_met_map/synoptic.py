@@ -4,13 +4,14 @@
 Synoptic analysis or diagnostic maps for numeric weather model.
 """
 import numpy as np
-from nmc_met_io.retrieve_micaps_server import get_model_grid,get_model_3D_grid
-from nmc_met_map.graphics import synoptic_graphics
+from nmc_met_map.lib.retrieve import get_model_grid,get_model_3D_grid
+from nmc_met_map.lib.lazy import lazy_import
+synoptic_graphics = lazy_import('nmc_met_map.graphics.synoptic_graphics')
 import nmc_met_map.lib.utility as utl
-import metpy.calc as mpcalc
-from metpy.units import units
-import xarray as xr
+from nmc_met_map.lib import instrument, kernels, derived
+xr = lazy_import('xarray')
 
+@instrument.product
 def gh_uv_mslp(initial_time=None, fhour=0, day_back=0,model='ECMWF',
     gh_lev='500',uv_lev='850',
     map_ratio=19/9,zoom_ratio=20,cntr_pnt=[102,34],
@@ -20,6 +21,27 @@ def gh_uv_mslp(initial_time=None, fhour=0, day_back=0,model='ECMWF',
     if(area != '全国'):
         south_China_sea=False
 
+    data = gh_uv_mslp_data(initial_time=initial_time, fhour=fhour, day_back=day_back,
+        model=model, gh_lev=gh_lev, uv_lev=uv_lev,
+        map_ratio=map_ratio, zoom_ratio=zoom_ratio, cntr_pnt=cntr_pnt, area=area)
+    if data is None:
+        return
+
+    synoptic_graphics.draw_gh_uv_mslp(
+        mslp=data['mslp'], gh=data['gh'], uv=data['uv'],
+        map_extent=data['map_extent'], regrid_shape=20,
+        city=city,south_China_sea=south_China_sea,
+        output_dir=output_dir,Global=Global)
+
+def gh_uv_mslp_data(initial_time=None, fhour=0, day_back=0,model='ECMWF',
+    gh_lev='500',uv_lev='850',
+    map_ratio=19/9,zoom_ratio=20,cntr_pnt=[102,34],area = '全国'):
+
+    """
+    Retrieve and crop the data of gh_uv_mslp (also used by the animation frames).
+    :return: dict of gh, uv, mslp and map_extent, None if the data is missing.
+    """
+
     # micaps data directory
     try:
         data_dir = [utl.Cassandra_dir(data_type='high',data_source=model,var_name='HGT',lvl=gh_lev),
@@ -54,6 +76,7 @@ def gh_uv_mslp(initial_time=None, fhour=0, day_back=0,model='ECMWF',
 
 
     # prepare data
+    instrument.phase('crop')
 
     if(area != None):
         cntr_pnt,zoom_ratio=utl.get_map_area(area_name=area)
@@ -95,12 +118,9 @@ def gh_uv_mslp(initial_time=None, fhour=0, day_back=0,model='ECMWF',
             'lat': mslp.coords['lat'].values[idx_y2],
              'data': mslp['data'].values[0,idx_y2[0][0]:(idx_y2[0][-1]+1),idx_x2[0][0]:(idx_x2[0][-1]+1)]}
 
-    synoptic_graphics.draw_gh_uv_mslp(
-        mslp=mslp, gh=gh, uv=uv,
-        map_extent=map_extent, regrid_shape=20,
-        city=city,south_China_sea=south_China_sea,
-        output_dir=output_dir,Global=Global)
+    return {'gh': gh, 'uv': uv, 'mslp': mslp, 'map_extent': map_extent}
 
+@instrument.product
 def gh_uv_wsp(initial_time=None, fhour=6, day_back=0,model='ECMWF',
     gh_lev='500',uv_lev='850',
     map_ratio=19/9,zoom_ratio=20,cntr_pnt=[102,34],
@@ -155,6 +175,7 @@ def gh_uv_wsp(initial_time=None, fhour=6, day_back=0,model='ECMWF',
     init_time = gh.coords['forecast_reference_time'].values
 
     # prepare data
+    instrument.phase('crop')
 
     if(area != None):
         cntr_pnt,zoom_ratio=utl.get_map_area(area_name=area)
@@ -193,8 +214,10 @@ def gh_uv_wsp(initial_time=None, fhour=6, day_back=0,model='ECMWF',
              'lev':uv_lev}
     wsp = {'lon': u.coords['lon'].values[idx_x2],
             'lat': u.coords['lat'].values[idx_y2],
-             'data': np.squeeze((u['data'].values[0,0,idx_y2[0][0]:(idx_y2[0][-1]+1),idx_x2[0][0]:(idx_x2[0][-1]+1)])**2+
-             (v['data'].values[0,0,idx_y2[0][0]:(idx_y2[0][-1]+1),idx_x2[0][0]:(idx_x2[0][-1]+1)])**2)**0.5}
+             'data': derived.field('wsp',
+                {'u': u['data'].values[0,0,idx_y2[0][0]:(idx_y2[0][-1]+1),idx_x2[0][0]:(idx_x2[0][-1]+1)],
+                 'v': v['data'].values[0,0,idx_y2[0][0]:(idx_y2[0][-1]+1),idx_x2[0][0]:(idx_x2[0][-1]+1)]},
+                model=model,init_time=init_time,fhour=fhour,levels=uv_lev,region=map_extent)}
 
 
     synoptic_graphics.draw_gh_uv_wsp(
@@ -203,6 +226,7 @@ def gh_uv_wsp(initial_time=None, fhour=6, day_back=0,model='ECMWF',
         city=city,south_China_sea=south_China_sea,
         output_dir=output_dir,Global=Global) 
 
+@instrument.product
 def gh_uv_r6(initial_time=None, fhour=6, day_back=0,model='ECMWF',
     gh_lev='500',uv_lev='850',
     map_ratio=19/9,zoom_ratio=20,cntr_pnt=[102,34],
@@ -245,6 +269,7 @@ def gh_uv_r6(initial_time=None, fhour=6, day_back=0,model='ECMWF',
 
 
     # prepare data
+    instrument.phase('crop')
 
     if(area != None):
         cntr_pnt,zoom_ratio=utl.get_map_area(area_name=area)
@@ -293,6 +318,7 @@ def gh_uv_r6(initial_time=None, fhour=6, day_back=0,model='ECMWF',
         output_dir=output_dir,Global=Global)
 
 
+@instrument.product
 def PV_Div_uv(initial_time=None, fhour=6, day_back=0,model='ECMWF',
     map_ratio=19/9,zoom_ratio=20,cntr_pnt=[102,34],
     levels=[1000, 950, 925, 900, 850, 800, 700,600,500,400,300,250,200,100],lvl_ana=250,
@@ -342,23 +368,10 @@ def PV_Div_uv(initial_time=None, fhour=6, day_back=0,model='ECMWF',
     lats = np.squeeze(rh['lat'].values)
     lons = np.squeeze(rh['lon'].values)
 
-    pres = np.array(levels)*100 * units('Pa')
-    tmpk = mpcalc.smooth_n_point(t['data'].values.squeeze(), 9, 2)*units('degC')
-    thta = mpcalc.potential_temperature(pres[:, None, None], tmpk)
-
-    uwnd = mpcalc.smooth_n_point(u['data'].values.squeeze(), 9, 2)*units.meter/units.second
-    vwnd = mpcalc.smooth_n_point(v['data'].values.squeeze(), 9, 2)*units.meter/units.second
-
-    dx, dy = mpcalc.lat_lon_grid_deltas(lons, lats)
-
-    # Comput the PV on all isobaric surfaces
-    pv = mpcalc.potential_vorticity_baroclinic(thta, pres[:, None, None], uwnd, vwnd,
-                                            dx[None, :, :], dy[None, :, :],
-                                            lats[None, :, None] * units('degrees'))
-    div = mpcalc.divergence(uwnd, vwnd, dx[None, :, :], dy[None, :, :], dim_order='yx')
-
     # prepare data
-    idx_z1 = list(pres.m).index(((lvl_ana * units('hPa')).to(pres.units)).m)
+    instrument.phase('crop')
+    pres = kernels.field(levels)
+    idx_z1 = list(pres).index(lvl_ana)
     if(area != None):
         cntr_pnt,zoom_ratio=utl.get_map_area(area_name=area)
 
@@ -377,11 +390,43 @@ def PV_Div_uv(initial_time=None, fhour=6, day_back=0,model='ECMWF',
     idx_y1 = np.where((lats > map_extent[2]-delt_y) & 
         (lats < map_extent[3]+delt_y))
     #- to solve the problem of labels on all the contours
+
+    # the derivation is done on the window with a halo of the two passes
+    # of the 9 point smoother and the centered differences, and on the
+    # levels of the vertical differences at lvl_ana
+    halo = 2+1
+    win_x = utl.halo_window(idx_x1[0], len(lons), halo)
+    win_y = utl.halo_window(idx_y1[0], len(lats), halo)
+    z0 = min(max(idx_z1-1, 0), max(len(pres)-3, 0))
+    win_z = slice(z0, z0+3)
+    window = (win_z, win_y, win_x)
+    lons = lons[win_x]
+    lats = lats[win_y]
+    pres = pres[win_z]
+    idx_z1 = idx_z1-z0
+    idx_x1 = (idx_x1[0]-win_x.start,)
+    idx_y1 = (idx_y1[0]-win_y.start,)
+
+    instrument.phase('derive')
+    # hPa
+    tmpc = kernels.smooth_n_point(kernels.field(t['data'].values.squeeze()[window]), 9, 2)
+    thta = kernels.potential_temperature(pres[:, None, None], tmpc)
+
+    uwnd = kernels.smooth_n_point(kernels.field(u['data'].values.squeeze()[window]), 9, 2)
+    vwnd = kernels.smooth_n_point(kernels.field(v['data'].values.squeeze()[window]), 9, 2)
+
+    dx, dy = kernels.lat_lon_grid_deltas(lons, lats)
+
+    # Comput the PV on all isobaric surfaces
+    pv = kernels.potential_vorticity_baroclinic(thta, pres*100., uwnd, vwnd, dx, dy,
+                                                kernels.field(lats)[:, None])
+    div = kernels.divergence(uwnd, vwnd, dx, dy)
+
     init_time = u.coords['forecast_reference_time'].values
     pv = {
         'lon': lons[idx_x1],
         'lat': lats[idx_y1],
-        'data': np.array(pv)[idx_z1,idx_y1[0][0]:(idx_y1[0][-1]+1),idx_x1[0][0]:(idx_x1[0][-1]+1)],
+        'data': pv[idx_z1,idx_y1[0][0]:(idx_y1[0][-1]+1),idx_x1[0][0]:(idx_x1[0][-1]+1)],
         'lev':str(lvl_ana),
         'model':model,
         'fhour':fhour,
@@ -389,13 +434,13 @@ def PV_Div_uv(initial_time=None, fhour=6, day_back=0,model='ECMWF',
     uv = {
         'lon': lons[idx_x1],
         'lat': lats[idx_y1],
-        'udata': np.array(uwnd)[idx_z1,idx_y1[0][0]:(idx_y1[0][-1]+1),idx_x1[0][0]:(idx_x1[0][-1]+1)],
-        'vdata': np.array(vwnd)[idx_z1,idx_y1[0][0]:(idx_y1[0][-1]+1),idx_x1[0][0]:(idx_x1[0][-1]+1)],
+        'udata': uwnd[idx_z1,idx_y1[0][0]:(idx_y1[0][-1]+1),idx_x1[0][0]:(idx_x1[0][-1]+1)],
+        'vdata': vwnd[idx_z1,idx_y1[0][0]:(idx_y1[0][-1]+1),idx_x1[0][0]:(idx_x1[0][-1]+1)],
         'lev':str(lvl_ana)}
     div = {
         'lon': lons[idx_x1],
         'lat': lats[idx_y1],
-        'data': np.array(div)[idx_z1,idx_y1[0][0]:(idx_y1[0][-1]+1),idx_x1[0][0]:(idx_x1[0][-1]+1)],
+        'data': div[idx_z1,idx_y1[0][0]:(idx_y1[0][-1]+1),idx_x1[0][0]:(idx_x1[0][-1]+1)],
         'lev':str(lvl_ana)}
 
     synoptic_graphics.draw_PV_Div_uv(
@@ -4,32 +4,35 @@
 Synoptic analysis or diagnostic maps for numeric weather model.
 """
 import numpy as np
-from nmc_met_io.retrieve_micaps_server import get_model_grid,get_model_3D_grid
+from nmc_met_map.lib.retrieve import get_model_grid,get_model_3D_grid
 import nmc_met_map.lib.utility as utl
-import metpy.calc as mpcalc
-from metpy.units import units
-import xarray as xr
+from nmc_met_map.lib import instrument, kernels
+from nmc_met_map.lib.lazy import lazy_import, lazy_attr
+mpcalc = lazy_import('metpy.calc')
+units = lazy_attr('metpy.units', 'units')
+xr = lazy_import('xarray')
 
 from datetime import datetime, timedelta
-import cartopy.crs as ccrs
-import cartopy.feature as cfeature
-import matplotlib.pyplot as plt
-import metpy.calc
-from netCDF4 import num2date
-
-import cartopy.crs as ccrs
-import cartopy.feature as cfeature
-import matplotlib.lines as lines
-import matplotlib.patches as mpatches
-import matplotlib.pyplot as plt
-import metpy.calc as mpcalc
-from metpy.units import units
-from netCDF4 import num2date
+ccrs = lazy_import('cartopy.crs')
+cfeature = lazy_import('cartopy.feature')
+plt = lazy_import('matplotlib.pyplot')
+metpy = lazy_import('metpy')
+num2date = lazy_attr('netCDF4', 'num2date')
+
+ccrs = lazy_import('cartopy.crs')
+cfeature = lazy_import('cartopy.feature')
+lines = lazy_import('matplotlib.lines')
+mpatches = lazy_import('matplotlib.patches')
+plt = lazy_import('matplotlib.pyplot')
+mpcalc = lazy_import('metpy.calc')
+units = lazy_attr('metpy.units', 'units')
+num2date = lazy_attr('netCDF4', 'num2date')
 import numpy as np
 import numpy.ma as ma
-from scipy.ndimage import gaussian_filter
-from nmc_met_map.graphics import synthetical_graphics
+gaussian_filter = lazy_attr('scipy.ndimage', 'gaussian_filter')
+synthetical_graphics = lazy_import('nmc_met_map.graphics.synthetical_graphics')
 
+@instrument.product
 def Miller_Composite_Chart(initial_time=None, fhour=24, day_back=0,model='GRAPES_GFS',
     map_ratio=19/9,zoom_ratio=20,cntr_pnt=[102,34],
     Global=False,
@@ -121,56 +124,9 @@ def Miller_Composite_Chart(initial_time=None, fhour=24, day_back=0,model='GRAPES
 
     lats = np.squeeze(rh_700['lat'].values)
     lons = np.squeeze(rh_700['lon'].values)
-    x,y=np.meshgrid(rh_700['lon'], rh_700['lat'])
-
-    tmp_700 = t_700['data'].values.squeeze()*units('degC')
-    u_300 = (u_300['data'].values.squeeze()*units.meter/units.second).to('kt')
-    v_300 = (v_300['data'].values.squeeze()*units.meter/units.second).to('kt')
-    u_500 = (u_500['data'].values.squeeze()*units.meter/units.second).to('kt')
-    v_500 = (v_500['data'].values.squeeze()*units.meter/units.second).to('kt')
-    u_850 = (u_850['data'].values.squeeze()*units.meter/units.second).to('kt')
-    v_850 = (v_850['data'].values.squeeze()*units.meter/units.second).to('kt')
-    hgt_500 = (hgt_500['data'].values.squeeze())*10/9.8*units.meter
-    rh_700 = rh_700['data'].values.squeeze()
-    lifted_index = BLI['data'].values.squeeze()*units.kelvin
-    Td_sfc = Td2m['data'].values.squeeze()*units('degC')
-    dx,dy=mpcalc.lat_lon_grid_deltas(lons,lats)
-
-    avor_500=mpcalc.absolute_vorticity(u_500,v_500,dx,dy,y*units.degree)
-    pmsl=PRMSL['data'].values.squeeze()*units('hPa')
-
-    hgt_500_2 = (hgt_500_2['data'].values.squeeze())*10/9.8*units.meter
-    pmsl2=PRMSL2['data'].values.squeeze()*units('hPa')
-
-    # 500 hPa CVA
-    vort_adv_500 = mpcalc.advection(avor_500, [u_500.to('m/s'), v_500.to('m/s')],
-                                    (dx, dy), dim_order='yx') * 1e9
-    vort_adv_500_smooth = gaussian_filter(vort_adv_500, 4)
-
-    wspd_300 = gaussian_filter(mpcalc.wind_speed(u_300, v_300), 5)
-    wspd_500 = gaussian_filter(mpcalc.wind_speed(u_500, v_500), 5)
-    wspd_850 = gaussian_filter(mpcalc.wind_speed(u_850, v_850), 5)
-
-    Td_dep_700 = tmp_700 - mpcalc.dewpoint_rh(tmp_700, rh_700 / 100.)
-
-    pmsl_change = pmsl - pmsl2
-    hgt_500_change = hgt_500 - hgt_500_2
-
-    mask_500 = ma.masked_less_equal(wspd_500, 0.66 * np.max(wspd_500)).mask
-    u_500[mask_500] = np.nan
-    v_500[mask_500] = np.nan
-
-    # 300 hPa
-    mask_300 = ma.masked_less_equal(wspd_300, 0.66 * np.max(wspd_300)).mask
-    u_300[mask_300] = np.nan
-    v_300[mask_300] = np.nan
-
-    # 850 hPa
-    mask_850 = ma.masked_less_equal(wspd_850, 0.66 * np.max(wspd_850)).mask
-    u_850[mask_850] = np.nan
-    v_850[mask_850] = np.nan
 
     # prepare data
+    instrument.phase('crop')
     if(area != None):
         cntr_pnt,zoom_ratio=utl.get_map_area(area_name=area)
 
@@ -189,6 +145,88 @@ def Miller_Composite_Chart(initial_time=None, fhour=24, day_back=0,model='GRAPES
     idx_y1 = np.where((lats > map_extent[2]-delt_y) & 
         (lats < map_extent[3]+delt_y))
 
+    # the map window starts on the points of the barbs every 12, 10 and 8
+    # points of the whole grid
+    map_x = utl.halo_window(idx_x1[0], len(lons), align=120)
+    map_y = utl.halo_window(idx_y1[0], len(lats), align=120)
+    # the derivation is done on the map window with a halo of the
+    # gaussian filter (radius int(4*sigma+0.5)) of the vorticity advection,
+    # sigma 4 after its two differences
+    halo = int(4*4+0.5)+2
+    win_x = utl.halo_window(np.arange(map_x.start, map_x.stop), len(lons), halo)
+    win_y = utl.halo_window(np.arange(map_y.start, map_y.stop), len(lats), halo)
+    window = (win_y, win_x)
+    lons = lons[win_x]
+    lats = lats[win_y]
+    # the map window in the derivation window
+    inner = (slice(map_y.start-win_y.start, map_y.stop-win_y.start),
+             slice(map_x.start-win_x.start, map_x.stop-win_x.start))
+
+    instrument.phase('derive')
+    # kt, the jets are the winds over 66% of the maximum of the whole
+    # grid, the three wind speeds are smoothed on the whole grid
+    wspd_300, wspd_500, wspd_850 = [
+        gaussian_filter(kernels.wind_speed(kernels.field(u['data'].values.squeeze()),
+                                           kernels.field(v['data'].values.squeeze()))*kernels.MS_TO_KT, 5)
+        for u, v in ((u_300, v_300), (u_500, v_500), (u_850, v_850))]
+    jet_300, jet_500, jet_850 = [0.66 * np.max(wspd) for wspd in (wspd_300, wspd_500, wspd_850)]
+
+    tmp_700 = kernels.field(t_700['data'].values.squeeze()[window])
+    u_300 = kernels.field(u_300['data'].values.squeeze()[window])
+    v_300 = kernels.field(v_300['data'].values.squeeze()[window])
+    u_500 = kernels.field(u_500['data'].values.squeeze()[window])
+    v_500 = kernels.field(v_500['data'].values.squeeze()[window])
+    u_850 = kernels.field(u_850['data'].values.squeeze()[window])
+    v_850 = kernels.field(v_850['data'].values.squeeze()[window])
+    hgt_500 = kernels.field(hgt_500['data'].values.squeeze()[window])*10/9.8
+    rh_700 = kernels.field(rh_700['data'].values.squeeze()[window])
+    lifted_index = kernels.field(BLI['data'].values.squeeze()[window])
+    Td_sfc = kernels.field(Td2m['data'].values.squeeze()[window])
+    dx,dy=kernels.lat_lon_grid_deltas(lons,lats)
+
+    avor_500=kernels.absolute_vorticity(u_500,v_500,dx,dy,kernels.field(lats)[:, None])
+    pmsl=kernels.field(PRMSL['data'].values.squeeze()[window])
+
+    hgt_500_2 = kernels.field(hgt_500_2['data'].values.squeeze()[window])*10/9.8
+    pmsl2=kernels.field(PRMSL2['data'].values.squeeze()[window])
+
+    # 500 hPa CVA (1e-9 s**-2)
+    vort_adv_500 = kernels.advection(avor_500, u_500, v_500, dx, dy) * 1e9
+    vort_adv_500_smooth = gaussian_filter(vort_adv_500, 4)
+
+    Td_dep_700 = tmp_700 - kernels.dewpoint_from_rh(tmp_700, rh_700)
+
+    pmsl_change = pmsl - pmsl2
+    hgt_500_change = hgt_500 - hgt_500_2
+
+    # the jets in kt
+    u_300, v_300, u_500, v_500, u_850, v_850 = [
+        wind*kernels.MS_TO_KT for wind in (u_300, v_300, u_500, v_500, u_850, v_850)]
+
+    instrument.phase('crop')
+    lons = lons[inner[1]]
+    lats = lats[inner[0]]
+    (vort_adv_500_smooth, Td_dep_700, pmsl_change, hgt_500_change, u_300, v_300,
+     u_500, v_500, u_850, v_850, lifted_index, Td_sfc, pmsl) = [
+        value[inner] for value in (vort_adv_500_smooth, Td_dep_700, pmsl_change,
+                                   hgt_500_change, u_300, v_300, u_500, v_500,
+                                   u_850, v_850, lifted_index, Td_sfc, pmsl)]
+    wspd_300, wspd_500, wspd_850 = [wspd[map_y, map_x] for wspd in (wspd_300, wspd_500, wspd_850)]
+
+    mask_500 = ma.masked_less_equal(wspd_500, jet_500).mask
+    u_500[mask_500] = np.nan
+    v_500[mask_500] = np.nan
+
+    # 300 hPa
+    mask_300 = ma.masked_less_equal(wspd_300, jet_300).mask
+    u_300[mask_300] = np.nan
+    v_300[mask_300] = np.nan
+
+    # 850 hPa
+    mask_850 = ma.masked_less_equal(wspd_850, jet_850).mask
+    u_850[mask_850] = np.nan
+    v_850[mask_850] = np.nan
+
     fcst_info= {'lon':lons,'lat':lats,
                 'fhour':fhour,
                 'model':model,
@@ -196,9 +234,11 @@ def Miller_Composite_Chart(initial_time=None, fhour=24, day_back=0,model='GRAPES
                 }
 
     synthetical_graphics.draw_Miller_Composite_Chart(fcst_info=fcst_info,
-                    u_300=u_300,v_300=v_300,u_500=u_500,v_500=v_500,u_850=u_850,v_850=v_850,
-                    pmsl_change=pmsl_change,hgt_500_change=hgt_500_change,Td_dep_700=Td_dep_700,
-                    Td_sfc=Td_sfc,pmsl=pmsl,lifted_index=lifted_index,vort_adv_500_smooth=vort_adv_500_smooth,
+                    u_300=u_300*units('kt'),v_300=v_300*units('kt'),u_500=u_500*units('kt'),
+                    v_500=v_500*units('kt'),u_850=u_850*units('kt'),v_850=v_850*units('kt'),
+                    pmsl_change=pmsl_change*units('hPa'),hgt_500_change=hgt_500_change,Td_dep_700=Td_dep_700,
+                    Td_sfc=Td_sfc*units('degC'),pmsl=pmsl*units('hPa'),lifted_index=lifted_index,
+                    vort_adv_500_smooth=vort_adv_500_smooth,
                     map_extent=map_extent,
                     add_china=True,city=False,south_China_sea=True,
                     output_dir=None,Global=False)           
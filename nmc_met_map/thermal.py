@@ -4,12 +4,16 @@
 Synoptic analysis or diagnostic maps for numeric weather model.
 """
 import numpy as np
-from nmc_met_io.retrieve_micaps_server import get_model_grid
-from nmc_met_map.graphics import thermal_graphics
+from nmc_met_map.lib.retrieve import get_model_grid,get_model_3D_grid
+from nmc_met_map.lib.lazy import lazy_import, lazy_attr
+thermal_graphics = lazy_import('nmc_met_map.graphics.thermal_graphics')
 import nmc_met_map.lib.utility as utl
-from metpy.units import units
-import metpy.calc as mpcalc
+from nmc_met_map.lib import instrument
+from nmc_met_map.lib import convection
+units = lazy_attr('metpy.units', 'units')
+mpcalc = lazy_import('metpy.calc')
 
+@instrument.product
 def gh_uv_thetae(initial_time=None, fhour=6, day_back=0,model='ECMWF',
     gh_lev='500',uv_lev='850',th_lev='850',
     map_ratio=19/9,zoom_ratio=20,cntr_pnt=[102,34],
@@ -53,6 +57,7 @@ def gh_uv_thetae(initial_time=None, fhour=6, day_back=0,model='ECMWF',
 
 
     # prepare data
+    instrument.phase('crop')
 
     if(area != None):
         cntr_pnt,zoom_ratio=utl.get_map_area(area_name=area)
@@ -101,6 +106,7 @@ def gh_uv_thetae(initial_time=None, fhour=6, day_back=0,model='ECMWF',
         city=city,south_China_sea=south_China_sea,
         output_dir=output_dir,Global=Global)
 
+@instrument.product
 def gh_uv_tmp(initial_time=None, fhour=6, day_back=0,model='ECMWF',
     gh_lev='500',uv_lev='850',tmp_lev='850',
     map_ratio=19/9,zoom_ratio=20,cntr_pnt=[102,34],
@@ -144,6 +150,7 @@ def gh_uv_tmp(initial_time=None, fhour=6, day_back=0,model='ECMWF',
 
 
     # prepare data
+    instrument.phase('crop')
 
     if(area != None):
         cntr_pnt,zoom_ratio=utl.get_map_area(area_name=area)
@@ -190,4 +197,126 @@ def gh_uv_tmp(initial_time=None, fhour=6, day_back=0,model='ECMWF',
         tmp=tmp, gh=gh, uv=uv,
         map_extent=map_extent, regrid_shape=20,
         city=city,south_China_sea=south_China_sea,
-        output_dir=output_dir,Global=Global)        
\ No newline at end of file
+        output_dir=output_dir,Global=Global)
+
+@instrument.product
+def convective_index(initial_time=None, fhour=6, day_back=0,model='ECMWF',
+    index='CAPE',parcel='surface',
+    levels=[1000, 950, 925, 900, 850, 800, 700, 600, 500, 400, 300, 250, 200, 150, 100],
+    gh_lev='500',uv_lev='850',
+    map_ratio=19/9,zoom_ratio=20,cntr_pnt=[102,34],
+    south_China_sea=True,area = '全国',city=False,output_dir=None,
+    Global=False):
+
+    """
+    Convective diagnostics over the map, computed for all columns at once
+    by lib/convection.py.
+    :param index: 'CAPE', 'CIN', 'LCL', 'LFC', 'EL', 'LI' or 'K'.
+    :param parcel: 'surface' (lowest level above the ground) or 'mu'
+                   (most unstable) parcel.
+    :param levels: pressure levels of the columns.
+    """
+
+    if index not in convection.INDICES:
+        raise ValueError('index should be one of '+', '.join(convection.INDICES))
+    if(area != '全国'):
+        south_China_sea=False
+
+    # micaps data directory
+    try:
+        data_dir = [utl.Cassandra_dir(data_type='high',data_source=model,var_name='HGT',lvl=gh_lev),
+                    utl.Cassandra_dir(data_type='high',data_source=model,var_name='UGRD',lvl=uv_lev),
+                    utl.Cassandra_dir(data_type='high',data_source=model,var_name='VGRD',lvl=uv_lev),
+                    utl.Cassandra_dir(data_type='high',data_source=model,var_name='TMP',lvl=''),
+                    utl.Cassandra_dir(data_type='high',data_source=model,var_name='RH',lvl=''),
+                    utl.Cassandra_dir(data_type='surface',data_source=model,var_name='PSFC')]
+    except KeyError:
+        raise ValueError('Can not find all directories needed')
+
+    # get filename
+    if(initial_time != None):
+        filename = utl.model_filename(initial_time, fhour)
+    else:
+        filename=utl.filename_day_back_model(day_back=day_back,fhour=fhour)
+
+    # retrieve data from micaps server
+    gh = get_model_grid(data_dir[0], filename=filename)
+    if gh is None:
+        return
+    u = get_model_grid(data_dir[1], filename=filename)
+    if u is None:
+        return
+    v = get_model_grid(data_dir[2], filename=filename)
+    if v is None:
+        return
+    tmp = get_model_3D_grid(directory=data_dir[3][0:-1],filename=filename,levels=levels)
+    if tmp is None:
+        return
+    rh = get_model_3D_grid(directory=data_dir[4][0:-1],filename=filename,levels=levels)
+    if rh is None:
+        return
+    psfc = get_model_grid(data_dir[5], filename=filename)
+    if psfc is None:
+        return
+    init_time = gh.coords['forecast_reference_time'].values
+
+    # prepare data
+    instrument.phase('crop')
+
+    if(area != None):
+        cntr_pnt,zoom_ratio=utl.get_map_area(area_name=area)
+
+    map_extent=[0,0,0,0]
+    map_extent[0]=cntr_pnt[0]-zoom_ratio*1*map_ratio
+    map_extent[1]=cntr_pnt[0]+zoom_ratio*1*map_ratio
+    map_extent[2]=cntr_pnt[1]-zoom_ratio*1
+    map_extent[3]=cntr_pnt[1]+zoom_ratio*1
+
+    delt_x=(map_extent[1]-map_extent[0])*0.2
+    delt_y=(map_extent[3]-map_extent[2])*0.1
+
+#+ to solve the problem of labels on all the contours
+    idx_x1 = np.where((gh.coords['lon'].values > map_extent[0]-delt_x) & 
+        (gh.coords['lon'].values < map_extent[1]+delt_x))
+    idx_y1 = np.where((gh.coords['lat'].values > map_extent[2]-delt_y) & 
+        (gh.coords['lat'].values < map_extent[3]+delt_y))
+
+    idx_x2 = np.where((tmp.coords['lon'].values > map_extent[0]-delt_x) & 
+        (tmp.coords['lon'].values < map_extent[1]+delt_x))
+    idx_y2 = np.where((tmp.coords['lat'].values > map_extent[2]-delt_y) & 
+        (tmp.coords['lat'].values < map_extent[3]+delt_y))
+#- to solve the problem of labels on all the contours
+
+    gh = {'lon': gh.coords['lon'].values[idx_x1],
+             'lat': gh.coords['lat'].values[idx_y1],
+             'data': gh['data'].values[0,0,idx_y1[0][0]:(idx_y1[0][-1]+1),idx_x1[0][0]:(idx_x1[0][-1]+1)],
+             'lev':gh_lev,
+             'model':model,
+             'fhour':fhour,
+             'init_time':init_time}
+    uv = {'lon': u.coords['lon'].values[idx_x1],
+             'lat': u.coords['lat'].values[idx_y1],
+             'udata': u['data'].values[0,0,idx_y1[0][0]:(idx_y1[0][-1]+1),idx_x1[0][0]:(idx_x1[0][-1]+1)],
+             'vdata': v['data'].values[0,0,idx_y1[0][0]:(idx_y1[0][-1]+1),idx_x1[0][0]:(idx_x1[0][-1]+1)],
+             'lev':uv_lev}
+
+    # the columns of the map only, (level, lat, lon)
+    instrument.phase('derive')
+    t_3D = tmp['data'].values[0,:,idx_y2[0][0]:(idx_y2[0][-1]+1),idx_x2[0][0]:(idx_x2[0][-1]+1)]
+    rh_3D = rh['data'].values[0,:,idx_y2[0][0]:(idx_y2[0][-1]+1),idx_x2[0][0]:(idx_x2[0][-1]+1)]
+    # the levels below the ground are left out, the surface parcel is the
+    # lowest level above it
+    psfc_2D = psfc['data'].interp(
+        lon=tmp.coords['lon'].values[idx_x2], lat=tmp.coords['lat'].values[idx_y2]).values.squeeze()
+    result = convection.convective_indices(tmp['level'].values, t_3D, rh=rh_3D, parcel=parcel, psfc=psfc_2D)
+    conv = {'lon': tmp.coords['lon'].values[idx_x2],
+            'lat': tmp.coords['lat'].values[idx_y2],
+            'data': result[index],
+            'name': index,
+            'parcel': parcel}
+
+    thermal_graphics.draw_convective_index(
+        conv=conv, gh=gh, uv=uv,
+        map_extent=map_extent, regrid_shape=20,
+        city=city,south_China_sea=south_China_sea,
+        output_dir=output_dir,Global=Global)
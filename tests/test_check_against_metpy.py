@@ -0,0 +1,26 @@
+# _*_ coding: utf-8 _*_
+
+"""
+  The kernels (lib/kernels.py) and the convective indices
+  (lib/convection.py) against metpy.calc, skipped without metpy.
+
+  python -m pytest tests/
+"""
+
+import pytest
+
+
+@pytest.mark.parametrize('dtype', ['float32', 'float64'])
+def test_kernels(dtype):
+    pytest.importorskip('metpy')
+    from nmc_met_map.lib import kernels
+    diff = kernels.check_against_metpy(dtype=dtype)
+    assert set(diff) == set(kernels.TOLERANCE)
+
+
+def test_convection():
+    # the cape_cin of metpy < 1.6 fails on some of the synthetic soundings
+    pytest.importorskip('metpy', minversion='1.6')
+    from nmc_met_map.lib import convection
+    diff = convection.check_against_metpy()
+    assert set(diff) == set(convection.TOLERANCE)